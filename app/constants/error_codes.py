@@ -27,6 +27,9 @@ class ErrorCodes:
     INVALID_SYMBOL = 3004
     INVALID_TIMEFRAME = 3005
     INVALID_TIMEZONE = 3006
+    CANDLE_RESYNC_REQUIRED = 3007
+    ACCOUNT_STATE_STALE = 3008
+    ACCOUNT_STATE_INVALID = 3009
     
     # Service errors (4000-4999)
     SIGNAL_SERVICE_ERROR = 4001
@@ -37,6 +40,7 @@ class ErrorCodes:
     INTERNAL_SERVER_ERROR = 5001
     SERVICE_UNAVAILABLE = 5002
     DATABASE_ERROR = 5003
+    EXECUTOR_QUEUE_FULL = 5004
     
     # Cache errors (6000-6999)
     CACHE_MISS = 6001
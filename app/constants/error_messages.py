@@ -27,6 +27,9 @@ ERROR_MESSAGES = {
     ErrorCodes.INVALID_SYMBOL: "Invalid symbol: {symbol}",
     ErrorCodes.INVALID_TIMEFRAME: "Invalid timeframe: {timeframe}",
     ErrorCodes.INVALID_TIMEZONE: "Invalid timezone: {timezone}",
+    ErrorCodes.CANDLE_RESYNC_REQUIRED: "Candle history resync required for timeframes: {timeframes}",
+    ErrorCodes.ACCOUNT_STATE_STALE: "Account state of login {login} is not at version {version}, resend full state",
+    ErrorCodes.ACCOUNT_STATE_INVALID: "Invalid account state delta: {details}",
     
     # Service errors
     ErrorCodes.SIGNAL_SERVICE_ERROR: "Signal service error: {details}",
@@ -37,6 +40,7 @@ ERROR_MESSAGES = {
     ErrorCodes.INTERNAL_SERVER_ERROR: "Internal server error",
     ErrorCodes.SERVICE_UNAVAILABLE: "Service temporarily unavailable",
     ErrorCodes.DATABASE_ERROR: "Database operation failed",
+    ErrorCodes.EXECUTOR_QUEUE_FULL: "Server busy: {pool} executor queue is full, please retry",
     
     # Cache errors
     ErrorCodes.CACHE_MISS: "Cache miss for key: {key}",
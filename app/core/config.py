@@ -76,5 +76,68 @@ class Settings:
     SIGNAL_SERVICE_LOCK_TIMEOUT: int = int(os.getenv("SIGNAL_SERVICE_LOCK_TIMEOUT", "300"))  # 5 minutes
     SIGNAL_SERVICE_CACHE_WAIT_TIMEOUT: int = int(os.getenv("SIGNAL_SERVICE_CACHE_WAIT_TIMEOUT", "300"))  # 5 minutes
     SIGNAL_SERVICE_CACHE_TTL: int = int(os.getenv("SIGNAL_SERVICE_CACHE_TTL", "600"))  # 10 minutes
+    SIGNAL_PRE_CHECK_ENABLED: bool = os.getenv("SIGNAL_PRE_CHECK_ENABLED", "false").lower() == "true"  # Portfolio chặn mọi lệnh => không gọi AI (opt-in)
+    SIGNAL_PROMPT_MODE: str = os.getenv("SIGNAL_PROMPT_MODE", "full")  # full / compact (server tính SL buffer, R:R, pips, trailing stop)
+    SIGNAL_BATCH_SIZE: int = int(os.getenv("SIGNAL_BATCH_SIZE", "4"))  # Số symbol tối đa / 1 lần gọi AI của /signal/batch
+
+    # Market calendar settings - /signal ngoài giờ giao dịch không gọi AI
+    MARKET_CALENDAR_ENABLED: bool = os.getenv("MARKET_CALENDAR_ENABLED", "true").lower() == "true"
+    MARKET_WEEKLY_CLOSE: str = os.getenv("MARKET_WEEKLY_CLOSE", "FRI 17:00")  # Theo MARKET_SESSION_TIMEZONE
+    MARKET_WEEKLY_OPEN: str = os.getenv("MARKET_WEEKLY_OPEN", "SUN 17:00")  # Theo MARKET_SESSION_TIMEZONE
+    MARKET_SESSION_TIMEZONE: str = os.getenv("MARKET_SESSION_TIMEZONE", "America/New_York")  # Tự theo DST
+    MARKET_HOLIDAYS: str = os.getenv("MARKET_HOLIDAYS", "")  # YYYY-MM-DD,... theo ngày của broker (cache_key.timezone)
+
+    # Signal screener settings - chấm điểm setup (0-100) trước khi gọi AI
+    SIGNAL_SCREENER_MODE: str = os.getenv("SIGNAL_SCREENER_MODE", "shadow")  # off / shadow (chỉ thống kê) / enforce
+    SIGNAL_SCREENER_THRESHOLD: float = float(os.getenv("SIGNAL_SCREENER_THRESHOLD", "40"))  # Điểm < ngưỡng => HOLD
+    SIGNAL_SCREEN_TOP_N: int = int(os.getenv("SIGNAL_SCREEN_TOP_N", "5"))  # Số candidate tối đa của /signal/screen
+
+    # Signal reuse settings - input chưa đổi đáng kể so với lần gọi AI trước => phát lại signal cũ
+    SIGNAL_REUSE_ENABLED: bool = os.getenv("SIGNAL_REUSE_ENABLED", "true").lower() == "true"
+    SIGNAL_REUSE_MAX_AGE: int = int(os.getenv("SIGNAL_REUSE_MAX_AGE", "3600"))  # Giây 1 kết quả AI được phát lại
+    SIGNAL_REUSE_TOLERANCES: str = os.getenv("SIGNAL_REUSE_TOLERANCES", "")  # Override tolerance, vd. "rsi=1.5,level=0.05"
+
+    # Executor settings - CPU-bound (process pool) và blocking I/O (thread pool)
+    EXECUTOR_PROCESS_WORKERS: int = int(os.getenv("EXECUTOR_PROCESS_WORKERS", "2"))  # 0 = chạy CPU task trong thread pool
+    EXECUTOR_PROCESS_MAX_QUEUE: int = int(os.getenv("EXECUTOR_PROCESS_MAX_QUEUE", "32"))
+    EXECUTOR_PROCESS_START_METHOD: str = os.getenv("EXECUTOR_PROCESS_START_METHOD", "spawn")
+    EXECUTOR_THREAD_WORKERS: int = int(os.getenv("EXECUTOR_THREAD_WORKERS", "8"))
+    EXECUTOR_THREAD_MAX_QUEUE: int = int(os.getenv("EXECUTOR_THREAD_MAX_QUEUE", "128"))
+
+    # Candle store settings - lưu nến phía server cho delta sync của /signal
+    CANDLE_STORE_COLLECTION: str = os.getenv("CANDLE_STORE_COLLECTION", "candles")
+    CANDLE_STORE_WINDOW: int = int(os.getenv("CANDLE_STORE_WINDOW", "1000"))  # Số nến giữ cho mỗi symbol/timeframe
+    CANDLE_STORE_HOT_KEYS: int = int(os.getenv("CANDLE_STORE_HOT_KEYS", "512"))  # Số symbol/timeframe giữ trong memory
+
+    # Resample settings - dựng H2/H4/H8/D1/W1 từ 1 chuỗi gốc M30/H1
+    RESAMPLE_BASE_WINDOW: int = int(os.getenv("RESAMPLE_BASE_WINDOW", "12000"))  # Số nến gốc giữ trong candle store
+    RESAMPLE_OUTPUT_BARS: int = int(os.getenv("RESAMPLE_OUTPUT_BARS", "250"))  # Số nến tối đa mỗi timeframe sau resample
+
+    # Analysis cache settings - tái sử dụng block phân tích theo timeframe giữa các request
+    ANALYSIS_CACHE_ENABLED: bool = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2048"))
+    INDICATOR_ENGINE_MAX_STATES: int = int(os.getenv("INDICATOR_ENGINE_MAX_STATES", "2048"))  # State (timezone, symbol, timeframe) giữ trong memory
+
+    # Risk sweep settings - what-if theo lưới tham số rủi ro
+    RISK_SWEEP_MAX_POINTS: int = int(os.getenv("RISK_SWEEP_MAX_POINTS", "100000"))  # Số điểm tối đa của 1 lưới
+
+    # Risk rules settings - luật quản lý rủi ro theo profile (hot reload)
+    RISK_RULES_PATH: str = os.getenv("RISK_RULES_PATH", "app/config/risk_rules.json")
+    RISK_RULES_RELOAD_SECONDS: float = float(os.getenv("RISK_RULES_RELOAD_SECONDS", "5"))  # Chu kỳ kiểm tra file thay đổi
+    RISK_MANAGER_TRACE: bool = os.getenv("RISK_MANAGER_TRACE", "false").lower() == "true"  # Log chi tiết từng bước cho mọi request
+
+    # Correlation engine settings - tương quan cuốn chiếu từ nến đã lưu thay cho correlation_groups_json cố định
+    CORRELATION_ENGINE_ENABLED: bool = os.getenv("CORRELATION_ENGINE_ENABLED", "true").lower() == "true"
+    CORRELATION_TIMEFRAME: str = os.getenv("CORRELATION_TIMEFRAME", "H1")
+    CORRELATION_WINDOW: int = int(os.getenv("CORRELATION_WINDOW", "250"))  # Số lợi suất trong cửa sổ
+    CORRELATION_MIN_BARS: int = int(os.getenv("CORRELATION_MIN_BARS", "50"))  # Tối thiểu để có hệ số tương quan
+    CORRELATION_THRESHOLD: float = float(os.getenv("CORRELATION_THRESHOLD", "0.7"))  # |ρ| tối thiểu để coi là tương quan
+    CORRELATION_MAX_SYMBOLS: int = int(os.getenv("CORRELATION_MAX_SYMBOLS", "64"))  # Số symbol tối đa mỗi namespace
+    CORRELATION_STALE_BARS: int = int(os.getenv("CORRELATION_STALE_BARS", "24"))  # Symbol chậm hơn => không chặn mốc mới
+
+    # Account state settings - account/portfolio theo login và symbol_info theo broker lưu phía server
+    ACCOUNT_STATE_TTL: int = int(os.getenv("ACCOUNT_STATE_TTL", "86400"))  # 1 day kể từ lần ghi cuối
+    ACCOUNT_STATE_LOCAL_CACHE: int = int(os.getenv("ACCOUNT_STATE_LOCAL_CACHE", "4096"))  # Số (login, version) giữ trong memory
+    SYMBOL_INFO_TTL: int = int(os.getenv("SYMBOL_INFO_TTL", "604800"))  # 7 days
 
 settings = Settings()
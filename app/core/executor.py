@@ -0,0 +1,201 @@
+"""
+Executor management
+Chạy công việc CPU-bound (process pool) và blocking I/O (thread pool) ngoài event loop
+
+- Khởi tạo / shutdown qua lifespan trong app/main.py
+- Mỗi pool có hàng đợi giới hạn (workers + max_queue); vượt giới hạn => ExecutorQueueFullError
+- Metrics: in_flight, queue_depth, completed, failed, rejected, thời gian chờ/thực thi trung bình
+- Khi chưa start (script/test) hàm được chạy inline để giữ hành vi đồng bộ như trước
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .config import settings
+from ..utils.logger import Logger
+
+
+CPU_POOL = "cpu"
+IO_POOL = "io"
+
+
+class ExecutorQueueFullError(RuntimeError):
+    """Hàng đợi của pool đã đầy"""
+
+    def __init__(self, pool: str):
+        super().__init__(f"{pool} executor queue is full")
+        self.pool = pool
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict, submitted_at: float):
+    """Chạy trong worker: trả kèm thời gian chờ trong queue và thời gian thực thi"""
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class _PoolStats:
+    """Metrics của 1 pool"""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    def to_dict(self, mode: str) -> Dict[str, Any]:
+        finished = max(self.completed, 1)
+        return {
+            "mode": mode,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / finished * 1000, 3),
+            "avg_run_ms": round(self.total_run / finished * 1000, 3)
+        }
+
+
+class ExecutorManager:
+    """Quản lý process pool (CPU) và thread pool (I/O) dùng chung cho các service"""
+
+    def __init__(self, process_workers: Optional[int] = None, process_max_queue: Optional[int] = None,
+                 thread_workers: Optional[int] = None, thread_max_queue: Optional[int] = None):
+        """
+        Args:
+            process_workers, process_max_queue: Kích thước process pool / hàng đợi (mặc định theo settings)
+            thread_workers, thread_max_queue: Kích thước thread pool / hàng đợi (mặc định theo settings)
+        """
+        self.logger = Logger("executor")
+        self._executors: Dict[str, Optional[Executor]] = {CPU_POOL: None, IO_POOL: None}
+        self._stats = {
+            CPU_POOL: _PoolStats(
+                CPU_POOL,
+                settings.EXECUTOR_PROCESS_WORKERS if process_workers is None else process_workers,
+                settings.EXECUTOR_PROCESS_MAX_QUEUE if process_max_queue is None else process_max_queue
+            ),
+            IO_POOL: _PoolStats(
+                IO_POOL,
+                settings.EXECUTOR_THREAD_WORKERS if thread_workers is None else thread_workers,
+                settings.EXECUTOR_THREAD_MAX_QUEUE if thread_max_queue is None else thread_max_queue
+            )
+        }
+        self._cpu_in_threads = False
+
+    @property
+    def started(self) -> bool:
+        return self._executors[IO_POOL] is not None
+
+    def start(self):
+        """Khởi tạo các pool (gọi từ lifespan startup)"""
+        if self.started:
+            return
+        io_stats, cpu_stats = self._stats[IO_POOL], self._stats[CPU_POOL]
+        self._executors[IO_POOL] = ThreadPoolExecutor(max_workers=io_stats.workers, thread_name_prefix="fxapi-io")
+
+        if cpu_stats.workers > 0:
+            context = multiprocessing.get_context(settings.EXECUTOR_PROCESS_START_METHOD)
+            self._executors[CPU_POOL] = ProcessPoolExecutor(max_workers=cpu_stats.workers, mp_context=context)
+            self._cpu_in_threads = False
+        else:
+            # EXECUTOR_PROCESS_WORKERS=0: dùng chung thread pool (vẫn không block event loop)
+            self._executors[CPU_POOL] = self._executors[IO_POOL]
+            cpu_stats.workers = io_stats.workers
+            self._cpu_in_threads = True
+
+        self.logger.info(
+            f"Executors started: cpu={cpu_stats.workers} ({'threads' if self._cpu_in_threads else 'processes'}), "
+            f"io={io_stats.workers} threads"
+        )
+
+    def shutdown(self):
+        """Đóng các pool (gọi từ lifespan shutdown)"""
+        cpu_executor, io_executor = self._executors[CPU_POOL], self._executors[IO_POOL]
+        self._executors = {CPU_POOL: None, IO_POOL: None}
+        if cpu_executor is not None and cpu_executor is not io_executor:
+            cpu_executor.shutdown(wait=True, cancel_futures=True)
+        if io_executor is not None:
+            io_executor.shutdown(wait=True, cancel_futures=True)
+        self.logger.info("Executors shut down")
+
+    async def run_cpu(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Chạy hàm CPU-bound trong process pool
+
+        Hàm và tham số phải pickle được (hàm cấp module, dữ liệu thuần dict/list/numpy).
+
+        Raises:
+            ExecutorQueueFullError: Hàng đợi CPU đã đầy
+        """
+        return await self._submit(CPU_POOL, fn, args, kwargs)
+
+    async def run_io(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Chạy hàm blocking I/O (Redis sync client, file log...) trong thread pool
+
+        Raises:
+            ExecutorQueueFullError: Hàng đợi I/O đã đầy
+        """
+        return await self._submit(IO_POOL, fn, args, kwargs)
+
+    async def _submit(self, pool: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        executor = self._executors[pool]
+        if executor is None:
+            return fn(*args, **kwargs)
+
+        stats = self._stats[pool]
+        if stats.in_flight >= stats.capacity:
+            stats.rejected += 1
+            self.logger.warning(f"{pool} executor queue full ({stats.in_flight}/{stats.capacity})")
+            raise ExecutorQueueFullError(pool)
+
+        stats.in_flight += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(_timed_call, fn, args, kwargs, time.time())
+            result, waited, ran = await loop.run_in_executor(executor, call)
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+        stats.completed += 1
+        stats.total_wait += waited
+        stats.total_run += ran
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Metrics của các pool (dùng cho health endpoint)"""
+        if not self.started:
+            mode = {CPU_POOL: "inline", IO_POOL: "inline"}
+        else:
+            mode = {CPU_POOL: "threads" if self._cpu_in_threads else "processes", IO_POOL: "threads"}
+        return {pool: stats.to_dict(mode[pool]) for pool, stats in self._stats.items()}
+
+
+# Global executor manager instance
+executor_manager = ExecutorManager()
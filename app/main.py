@@ -8,6 +8,16 @@ from contextlib import asynccontextmanager
 # Import core components
 from .core.config import settings
 from .core.database import db_manager
+from .core.executor import executor_manager
+from .utils.analysis_cache import analysis_cache
+from .utils.risk_rules import risk_rule_registry
+from .utils.correlation_index import correlation_index_cache
+from .utils.correlation_engine import correlation_engines
+from .services.account_state_service import account_state_service
+from .utils.signal_screener import signal_screener
+from .utils.signal_change_detector import signal_change_detector
+from .utils.signal_postprocessor import signal_postprocessor
+from .utils.prompt_batch import prompt_batch_metrics
 
 # Import routers
 from .routers.v1 import items_router as v1_items, health_router as v1_health
@@ -22,8 +32,10 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     await db_manager.connect_databases()
+    executor_manager.start()
     yield
     # Shutdown  
+    executor_manager.shutdown()
     await db_manager.disconnect_databases()
 
 # Tạo FastAPI app với lifespan management
@@ -77,6 +89,16 @@ async def global_health_check():
         "version": settings.APP_VERSION,
         "mongodb": db_status["mongodb"],
         "redis": db_status["redis"],
+        "executors": executor_manager.get_metrics(),
+        "analysis_cache": analysis_cache.get_metrics(),
+        "risk_rules": risk_rule_registry.get_metrics(),
+        "correlation_index": correlation_index_cache.get_metrics(),
+        "correlation_engine": correlation_engines.get_metrics(),
+        "account_state": account_state_service.get_metrics(),
+        "signal_screener": signal_screener.get_metrics(),
+        "signal_change_detector": signal_change_detector.get_metrics(),
+        "signal_postprocessor": signal_postprocessor.get_metrics(),
+        "prompt_batch": prompt_batch_metrics.get_metrics(),
         "available_apis": {
             "v1": settings.API_V1_PREFIX,
             "v2": settings.API_V2_PREFIX
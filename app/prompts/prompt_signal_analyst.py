@@ -9,11 +9,133 @@ def prompt_signal_analyst(params):
     symbol = params.get('symbol')
     provided_data = params.get('provided_data')
     main_timeframe = params.get('main_timeframe', "H4") 
+    compact = params.get('compact', False)
     tf_config = get_timeframe_config(main_timeframe)
     market_context = get_market_context()
 
+    # Prompt compact: model chỉ trả hướng, loại lệnh và các mức giá;
+    # SL buffer / R:R / pips / trailing stop do app/utils/signal_postprocessor.py tính chính xác
+    if compact:
+        stop_loss_rules = f"""                2.  **Report the Structure Level Only:**
+                    - Put the price of that swing low (BUY) / swing high (SELL) in `stop_loss_structure`.
+                    - The server applies the mandatory volatility buffer (0.5 x ATR of `{tf_config['main_timeframe']}`) and returns the final `stop_loss_proposed`. Account for this buffer when judging SL distance and R:R.
+
+"""
+        trailing_stop_section = f"""            11. **DERIVED FIELDS (COMPUTED BY THE SERVER)**:
+                Do NOT calculate `trailing_stop_loss`, `pips_to_take_profit`, `risk_reward_ratio` or the final `stop_loss_proposed`. The server computes them exactly from your levels, the ATR and `symbol_info.digits`. Only estimate R:R to decide whether a scenario passes the 1.5 quality filter.
+
+"""
+        output_fields = """            "order_type_proposed": "MARKET/LIMIT/STOP" or null,
+            "entry_price_proposed": float or null,
+            "stop_loss_structure": float or null,
+            "take_profit_proposed": float or null,
+            "estimate_win_probability": integer (20-85) or null,
+"""
+    else:
+        stop_loss_rules = f"""                2.  **Calculate the Volatility Buffer (The Moat):**
+                    - Next, calculate a "smart buffer" to place your SL beyond the reach of typical market noise and stop-hunting activities.
+                    - This buffer MUST be equal to **0.5 times the ATR value** on the `{tf_config['main_timeframe']}`. For example, if the `{tf_config['main_timeframe']}` ATR is 30 pips, the buffer is 15 pips.
+
+                3.  **Determine Final SL Price:**
+                    - The final `stop_loss_proposed` price MUST be the price of the technical structure level, with the calculated volatility buffer applied to push it further away.
+                    - **For a BUY signal:**
+                        `stop_loss_proposed = [Price of Key Swing Low] - (0.5 * ATR)`
+                    - **For a SELL signal:**
+                        `stop_loss_proposed = [Price of Key Swing High] + (0.5 * ATR)`
+
+                **CRITICAL INSTRUCTION: This is a non-negotiable, two-step rule.** You are FORBIDDEN from placing the Stop Loss directly at or just beyond the swing high/low. The calculated Volatility Buffer is a mandatory component of the final Stop Loss price. This ensures the trade has adequate "breathing room" and is protected from predictable liquidity sweeps.
+                
+"""
+        trailing_stop_section = f"""            11. **TRAILING STOP LOSS CALCULATION (ATR-BASED METHOD)**:
+                This section applies ONLY if a valid BUY/SELL signal is generated.
+
+                **A. Trailing Stop Loss Calculation (in Pips):**
+                This MUST be a universal, step-by-step calculation that works for ALL currency pairs.
+
+                1.  **Step 1: Get Raw Values from Input Data.**
+                    -   From `{tf_config['main_timeframe']}` indicator data, get the `Raw ATR Value`.
+                    -   From `symbol_info`, get the `Digits` value (the number of decimal places for the price).
+
+                2.  **Step 2: Define ATR Multiplier (N).**
+                    -   Use the default multiplier `N = 2.0`.
+
+                3.  **Step 3: Calculate the Raw Distance.**
+                    -   `Raw Distance = Raw ATR Value * N`
+
+                4.  **Step 4: Determine the Correct Pip Divisor (CRITICAL LOGIC).**
+                    -   You MUST determine the value of 1 pip based on the `Digits` value. This logic handles both JPY and non-JPY pairs.
+                    -   **IF `Digits` is 3 or 2 (typical for JPY pairs):**
+                        -   The `Pip Divisor` is `0.01`.
+                    -   **ELSE (meaning `Digits` is 5 or 4, for non-JPY pairs):**
+                        -   The `Pip Divisor` is `0.0001`.
+
+                5.  **Step 5: Calculate Final Value in Pips.**
+                    -   `Final TSL in Pips = Raw Distance / Pip Divisor`
+
+                6.  **Step 6: Final Formatting.**
+                    -   Round the `Final TSL in Pips` to one decimal place. This final number is the value to be placed in the `trailing_stop_loss` field.
+
+                ---
+                **INTERNAL VALIDATION EXAMPLES (Apply this logic):**
+
+                *   **Example 1 (Non-JPY Pair):**
+                    -   Symbol: EURUSD, `Digits` = 5
+                    -   `Raw ATR Value` = `0.00224`
+                    -   `Raw Distance` = `0.00224 * 2.0 = 0.00448`
+                    -   `Pip Divisor` (since Digits=5) = `0.0001`
+                    -   `Final TSL in Pips` = `0.00448 / 0.0001 = 44.8`
+
+                *   **Example 2 (JPY Pair):**
+                    -   Symbol: USDJPY, `Digits` = 3
+                    -   `Raw ATR Value` = `0.158`
+                    -   `Raw Distance` = `0.158 * 2.0 = 0.316`
+                    -   `Pip Divisor` (since Digits=3) = `0.01`
+                    -   `Final TSL in Pips` = `0.316 / 0.01 = 31.6`
+                ---
+
+"""
+        output_fields = """            "order_type_proposed": "MARKET/LIMIT/STOP" or null,
+            "entry_price_proposed": float or null,
+            "stop_loss_proposed": float or null,
+            "take_profit_proposed": float or null,
+            "estimate_win_probability": integer (20-85) or null,
+            "risk_reward_ratio": float or null,
+            "trailing_stop_loss": float or null,
+            "pips_to_take_profit": float or null,
+"""
+
+    signal_object = f"""{{
+            "symbol": "{{symbol}}",
+            "signal_type": "BUY/SELL/HOLD",
+{output_fields}            "technical_reasoning": "string"
+        }}"""
+    # Prompt batch: 1 lần gọi AI phân tích nhiều symbol (cùng main timeframe), dùng chung phần hướng dẫn
+    symbols = params.get('symbols')
+    if symbols:
+        analysis_subject = (f"The current analysis covers {len(symbols)} trading symbols: {', '.join(symbols)}. "
+                            f"Apply the full process below to EACH symbol independently, using only that symbol's data.")
+        input_and_output = f"""            Input data (JSON object keyed by symbol; use each symbol's pre-analyzed data for its own analysis): {provided_data}
+
+        **OUTPUT FORMAT (JSON array only, exactly one object per symbol in the order listed above, no extra text):**
+        ```json
+        [
+        {signal_object.replace('{symbol}', '<SYMBOL>')},
+        ...
+        ]
+        ```
+"""
+    else:
+        analysis_subject = f"The current analysis is for the trading symbol {symbol}."
+        input_and_output = f"""            Input data (use this pre-analyzed data for your reasoning): {provided_data}
+
+        **OUTPUT FORMAT (JSON only, no extra text):**
+        ```json
+        {signal_object.replace('{symbol}', str(symbol))}
+        ```
+"""
+
     fmessage = f"""
-            You are an expert AI specializing in forex trading signal analysis. The current analysis is for the trading symbol {symbol}.
+            You are an expert AI specializing in forex trading signal analysis. {analysis_subject}
             Main trading timeframe: {tf_config['main_timeframe']}
 
             **CURRENT MARKET CONTEXT & TIMING:**
@@ -140,20 +262,7 @@ def prompt_signal_analyst(params):
                 1.  **Identify the Technical Structure (The Fortress):**
                     - First, identify the most recent and logical key swing high (for SELL signals) or swing low (for BUY signals) from the `key_levels` list on the `{tf_config['main_timeframe']}`. This structure is your primary defense line.
                 
-                2.  **Calculate the Volatility Buffer (The Moat):**
-                    - Next, calculate a "smart buffer" to place your SL beyond the reach of typical market noise and stop-hunting activities.
-                    - This buffer MUST be equal to **0.5 times the ATR value** on the `{tf_config['main_timeframe']}`. For example, if the `{tf_config['main_timeframe']}` ATR is 30 pips, the buffer is 15 pips.
-
-                3.  **Determine Final SL Price:**
-                    - The final `stop_loss_proposed` price MUST be the price of the technical structure level, with the calculated volatility buffer applied to push it further away.
-                    - **For a BUY signal:**
-                        `stop_loss_proposed = [Price of Key Swing Low] - (0.5 * ATR)`
-                    - **For a SELL signal:**
-                        `stop_loss_proposed = [Price of Key Swing High] + (0.5 * ATR)`
-
-                **CRITICAL INSTRUCTION: This is a non-negotiable, two-step rule.** You are FORBIDDEN from placing the Stop Loss directly at or just beyond the swing high/low. The calculated Volatility Buffer is a mandatory component of the final Stop Loss price. This ensures the trade has adequate "breathing room" and is protected from predictable liquidity sweeps.
-                
-                **RISK-TO-REWARD (R:R) QUALITY CHECK (Read Carefully)**:
+{stop_loss_rules}                **RISK-TO-REWARD (R:R) QUALITY CHECK (Read Carefully)**:
                 This is the final quality filter for a trade. The process is sequential and must be followed exactly.
                 1.  First, determine the most logical Stop Loss and Take Profit levels based purely on technical analysis as described above (key levels, market structure, ATR).
                 2.  Second, using these technically-sound levels, calculate the resulting, "natural" Risk-to-Reward ratio.
@@ -165,54 +274,7 @@ def prompt_signal_analyst(params):
                 - There is NO upper limit for R:R. A trade with a natural R:R of 2.5:1 or 3.0:1 is an excellent trade and should not be modified.
                 - **If the natural R:R calculated from the most logical TP and SL is LESS THAN 1.2, the trade does not meet the minimum quality standard.** The trade setup is considered INVALID. You MUST discard this setup and move to evaluate the next scenario, or declare a final "HOLD" signal if no other valid scenarios exist.
 
-            11. **TRAILING STOP LOSS CALCULATION (ATR-BASED METHOD)**:
-                This section applies ONLY if a valid BUY/SELL signal is generated.
-
-                **A. Trailing Stop Loss Calculation (in Pips):**
-                This MUST be a universal, step-by-step calculation that works for ALL currency pairs.
-
-                1.  **Step 1: Get Raw Values from Input Data.**
-                    -   From `{tf_config['main_timeframe']}` indicator data, get the `Raw ATR Value`.
-                    -   From `symbol_info`, get the `Digits` value (the number of decimal places for the price).
-
-                2.  **Step 2: Define ATR Multiplier (N).**
-                    -   Use the default multiplier `N = 2.0`.
-
-                3.  **Step 3: Calculate the Raw Distance.**
-                    -   `Raw Distance = Raw ATR Value * N`
-
-                4.  **Step 4: Determine the Correct Pip Divisor (CRITICAL LOGIC).**
-                    -   You MUST determine the value of 1 pip based on the `Digits` value. This logic handles both JPY and non-JPY pairs.
-                    -   **IF `Digits` is 3 or 2 (typical for JPY pairs):**
-                        -   The `Pip Divisor` is `0.01`.
-                    -   **ELSE (meaning `Digits` is 5 or 4, for non-JPY pairs):**
-                        -   The `Pip Divisor` is `0.0001`.
-
-                5.  **Step 5: Calculate Final Value in Pips.**
-                    -   `Final TSL in Pips = Raw Distance / Pip Divisor`
-
-                6.  **Step 6: Final Formatting.**
-                    -   Round the `Final TSL in Pips` to one decimal place. This final number is the value to be placed in the `trailing_stop_loss` field.
-
-                ---
-                **INTERNAL VALIDATION EXAMPLES (Apply this logic):**
-
-                *   **Example 1 (Non-JPY Pair):**
-                    -   Symbol: EURUSD, `Digits` = 5
-                    -   `Raw ATR Value` = `0.00224`
-                    -   `Raw Distance` = `0.00224 * 2.0 = 0.00448`
-                    -   `Pip Divisor` (since Digits=5) = `0.0001`
-                    -   `Final TSL in Pips` = `0.00448 / 0.0001 = 44.8`
-
-                *   **Example 2 (JPY Pair):**
-                    -   Symbol: USDJPY, `Digits` = 3
-                    -   `Raw ATR Value` = `0.158`
-                    -   `Raw Distance` = `0.158 * 2.0 = 0.316`
-                    -   `Pip Divisor` (since Digits=3) = `0.01`
-                    -   `Final TSL in Pips` = `0.316 / 0.01 = 31.6`
-                ---
-
-            12. **QUALITY & VIABILITY FILTERS (MANDATORY PRE-CHECKS):**
+{trailing_stop_section}            12. **QUALITY & VIABILITY FILTERS (MANDATORY PRE-CHECKS):**
                 Before generating any BUY/SELL signal, you MUST ensure it passes these viability filters. If a potential signal from any scenario (A, B, or C) fails ANY of these filters, you MUST reject that scenario and evaluate the next.
 
                 1. MINIMUM TRADE DISTANCE FILTER (ADAPTIVE VOLATILITY CHECK):
@@ -239,23 +301,5 @@ def prompt_signal_analyst(params):
             
             If any check fails, return a HOLD signal.
 
-            Input data (use this pre-analyzed data for your reasoning): {provided_data}
-
-        **OUTPUT FORMAT (JSON only, no extra text):**
-        ```json
-        {{
-            "symbol": "{symbol}",
-            "signal_type": "BUY/SELL/HOLD",
-            "order_type_proposed": "MARKET/LIMIT/STOP" or null,
-            "entry_price_proposed": float or null,
-            "stop_loss_proposed": float or null,
-            "take_profit_proposed": float or null,
-            "estimate_win_probability": integer (20-85) or null,
-            "risk_reward_ratio": float or null,
-            "trailing_stop_loss": float or null,
-            "pips_to_take_profit": float or null,
-            "technical_reasoning": "string"
-        }}
-        ```
-    """
+{input_and_output}    """
     return fmessage
\ No newline at end of file
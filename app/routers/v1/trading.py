@@ -1,39 +1,129 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from app.services.signal_service import SignalService
-from app.services.risk_manager_service import RiskManagerService
+from app.services.risk_manager_service import analyze_risk_task
+from app.services.portfolio_allocation_service import allocate_portfolio_task
+from app.services.multi_account_risk_service import size_accounts_task
+from app.services.risk_sweep_service import sweep_risk_task
 from app.services.tracking_service import TrackingService
+from app.services.account_state_service import account_state_service, AccountStateConflict, AccountStateError
+from app.utils.correlation_engine import correlation_engines
+from app.utils.signal_screener import signal_screener
 from app.utils.response_handler import ResponseHandler
 from app.utils.logger import Logger
+from app.core.executor import executor_manager, ExecutorQueueFullError
 
 router = APIRouter()
 logger = Logger("trading_api")
 
 # Request models
+class AccountStateRef(BaseModel):
+    login: str
+    version: int  # Version trả về từ /account_state hoặc /account_state/delta
+
 class SignalRequest(BaseModel):
     cache_key: Dict[str, str]
     symbol: str
     timeframe: str
-    account_info: Dict[str, Any]
+    account_info: Optional[Dict[str, Any]] = None  # Bỏ khi gửi account_state
     balance_config: Dict[str, Any]
     max_positions: int
     active_orders_summary: str
     pending_orders_summary: str
-    portfolio_exposure: Dict[str, Any]
-    account_type_details: Dict[str, Any]
-    symbol_info: Dict[str, Any]
-    multi_timeframes: Dict[str, Any]
+    portfolio_exposure: Optional[Dict[str, Any]] = None
+    account_type_details: Optional[Dict[str, Any]] = None
+    symbol_info: Optional[Dict[str, Any]] = None  # Bỏ khi đã gửi 1 lần cho broker/symbol (cùng account_state)
+    multi_timeframes: Dict[str, Any]  # Mỗi timeframe: raw_data (list nến) hoặc raw_columns (columnar/base64) - xem app/utils/candle_codec.py
+    base_timeframe: Optional[str] = None  # M30/H1: chỉ gửi 1 chuỗi nến, server resample ra các timeframe cần thiết
+    base_time_basis: Optional[str] = None  # "server" (mặc định, time MT5) hoặc "utc"
+    account_state: Optional[AccountStateRef] = None  # Lấy account/portfolio đã lưu phía server
+    pre_check: Optional[bool] = None  # Pre-flight portfolio gate trước khi gọi AI (mặc định SIGNAL_PRE_CHECK_ENABLED)
+
+class SignalBatchRequest(BaseModel):
+    requests: List[SignalRequest]
+    batch_size: Optional[int] = None  # Số symbol tối đa / 1 lần gọi AI (mặc định SIGNAL_BATCH_SIZE)
+
+class ScreenItem(BaseModel):
+    symbol: str
+    timeframe: str
+    multi_timeframes: Dict[str, Any]  # Mỗi timeframe: indicators + analyze_price_action (không cần nến)
+    timezone: Optional[str] = None  # cache_key.timezone của broker - indicators thiếu lấy từ IndicatorEngine theo namespace này
+
+class SignalScreenRequest(BaseModel):
+    items: List[ScreenItem]
+    top_n: Optional[int] = None  # Mặc định SIGNAL_SCREEN_TOP_N
+    min_score: Optional[float] = None  # Mặc định SIGNAL_SCREENER_THRESHOLD
+
+class MarginTier(BaseModel):
+    up_to_lot: Optional[float] = None  # None = bậc cuối, không giới hạn
+    leverage: float
+
+class MarginModel(BaseModel):
+    contract_size: float
+    leverage: float
+    margin_rate: float = 1.0  # Tỉ giá margin currency -> account currency
+    price: Optional[float] = None  # Mặc định entry_price_proposed
+    tiers: Optional[List[MarginTier]] = None  # Bậc leverage theo khối lượng của broker
+
+class RollingCorrelation(BaseModel):
+    namespace: str  # cache_key.timezone của /signal (namespace của candle store)
+    threshold: Optional[float] = None  # |ρ| tối thiểu, mặc định CORRELATION_THRESHOLD
 
 class RiskManagerRequest(BaseModel):
     proposed_signal_json: Dict[str, Any]
+    account_info_json: Optional[Dict[str, Any]] = None  # Bỏ khi gửi account_state
+    symbol_info: Optional[Dict[str, Any]] = None
+    portfolio_exposure_json: Optional[Dict[str, Any]] = None
+    balance_config: Dict[str, Any]
+    correlation_groups_json: Dict[str, Any] = {}  # Có thể bỏ khi dùng rolling_correlation
+    symbol: Dict[str, str]
+    lot_size_to_margin_map: Optional[Dict[str, float]] = None  # Thiếu => tính margin theo margin_model / trade_contract_size + leverage
+    margin_model: Optional[MarginModel] = None
+    rolling_correlation: Optional[RollingCorrelation] = None  # Nhóm tương quan theo ngưỡng từ correlation engine
+    trace: bool = False  # Log chi tiết từng bước của risk manager cho request này
+    account_state: Optional[AccountStateRef] = None  # Lấy account/portfolio đã lưu phía server
+
+class RiskSweepRequest(RiskManagerRequest):
+    grid: Dict[str, List[float]]  # {tham số: [giá trị]} - xem SWEEP_PARAMETERS trong risk_sweep_service
+
+class RiskManagerBatchRequest(BaseModel):
+    proposed_signals_json: List[Dict[str, Any]]
     account_info_json: Dict[str, Any]
-    symbol_info: Dict[str, Any]
+    symbol_info_by_symbol: Dict[str, Dict[str, Any]]  # {symbol: symbol_info}
     portfolio_exposure_json: Dict[str, Any]
     balance_config: Dict[str, Any]
     correlation_groups_json: Dict[str, Any]
+    lot_size_to_margin_maps: Optional[Dict[str, Dict[str, float]]] = None  # {symbol: lot_size_to_margin_map}
+    margin_models: Optional[Dict[str, MarginModel]] = None  # {symbol: margin_model}
+
+class MultiAccountEntry(BaseModel):
+    account_info_json: Dict[str, Any]
+    portfolio_exposure_json: Dict[str, Any]
+    balance_config: Dict[str, Any]
+    lot_size_to_margin_map: Optional[Dict[str, float]] = None  # Thiếu => dùng nguồn margin chung của request
+    margin_model: Optional[MarginModel] = None
+
+class RiskManagerMultiAccountRequest(BaseModel):
+    proposed_signal_json: Dict[str, Any]
+    symbol_info: Dict[str, Any]
+    correlation_groups_json: Dict[str, Any] = {}
     symbol: Dict[str, str]
-    lot_size_to_margin_map: Dict[str, float]
+    accounts: List[MultiAccountEntry]  # Các tài khoản copy cùng 1 tín hiệu
+    lot_size_to_margin_map: Optional[Dict[str, float]] = None
+    margin_model: Optional[MarginModel] = None
+    rolling_correlation: Optional[RollingCorrelation] = None
+
+class AccountStateRequest(BaseModel):
+    login: str
+    account_info: Dict[str, Any]
+    portfolio_exposure: Dict[str, Any]
+    account_type_details: Optional[Dict[str, Any]] = None
+
+class AccountStateDeltaRequest(BaseModel):
+    login: str
+    version: int  # Version hiện tại của client
+    ops: List[Dict[str, Any]]  # Xem apply_state_delta trong account_state_service
 
 class TrackingDataRequest(BaseModel):
     login: str
@@ -45,9 +135,38 @@ class TrackingDataRequest(BaseModel):
 
 # Initialize services
 signal_service = SignalService()
-risk_manager_service = RiskManagerService()
 tracking_service = TrackingService()
 
+def _apply_rolling_correlation(request_data: Dict[str, Any]):
+    """
+    Thay correlation_groups_json bằng nhóm tương quan theo ngưỡng của correlation engine (nếu request yêu cầu)
+    Engine chưa đủ dữ liệu cho symbol => giữ correlation_groups_json của request
+    
+    Args:
+        request_data: Request data (sửa tại chỗ)
+    """
+    options = request_data.pop("rolling_correlation", None)
+    if not options:
+        return
+    signal = request_data.get("proposed_signal_json") or {}
+    symbol = signal.get("symbol") if isinstance(signal, dict) else None
+    groups = correlation_engines.correlation_groups(options["namespace"], symbol, options.get("threshold")) if isinstance(symbol, str) else None
+    if groups is None:
+        logger.warning(f"Rolling correlation unavailable for {symbol} @ {options['namespace']}, using correlation_groups_json")
+        return
+    request_data["correlation_groups_json"] = groups
+    logger.info(f"Rolling correlation group for {symbol}: {next(iter(groups.values()))}")
+
+SIGNAL_STATE_FIELDS = {"account_info": "account_info", "portfolio_exposure": "portfolio_exposure",
+                       "account_type_details": "account_type_details"}
+RISK_STATE_FIELDS = {"account_info_json": "account_info", "portfolio_exposure_json": "portfolio_exposure"}
+
+async def _hydrate_risk_request(request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Điền account/portfolio/symbol_info của request risk manager từ account_state (error response hoặc None)"""
+    signal = request_data.get("proposed_signal_json") or {}
+    symbol = signal.get("symbol") if isinstance(signal, dict) else None
+    return await account_state_service.hydrate(request_data, RISK_STATE_FIELDS, symbol)
+
 @router.post("/signal")
 async def get_signal(request: SignalRequest):
     """
@@ -64,6 +183,9 @@ async def get_signal(request: SignalRequest):
         
         # Convert Pydantic model to dict
         request_data = request.dict()
+        error = await account_state_service.hydrate(request_data, SIGNAL_STATE_FIELDS, request.symbol)
+        if error:
+            return error
         
         # Process signal with caching
         result = await signal_service.analyze_signal(request_data)
@@ -75,6 +197,70 @@ async def get_signal(request: SignalRequest):
         logger.error(f"Signal endpoint error: {str(e)}")
         return ResponseHandler.internal_server_error()
 
+@router.post("/signal/batch")
+async def get_signal_batch(request: SignalBatchRequest):
+    """
+    Batch signal endpoint - các symbol cùng main timeframe được phân tích chung 1 lần gọi AI
+    
+    Args:
+        request: Danh sách request /signal
+        
+    Returns:
+        Response /signal của từng request (theo thứ tự gửi lên) + tổng kết
+    """
+    try:
+        logger.info(f"Signal batch request received: {len(request.requests)} symbols")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(request.requests)
+        pending, pending_index = [], []
+        for index, item in enumerate(request.requests):
+            request_data = item.dict()
+            error = await account_state_service.hydrate(request_data, SIGNAL_STATE_FIELDS, item.symbol)
+            if error:
+                results[index] = error
+                continue
+            pending.append(request_data)
+            pending_index.append(index)
+        
+        for index, result in zip(pending_index, await signal_service.analyze_signal_batch(pending, request.batch_size)):
+            results[index] = result
+        
+        summary = {
+            "requests": len(results),
+            "succeeded": sum(1 for result in results if result.get("success")),
+            "batched": sum(1 for result in results if result.get("prompt_batch"))
+        }
+        logger.info(f"Signal batch request completed: {summary}")
+        return ResponseHandler.success({"results": results, "summary": summary})
+        
+    except Exception as e:
+        logger.error(f"Signal batch endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.post("/signal/screen")
+async def screen_signals(request: SignalScreenRequest):
+    """
+    Batch screening endpoint - chấm điểm setup cho nhiều symbol / timeframe trong 1 lượt, không gọi AI
+
+    Args:
+        request: Snapshot indicators + price action của từng symbol / timeframe
+
+    Returns:
+        Các candidate nên gọi /signal (điểm giảm dần) + setup dưới ngưỡng / không chấm được
+    """
+    try:
+        logger.info(f"Signal screen request received: {len(request.items)} items")
+
+        # Vài phép numpy trên snapshot nhỏ + đọc state IndicatorEngine của process chính => chạy inline
+        result = signal_screener.rank([item.dict() for item in request.items], request.top_n, request.min_score)
+
+        logger.info(f"Signal screen request completed: {result['summary']['candidates']} candidates")
+        return ResponseHandler.success(result)
+
+    except Exception as e:
+        logger.error(f"Signal screen endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
 @router.post("/risk_manager")
 async def get_risk_manager(request: RiskManagerRequest):
     """
@@ -91,17 +277,189 @@ async def get_risk_manager(request: RiskManagerRequest):
         
         # Convert Pydantic model to dict
         request_data = request.dict()
+        error = await _hydrate_risk_request(request_data)
+        if error:
+            return error
+        _apply_rolling_correlation(request_data)
         
-        # Process risk management
-        result = risk_manager_service.analyze_risk(request_data)
+        # Process risk management (CPU-bound => process pool, không block event loop)
+        result = await executor_manager.run_cpu(analyze_risk_task, request_data)
         
         logger.info(f"Risk manager request completed for {request.symbol.get('origin_name', 'unknown')}")
         return ResponseHandler.success(result)
         
+    except ExecutorQueueFullError as e:
+        logger.warning(f"Risk manager request rejected: {e}")
+        return ResponseHandler.executor_queue_full(e.pool)
     except Exception as e:
         logger.error(f"Risk manager endpoint error: {str(e)}")
         return ResponseHandler.internal_server_error()
 
+@router.post("/risk_manager/batch")
+async def get_risk_manager_batch(request: RiskManagerBatchRequest):
+    """
+    Batch risk manager endpoint - phân bổ nhiều tín hiệu trên 1 snapshot portfolio
+    
+    Args:
+        request: Danh sách tín hiệu + account/portfolio dùng chung
+        
+    Returns:
+        Quyết định cho từng tín hiệu (theo thứ tự gửi lên) + tổng kết phân bổ
+    """
+    try:
+        logger.info(f"Risk manager batch request received: {len(request.proposed_signals_json)} signals")
+        
+        # Convert Pydantic model to dict
+        request_data = request.dict()
+        
+        # CPU-bound => process pool
+        result = await executor_manager.run_cpu(allocate_portfolio_task, request_data)
+        
+        logger.info(f"Risk manager batch request completed: {result['summary']['accepted']} accepted")
+        return ResponseHandler.success(result)
+        
+    except ExecutorQueueFullError as e:
+        logger.warning(f"Risk manager batch request rejected: {e}")
+        return ResponseHandler.executor_queue_full(e.pool)
+    except Exception as e:
+        logger.error(f"Risk manager batch endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.post("/risk_manager/multi_account")
+async def get_risk_manager_multi_account(request: RiskManagerMultiAccountRequest):
+    """
+    Multi-account risk manager endpoint - tính lot cho 1 tín hiệu trên nhiều tài khoản (copy trading)
+    
+    Args:
+        request: Tín hiệu + symbol dùng chung và danh sách account/portfolio/balance_config
+        
+    Returns:
+        Quyết định cho từng tài khoản (theo thứ tự gửi lên) + tổng kết
+    """
+    try:
+        logger.info(f"Risk manager multi-account request received for {request.symbol.get('origin_name', 'unknown')}: {len(request.accounts)} accounts")
+        
+        # Convert Pydantic model to dict
+        request_data = request.dict()
+        _apply_rolling_correlation(request_data)
+        
+        # CPU-bound => process pool
+        result = await executor_manager.run_cpu(size_accounts_task, request_data)
+        
+        logger.info(f"Risk manager multi-account request completed: {result['summary']['accepted']}/{result['summary']['accounts']} accepted")
+        return ResponseHandler.success(result)
+        
+    except ExecutorQueueFullError as e:
+        logger.warning(f"Risk manager multi-account request rejected: {e}")
+        return ResponseHandler.executor_queue_full(e.pool)
+    except Exception as e:
+        logger.error(f"Risk manager multi-account endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.post("/risk_manager/sweep")
+async def get_risk_manager_sweep(request: RiskSweepRequest):
+    """
+    What-if risk manager endpoint - lot / trạng thái / lãi lỗ dự kiến trên lưới tham số rủi ro
+    
+    Args:
+        request: Giống /risk_manager + grid tham số cần quét
+        
+    Returns:
+        Kết quả theo cột cho từng điểm lưới
+    """
+    try:
+        logger.info(f"Risk manager sweep request received for {request.symbol.get('origin_name', 'unknown')}: {sorted(request.grid)}")
+        
+        # Convert Pydantic model to dict
+        request_data = request.dict()
+        error = await _hydrate_risk_request(request_data)
+        if error:
+            return error
+        _apply_rolling_correlation(request_data)
+        
+        # CPU-bound => process pool
+        result = await executor_manager.run_cpu(sweep_risk_task, request_data)
+        
+        logger.info(f"Risk manager sweep request completed: {result['points']} points")
+        return ResponseHandler.success(result)
+        
+    except ValueError as e:
+        logger.warning(f"Risk manager sweep request invalid: {e}")
+        return ResponseHandler.risk_manager_service_error(str(e))
+    except ExecutorQueueFullError as e:
+        logger.warning(f"Risk manager sweep request rejected: {e}")
+        return ResponseHandler.executor_queue_full(e.pool)
+    except Exception as e:
+        logger.error(f"Risk manager sweep endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.get("/correlation")
+async def get_correlation(namespace: str, threshold: Optional[float] = None):
+    """
+    Correlation endpoint - ma trận tương quan cuốn chiếu và các cụm symbol của 1 namespace
+    
+    Args:
+        namespace: cache_key.timezone của /signal
+        threshold: |ρ| tối thiểu để gom cụm (mặc định CORRELATION_THRESHOLD)
+        
+    Returns:
+        Symbols, ma trận tương quan (None nếu chưa đủ dữ liệu) và các cụm
+    """
+    try:
+        return ResponseHandler.success(correlation_engines.snapshot(namespace, threshold))
+    except Exception as e:
+        logger.error(f"Correlation endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.post("/account_state")
+async def put_account_state(request: AccountStateRequest):
+    """
+    Account state endpoint - lưu snapshot đầy đủ account/portfolio của 1 login
+    
+    Args:
+        request: login + account_info, portfolio_exposure, account_type_details
+        
+    Returns:
+        login và version để tham chiếu trong /signal, /risk_manager (account_state)
+    """
+    try:
+        version = await account_state_service.put(request.login, request.dict())
+        logger.info(f"Account state saved for {request.login}: version {version}")
+        return ResponseHandler.success({"login": request.login, "version": version})
+        
+    except AccountStateConflict as e:
+        logger.warning(f"Account state snapshot rejected: {e}")
+        return ResponseHandler.account_state_stale(e.login, e.version, e.current_version)
+    except Exception as e:
+        logger.error(f"Account state endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
+@router.post("/account_state/delta")
+async def apply_account_state_delta(request: AccountStateDeltaRequest):
+    """
+    Account state delta endpoint - cập nhật tăng dần state của 1 login (equity, vị thế, lệnh chờ)
+    
+    Args:
+        request: login, version hiện tại và danh sách thao tác
+        
+    Returns:
+        login và version mới; version không khớp => lỗi ACCOUNT_STATE_STALE (gửi lại snapshot),
+        thao tác không hợp lệ => lỗi ACCOUNT_STATE_INVALID
+    """
+    try:
+        version = await account_state_service.apply(request.login, request.version, request.ops)
+        return ResponseHandler.success({"login": request.login, "version": version})
+        
+    except AccountStateConflict as e:
+        logger.warning(f"Account state delta rejected: {e}")
+        return ResponseHandler.account_state_stale(e.login, e.version, e.current_version)
+    except AccountStateError as e:
+        logger.warning(f"Account state delta invalid: {e}")
+        return ResponseHandler.account_state_invalid(str(e))
+    except Exception as e:
+        logger.error(f"Account state delta endpoint error: {str(e)}")
+        return ResponseHandler.internal_server_error()
+
 @router.post("/tracking_data")
 async def save_tracking_data(request: TrackingDataRequest):
     """
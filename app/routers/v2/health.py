@@ -5,7 +5,17 @@ from fastapi import APIRouter
 from ...models.base import HealthResponse
 from ...core.database import db_manager
 from ...core.config import settings
+from ...core.executor import executor_manager
 from ...services.redis_service import redis_service
+from ...utils.analysis_cache import analysis_cache
+from ...utils.risk_rules import risk_rule_registry
+from ...utils.correlation_index import correlation_index_cache
+from ...utils.correlation_engine import correlation_engines
+from ...services.account_state_service import account_state_service
+from ...utils.signal_screener import signal_screener
+from ...utils.signal_change_detector import signal_change_detector
+from ...utils.signal_postprocessor import signal_postprocessor
+from ...utils.prompt_batch import prompt_batch_metrics
 
 router = APIRouter(tags=["Health V2"])
 
@@ -47,7 +57,17 @@ async def detailed_health_check_v2():
             }
         },
         "performance": {
-            "response_time_ms": response_time
+            "response_time_ms": response_time,
+            "executors": executor_manager.get_metrics(),
+            "analysis_cache": analysis_cache.get_metrics(),
+            "risk_rules": risk_rule_registry.get_metrics(),
+            "correlation_index": correlation_index_cache.get_metrics(),
+            "correlation_engine": correlation_engines.get_metrics(),
+            "account_state": account_state_service.get_metrics(),
+            "signal_screener": signal_screener.get_metrics(),
+            "signal_change_detector": signal_change_detector.get_metrics(),
+            "signal_postprocessor": signal_postprocessor.get_metrics(),
+            "prompt_batch": prompt_batch_metrics.get_metrics()
         },
         "config": {
             "debug_mode": settings.DEBUG,
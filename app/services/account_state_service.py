@@ -0,0 +1,352 @@
+"""
+Account State Service - Lưu trạng thái tài khoản (account_info, portfolio_exposure, account_type_details) theo MT5 login
+và symbol_info theo broker/symbol phía server
+
+Cho phép /signal, /risk_manager gửi tham chiếu {"login", "version"} thay vì toàn bộ account/portfolio mỗi lần gọi:
+- POST /account_state: snapshot đầy đủ => version mới
+- POST /account_state/delta: cập nhật tăng dần (equity tick, mở/đóng vị thế, đặt/hủy lệnh chờ) trên đúng version => version mới
+- Version không khớp (client bỏ lỡ cập nhật / state hết hạn) => client gửi lại snapshot đầy đủ
+- Redis (db_manager.redis_client) để mọi process dùng chung, ghi bằng WATCH/MULTI (compare-and-set theo version);
+  chưa kết nối Redis (script/test) => lưu in-memory
+- Version hiện tại lưu ở key riêng: mỗi tham chiếu chỉ GET version (rẻ) rồi đọc state từ cache local theo (login, version),
+  version cũ (đã có ghi mới ở process bất kỳ) luôn bị từ chối
+"""
+
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import WatchError
+
+from ..constants import ErrorCodes
+from ..core.config import settings
+from ..core.database import db_manager
+from ..utils.logger import Logger
+from ..utils.response_handler import ResponseHandler
+
+
+ACCOUNT_STATE_PREFIX = "account_state"
+ACCOUNT_VERSION_PREFIX = "account_state_version"
+SYMBOL_INFO_PREFIX = "symbol_info"
+STATE_FIELDS = ('account_info', 'portfolio_exposure', 'account_type_details')
+DEFAULT_BROKER = "default"  # account_info thiếu 'server' => symbol_info dùng chung namespace này
+WRITE_RETRIES = 3           # Số lần thử lại snapshot khi có ghi đồng thời
+
+
+class AccountStateError(ValueError):
+    """Delta / snapshot không hợp lệ"""
+
+
+class AccountStateConflict(Exception):
+    """State của login không ở version client tham chiếu (hoặc không còn)"""
+
+    def __init__(self, login: str, version: Any, current_version: Optional[int]):
+        super().__init__(f"Account state of {login} is not at version {version} (current: {current_version})")
+        self.login = login
+        self.version = version
+        self.current_version = current_version
+
+
+def apply_state_delta(state: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Áp dụng các thao tác delta lên bản sao của state
+
+    Thao tác (theo thứ tự gửi lên):
+        {"op": "account", "fields": {...}}                      - equity/balance/profit/margin tick (ghi đè account_info)
+        {"op": "position_opened", "position": {...}}            - thêm vị thế (trùng ticket => thay thế)
+        {"op": "position_updated", "ticket": t, "fields": {...}} - cập nhật profit / SL / TP của vị thế
+        {"op": "position_closed", "ticket": t}                  - bỏ vị thế
+        {"op": "order_placed", "order": {...}}                  - thêm lệnh chờ (trùng ticket => thay thế)
+        {"op": "order_removed", "ticket": t}                    - bỏ lệnh chờ (khớp / hủy)
+        {"op": "summary", "fields": {...}}                      - ghi đè portfolio_exposure.summary
+        {"op": "account_type", "fields": {...}}                 - ghi đè account_type_details
+
+    Raises:
+        AccountStateError: Thao tác không hợp lệ / ticket không tồn tại
+    """
+    state = copy.deepcopy(state)
+    portfolio = state.setdefault('portfolio_exposure', {})
+    positions = portfolio.setdefault('active_positions', [])
+    orders = portfolio.setdefault('pending_orders', [])
+
+    def index_of(items: list, ticket: Any) -> int:
+        for i, item in enumerate(items):
+            if isinstance(item, dict) and item.get('ticket') == ticket:
+                return i
+        return -1
+
+    def upsert(items: list, item: Any, name: str):
+        if not isinstance(item, dict) or item.get('ticket') is None:
+            raise AccountStateError(f"{name} must be an object with a ticket")
+        i = index_of(items, item['ticket'])
+        if i >= 0:
+            items[i] = item
+        else:
+            items.append(item)
+
+    def remove(items: list, ticket: Any, name: str):
+        i = index_of(items, ticket)
+        if i < 0:
+            raise AccountStateError(f"Unknown {name} ticket: {ticket}")
+        del items[i]
+
+    def fields_of(op: dict) -> dict:
+        fields = op.get('fields')
+        if not isinstance(fields, dict):
+            raise AccountStateError(f"'{op.get('op')}' requires 'fields' object")
+        return fields
+
+    for op in ops:
+        name = op.get('op') if isinstance(op, dict) else None
+        if name == 'account':
+            state.setdefault('account_info', {}).update(fields_of(op))
+        elif name == 'position_opened':
+            upsert(positions, op.get('position'), 'position')
+        elif name == 'position_updated':
+            i = index_of(positions, op.get('ticket'))
+            if i < 0:
+                raise AccountStateError(f"Unknown position ticket: {op.get('ticket')}")
+            positions[i] = dict(positions[i], **fields_of(op))
+        elif name == 'position_closed':
+            remove(positions, op.get('ticket'), 'position')
+        elif name == 'order_placed':
+            upsert(orders, op.get('order'), 'order')
+        elif name == 'order_removed':
+            remove(orders, op.get('ticket'), 'order')
+        elif name == 'summary':
+            portfolio.setdefault('summary', {}).update(fields_of(op))
+        elif name == 'account_type':
+            state.setdefault('account_type_details', {}).update(fields_of(op))
+        else:
+            raise AccountStateError(f"Unknown account state op: {name}")
+    return state
+
+
+class AccountStateService:
+    """Kho trạng thái tài khoản theo login (Redis, version compare-and-set) + cache symbol_info theo broker"""
+
+    def __init__(self, ttl: Optional[int] = None, symbol_info_ttl: Optional[int] = None, local_cache_size: Optional[int] = None):
+        """
+        Args:
+            ttl: Thời gian giữ state của 1 login kể từ lần ghi cuối (mặc định ACCOUNT_STATE_TTL)
+            symbol_info_ttl: Thời gian giữ symbol_info (mặc định SYMBOL_INFO_TTL)
+            local_cache_size: Số (login, version) giữ trong memory (mặc định ACCOUNT_STATE_LOCAL_CACHE)
+        """
+        self.logger = Logger("account_state_service")
+        self.ttl = ttl or settings.ACCOUNT_STATE_TTL
+        self.symbol_info_ttl = symbol_info_ttl or settings.SYMBOL_INFO_TTL
+        self.local_cache_size = local_cache_size or settings.ACCOUNT_STATE_LOCAL_CACHE
+        self._local: "OrderedDict[Tuple[str, int], str]" = OrderedDict()  # (login, version) -> JSON state
+        self._memory: Dict[str, str] = {}  # Store khi chưa kết nối Redis
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        """Redis client (None nếu chưa kết nối)"""
+        return db_manager.redis_client
+
+    @staticmethod
+    def state_key(login: Any) -> str:
+        return f"{ACCOUNT_STATE_PREFIX}:{login}"
+
+    @staticmethod
+    def version_key(login: Any) -> str:
+        return f"{ACCOUNT_VERSION_PREFIX}:{login}"
+
+    @staticmethod
+    def symbol_info_key(broker: Optional[str], symbol: str) -> str:
+        return f"{SYMBOL_INFO_PREFIX}:{broker or DEFAULT_BROKER}:{symbol}"
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def put(self, login: Any, state: Dict[str, Any]) -> int:
+        """
+        Lưu snapshot đầy đủ của tài khoản
+
+        Args:
+            login: MT5 login
+            state: {'account_info', 'portfolio_exposure', 'account_type_details'} (thiếu field => {})
+
+        Returns:
+            int: Version mới
+        """
+        snapshot = {field: state.get(field) or {} for field in STATE_FIELDS}
+        for _ in range(WRITE_RETRIES):
+            try:
+                return await self._write(str(login), None, lambda _: snapshot)
+            except AccountStateConflict:
+                continue
+        raise AccountStateConflict(str(login), None, None)
+
+    async def apply(self, login: Any, version: int, ops: List[Dict[str, Any]]) -> int:
+        """
+        Áp dụng delta lên state đang ở `version`
+
+        Returns:
+            int: Version mới
+
+        Raises:
+            AccountStateConflict: State không ở version này (client gửi lại snapshot)
+            AccountStateError: Delta không hợp lệ
+        """
+        return await self._write(str(login), version, lambda state: apply_state_delta(state, ops))
+
+    async def resolve(self, login: Any, version: int) -> Dict[str, Any]:
+        """
+        State của login tại version (bản sao riêng cho request)
+
+        Raises:
+            AccountStateConflict: State không còn / đã sang version khác
+        """
+        login = str(login)
+        # Luôn kiểm tra version hiện tại: writer khác đã ghi version mới => conflict dù version cũ còn trong cache local
+        current = await self._get(self.version_key(login))
+        if current is not None and int(current) != version:
+            raise AccountStateConflict(login, version, int(current))
+        raw = self._local.get((login, version)) if current is not None else None
+        if raw is not None:
+            self._local.move_to_end((login, version))
+            self.hits += 1
+            return json.loads(raw)['state']
+
+        self.misses += 1
+        raw = await self._get(self.state_key(login))
+        record = json.loads(raw) if raw else None
+        current = record['version'] if record else None
+        if current != version:
+            raise AccountStateConflict(login, version, current)
+        self._remember(login, version, raw)
+        return record['state']
+
+    async def put_symbol_info(self, broker: Optional[str], symbol: str, symbol_info: Dict[str, Any]):
+        """Lưu symbol_info của broker/symbol"""
+        await self._set(self.symbol_info_key(broker, symbol), json.dumps(symbol_info), self.symbol_info_ttl)
+
+    async def get_symbol_info(self, broker: Optional[str], symbol: str) -> Optional[Dict[str, Any]]:
+        """symbol_info đã lưu (None nếu chưa có)"""
+        raw = await self._get(self.symbol_info_key(broker, symbol))
+        return json.loads(raw) if raw else None
+
+    async def hydrate(self, request_data: Dict[str, Any], fields: Dict[str, str], symbol: Optional[str],
+                      symbol_info_field: str = "symbol_info") -> Optional[Dict[str, Any]]:
+        """
+        Điền các field account/portfolio/symbol_info còn thiếu của request từ state tham chiếu
+
+        - request_data["account_state"] = {"login", "version"}: field thiếu lấy từ state tại version đó
+        - symbol_info gửi kèm => lưu cho broker/symbol; thiếu => lấy bản đã lưu
+
+        Args:
+            request_data: Request data (sửa tại chỗ, bỏ key account_state)
+            fields: {field của request: field của state} (vd {"account_info_json": "account_info"})
+            symbol: Symbol để tra / lưu symbol_info
+            symbol_info_field: Tên field symbol_info của request
+
+        Returns:
+            dict: Error response hoặc None nếu request đã đủ dữ liệu
+        """
+        reference = request_data.pop("account_state", None)
+        if reference:
+            try:
+                state = await self.resolve(reference["login"], reference["version"])
+            except AccountStateConflict as e:
+                self.logger.warning(str(e))
+                return ResponseHandler.account_state_stale(e.login, e.version, e.current_version)
+            for field, state_field in fields.items():
+                if request_data.get(field) is None:
+                    request_data[field] = state.get(state_field) or {}
+
+            broker = (state.get('account_info') or {}).get('server')
+            if isinstance(symbol, str):
+                if request_data.get(symbol_info_field) is not None:
+                    await self.put_symbol_info(broker, symbol, request_data[symbol_info_field])
+                else:
+                    request_data[symbol_info_field] = await self.get_symbol_info(broker, symbol)
+
+        for field in list(fields) + [symbol_info_field]:
+            if request_data.get(field) is None:
+                return ResponseHandler.error(ErrorCodes.MISSING_REQUIRED_FIELD, field=field)
+        return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Cache local (login, version) và backend"""
+        total = self.hits + self.misses
+        return {
+            'backend': 'redis' if self.redis is not None else 'memory',
+            'cached_versions': len(self._local),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+    # ------------------------------------------------------------------
+    # Storage helpers
+    # ------------------------------------------------------------------
+    async def _write(self, login: str, expected_version: Optional[int], build) -> int:
+        """
+        Compare-and-set state của login
+
+        Args:
+            expected_version: Version hiện tại bắt buộc (None => ghi đè bất kể version)
+            build: state hiện tại -> state mới
+
+        Raises:
+            AccountStateConflict: Version không khớp hoặc có ghi đồng thời
+        """
+        key = self.state_key(login)
+        if self.redis is None:
+            version, raw = self._build_record(login, self._memory.get(key), expected_version, build)
+            self._memory[key] = raw
+            self._memory[self.version_key(login)] = str(version)
+        else:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                current = await pipe.get(key)
+                version, raw = self._build_record(login, current, expected_version, build)
+                pipe.multi()
+                pipe.set(key, raw, ex=self.ttl)
+                pipe.set(self.version_key(login), version, ex=self.ttl)
+                try:
+                    await pipe.execute()
+                except WatchError:
+                    raise AccountStateConflict(login, expected_version, None)
+        self._remember(login, version, raw)
+        return version
+
+    @staticmethod
+    def _build_record(login: str, current: Optional[str], expected_version: Optional[int], build) -> Tuple[int, str]:
+        """Record mới (version, JSON) từ record hiện tại"""
+        record = json.loads(current) if current else None
+        current_version = record['version'] if record else None
+        if expected_version is not None and current_version != expected_version:
+            raise AccountStateConflict(login, expected_version, current_version)
+
+        state = build(record['state'] if record else {})
+        # Version tăng dần và không lặp lại sau khi state hết hạn (cache local theo version luôn đúng)
+        version = max((current_version or 0) + 1, int(time.time() * 1000))
+        return version, json.dumps({'version': version, 'state': state})
+
+    def _remember(self, login: str, version: int, raw: str):
+        """Lưu (login, version) vào cache local (LRU)"""
+        self._local[(login, version)] = raw
+        self._local.move_to_end((login, version))
+        while len(self._local) > self.local_cache_size:
+            self._local.popitem(last=False)
+
+    async def _get(self, key: str) -> Optional[str]:
+        if self.redis is None:
+            return self._memory.get(key)
+        return await self.redis.get(key)
+
+    async def _set(self, key: str, raw: str, ttl: int):
+        if self.redis is None:
+            self._memory[key] = raw
+        else:
+            await self.redis.set(key, raw, ex=ttl)
+
+
+# Global service instance
+account_state_service = AccountStateService()
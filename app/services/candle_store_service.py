@@ -0,0 +1,297 @@
+"""
+Candle Store Service - Lưu nến theo (timezone, symbol, timeframe) phía server
+Cho phép client chỉ gửi các nến mới (raw_delta) thay vì upload lại toàn bộ lịch sử mỗi lần gọi /signal
+
+- MongoDB time-series collection (qua motor client của db_manager) để lưu lâu dài
+- Hot window in-memory (LRU theo key) để ghép delta không cần đọc Mongo; since không có trong hot window
+  => đọc lại Mongo 1 lần trước khi trả resync (worker khác có thể đã ghi các nến mới hơn)
+- Delta protocol: client gửi {"since": <timestamp đã được ack>, ...columns} gồm các nến có time >= since
+  (gửi lại nến đã ack vì lúc đó nến có thể chưa đóng); server ghép vào cửa sổ và trả về timestamp
+  nến cuối (candle_sync) để client dùng cho lần gửi sau
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from ..core.database import db_manager
+from ..utils.logger import Logger
+from ..utils.candle_codec import (
+    CandleColumns, CandleDecodeError, decode_columns, decode_timeframe, has_candles,
+    RAW_DELTA_KEY, PRICE_DTYPE, TIME_DTYPE
+)
+
+
+class CandleStoreService:
+    """Kho nến server-side với hot window in-memory + Mongo time-series"""
+
+    def __init__(self, window_size: Optional[int] = None, hot_keys: Optional[int] = None):
+        """
+        Args:
+            window_size: Số nến tối đa giữ cho mỗi key (mặc định CANDLE_STORE_WINDOW)
+            hot_keys: Số key tối đa giữ trong memory (mặc định CANDLE_STORE_HOT_KEYS)
+        """
+        self.logger = Logger("candle_store_service")
+        self.window_size = window_size or settings.CANDLE_STORE_WINDOW
+        self.hot_keys = hot_keys or settings.CANDLE_STORE_HOT_KEYS
+        self.collection_name = settings.CANDLE_STORE_COLLECTION
+        self._hot: "OrderedDict[str, CandleColumns]" = OrderedDict()
+        self._collection_ready = False
+
+    @property
+    def collection(self):
+        """Mongo collection (None nếu chưa kết nối database)"""
+        return db_manager.db[self.collection_name] if db_manager.db is not None else None
+
+    @staticmethod
+    def make_key(namespace: str, symbol: str, timeframe: str) -> str:
+        """Key của cửa sổ nến: namespace = timezone broker (giờ server khác nhau => nến khác nhau)"""
+        return f"{namespace}:{symbol}:{timeframe}"
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def sync_timeframes(self, namespace: str, symbol: str, multi_timeframes: Dict[str, Any],
+                              window_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Đồng bộ nến của request với store và dựng cửa sổ đầy đủ cho từng timeframe
+
+        - raw_delta: ghép vào cửa sổ đã lưu (thiếu dữ liệu => cần resync)
+        - raw_data / raw_columns: dùng trực tiếp và cập nhật store
+
+        Args:
+            namespace: Namespace của store (cache_key.timezone)
+            symbol: Symbol name
+            multi_timeframes: Multi timeframes data từ request
+            window_size: Số nến tối đa giữ cho các key này (mặc định self.window_size)
+
+        Returns:
+            dict: {
+                'success': bool,
+                'columns': {tf: CandleColumns},
+                'acks': {tf: timestamp nến cuối đã lưu},
+                'resync': [tf cần client upload lại toàn bộ],
+                'error': Optional[str]
+            }
+        """
+        result = {'success': True, 'columns': {}, 'acks': {}, 'resync': [], 'error': None}
+        for tf, tf_data in (multi_timeframes or {}).items():
+            if not has_candles(tf_data):
+                continue
+            key = self.make_key(namespace, symbol, tf)
+            try:
+                if RAW_DELTA_KEY in tf_data:
+                    columns = await self.apply_delta(key, tf_data[RAW_DELTA_KEY], window_size)
+                    if columns is None:
+                        result['resync'].append(tf)
+                        continue
+                else:
+                    columns = decode_timeframe(tf_data)
+                    columns = await self.store_window(key, columns, window_size)
+            except CandleDecodeError as e:
+                result.update(success=False, error=f"Malformed candle payload for {symbol} @ {tf}: {e}")
+                return result
+
+            result['columns'][tf] = columns
+            if columns.size and isinstance(columns.times, np.ndarray):
+                result['acks'][tf] = int(columns.times[-1])
+
+        if result['resync']:
+            result['success'] = False
+            result['error'] = f"Candle store has no continuous history for {symbol} @ {', '.join(result['resync'])}"
+        return result
+
+    async def apply_delta(self, key: str, payload: Dict[str, Any], window_size: Optional[int] = None) -> Optional[CandleColumns]:
+        """
+        Ghép delta vào cửa sổ đã lưu
+
+        Args:
+            key: Store key
+            payload: raw_delta ({"since": timestamp, ...columns})
+            window_size: Số nến tối đa của cửa sổ
+
+        Returns:
+            CandleColumns của cửa sổ đầy đủ, hoặc None nếu store không nối tiếp được (client cần resync)
+
+        Raises:
+            CandleDecodeError: Payload sai format / time không tăng dần
+        """
+        since = payload.get('since') if isinstance(payload, dict) else None
+        if not isinstance(since, int):
+            raise CandleDecodeError("raw_delta.since must be an epoch timestamp")
+        delta = self._normalize(decode_columns(payload))
+        if delta is None:
+            raise CandleDecodeError("raw_delta.time must be epoch timestamps")
+        self._check_increasing(delta, "raw_delta.time")
+
+        from_hot = key in self._hot
+        window = await self._load(key, window_size)
+        if from_hot and window.size and not self._contiguous(window, since):
+            # Hot window có thể cũ (process khác đã ghi nến mới vào Mongo) => đọc lại Mongo 1 lần trước khi bắt resync
+            window = await self._load(key, window_size, refresh=True)
+        if window is None or window.size == 0:
+            return None
+        # since phải là 1 nến trong cửa sổ đã lưu và delta phải bắt đầu đúng từ nến đó
+        if not self._contiguous(window, since) or (delta.size and delta.times[0] != since):
+            return None
+
+        merged = self._merge(window, delta, window_size)
+        self._remember(key, merged)
+        await self._persist(key, delta)
+        return merged
+
+    async def store_window(self, key: str, columns: CandleColumns, window_size: Optional[int] = None) -> CandleColumns:
+        """
+        Lưu cửa sổ client upload đầy đủ (raw_data / raw_columns)
+
+        Returns:
+            CandleColumns (times chuẩn hóa int64 nếu là epoch); không lưu nếu time không phải epoch
+
+        Raises:
+            CandleDecodeError: time không tăng dần
+        """
+        normalized = self._normalize(columns)
+        if normalized is None or normalized.size == 0:
+            return columns
+        self._check_increasing(normalized, "candle time")
+
+        previous = self._hot.get(key)
+        merged = self._merge(previous, normalized, window_size) if previous is not None else self._trim(normalized, window_size)
+        self._remember(key, merged)
+
+        # Chỉ ghi các nến từ nến cuối đã lưu trở đi (nến đang hình thành có thể đã đổi giá)
+        if previous is not None and previous.size:
+            start = int(np.searchsorted(normalized.times, previous.times[-1], side='left'))
+            await self._persist(key, self._slice(normalized, start))
+        else:
+            await self._persist(key, normalized)
+        return normalized
+
+    def get_window(self, key: str) -> Optional[CandleColumns]:
+        """Cửa sổ nến trong hot memory (None nếu chưa có)"""
+        return self._hot.get(key)
+
+    # ------------------------------------------------------------------
+    # Window helpers
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _normalize(columns: CandleColumns) -> Optional[CandleColumns]:
+        """Chuẩn hóa times về int64 (None nếu times không phải epoch)"""
+        times = columns.times
+        if not isinstance(times, np.ndarray):
+            if not all(isinstance(t, int) for t in times):
+                return None
+            times = np.asarray(times, dtype=TIME_DTYPE)
+        elif times.dtype.kind not in 'iu':
+            return None
+        return columns._replace(times=times.astype(TIME_DTYPE, copy=False))
+
+    @staticmethod
+    def _check_increasing(columns: CandleColumns, field: str):
+        """Nến trùng / lệch thứ tự phá _merge (searchsorted) và _contiguous của mọi delta sau => từ chối"""
+        if columns.size > 1 and np.any(np.diff(columns.times) <= 0):
+            raise CandleDecodeError(f"{field} must be strictly increasing")
+
+    @staticmethod
+    def _contiguous(window: CandleColumns, since: int) -> bool:
+        """since phải trùng 1 nến trong cửa sổ (client đã được ack đúng nến đó)"""
+        idx = int(np.searchsorted(window.times, since, side='left'))
+        return idx < window.size and window.times[idx] == since
+
+    def _merge(self, window: CandleColumns, delta: CandleColumns, window_size: Optional[int] = None) -> CandleColumns:
+        """Giữ các nến của cửa sổ trước delta, nối delta (ghi đè nến trùng time) và cắt theo window_size"""
+        if delta.size == 0:
+            return window
+        cut = int(np.searchsorted(window.times, delta.times[0], side='left'))
+        merged = CandleColumns(*(np.concatenate((np.asarray(old[:cut]), np.asarray(new)))
+                                 for old, new in zip(window, delta)))
+        return self._trim(merged, window_size)
+
+    def _trim(self, columns: CandleColumns, window_size: Optional[int] = None) -> CandleColumns:
+        limit = window_size or self.window_size
+        if columns.size <= limit:
+            return columns
+        return self._slice(columns, columns.size - limit)
+
+    @staticmethod
+    def _slice(columns: CandleColumns, start: int) -> CandleColumns:
+        return CandleColumns(*(col[start:] for col in columns))
+
+    def _remember(self, key: str, columns: CandleColumns):
+        self._hot[key] = columns
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_keys:
+            self._hot.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Mongo persistence
+    # ------------------------------------------------------------------
+    async def _ensure_collection(self):
+        """Tạo time-series collection nếu chưa có"""
+        if self._collection_ready or self.collection is None:
+            return
+        names = await db_manager.db.list_collection_names(filter={"name": self.collection_name})
+        if not names:
+            await db_manager.db.create_collection(
+                self.collection_name,
+                timeseries={"timeField": "ts", "metaField": "key", "granularity": "minutes"}
+            )
+        self._collection_ready = True
+
+    async def _load(self, key: str, window_size: Optional[int] = None, refresh: bool = False) -> Optional[CandleColumns]:
+        """Lấy cửa sổ từ hot memory, fallback Mongo khi nguội (refresh => bỏ qua hot memory, đọc lại Mongo)"""
+        window = None if refresh else self._hot.get(key)
+        if window is not None:
+            self._hot.move_to_end(key)
+            return window
+        if self.collection is None:
+            return None
+
+        try:
+            limit = window_size or self.window_size
+            cursor = self.collection.find({"key": key}, {"_id": 0}).sort("ts", -1).limit(limit)
+            docs = await cursor.to_list(length=limit)
+        except Exception as e:
+            self.logger.warning(f"Failed to load candles for {key}: {e}")
+            return None
+        if not docs:
+            return None
+
+        docs.reverse()
+        window = CandleColumns(
+            np.array([int(d["ts"].replace(tzinfo=timezone.utc).timestamp()) for d in docs], dtype=TIME_DTYPE),
+            *(np.array([d[field] for d in docs], dtype=PRICE_DTYPE) for field in ("o", "h", "l", "c", "v"))
+        )
+        self._remember(key, window)
+        return window
+
+    async def _persist(self, key: str, columns: CandleColumns):
+        """Ghi nến vào Mongo (xóa nến trùng time trước để cập nhật nến đang hình thành)"""
+        if self.collection is None or columns.size == 0:
+            return
+        try:
+            await self._ensure_collection()
+            first_ts = self._to_datetime(columns.times[0])
+            await self.collection.delete_many({"key": key, "ts": {"$gte": first_ts}})
+            await self.collection.insert_many(self._to_documents(key, columns), ordered=False)
+        except Exception as e:
+            # Store vẫn hoạt động bằng hot window nếu Mongo lỗi
+            self.logger.warning(f"Failed to persist candles for {key}: {e}")
+
+    @staticmethod
+    def _to_datetime(epoch: int) -> datetime:
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc)
+
+    def _to_documents(self, key: str, columns: CandleColumns) -> List[Dict[str, Any]]:
+        rows: Tuple[list, ...] = tuple(col.tolist() for col in columns)
+        return [
+            {"key": key, "ts": self._to_datetime(t), "o": o, "h": h, "l": l, "c": c, "v": v}
+            for t, o, h, l, c, v in zip(*rows)
+        ]
+
+
+# Global candle store instance
+candle_store_service = CandleStoreService()
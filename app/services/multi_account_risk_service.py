@@ -0,0 +1,473 @@
+"""
+Multi-Account Risk Service - 1 tín hiệu, nhiều tài khoản (copy trading fan-out)
+Cùng quyết định với /risk_manager cho từng tài khoản nhưng tính trong 1 lượt
+
+- Phần dùng chung (loss/lot, điều chỉnh TP, R:R, nhóm tương quan của symbol) tính 1 lần
+- Mỗi tài khoản chỉ quét portfolio 1 lần để lấy các đặc trưng (số vị thế, xung đột cùng symbol,
+  lệnh chờ bị thay thế, vị thế tương quan); phần số học (tổng rủi ro, lot, điều chỉnh portfolio,
+  lượng tử hóa, margin, lãi/lỗ dự kiến) tính trên mảng NumPy cho mọi tài khoản
+- Margin: binary search song song (map dùng chung / công thức theo leverage từng tài khoản)
+- Ngưỡng / hệ số lấy theo risk profile của từng tài khoản (risk_rules); profile khác cấu trúc mặc định,
+  tài khoản có dữ liệu ngoài phạm vi bản vectorized (thiếu số liệu, equity <= 0, margin theo bậc...)
+  đi qua đúng logic của RiskManagerService => kết quả luôn giống /risk_manager
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.logger import Logger, NullLogger
+from app.utils.risk_rules import correlation_group, is_group_member
+from app.utils.margin_solver import MarginIndex, MarginModel, _is_real, solve_max_safe_lot, solve_max_safe_lots
+from app.utils.risk_math import (
+    DEFAULT_RISK_RULES, adjust_take_profit, base_lot_size, base_risk_percent, expected_loss_per_lot,
+    portfolio_adjusted_lot, quantize_lots
+)
+from app.services.risk_manager_service import RiskManagerService
+
+
+PENDING_ORDER_TYPES = ('LIMIT', 'STOP')
+
+# Trạng thái theo từng dòng (tài khoản / điểm what-if); _SCALAR = tính bằng RiskManagerService
+STATUS_NAMES = ("CONTINUE", "HOLD", "SKIP", "STOP_TRADE")
+_CONTINUE, _HOLD, _SKIP, _STOP_TRADE, _SCALAR = 0, 1, 2, 3, 4
+
+
+class MultiAccountRiskService:
+    """Tính lot cho 1 tín hiệu trên nhiều tài khoản"""
+
+    def __init__(self, risk_service: Optional[RiskManagerService] = None, logger: Optional[Logger] = None):
+        """
+        Args:
+            risk_service: RiskManagerService dùng cho các tài khoản ngoài phạm vi bản vectorized
+            logger: Optional logger instance
+        """
+        self.logger = logger or Logger("multi_account_risk_service")
+        self.risk_service = risk_service or RiskManagerService(logger=self.logger)
+        self._quiet = NullLogger()
+        self._index_cache: Dict[int, tuple] = {}  # id(map) -> (map, MarginIndex) trong 1 request
+
+    def size_accounts(self, params: dict) -> dict:
+        """
+        Tính quyết định cho từng tài khoản
+
+        Args:
+            params (dict):
+                - proposed_signal_json, symbol_info, symbol, correlation_groups_json: dùng chung
+                - accounts: [{account_info_json, portfolio_exposure_json, balance_config,
+                              lot_size_to_margin_map?, margin_model?}]
+                - lot_size_to_margin_map, margin_model: Optional, dùng cho tài khoản không tự gửi
+
+        Returns:
+            dict: {
+                'decisions': [kết quả như /risk_manager + 'login', theo thứ tự accounts],
+                'summary': {'accounts', 'accepted', 'rejected', 'total_lot_size', 'vectorized', 'fallback'}
+            }
+        """
+        accounts: List[dict] = params.get('accounts') or []
+        signal = params.get('proposed_signal_json') or {}
+        symbol = signal.get('symbol', 'UNKNOWN') if isinstance(signal, dict) else 'UNKNOWN'
+        self.logger.info(f"=== MULTI-ACCOUNT RISK: {symbol}, {len(accounts)} tài khoản ===")
+
+        decisions: List[Optional[dict]] = [None] * len(accounts)
+        shared = self._prepare_signal(signal, params.get('symbol_info') or {}, params.get('correlation_groups_json') or {})
+        self._index_cache.clear()
+        if shared is None:
+            status = np.full(len(accounts), _SCALAR, dtype=np.int8)
+        else:
+            features = self._collect_features(accounts, signal, symbol, shared)
+            status = self._gate(features, features['max_positions'], features['vTotalRiskCap'], features['vRisk'])
+            sized = self._size_rows(features, shared, status, params, signal)
+            self._build_decisions(features, shared, sized, signal, symbol, decisions)
+
+        scalar_rows = np.flatnonzero(status == _SCALAR).tolist()
+        for i in scalar_rows:
+            decisions[i] = self.risk_service._analyze_risk_enhanced(self._single_params(params, accounts[i]), self._quiet)
+
+        for i, account in enumerate(accounts):
+            account_info = account.get('account_info_json') if isinstance(account, dict) else None
+            decisions[i]['login'] = account_info.get('login') if isinstance(account_info, dict) else None
+
+        fallback = len(scalar_rows)
+        accepted = [d for d in decisions if d['status'] == "CONTINUE"]
+        result = {
+            'decisions': decisions,
+            'summary': {
+                'accounts': len(decisions),
+                'accepted': len(accepted),
+                'rejected': len(decisions) - len(accepted),
+                'total_lot_size': round(sum(d['lot_size'] for d in accepted), 2),
+                'vectorized': len(decisions) - fallback,
+                'fallback': fallback
+            }
+        }
+        self.logger.info(f"=== KẾT THÚC MULTI-ACCOUNT RISK: {len(accepted)}/{len(decisions)} tài khoản vào lệnh "
+                         f"({fallback} tài khoản tính riêng) ===")
+        return result
+
+    # ------------------------------------------------------------------
+    # Shared / per-account preparation
+    # ------------------------------------------------------------------
+    def _prepare_signal(self, signal: dict, symbol_info: dict, correlation_groups: dict) -> Optional[dict]:
+        """
+        Các giá trị chỉ phụ thuộc tín hiệu + symbol
+
+        Returns:
+            dict hoặc None nếu tín hiệu / symbol_info ngoài phạm vi bản vectorized
+        """
+        if not isinstance(signal, dict) or not isinstance(symbol_info, dict) or not isinstance(correlation_groups, dict):
+            return None
+        try:
+            limits = [symbol_info.get('volume_min'), symbol_info.get('volume_max'), symbol_info.get('volume_step')]
+            win_probability = signal.get('estimate_win_probability', 50)
+            if not all(_is_real(v) for v in limits + [win_probability]) or not limits[2] > 0:
+                return None
+            entry = float(signal.get('entry_price_proposed'))
+            stop_loss = float(signal.get('stop_loss_proposed'))
+            take_profit = float(signal.get('take_profit_proposed'))
+            tick_size = float(symbol_info.get('trade_tick_size', 0))
+            tick_value = float(symbol_info.get('trade_tick_value', 0))
+            is_buy = signal.get('signal_type').upper() == 'BUY'
+            # Nhóm tương quan đầu tiên chứa symbol (inverted index dùng chung, như PortfolioSnapshot)
+            group = correlation_group(correlation_groups, signal.get('symbol', 'UNKNOWN'))
+            group_symbols, group_set = group if group is not None else (None, None)
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+        loss_per_lot = float(expected_loss_per_lot(entry, stop_loss, tick_size, tick_value))
+        take_profit_adjusted, rr_before, rr_after = (float(v) for v in adjust_take_profit(entry, stop_loss, take_profit, is_buy))
+
+        return {
+            'volume_min': limits[0], 'volume_max': limits[1], 'volume_step': limits[2],
+            'risk_percent': float(base_risk_percent(win_probability)),
+            'entry': entry,
+            'stop_loss': stop_loss,
+            'loss_per_lot': loss_per_lot,
+            'take_profit': take_profit_adjusted,
+            'rr_before': rr_before,
+            'rr_after': rr_after,
+            'group_symbols': group_symbols,
+            'group_set': group_set,
+            'is_pending': signal.get('order_type_proposed') in PENDING_ORDER_TYPES
+        }
+
+    def _collect_features(self, accounts: List[dict], signal: dict, symbol: str, shared: dict) -> dict:
+        """
+        Quét portfolio từng tài khoản 1 lần (xung đột cùng symbol, lệnh chờ bị thay thế, vị thế tương quan)
+        và lấy tham số luật từ risk profile của tài khoản
+
+        Returns:
+            dict: Mảng đặc trưng theo dòng ('account' = vị trí tài khoản trong accounts,
+                  các khóa của DEFAULT_RISK_RULES = tham số luật, 'profiles' = RuleProfile)
+        """
+        n = len(accounts)
+        numbers = np.zeros((10, n), dtype=np.float64)
+        rule_values = np.tile(np.array(list(DEFAULT_RISK_RULES.values()), dtype=np.float64)[:, None], (1, n))
+        profiles: List[Any] = [None] * n
+        registry = self.risk_service.rule_registry
+        conflict = np.zeros(n, dtype=bool)
+        scalar = np.zeros(n, dtype=bool)
+        tickets: List[Optional[list]] = [None] * n
+        correlated: List[list] = [[] for _ in range(n)]
+        group_symbols, group_set = shared['group_symbols'], shared['group_set']
+        signal_type = signal.get('signal_type', '')
+
+        for i, account in enumerate(accounts):
+            try:
+                account_info = account['account_info_json']
+                portfolio = account['portfolio_exposure_json']
+                balance_config = account['balance_config']
+                profiles[i] = registry.resolve(account_info, balance_config)
+                if profiles[i].vector_rules is None:
+                    raise ValueError("risk profile outside vectorized pipeline")
+                rule_values[:, i] = [profiles[i].vector_rules[name] for name in DEFAULT_RISK_RULES]
+                summary = portfolio.get('summary', {})
+                values = (
+                    account_info.get('equity', 0), account_info.get('balance', 0), account_info.get('profit', 0),
+                    balance_config.get('max_risk', 2.0), balance_config.get('total_max_risk', 6.0),
+                    balance_config.get('max_position', 5),
+                    summary.get('total_potential_loss_from_portfolio_usd', 0.0),
+                    summary.get('total_margin_used_from_portfolio_usd', 0.0)
+                )
+                if not all(_is_real(v) for v in values) or not values[0] > 0:
+                    raise ValueError("outside vectorized range")
+                active = portfolio.get('active_positions', [])
+                pending = portfolio.get('pending_orders', [])
+                numbers[:, i] = values + (len(active), len(pending))
+
+                # STEP 1b: vị thế cùng symbol đang lỗ / ngược hướng (lấy luôn vị thế tương quan)
+                for position in active:
+                    if position.get('symbol') == symbol and not conflict[i]:
+                        position_profit = position.get('profit', 0)
+                        if position_profit < 0 or (position_profit >= 0 and position.get('type', '') != signal_type):
+                            conflict[i] = True
+                    if group_symbols is not None and is_group_member(position.get('symbol'), group_symbols, group_set):
+                        correlated[i].append(position.get('symbol'))
+                # STEP 1c: lệnh chờ cùng symbol được thay thế
+                if shared['is_pending']:
+                    tickets[i] = [order.get('ticket') for order in pending if order.get('symbol') == symbol] or None
+            except Exception:
+                scalar[i] = True
+
+        equity, balance, profit, vRisk, vTotalRiskCap, max_positions, existing_loss, existing_margin, \
+            num_active, num_pending = numbers
+        features = {
+            'account': np.arange(n), 'equity': equity, 'balance': balance, 'profit': profit,
+            'vRisk': vRisk, 'vTotalRiskCap': vTotalRiskCap, 'max_positions': max_positions,
+            'existing_loss': existing_loss, 'existing_margin': existing_margin,
+            'num_active': num_active, 'num_pending': num_pending,
+            'conflict': conflict, 'scalar': scalar, 'tickets': tickets, 'correlated': correlated,
+            'profiles': profiles
+        }
+        features.update(zip(DEFAULT_RISK_RULES, rule_values))
+        return features
+
+    @staticmethod
+    def _take_rows(features: dict, rows: np.ndarray) -> dict:
+        """Đặc trưng của các dòng được chọn (lặp lại 1 tài khoản nhiều lần cho what-if)"""
+        return {key: ([value[j] for j in rows] if isinstance(value, list) else value[rows])
+                for key, value in features.items()}
+
+    # ------------------------------------------------------------------
+    # Vectorized pipeline
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _gate(features: dict, max_positions, vTotalRiskCap, vRisk) -> np.ndarray:
+        """
+        STEP 1 (pre-flight) cho mọi dòng, cùng thứ tự với _perform_pre_flight_checks
+
+        Returns:
+            np.ndarray: _CONTINUE / _SKIP / _STOP_TRADE / _SCALAR theo dòng
+        """
+        equity = features['equity']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            total_risk_percent = ((features['existing_loss'] + equity * (np.asarray(vRisk) / 100)) / equity) * 100
+        replaces_pending = np.array([t is not None for t in features['tickets']], dtype=bool)
+        return np.select(
+            [features['scalar'],
+             features['num_active'] >= np.trunc(max_positions),
+             features['conflict'],
+             replaces_pending,
+             total_risk_percent > vTotalRiskCap],
+            [_SCALAR, _STOP_TRADE, _SKIP, _CONTINUE, _STOP_TRADE],
+            default=_CONTINUE
+        ).astype(np.int8)
+
+    def _size_rows(self, features: dict, shared: dict, status: np.ndarray, params: dict, signal: dict,
+                   rules: Optional[dict] = None) -> dict:
+        """
+        STEP 3-4 cho các dòng _CONTINUE
+
+        Args:
+            rules: Ghi đè tham số luật của profile (float hoặc mảng theo dòng)
+
+        Returns:
+            dict: {'status', 'lots', 'estimate_loss', 'estimate_profit'} theo dòng (NaN nếu không vào lệnh)
+        """
+        rules = {**{name: features[name] for name in DEFAULT_RISK_RULES}, **(rules or {})}
+        status = status.copy()
+        n = status.size
+        lots = np.full(n, np.nan)
+        rows = np.flatnonzero(status == _CONTINUE)
+
+        def at(value):
+            return value[rows] if isinstance(value, np.ndarray) and value.ndim else value
+
+        if rows.size:
+            # STEP 3a-3c
+            risk_percent = np.minimum(shared['risk_percent'], at(features['vRisk']))
+            base = base_lot_size(at(features['equity']), risk_percent, shared['loss_per_lot'])
+            adjusted = portfolio_adjusted_lot(
+                base, at(features['profit']), at(features['balance']),
+                np.full(rows.size, shared['group_symbols'] is not None),
+                np.array([len(features['correlated'][i]) for i in rows]),
+                at(features['num_active']), at(features['num_pending']),
+                drawdown_threshold=at(rules['drawdown_threshold']), drawdown_factor=at(rules['drawdown_factor']),
+                correlation_factor=at(rules['correlation_factor']),
+                high_positions_factor=at(rules['high_positions_factor']),
+                low_positions_factor=at(rules['low_positions_factor'])
+            )
+            initial = quantize_lots(adjusted, shared['volume_min'], shared['volume_max'], shared['volume_step'])
+            min_free = np.broadcast_to(at(rules['min_free_margin_percent']), rows.shape)
+            max_usage = np.broadcast_to(at(rules['max_margin_usage_percent']), rows.shape)
+            lots[rows] = self._fit_margins(
+                rows, adjusted, initial, features, shared, params, signal, min_free, max_usage
+            )
+            status[rows[np.isnan(lots[rows])]] = _HOLD
+
+        # STEP 4: lãi/lỗ dự kiến với lot cuối cùng
+        estimate_loss = -np.abs(lots * shared['loss_per_lot'])
+        sl_distance = abs(shared['entry'] - shared['stop_loss'])
+        tp_distance = abs(shared['take_profit'] - shared['entry'])
+        if sl_distance > 0:
+            estimate_profit = np.abs((tp_distance / sl_distance) * estimate_loss)
+        else:
+            estimate_profit = np.where(np.isnan(lots), np.nan, 0.0)
+        return {'status': status, 'lots': lots, 'estimate_loss': estimate_loss, 'estimate_profit': estimate_profit}
+
+    def _fit_margins(self, rows: np.ndarray, adjusted: np.ndarray, initial: np.ndarray, features: dict,
+                     shared: dict, params: dict, signal: dict, min_free: np.ndarray, max_usage: np.ndarray) -> np.ndarray:
+        """
+        STEP 3d: lot lớn nhất an toàn ký quỹ theo nguồn margin của từng tài khoản
+
+        Map dùng chung (đơn điệu) / công thức không bậc => binary search song song; còn lại giải từng dòng
+        (solve_max_safe_lot, cuối cùng là _fit_lot_to_margin với profile của tài khoản nếu solver không hỗ trợ).
+
+        Returns:
+            np.ndarray: Lot theo vị trí trong rows, NaN = HOLD
+        """
+        lots = np.full(rows.size, np.nan)
+        valid = np.flatnonzero(np.isfinite(initial))
+        accounts = features['account'][rows]
+        sources = {int(i): self._margin_source(params, int(i), signal) for i in np.unique(accounts[valid])}
+
+        by_index: Dict[int, list] = {}
+        modelled, singles = [], []
+        for k in valid.tolist():
+            kind, source = sources[int(accounts[k])]
+            if kind == 'map' and source is not None:
+                by_index.setdefault(id(source), []).append(k)
+            elif kind == 'model' and not source.tiers:
+                modelled.append(k)
+            elif kind != 'none':
+                singles.append(k)
+
+        groups = [(members, sources[int(accounts[members[0]])][1], None) for members in by_index.values()]
+        if modelled:
+            models = [sources[int(accounts[k])][1] for k in modelled]
+            groups.append((modelled, None, tuple(
+                np.array([getattr(m, name) for m in models], dtype=np.float64)
+                for name in ('contract_size', 'price', 'margin_rate', 'leverage')
+            )))
+        for members, margin_index, margin_params in groups:
+            members = np.asarray(members, dtype=np.int64)
+            picked = rows[members]
+            solved = solve_max_safe_lots(
+                initial[members], shared['volume_min'], shared['volume_step'],
+                features['equity'][picked], features['existing_margin'][picked],
+                min_free[members], max_usage[members], margin_index=margin_index, margin_params=margin_params
+            )
+            if solved is None:
+                singles.extend(members.tolist())
+            else:
+                lots[members] = solved[0]
+
+        for k in singles:
+            i = int(rows[k])
+            kind, source = sources[int(accounts[k])]
+            solution = solve_max_safe_lot(
+                float(initial[k]), shared['volume_min'], shared['volume_step'],
+                float(features['equity'][i]), float(features['existing_margin'][i]),
+                float(min_free[k]), float(max_usage[k]),
+                margin_index=source if kind == 'map' else None,
+                margin_fn=source.margin if kind == 'model' else None
+            ) if source is not None else None
+            if solution is None:
+                account = params['accounts'][int(accounts[k])]
+                sizing = self.risk_service._fit_lot_to_margin(
+                    float(adjusted[k]), signal, account['account_info_json'], params.get('symbol_info') or {},
+                    account['portfolio_exposure_json'], features['correlated'][i],
+                    self._margin_params(params, account), self._quiet, profile=features['profiles'][i]
+                )
+                lots[k] = sizing['final_lot_size'] if sizing.get('status') != "HOLD" else np.nan
+            elif solution.lot is not None:
+                lots[k] = solution.lot
+        return lots
+
+    def _margin_source(self, params: dict, i: int, signal: dict):
+        """
+        Nguồn margin của tài khoản (cùng thứ tự ưu tiên với _fit_lot_to_margin: map > margin_model > công thức)
+
+        Returns:
+            tuple: ('map', MarginIndex | None) / ('model', MarginModel) / ('none', None) khi không tính được margin
+        """
+        account = params['accounts'][i]
+        margin_params = self._margin_params(params, account)
+        margin_map = margin_params['lot_size_to_margin_map']
+        if isinstance(margin_map, dict) and margin_map:
+            cached = self._index_cache.get(id(margin_map))
+            if cached is None or cached[0] is not margin_map:
+                cached = (margin_map, MarginIndex.from_map(margin_map))
+                self._index_cache[id(margin_map)] = cached
+            return 'map', cached[1]
+
+        margin_model = margin_params['margin_model']
+        if not isinstance(margin_model, dict):
+            margin_model = {
+                'contract_size': (params.get('symbol_info') or {}).get('trade_contract_size'),
+                'leverage': account['account_info_json'].get('leverage')
+            }
+        model = MarginModel.from_dict(margin_model, entry_price=signal.get('entry_price_proposed'))
+        return ('model', model) if model is not None else ('none', None)
+
+    def _build_decisions(self, features: dict, shared: dict, sized: dict, signal: dict, symbol: str,
+                         decisions: List[Optional[dict]]):
+        """Kết quả như /risk_manager cho các dòng không phải _SCALAR"""
+        risk = self.risk_service
+        rr_before = None if np.isnan(shared['rr_before']) else shared['rr_before']
+        rr_after = None if np.isnan(shared['rr_after']) else shared['rr_after']
+        templates = {code: risk._build_final_response(status=STATUS_NAMES[code], symbol=symbol, proposed_signal=signal)
+                     for code in (_HOLD, _SKIP, _STOP_TRADE)}
+
+        for k, code in enumerate(sized['status'].tolist()):
+            if code == _SCALAR:
+                continue
+            if code != _CONTINUE:
+                decisions[k] = dict(templates[code])
+                continue
+            decisions[k] = risk._build_final_response(
+                status="CONTINUE",
+                symbol=symbol,
+                proposed_signal=signal,
+                lot_size=float(sized['lots'][k]),
+                take_profit=shared['take_profit'],
+                estimate_profit=float(sized['estimate_profit'][k]) if shared['entry'] != shared['stop_loss'] else 0,
+                estimate_loss=float(sized['estimate_loss'][k]),
+                risk_reward_before=rr_before,
+                risk_reward_after=rr_after,
+                correlated_symbols=list(features['correlated'][k]),
+                tickets_to_delete=features['tickets'][k]
+            )
+
+    @staticmethod
+    def _margin_params(params: dict, account: dict) -> dict:
+        """Nguồn margin của tài khoản: của riêng tài khoản nếu có, ngược lại dùng chung"""
+        own = {'lot_size_to_margin_map': account.get('lot_size_to_margin_map'), 'margin_model': account.get('margin_model')}
+        if own['lot_size_to_margin_map'] or own['margin_model']:
+            return own
+        return {'lot_size_to_margin_map': params.get('lot_size_to_margin_map'), 'margin_model': params.get('margin_model')}
+
+    def _single_params(self, params: dict, account: Any) -> dict:
+        """params của /risk_manager cho 1 tài khoản"""
+        account = account if isinstance(account, dict) else {}
+        single = {
+            'proposed_signal_json': params.get('proposed_signal_json'),
+            'account_info_json': account.get('account_info_json', {}),
+            'symbol_info': params.get('symbol_info', {}),
+            'portfolio_exposure_json': account.get('portfolio_exposure_json', {}),
+            'balance_config': account.get('balance_config', {}),
+            'correlation_groups_json': params.get('correlation_groups_json', {}),
+            'symbol': params.get('symbol', {})
+        }
+        single.update(self._margin_params(params, account))
+        return single
+
+
+# Process pool entry point
+_worker_service: Optional[MultiAccountRiskService] = None
+
+
+def size_accounts_task(params: dict) -> dict:
+    """
+    Chạy MultiAccountRiskService.size_accounts trong worker (hàm cấp module để pickle được)
+
+    Args:
+        params (dict): Giống MultiAccountRiskService.size_accounts
+
+    Returns:
+        dict: Multi-account sizing result
+    """
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = MultiAccountRiskService()
+    return _worker_service.size_accounts(params)
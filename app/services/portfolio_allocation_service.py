@@ -0,0 +1,306 @@
+"""
+Portfolio Allocation Service - Phân bổ nhiều tín hiệu đề xuất trên 1 snapshot portfolio
+Dùng cho các tín hiệu xuất hiện cùng lúc (cùng 1 lần đóng nến) thay vì gọi /risk_manager tuần tự
+
+- Các bước không phụ thuộc portfolio (rủi ro theo win probability, loss/lot, lot ban đầu, R:R) tính 1 lượt bằng NumPy
+- Xếp hạng theo estimate_win_probability rồi R:R (trước điều chỉnh), giảm dần
+- Phân bổ lần lượt theo hạng: mỗi tín hiệu được đánh giá bằng đúng logic của RiskManagerService
+  (pre-flight, điều chỉnh portfolio, margin) trên snapshot đã cộng các lệnh được chấp nhận trước nó
+  => total_max_risk / max_position áp dụng cho cả nhóm
+- Mỗi symbol chỉ được phân bổ 1 lệnh trong 1 batch
+"""
+
+import copy
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.logger import Logger, NullLogger
+from app.utils.response_logger import response_logger
+from app.utils.risk_math import adjust_take_profit, base_lot_size, base_risk_percent, expected_loss_per_lot
+from app.utils.risk_rules import PortfolioSnapshot
+from app.services.risk_manager_service import RiskManagerService, resolve_max_positions
+
+
+PENDING_ORDER_TYPES = ('LIMIT', 'STOP')
+
+
+class PortfolioAllocationService:
+    """Phân bổ N tín hiệu đề xuất trong giới hạn rủi ro của 1 tài khoản"""
+
+    def __init__(self, risk_service: Optional[RiskManagerService] = None, logger: Optional[Logger] = None):
+        """
+        Args:
+            risk_service: RiskManagerService dùng cho các bước phụ thuộc portfolio
+            logger: Optional logger instance
+        """
+        self.logger = logger or Logger("portfolio_allocation_service")
+        self.risk_service = risk_service or RiskManagerService(logger=self.logger)
+        self._quiet = NullLogger()
+
+    def allocate(self, params: dict) -> dict:
+        """
+        Phân bổ các tín hiệu đề xuất
+
+        Args:
+            params (dict):
+                - proposed_signals_json: List tín hiệu (cùng format proposed_signal_json)
+                - account_info_json, portfolio_exposure_json, balance_config, correlation_groups_json
+                - symbol_info_by_symbol: {symbol: symbol_info}
+                - lot_size_to_margin_maps: Optional {symbol: lot_size_to_margin_map}
+                - margin_models: Optional {symbol: margin_model}
+
+        Returns:
+            dict: {
+                'decisions': [kết quả như /risk_manager + 'rank', theo thứ tự input],
+                'summary': {'accepted', 'rejected', 'total_risk_percent_after', 'active_positions_after', 'pending_orders_after'}
+            }
+        """
+        signals: List[dict] = params.get('proposed_signals_json') or []
+        account_info = params.get('account_info_json', {})
+        balance_config = params.get('balance_config', {})
+        equity = float(account_info.get('equity', 0))
+        vRisk = float(balance_config.get('max_risk', 2.0))
+        vTotalRiskCap = float(balance_config.get('total_max_risk', 6.0))
+        max_positions = resolve_max_positions(balance_config)
+        self.logger.info(f"=== PORTFOLIO ALLOCATION: {len(signals)} tín hiệu, equity=${equity:.2f} ===")
+
+        prepared = self._prepare_signals(signals, params.get('symbol_info_by_symbol') or {}, equity, vRisk)
+        working = self._copy_portfolio(params.get('portfolio_exposure_json', {}))
+        decisions: List[Optional[dict]] = [None] * len(signals)
+        allocated_symbols = set()
+
+        for rank, i in enumerate(self._rank(prepared), start=1):
+            signal = signals[i]
+            symbol = signal.get('symbol', 'UNKNOWN') if isinstance(signal, dict) else 'UNKNOWN'
+            if prepared['errors'][i]:
+                decision = self._reject("SKIP", symbol, signal, f"Unexpected error: {prepared['errors'][i]}")
+            elif symbol in allocated_symbols:
+                decision = self._reject("SKIP", symbol, signal, "Symbol already allocated in this batch")
+            else:
+                decision, allocation = self._evaluate(
+                    i, signal, symbol, prepared, working, params, equity, vRisk, vTotalRiskCap, max_positions
+                )
+                if allocation:
+                    allocated_symbols.add(symbol)
+                    self._apply_allocation(working, signal, symbol, decision, allocation)
+            decision['rank'] = rank
+            decisions[i] = decision
+            self.logger.info(f"   #{rank} {symbol}: {decision['status']} lot={decision['lot_size']}")
+
+        summary = working['summary']
+        accepted = sum(1 for d in decisions if d['status'] == "CONTINUE")
+        result = {
+            'decisions': decisions,
+            'summary': {
+                'accepted': accepted,
+                'rejected': len(decisions) - accepted,
+                'total_risk_percent_after': (
+                    round(summary.get('total_potential_loss_from_portfolio_usd', 0.0) / equity * 100, 4) if equity else None
+                ),
+                'active_positions_after': len(working['active_positions']),
+                'pending_orders_after': len(working['pending_orders'])
+            }
+        }
+        self.logger.info(f"=== KẾT THÚC PORTFOLIO ALLOCATION: {accepted}/{len(decisions)} tín hiệu được chấp nhận ===")
+
+        try:
+            response_logger.log_risk_manager_response(symbol="BATCH", response_data=result, request_data=params)
+        except Exception as log_error:
+            self.logger.warning(f"Failed to log portfolio allocation response: {log_error}")
+        return result
+
+    # ------------------------------------------------------------------
+    # Vectorized pass
+    # ------------------------------------------------------------------
+    def _prepare_signals(self, signals: List[dict], symbol_infos: Dict[str, dict], equity: float, vRisk: float) -> dict:
+        """Tính 1 lượt cho mọi tín hiệu các bước không phụ thuộc portfolio"""
+        n = len(signals)
+        fields = np.zeros((6, n), dtype=np.float64)  # entry, sl, tp, win_probability, tick_size, tick_value
+        is_buy = np.zeros(n, dtype=bool)
+        errors: List[Optional[str]] = [None] * n
+
+        for i, signal in enumerate(signals):
+            try:
+                symbol_info = symbol_infos.get(signal.get('symbol'))
+                if not isinstance(symbol_info, dict):
+                    raise ValueError(f"Missing symbol_info for {signal.get('symbol')}")
+                fields[:, i] = (
+                    float(signal.get('entry_price_proposed')), float(signal.get('stop_loss_proposed')),
+                    float(signal.get('take_profit_proposed')), float(signal.get('estimate_win_probability', 50)),
+                    float(symbol_info.get('trade_tick_size', 0)), float(symbol_info.get('trade_tick_value', 0))
+                )
+                is_buy[i] = signal.get('signal_type').upper() == 'BUY'
+            except Exception as e:
+                errors[i] = str(e)
+
+        entry, stop_loss, take_profit, win_probability, tick_size, tick_value = fields
+        loss_per_lot = expected_loss_per_lot(entry, stop_loss, tick_size, tick_value)
+        risk_percent = np.minimum(base_risk_percent(win_probability), vRisk)
+        take_profit_adjusted, rr_before, rr_after = adjust_take_profit(entry, stop_loss, take_profit, is_buy)
+        return {
+            'entry': entry,
+            'stop_loss': stop_loss,
+            'win_probability': win_probability,
+            'loss_per_lot': loss_per_lot,
+            'base_lot': base_lot_size(equity, risk_percent, loss_per_lot),
+            'take_profit': take_profit_adjusted,
+            'rr_before': rr_before,
+            'rr_after': rr_after,
+            'symbol_infos': symbol_infos,
+            'errors': errors
+        }
+
+    @staticmethod
+    def _rank(prepared: dict) -> List[int]:
+        """Thứ tự xét: win probability rồi R:R giảm dần (tín hiệu lỗi xét sau cùng)"""
+        rr = np.nan_to_num(prepared['rr_before'], nan=0.0)
+        failed = np.array([e is not None for e in prepared['errors']], dtype=bool)
+        # lexsort: key cuối là key chính
+        return np.lexsort((-rr, -prepared['win_probability'], failed)).tolist()
+
+    # ------------------------------------------------------------------
+    # Sequential allocation (logic của RiskManagerService)
+    # ------------------------------------------------------------------
+    def _evaluate(self, i: int, signal: dict, symbol: str, prepared: dict, working: dict, params: dict,
+                  equity: float, vRisk: float, vTotalRiskCap: float, max_positions: int):
+        """
+        Đánh giá 1 tín hiệu trên snapshot hiện tại
+
+        Returns:
+            tuple: (decision, allocation) - allocation None nếu không được chấp nhận
+        """
+        risk = self.risk_service
+        account_info = params.get('account_info_json', {})
+        symbol_info = prepared['symbol_infos'][symbol]
+        correlation_groups = params.get('correlation_groups_json', {})
+        try:
+            # Profile luật của tài khoản + snapshot hiện tại (đã cộng các lệnh được chấp nhận trước) quét 1 lần
+            profile = risk.rule_registry.resolve(account_info, params.get('balance_config', {}))
+            snapshot = PortfolioSnapshot.build(working, symbol, signal.get('signal_type', ''), correlation_groups)
+            status, reason, pre_flight_data = risk._perform_pre_flight_checks(
+                symbol=symbol, proposed_signal=signal, portfolio_exposure=working, max_positions=max_positions,
+                equity=equity, vTotalRiskCap=vTotalRiskCap, symbol_info=symbol_info, vRisk=vRisk, logger=self._quiet,
+                profile=profile, snapshot=snapshot
+            )
+            if status != "CONTINUE":
+                return self._reject(status, symbol, signal, reason), None
+
+            if not prepared['loss_per_lot'][i] > 0:
+                return self._reject("HOLD", symbol, signal, "Lot size too small"), None
+            adjusted_lot, correlated_symbols = risk._apply_portfolio_adjustments(
+                float(prepared['base_lot'][i]), signal, account_info, working,
+                correlation_groups, self._quiet, profile=profile, snapshot=snapshot
+            )
+            sizing = risk._fit_lot_to_margin(
+                adjusted_lot, signal, account_info, symbol_info, working, correlated_symbols,
+                self._symbol_params(params, symbol), self._quiet, profile=profile
+            )
+            if sizing.get('status') == "HOLD":
+                return self._reject("HOLD", symbol, signal, "Lot size too small"), None
+        except Exception as e:
+            return self._reject("SKIP", symbol, signal, f"Unexpected error: {str(e)}"), None
+
+        lot_size = sizing['final_lot_size']
+        estimate_loss = -abs(lot_size * float(prepared['loss_per_lot'][i]))
+        entry, take_profit = float(prepared['entry'][i]), float(prepared['take_profit'][i])
+        sl_distance = abs(entry - float(prepared['stop_loss'][i]))
+        tp_distance = abs(take_profit - entry)
+        estimate_profit = abs((tp_distance / sl_distance) * estimate_loss) if sl_distance > 0 else 0
+
+        rr_before, rr_after = float(prepared['rr_before'][i]), float(prepared['rr_after'][i])
+        decision = risk._build_final_response(
+            status="CONTINUE",
+            symbol=symbol,
+            proposed_signal=signal,
+            lot_size=lot_size,
+            take_profit=take_profit,
+            estimate_profit=estimate_profit,
+            estimate_loss=estimate_loss,
+            risk_reward_before=None if np.isnan(rr_before) else rr_before,
+            risk_reward_after=None if np.isnan(rr_after) else rr_after,
+            correlated_symbols=sizing.get('correlated_symbols', []),
+            tickets_to_delete=pre_flight_data.get('tickets_to_delete')
+        )
+        return decision, {'margin_usd': sizing.get('margin_usd') or 0.0, 'risk_usd': abs(estimate_loss)}
+
+    def _reject(self, status: str, symbol: str, signal: Any, reason: str) -> dict:
+        decision = self.risk_service._build_final_response(
+            status=status, symbol=symbol, proposed_signal=signal if isinstance(signal, dict) else {}
+        )
+        decision['reason'] = reason
+        return decision
+
+    @staticmethod
+    def _symbol_params(params: dict, symbol: str) -> dict:
+        """margin map / margin model của symbol theo format params của RiskManagerService"""
+        return {
+            'lot_size_to_margin_map': (params.get('lot_size_to_margin_maps') or {}).get(symbol),
+            'margin_model': (params.get('margin_models') or {}).get(symbol)
+        }
+
+    @staticmethod
+    def _copy_portfolio(portfolio_exposure: dict) -> dict:
+        return {
+            'active_positions': copy.copy(portfolio_exposure.get('active_positions', [])),
+            'pending_orders': copy.copy(portfolio_exposure.get('pending_orders', [])),
+            'summary': dict(portfolio_exposure.get('summary', {}))
+        }
+
+    @staticmethod
+    def _apply_allocation(working: dict, signal: dict, symbol: str, decision: dict, allocation: dict):
+        """Cộng lệnh vừa được chấp nhận vào snapshot (lệnh chờ bị thay thế được gỡ ra)"""
+        summary = working['summary']
+        replaced = set(decision.get('delete_pending_orders') or [])
+        if replaced:
+            kept = []
+            for order in working['pending_orders']:
+                if order.get('ticket') in replaced:
+                    summary['total_potential_loss_from_portfolio_usd'] = (
+                        summary.get('total_potential_loss_from_portfolio_usd', 0.0) - float(order.get('potential_loss_usd', 0.0))
+                    )
+                    summary['total_margin_used_from_portfolio_usd'] = (
+                        summary.get('total_margin_used_from_portfolio_usd', 0.0) - float(order.get('margin_used_usd', 0.0))
+                    )
+                else:
+                    kept.append(order)
+            working['pending_orders'] = kept
+
+        order = {
+            'symbol': symbol,
+            'type': signal.get('signal_type'),
+            'lot_size': decision['lot_size'],
+            'profit': 0.0,
+            'potential_loss_usd': allocation['risk_usd'],
+            'margin_used_usd': allocation['margin_usd']
+        }
+        if signal.get('order_type_proposed') in PENDING_ORDER_TYPES:
+            working['pending_orders'].append(order)
+        else:
+            working['active_positions'].append(order)
+        summary['total_potential_loss_from_portfolio_usd'] = (
+            summary.get('total_potential_loss_from_portfolio_usd', 0.0) + allocation['risk_usd']
+        )
+        summary['total_margin_used_from_portfolio_usd'] = (
+            summary.get('total_margin_used_from_portfolio_usd', 0.0) + allocation['margin_usd']
+        )
+
+
+# Process pool entry point
+_worker_service: Optional[PortfolioAllocationService] = None
+
+
+def allocate_portfolio_task(params: dict) -> dict:
+    """
+    Chạy PortfolioAllocationService.allocate trong worker (hàm cấp module để pickle được)
+
+    Args:
+        params (dict): Giống PortfolioAllocationService.allocate
+
+    Returns:
+        dict: Allocation result
+    """
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = PortfolioAllocationService()
+    return _worker_service.allocate(params)
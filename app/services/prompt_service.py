@@ -5,6 +5,8 @@ Kế thừa và tối ưu hóa logic từ create_prompt_for_signal_analyst
 import json
 from typing import Dict, Any, Optional, List
 from ..utils.logger import Logger
+from ..utils.indicator_engine import indicator_engine
+from ..core.config import settings
 
 
 class CustomEncoder(json.JSONEncoder):
@@ -49,27 +51,12 @@ class PromptService:
             str: Prompt string để gửi cho AIService
         """
         try:
-            # Copy dữ liệu để tránh modify original
-            data_for_prompt = data.copy()
-            
             # Extract thông tin cần thiết
-            symbol = data_for_prompt.get('symbol', '')
-            main_timeframe = data_for_prompt.get('timeframe', 'H4')
-            
-            # Loại bỏ các field không cần thiết để giảm chi phí API
-            fields_to_remove = [
-                'cache_key', 'all_order_active', 'active_orders_summary',
-                'portfolio_exposure', 'account_info', 'account_type_details',
-                'balance_config', 'max_positions', 'pending_orders_summary',
-                'symbol', 'timeframe'
-            ]
-            
-            for field in fields_to_remove:
-                if field in data_for_prompt:
-                    del data_for_prompt[field]
+            symbol = data.get('symbol', '')
+            main_timeframe = data.get('timeframe', 'H4')
             
             # Convert dữ liệu còn lại thành JSON string
-            provided_data = json.dumps(data_for_prompt, cls=CustomEncoder, ensure_ascii=False)
+            provided_data = json.dumps(self._signal_prompt_data(data), cls=CustomEncoder, ensure_ascii=False)
             
             # Lấy prompt function
             prompt_function = self.get_prompt_function('prompt_signal_analyst')
@@ -81,7 +68,8 @@ class PromptService:
             params = {
                 'symbol': symbol,
                 'provided_data': provided_data,
-                'main_timeframe': main_timeframe
+                'main_timeframe': main_timeframe,
+                'compact': settings.SIGNAL_PROMPT_MODE.lower() == "compact"  # Field dẫn xuất do signal_postprocessor tính
             }
             
             # Generate prompt message
@@ -94,6 +82,93 @@ class PromptService:
             self.logger.error(f"Error creating prompt for signal analyst: {e}")
             raise
     
+    def create_prompt_for_signal_batch(self, items: List[Dict[str, Any]]) -> str:
+        """
+        Tạo 1 prompt Signal Analyst cho nhiều symbol cùng main timeframe (phần hướng dẫn dùng chung 1 lần)
+        
+        Args:
+            items: Dữ liệu /signal của từng symbol (symbol khác nhau, cùng timeframe)
+            
+        Returns:
+            str: Prompt yêu cầu JSON array, mỗi symbol 1 object theo thứ tự của items
+        """
+        try:
+            symbols = [item.get('symbol', '') for item in items]
+            provided_data = json.dumps(
+                {symbol: self._signal_prompt_data(item) for symbol, item in zip(symbols, items)},
+                cls=CustomEncoder, ensure_ascii=False
+            )
+            
+            prompt_function = self.get_prompt_function('prompt_signal_analyst')
+            if not prompt_function:
+                self.logger.error("Prompt function 'prompt_signal_analyst' not found")
+                raise ValueError("Prompt function 'prompt_signal_analyst' not found")
+            
+            return prompt_function({
+                'symbols': symbols,
+                'provided_data': provided_data,
+                'main_timeframe': items[0].get('timeframe', 'H4'),
+                'compact': settings.SIGNAL_PROMPT_MODE.lower() == "compact"
+            })
+            
+        except Exception as e:
+            self.logger.error(f"Error creating batch prompt for signal analyst: {e}")
+            raise
+    
+    def _signal_prompt_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Dữ liệu đưa vào prompt Signal Analyst: bỏ field không cần thiết để giảm chi phí API,
+        bổ sung indicators từ IndicatorEngine cho timeframe thiếu (không modify dữ liệu gốc)
+        """
+        # Copy dữ liệu để tránh modify original
+        data_for_prompt = data.copy()
+        symbol = data_for_prompt.get('symbol', '')
+        namespace = (data_for_prompt.get('cache_key') or {}).get('timezone')
+        
+        # Loại bỏ các field không cần thiết để giảm chi phí API
+        fields_to_remove = [
+            'cache_key', 'all_order_active', 'active_orders_summary',
+            'portfolio_exposure', 'account_info', 'account_type_details',
+            'balance_config', 'max_positions', 'pending_orders_summary',
+            'symbol', 'timeframe', 'base_timeframe', 'base_time_basis'
+        ]
+        
+        for field in fields_to_remove:
+            if field in data_for_prompt:
+                del data_for_prompt[field]
+
+        # Bổ sung indicators từ IndicatorEngine cho timeframe thiếu
+        if 'multi_timeframes' in data_for_prompt:
+            data_for_prompt['multi_timeframes'] = self._attach_engine_indicators(
+                symbol, data_for_prompt['multi_timeframes'], namespace
+            )
+        return data_for_prompt
+
+    def _attach_engine_indicators(self, symbol: str, multi_timeframes: Any, namespace: Optional[str] = None) -> Any:
+        """
+        Gắn indicators mới nhất từ IndicatorEngine cho các timeframe không có indicators
+        (không modify dữ liệu gốc của request)
+
+        Args:
+            symbol: Symbol name
+            multi_timeframes: Multi timeframes data
+            namespace: cache_key.timezone của broker (state của indicator engine)
+
+        Returns:
+            Multi timeframes data đã bổ sung indicators
+        """
+        if not isinstance(multi_timeframes, dict):
+            return multi_timeframes
+
+        result = {}
+        for tf, tf_data in multi_timeframes.items():
+            if isinstance(tf_data, dict) and not tf_data.get('indicators'):
+                snapshot = indicator_engine.get_snapshot(symbol, tf, namespace)
+                if snapshot:
+                    tf_data = {**tf_data, 'indicators': snapshot}
+            result[tf] = tf_data
+        return result
+
     def create_prompt_for_risk_manager(self, data: Dict[str, Any]) -> str:
         """
         Tạo prompt cho Risk Manager AI
@@ -8,11 +8,15 @@ from dotenv import load_dotenv
 load_dotenv()
 sys.path.append(str(Path(__file__).parent.parent))
 from app.utils.logger import Logger
+from app.utils.decision_trace import DecisionTrace, record_trace
+from app.core.config import settings
 from app.utils.common import *
 from app.utils.response_logger import response_logger
 import json
 import math
 from app.utils.common import map_signal_to_action
+from app.utils.margin_solver import MarginIndex, get_margin_model, solve_max_safe_lot
+from app.utils.risk_rules import PENDING_ORDER_TYPES, PortfolioSnapshot, RiskRuleRegistry, risk_rule_registry
 
 # Order Type Constants (mirrors MT5 values for interoperability)
 ORDER_TYPE_BUY = 0
@@ -22,6 +26,14 @@ ORDER_TYPE_SELL_LIMIT = 3
 ORDER_TYPE_BUY_STOP = 4
 ORDER_TYPE_SELL_STOP = 5
 
+DEFAULT_MAX_POSITIONS = 5  # balance_config thiếu max_position
+
+
+def resolve_max_positions(balance_config: Optional[dict]) -> int:
+    """Giới hạn số vị thế của balance_config - dùng chung cho /risk_manager, batch và gate /signal để cùng quyết định"""
+    return int((balance_config or {}).get('max_position', DEFAULT_MAX_POSITIONS))
+
+
 class RiskManagerService:
     """
     Risk Manager Service - Handles comprehensive risk management for trading signals.
@@ -30,14 +42,16 @@ class RiskManagerService:
     for trading operations. Refactored from final_risk_manager.py for better maintainability.
     """
     
-    def __init__(self, logger: Optional[Logger] = None):
+    def __init__(self, logger: Optional[Logger] = None, rule_registry: Optional[RiskRuleRegistry] = None):
         """
         Initialize RiskManagerService.
         
         Args:
             logger: Optional logger instance. If not provided, creates a default one.
+            rule_registry: Risk profiles (default: global risk_rule_registry from app/config/risk_rules.json)
         """
         self.logger = logger or Logger("risk_manager_service")
+        self.rule_registry = rule_registry or risk_rule_registry
     
     def analyze_risk(self, params: dict) -> dict:
         """
@@ -53,26 +67,31 @@ class RiskManagerService:
                 - balance_config: Risk configuration by balance
                 - account_type_details: Account type details
                 - portfolio_exposure_json: Current portfolio information
+                - trace: Optional - True => log chi tiết từng bước (mặc định theo RISK_MANAGER_TRACE)
         
         Returns:
             dict: Risk analysis result
         """
         # Use the override logger if provided, otherwise use instance logger
         logger = params.get('logger_override') or self.logger
+        # Log chi tiết chỉ khi bật trace; mặc định ghi trường quyết định và 1 dòng tổng kết
+        trace = DecisionTrace(logger, verbose=bool(params.get('trace')) or settings.RISK_MANAGER_TRACE)
         
-        logger.info("=== BẮT ĐẦU QUÁ TRÌNH QUẢN LÝ RỦI RO ===")
+        trace.info("=== BẮT ĐẦU QUÁ TRÌNH QUẢN LÝ RỦI RO ===")
         
         # Create a shallow copy for logging to avoid modifying the original dict
         params_to_log = params.copy()
         # Remove non-serializable objects before logging
         params_to_log.pop('mt5_services', None)
         params_to_log.pop('logger_override', None)
-        logger.info(f"=== PARAMS: {json.dumps(params_to_log, indent=2)} ===")
+        if trace.verbose:
+            trace.info(f"=== PARAMS: {json.dumps(params_to_log, indent=2)} ===")
         
         # Call enhanced risk manager to process risk management logic
-        result = self._analyze_risk_enhanced(params, logger)
+        result = self._analyze_risk_enhanced(params, trace)
         
-        logger.info(f"=== KẾT THÚC QUÁ TRÌNH QUẢN LÝ RỦI RO - STATUS: {result.get('status', 'UNKNOWN')} ===")
+        trace.record(status=result.get('status', 'UNKNOWN'))
+        logger.info(f"=== RISK MANAGER: {trace.summary()} ===")
         
         # Log response
         try:
@@ -80,7 +99,8 @@ class RiskManagerService:
             response_logger.log_risk_manager_response(
                 symbol=symbol,
                 response_data=result,
-                request_data=params_to_log
+                request_data=params_to_log,
+                decision_trace=trace.to_dict()
             )
         except Exception as log_error:
             logger.warning(f"Failed to log risk manager response: {log_error}")
@@ -88,6 +108,47 @@ class RiskManagerService:
         # Return result directly (no need to call AI API)
         return result
 
+    def pre_check(self, symbol: str, account_info: dict, portfolio_exposure: dict, balance_config: dict) -> Tuple[str, str]:
+        """
+        Pre-flight portfolio check trước khi có tín hiệu (gate của /signal, tránh gọi AI vô ích)
+
+        Chạy luật pre-flight của risk profile cho mọi tín hiệu có thể (BUY/SELL x MARKET/lệnh chờ):
+        chỉ trả về trạng thái dừng khi /risk_manager chắc chắn dừng với bất kỳ tín hiệu nào AI đề xuất.
+
+        Args:
+            symbol: Symbol cần phân tích
+            account_info: account_info của request /signal
+            portfolio_exposure: portfolio_exposure của request /signal
+            balance_config: balance_config của request /signal (max_position theo resolve_max_positions như /risk_manager)
+
+        Returns:
+            tuple: (status, reason) - "CONTINUE" nếu có thể vào lệnh, ngược lại STOP_TRADE / SKIP
+        """
+        try:
+            balance_config = balance_config or {}
+            equity = float(account_info.get('equity', 0))
+            context = {
+                'equity': equity,
+                'vRisk': float(balance_config.get('max_risk', 2.0)),
+                'vTotalRiskCap': float(balance_config.get('total_max_risk', 6.0)),
+                'max_positions': resolve_max_positions(balance_config)
+            }
+            profile = self.rule_registry.resolve(account_info, balance_config)
+        except Exception as e:
+            # Gate không chặn khi dữ liệu lỗi: để /risk_manager quyết định như cũ
+            self.logger.warning(f"Pre-check skipped for {symbol}: {e}")
+            return ("CONTINUE", f"Pre-check unavailable: {e}")
+
+        decision = None
+        for signal_type in ('BUY', 'SELL'):
+            snapshot = PortfolioSnapshot.build(portfolio_exposure, symbol, signal_type)
+            for is_pending_order in (False, True):
+                status, reason, _ = profile.pre_flight(snapshot, dict(context, is_pending_order=is_pending_order))
+                if status == "CONTINUE":
+                    return (status, reason)
+                decision = decision or (status, reason)
+        return decision
+
     def _analyze_risk_enhanced(self, params: dict, logger) -> dict:
         """
         Main coordinator function to evaluate a trading signal based on complex risk management rules.
@@ -131,9 +192,15 @@ class RiskManagerService:
             balance_config = params.get('balance_config', {})
             vRisk = float(balance_config.get('max_risk', 2.0))
             vTotalRiskCap = float(balance_config.get('total_max_risk', 6.0))
-            max_positions = int(balance_config.get('max_position', 5))
+            max_positions = resolve_max_positions(balance_config)
             correlation_groups = params.get('correlation_groups_json', {})
-            logger.info(f"⚙️ Risk config - Max Risk: {vRisk}%, Total Risk Cap: {vTotalRiskCap}%, Max Positions: {max_positions}")
+            profile = self.rule_registry.resolve(account_info, balance_config)
+            logger.info(f"⚙️ Risk config - Max Risk: {vRisk}%, Total Risk Cap: {vTotalRiskCap}%, Max Positions: {max_positions}, Profile: {profile.name}")
+            record_trace(logger, symbol=symbol, profile=profile.name, equity=equity, max_risk=vRisk,
+                         total_max_risk=vTotalRiskCap, max_position=max_positions)
+
+            # Portfolio được quét 1 lần cho mọi luật (pre-flight + điều chỉnh lot)
+            snapshot = PortfolioSnapshot.build(portfolio_exposure, symbol, proposed_signal.get('signal_type', ''), correlation_groups)
 
             logger.info("[🚀 BƯỚC B: THỰC THI WORKFLOW QUẢN LÝ RỦI RO]")
 
@@ -148,10 +215,13 @@ class RiskManagerService:
                 vTotalRiskCap=vTotalRiskCap,
                 symbol_info=symbol_info,
                 vRisk=vRisk,
-                logger=logger
+                logger=logger,
+                profile=profile,
+                snapshot=snapshot
             )
 
             logger.info(f"📋 Kết quả pre-flight check: {pre_flight_status} - {pre_flight_reason}")
+            record_trace(logger, pre_flight=pre_flight_status, reason=pre_flight_reason)
             
             if pre_flight_status != "CONTINUE":
                 logger.warning(f"❌ Dừng xử lý do pre-flight check: {pre_flight_status}")
@@ -169,7 +239,9 @@ class RiskManagerService:
                 correlation_groups=correlation_groups,
                 vRisk=vRisk,
                 params=params, # Pass params in
-                logger=logger
+                logger=logger,
+                profile=profile,
+                snapshot=snapshot
             )
 
             final_lot_size = lot_size_result.get('final_lot_size')
@@ -205,6 +277,7 @@ class RiskManagerService:
             
             estimate_loss = -abs(final_lot_size * expected_loss_per_lot)
             logger.info(f"📉 Thua lỗ dự kiến: ${estimate_loss:.2f}")
+            record_trace(logger, take_profit=adjusted_take_profit, estimate_loss=estimate_loss)
             
             # Calculate TP distance from entry
             sl_distance = abs(float(proposed_signal.get('entry_price_proposed')) - float(proposed_signal.get('stop_loss_proposed')))
@@ -264,89 +337,38 @@ class RiskManagerService:
                 reason=f"Unexpected error: {str(e)}"
             )
 
-    def _perform_pre_flight_checks(self, symbol, proposed_signal, portfolio_exposure, max_positions, equity, vTotalRiskCap, symbol_info, vRisk, logger):
+    def _perform_pre_flight_checks(self, symbol, proposed_signal, portfolio_exposure, max_positions, equity, vTotalRiskCap, symbol_info, vRisk, logger,
+                                   profile=None, snapshot=None):
         """
-        Perform all GO/NO-GO checks in STEP 1 of the prompt.
+        Perform all GO/NO-GO checks in STEP 1 of the prompt (luật pre-flight của risk profile).
+        
+        Args:
+            profile: RuleProfile (None => default_profile của risk_rule_registry)
+            snapshot: PortfolioSnapshot đã dựng (None => quét portfolio_exposure)
         
         Returns:
             tuple: (status, reason, data)
         """
+        profile = profile or self.rule_registry.profile()
+        if snapshot is None:
+            signal_type = proposed_signal.get('signal_type', '') if isinstance(proposed_signal, dict) else ''
+            snapshot = PortfolioSnapshot.build(portfolio_exposure, symbol, signal_type)
         try:
-            logger.info("🔍 STEP 1a: KIỂM TRA GIỚI HẠN VỊ THẾ ACTIVE")
-            # STEP 1a: Active Position Limit Check
-            active_positions = portfolio_exposure.get('active_positions', [])
-            logger.info(f"   - Vị thế active hiện tại: {len(active_positions)} (Giới hạn: {max_positions})")
-            if len(active_positions) >= max_positions:
-                logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. Đã đạt giới hạn vị thế tối đa.")
-                return ("STOP_TRADE", "Max position limit reached", {})
-            logger.info("   -> ✅ KẾT QUẢ: Pass.")
-            
-            logger.info("🔍 STEP 1b: KIỂM TRA LỆNH ACTIVE CÙNG SYMBOL")
-            # STEP 1b: Same Symbol Active Trade Check
-            is_conflicting_active_trade = False
-            for position in active_positions:
-                if position.get('symbol') == symbol:
-                    logger.info(f"   - Tìm thấy lệnh active cùng symbol: {symbol}")
-                    if position.get('profit', 0) < 0:
-                        logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. Lệnh active đang thua lỗ: ${position.get('profit', 0):.2f}")
-                        return ("SKIP", "An active trade on the same symbol is losing", {})
-                    elif position.get('profit', 0) >= 0:
-                        # Check if opposite direction
-                        position_type = position.get('type', '')
-                        signal_type = proposed_signal.get('signal_type', '')
-                        logger.info(f"   - Kiểm tra hướng giao dịch - Position: {position_type}, Signal: {signal_type}")
-                        if position_type != signal_type:
-                            logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. Cấm giao dịch ngược hướng trên symbol đang lãi.")
-                            return ("SKIP", "Opposite direction trade on a profitable symbol is forbidden", {})
-            if not is_conflicting_active_trade:
-                logger.info("   -> ✅ KẾT QUẢ: Pass.")
-
-            logger.info("🔍 STEP 1c: KIỂM TRA XUNG ĐỘT LỆNH PENDING (LOGIC MỚI: THAY THẾ)")
-            # STEP 1c: Same Symbol Pending Order Conflict Check
-            pending_orders_to_delete = []
-            if proposed_signal.get('order_type_proposed') in ['LIMIT', 'STOP']:
-                pending_orders = portfolio_exposure.get('pending_orders', [])
-                logger.info(f"   - Tín hiệu mới là PENDING. Kiểm tra {len(pending_orders)} lệnh chờ hiện có.")
-                for order in pending_orders:
-                    if order.get('symbol') == symbol:
-                        # According to option B: Delete all pending orders of the same symbol, regardless of direction.
-                        logger.warning(f"   -> KẾT QUẢ: Tìm thấy lệnh chờ ticket: {order.get('ticket')} cho {symbol}. Sẽ được thay thế.")
-                        pending_orders_to_delete.append(order.get('ticket'))
-                
-                if pending_orders_to_delete:
-                    logger.info(f"   -> Sẽ đề xuất xóa {len(pending_orders_to_delete)} lệnh chờ cũ.")
-                    return ("CONTINUE", "Pending orders identified for replacement", {'tickets_to_delete': pending_orders_to_delete})
-
-            logger.info("   -> ✅ KẾT QUẢ: Pass.")
-            
-            logger.info("🔍 STEP 1d: KIỂM TRA TỔNG RỦI RO PORTFOLIO")
-            # STEP 1d: Total Unified Portfolio Risk Check
-            total_potential_loss_from_portfolio_usd = portfolio_exposure.get('summary', {}).get('total_potential_loss_from_portfolio_usd', 0.0)
-            
-            # Calculate potential loss for new signal (using vRisk)
-            risk_in_usd_new = equity * (vRisk / 100)
-            
-            total_potential_risk_usd = total_potential_loss_from_portfolio_usd + risk_in_usd_new
-            total_risk_percent = (total_potential_risk_usd / equity) * 100
-            
-            logger.info(f"   - Rủi ro hiện tại: ${total_potential_loss_from_portfolio_usd:.2f}")
-            logger.info(f"   - Rủi ro mới (dự kiến): ${risk_in_usd_new:.2f}")
-            logger.info(f"   - Tổng rủi ro (dự kiến): ${total_potential_risk_usd:.2f} ({total_risk_percent:.2f}%)")
-            logger.info(f"   - Giới hạn rủi ro: {vTotalRiskCap}%")
-            
-            if total_risk_percent > vTotalRiskCap:
-                logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. Tổng rủi ro vượt quá giới hạn: {total_risk_percent:.2f}% > {vTotalRiskCap}%")
-                return ("STOP_TRADE", "Total portfolio risk exceeds cap", {})
-            logger.info("   -> ✅ KẾT QUẢ: Pass.")
-            
-            logger.info("✅ Tất cả kiểm tra pre-flight đã pass")
-            return ("CONTINUE", "All pre-flight checks passed", {})
-            
+            is_pending_order = proposed_signal.get('order_type_proposed') in PENDING_ORDER_TYPES
         except Exception as e:
-            logger.error(f"❌ Lỗi trong pre-flight checks: {str(e)}")
             return ("SKIP", f"Error in pre-flight checks: {str(e)}", {})
 
-    def _calculate_final_lot_size(self, proposed_signal, account_info, symbol_info, portfolio_exposure, correlation_groups, vRisk, params, logger):
+        status, reason, data = profile.pre_flight(snapshot, {
+            'equity': equity, 'vRisk': vRisk, 'vTotalRiskCap': vTotalRiskCap,
+            'max_positions': max_positions, 'is_pending_order': is_pending_order
+        })
+        logger.info(f"🔍 STEP 1 [{profile.name}]: active={snapshot.num_active}/{max_positions}, "
+                    f"pending={snapshot.num_pending} -> {status}: {reason}")
+        record_trace(logger, active=snapshot.num_active, pending=snapshot.num_pending)
+        return (status, reason, data)
+
+    def _calculate_final_lot_size(self, proposed_signal, account_info, symbol_info, portfolio_exposure, correlation_groups, vRisk, params, logger,
+                                  profile=None, snapshot=None):
         """
         Perform entire STEP 3 of the prompt, calculate lot size from basic to final.
         
@@ -354,10 +376,8 @@ class RiskManagerService:
             dict: {'final_lot_size': float} or {'status': 'HOLD'}
         """
         try:
-            logger.info("🧮 STEP 3a: XÁC ĐỊNH RỦI RO CƠ BẢN")
             # STEP 3a: Determine Base Risk %
             estimate_win_probability = proposed_signal.get('estimate_win_probability', 50)
-            logger.info(f"📊 Xác suất thắng: {estimate_win_probability}%")
             
             if estimate_win_probability > 75:
                 calculated_risk_percent = 1.5
@@ -369,13 +389,10 @@ class RiskManagerService:
                 calculated_risk_percent = 0.5
             
             final_risk_percent = min(calculated_risk_percent, vRisk)
-            logger.info(f"📊 Rủi ro cơ bản: {calculated_risk_percent}%, Rủi ro cuối cùng (sau khi so sánh với vRisk): {final_risk_percent}%")
             
-            logger.info("🧮 STEP 3b: TÍNH TOÁN LOT SIZE BAN ĐẦU")
             # STEP 3b: Calculate Initial Lot Size
             equity = float(account_info.get('equity'))
             risk_in_usd = equity * (final_risk_percent / 100)
-            logger.info(f"💰 Rủi ro tính bằng USD: ${risk_in_usd:.2f}")
             
             expected_loss_per_lot = self._calculate_expected_loss_per_lot(
                 entry_price=float(proposed_signal.get('entry_price_proposed')),
@@ -383,148 +400,202 @@ class RiskManagerService:
                 symbol_info=symbol_info,
                 logger=logger
             )
-            
-            logger.info(f"📉 Thua lỗ dự kiến cho 1 lot: ${expected_loss_per_lot:.2f}")
+            logger.info(f"🧮 STEP 3a-b: win={estimate_win_probability}%, risk={final_risk_percent}% (${risk_in_usd:.2f}), "
+                        f"loss/lot=${expected_loss_per_lot:.2f}")
+            record_trace(logger, risk_percent=final_risk_percent, loss_per_lot=expected_loss_per_lot)
             
             if expected_loss_per_lot <= 0:
                 logger.warning("❌ Thua lỗ dự kiến <= 0, trả về HOLD")
                 return {'status': 'HOLD'}
             
             base_lot_size = risk_in_usd / expected_loss_per_lot
-            logger.info(f"📊 Lot size ban đầu: {base_lot_size:.4f}")
             
-            logger.info("🧮 STEP 3c: ÁP DỤNG ĐIỀU CHỈNH PORTFOLIO")
-            adjusted_lot = base_lot_size
+            adjusted_lot, correlated_symbols = self._apply_portfolio_adjustments(
+                base_lot_size, proposed_signal, account_info, portfolio_exposure, correlation_groups, logger,
+                profile=profile, snapshot=snapshot
+            )
+            return self._fit_lot_to_margin(
+                adjusted_lot, proposed_signal, account_info, symbol_info, portfolio_exposure, correlated_symbols, params, logger,
+                profile=profile
+            )
             
-            # Drawdown Control - Loss control
-            logger.info("   - ** Drawdown Control **")
-            profit = float(account_info.get('profit', 0))
-            balance = float(account_info.get('balance', 0))
-            drawdown_threshold = -(0.04 * balance)
-            logger.info(f"     - Profit hiện tại: ${profit:.2f}, Ngưỡng sụt giảm (4%): ${drawdown_threshold:.2f}")
+        except Exception as e:
+            logger.error(f"❌ Lỗi trong tính toán lot size: {str(e)}")
+            return {'status': 'HOLD', 'correlated_symbols': []}
 
-            if profit < drawdown_threshold:
-                original_lot = adjusted_lot
-                adjusted_lot *= 0.7
-                logger.warning(f"     -> KẾT QUẢ: Áp dụng giảm 30%. Lot size: {original_lot:.4f} -> {adjusted_lot:.4f}")
-            else:
-                logger.info("     -> KẾT QUẢ: Pass. Không điều chỉnh.")
-            
-            # Correlation Control - Correlation control
-            logger.info("   - ** Correlation Control **")
-            active_positions = portfolio_exposure.get('active_positions', [])
-            symbol_name = proposed_signal.get('symbol', 'UNKNOWN')  # Get from proposed_signal
-            
-            correlated_symbols = [] # Initialize empty list
-            
-            # Find correlation group for current symbol
-            current_symbol_group = None
-            for group_name, group_symbols in correlation_groups.items():
-                if symbol_name in group_symbols:
-                    current_symbol_group = group_name
-                    break
-            
-            if current_symbol_group:
-                logger.info(f"     - Symbol '{symbol_name}' thuộc nhóm tương quan: {current_symbol_group}")
-                correlated_positions = 0
-                for position in active_positions:
-                    pos_symbol = position.get('symbol')
-                    if pos_symbol in correlation_groups.get(current_symbol_group, []):
-                        correlated_positions += 1
-                        correlated_symbols.append(pos_symbol) # Add symbol to list
-                
-                logger.info(f"     - Số vị thế tương quan đang active: {correlated_positions} - Symbols: {correlated_symbols}")
-                if correlated_positions >= 2:
-                    original_lot = adjusted_lot
-                    adjusted_lot *= 0.5
-                    logger.warning(f"     -> KẾT QUẢ: Áp dụng giảm 50%. Lot size: {original_lot:.4f} -> {adjusted_lot:.4f}")
-                else:
-                    logger.info("     -> KẾT QUẢ: Pass. Không điều chỉnh.")
-            else:
-                logger.info(f"     - Symbol '{symbol_name}' không thuộc nhóm tương quan nào. Bỏ qua kiểm tra.")
-
-            # Weighted Position Count - Weighted position counting
-            logger.info("   - ** Weighted Position Count **")
-            num_active = len(portfolio_exposure.get('active_positions', []))
-            num_pending = len(portfolio_exposure.get('pending_orders', []))
-            effective_positions = num_active + (num_pending * 0.33)
-            logger.info(f"     - Vị thế active: {num_active}, Pending: {num_pending} => Vị thế hiệu quả: {effective_positions:.2f}")
-            
-            original_lot = adjusted_lot
-            if effective_positions >= 3:
-                adjusted_lot *= 0.5
-                logger.warning(f"     -> KẾT QUẢ: >= 3 vị thế hiệu quả, áp dụng giảm 50%. Lot size: {original_lot:.4f} -> {adjusted_lot:.4f}")
-            elif 1 <= effective_positions < 3:
-                adjusted_lot *= 0.7
-                logger.warning(f"     -> KẾT QUẢ: 1-3 vị thế hiệu quả, áp dụng giảm 30%. Lot size: {original_lot:.4f} -> {adjusted_lot:.4f}")
-            else:
-                logger.info("     -> KẾT QUẢ: Pass. Không điều chỉnh.")
-            
-            logger.info(f"📊 Lot size sau điều chỉnh portfolio: {adjusted_lot:.4f}")
-            
-            logger.info(f"📊 Lot size cuối cùng trước lượng tử hóa: {adjusted_lot:.4f}")
-            
-            initial_quantized_lot = self._quantize_and_validate_lot(
-                lot_size=adjusted_lot,
-                volume_min=symbol_info.get('volume_min'),
-                volume_max=symbol_info.get('volume_max'),
-                volume_step=symbol_info.get('volume_step')
+    def _apply_portfolio_adjustments(self, base_lot_size, proposed_signal, account_info, portfolio_exposure, correlation_groups, logger,
+                                     profile=None, snapshot=None):
+        """
+        STEP 3c: điều chỉnh lot theo các luật sizing của risk profile (drawdown, tương quan, số vị thế hiệu quả).
+        
+        Args:
+            profile: RuleProfile (None => default_profile của risk_rule_registry)
+            snapshot: PortfolioSnapshot đã dựng kèm correlation_groups (None => quét portfolio_exposure)
+        
+        Returns:
+            tuple: (adjusted_lot, correlated_symbols)
+        """
+        profile = profile or self.rule_registry.profile()
+        if snapshot is None:
+            snapshot = PortfolioSnapshot.build(
+                portfolio_exposure, proposed_signal.get('symbol', 'UNKNOWN'), proposed_signal.get('signal_type', ''), correlation_groups
             )
-            
-            if initial_quantized_lot is None:
-                logger.warning("❌ Lot size ban đầu sau lượng tử hóa không hợp lệ, trả về HOLD")
-                return {'status': 'HOLD'}
+        adjusted_lot, applied = profile.adjust_lot(base_lot_size, snapshot, account_info)
+        snapshot.require('correlation')
+        logger.info(f"🧮 STEP 3c [{profile.name}]: {base_lot_size:.4f} -> {adjusted_lot:.4f} "
+                    f"({', '.join(applied) or 'không điều chỉnh'}), correlated={snapshot.correlated_symbols}")
+        record_trace(logger, base_lot=base_lot_size, adjusted_lot=adjusted_lot, adjustments=applied,
+                     correlated=list(snapshot.correlated_symbols))
+        return adjusted_lot, list(snapshot.correlated_symbols)
+
+    def _fit_lot_to_margin(self, adjusted_lot, proposed_signal, account_info, symbol_info, portfolio_exposure, correlated_symbols, params, logger,
+                           profile=None):
+        """
+        Lượng tử hóa lot và dò lot lớn nhất an toàn ký quỹ (ngưỡng margin của risk profile).
+        
+        Returns:
+            dict: {'final_lot_size', 'margin_usd', 'correlated_symbols'} or {'status': 'HOLD', ...}
+        """
+        logger.info(f"📊 Lot size cuối cùng trước lượng tử hóa: {adjusted_lot:.4f}")
+        
+        initial_quantized_lot = self._quantize_and_validate_lot(
+            lot_size=adjusted_lot,
+            volume_min=symbol_info.get('volume_min'),
+            volume_max=symbol_info.get('volume_max'),
+            volume_step=symbol_info.get('volume_step')
+        )
+        
+        if initial_quantized_lot is None:
+            logger.warning("❌ Lot size ban đầu sau lượng tử hóa không hợp lệ, trả về HOLD")
+            return {'status': 'HOLD'}
 
-            logger.info(f"✅ Lot size ban đầu (đã lượng tử hóa): {initial_quantized_lot}")
-            
-            # --- NEW: Adaptive Margin Lot Size Search ---
-            logger.info("🔄 Bắt đầu dò tìm Lot Size thích ứng với Margin")
-            
-            lot_size_to_margin_map = params.get('lot_size_to_margin_map')
-            if not isinstance(lot_size_to_margin_map, dict) or not lot_size_to_margin_map:
-                logger.error("CRITICAL: 'lot_size_to_margin_map' không hợp lệ hoặc bị thiếu.")
+        logger.info(f"✅ Lot size ban đầu (đã lượng tử hóa): {initial_quantized_lot}")
+        
+        # --- NEW: Adaptive Margin Lot Size Search ---
+        logger.info("🔄 Bắt đầu dò tìm Lot Size thích ứng với Margin")
+        
+        lot_size_to_margin_map = params.get('lot_size_to_margin_map')
+        margin_fn = None
+        if not isinstance(lot_size_to_margin_map, dict) or not lot_size_to_margin_map:
+            margin_fn = self._margin_model_fn(params.get('margin_model'), proposed_signal, account_info, symbol_info)
+            if margin_fn is None:
+                logger.error("CRITICAL: 'lot_size_to_margin_map' không hợp lệ hoặc bị thiếu (và không có margin_model / trade_contract_size + leverage hợp lệ).")
                 return {'status': 'HOLD', 'correlated_symbols': correlated_symbols}
+            logger.info(f"   - Không có lot_size_to_margin_map, tính margin theo {'margin_model' if params.get('margin_model') else 'contract_size/leverage'}")
+
+        volume_min = symbol_info.get('volume_min', 0.01)
+        volume_step = symbol_info.get('volume_step', 0.01)
+
+        solution = self._solve_margin_lot(
+            initial_quantized_lot, volume_min, volume_step, account_info, portfolio_exposure,
+            lot_size_to_margin_map if margin_fn is None else None, margin_fn, profile=profile
+        )
+        margin_lookup = margin_fn or (lambda lot: lot_size_to_margin_map.get(f"{lot:.2f}"))
+        if solution is None:
+            # Input ngoài phạm vi solver (step lẻ, equity <= 0, dữ liệu không phải số...) => dò tuyến tính
+            current_lot = self._search_margin_lot_linear(
+                initial_quantized_lot, volume_min, volume_step, account_info, portfolio_exposure, margin_lookup, logger,
+                profile=profile
+            )
+            margin_usd = margin_lookup(current_lot) if current_lot is not None else None
+        else:
+            current_lot, margin_usd = solution.lot, solution.margin
+            logger.info(f"   - Margin solver: {solution.probes} lần kiểm tra, margin={solution.margin}")
+        record_trace(logger, quantized_lot=initial_quantized_lot, margin_lot=current_lot, margin_usd=margin_usd)
+
+        if current_lot is not None:
+            logger.info(f"✅ Tìm thấy Lot Size hợp lệ về ký quỹ: {current_lot:.2f}")
+            if current_lot < initial_quantized_lot:
+                logger.warning(f"   - Lot size đã được điều chỉnh giảm từ {initial_quantized_lot} xuống {current_lot:.2f} do hạn chế về ký quỹ.")
+            return {'final_lot_size': current_lot, 'margin_usd': margin_usd, 'correlated_symbols': correlated_symbols}
+
+        # If the search finishes without finding a suitable lot size
+        logger.warning(f"❌ Không tìm thấy Lot Size nào phù hợp sau khi dò tìm. Lot nhỏ nhất ({volume_min}) vẫn không đủ ký quỹ.")
+        return {'status': 'HOLD', 'correlated_symbols': correlated_symbols}
+
+    def _margin_model_fn(self, margin_model, proposed_signal, account_info, symbol_info):
+        """
+        Hàm margin(lot) khi client không gửi lot_size_to_margin_map.
+        - margin_model (contract_size, leverage, margin_rate, price, tiers) nếu có
+        - Ngược lại: lot * trade_contract_size * entry_price / leverage của account
+        Model được cache theo account/symbol (margin từng lot được memo giữa các request).
+        
+        Returns:
+            callable | None: None nếu tham số không hợp lệ
+        """
+        if not isinstance(margin_model, dict):
+            margin_model = {
+                'contract_size': symbol_info.get('trade_contract_size'),
+                'leverage': account_info.get('leverage')
+            }
+        model = get_margin_model(
+            account_info.get('login'),
+            proposed_signal.get('symbol'),
+            margin_model,
+            entry_price=proposed_signal.get('entry_price_proposed')
+        )
+        return model.margin if model is not None else None
+
+    def _solve_margin_lot(self, initial_lot, volume_min, volume_step, account_info, portfolio_exposure,
+                          lot_size_to_margin_map=None, margin_fn=None, profile=None):
+        """
+        Tìm lot lớn nhất an toàn ký quỹ bằng margin solver (binary search trên index của map / công thức).
+        Cho cùng kết quả với _search_margin_lot_linear.
+        profile: RuleProfile cho ngưỡng margin (None => default_profile của risk_rule_registry)
+        
+        Returns:
+            MarginSolution | None: None nếu input ngoài phạm vi solver
+        """
+        profile = profile or self.rule_registry.profile()
+        try:
+            equity = float(account_info.get('equity', 0))
+            existing_margin_usd = portfolio_exposure.get('summary', {}).get('total_margin_used_from_portfolio_usd', 0.0)
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+        margin_index = None
+        if lot_size_to_margin_map is not None:
+            margin_index = MarginIndex.from_map(lot_size_to_margin_map)
+            if margin_index is None:
+                return None
 
-            current_lot = initial_quantized_lot
-            volume_min = symbol_info.get('volume_min', 0.01)
-            volume_step = symbol_info.get('volume_step', 0.01)
+        return solve_max_safe_lot(
+            initial_lot, volume_min, volume_step, equity, existing_margin_usd,
+            profile.min_free_margin_percent, profile.max_margin_usage_percent,
+            margin_index=margin_index, margin_fn=margin_fn
+        )
 
-            while current_lot >= volume_min:
-                logger.info(f"   - Đang kiểm tra lot: {current_lot:.2f}...")
-                
-                # Look up margin from pre-calculated map
-                current_lot_str = f"{current_lot:.2f}"
-                new_margin = lot_size_to_margin_map.get(current_lot_str)
-                
-                if new_margin is None:
-                    logger.warning(f"   - Không tìm thấy margin cho lot size {current_lot_str} trong map. Bỏ qua.")
-                    current_lot = round(current_lot - volume_step, 2)
-                    continue
-                    
-                margin_safe, margin_reason = self._check_margin_safety(
-                    account_info, 
-                    portfolio_exposure, 
-                    new_margin, # Pass looked up margin
-                    logger
-                )
-                
-                if margin_safe:
-                    logger.info(f"✅ Tìm thấy Lot Size hợp lệ về ký quỹ: {current_lot:.2f}")
-                    if current_lot < initial_quantized_lot:
-                        logger.warning(f"   - Lot size đã được điều chỉnh giảm từ {initial_quantized_lot} xuống {current_lot:.2f} do hạn chế về ký quỹ.")
-                    
-                    return {'final_lot_size': current_lot, 'correlated_symbols': correlated_symbols}
-
-                # If not safe, reduce lot size and try again
-                current_lot = round(current_lot - volume_step, 2)
-            
-            # If the loop finishes without finding a suitable lot size
-            logger.warning(f"❌ Không tìm thấy Lot Size nào phù hợp sau khi dò tìm. Lot nhỏ nhất ({volume_min}) vẫn không đủ ký quỹ.")
-            return {'status': 'HOLD', 'correlated_symbols': correlated_symbols}
+    def _search_margin_lot_linear(self, initial_lot, volume_min, volume_step, account_info, portfolio_exposure, margin_lookup, logger,
+                                  profile=None):
+        """
+        Dò tuyến tính từ initial_lot giảm dần theo volume_step (fallback của margin solver).
+        
+        Returns:
+            float | None: Lot lớn nhất an toàn ký quỹ, None nếu không có
+        """
+        current_lot = initial_lot
+        while current_lot >= volume_min:
+            logger.info(f"   - Đang kiểm tra lot: {current_lot:.2f}...")
             
-        except Exception as e:
-            logger.error(f"❌ Lỗi trong tính toán lot size: {str(e)}")
-            return {'status': 'HOLD', 'correlated_symbols': []}
+            new_margin = margin_lookup(current_lot)
+            if new_margin is None:
+                logger.warning(f"   - Không tìm thấy margin cho lot size {current_lot:.2f} trong map. Bỏ qua.")
+                current_lot = round(current_lot - volume_step, 2)
+                continue
+                
+            margin_safe, margin_reason = self._check_margin_safety(
+                account_info, 
+                portfolio_exposure, 
+                new_margin, # Pass looked up margin
+                logger,
+                profile=profile
+            )
+            if margin_safe:
+                return current_lot
+
+            # If not safe, reduce lot size and try again
+            current_lot = round(current_lot - volume_step, 2)
+        return None
 
     def _calculate_expected_loss_per_lot(self, entry_price, stop_loss, symbol_info, logger):
         """
@@ -652,12 +723,14 @@ class RiskManagerService:
             logger.error(f"     -> Lỗi khi điều chỉnh R:R: {e}")
             return take_profit
 
-    def _check_margin_safety(self, account_info, portfolio_exposure, new_order_margin_usd, logger):
+    def _check_margin_safety(self, account_info, portfolio_exposure, new_order_margin_usd, logger, profile=None):
         """
         Restore margin safety check logic, using standardized calculation method.
-        - Free margin > 50% of equity
-        - Total margin usage < 40% of equity
+        - Free margin > min_free_margin_percent of equity (default 50%)
+        - Total margin usage < max_margin_usage_percent of equity (default 40%)
         """
+        profile = profile or self.rule_registry.profile()
+        min_free_percent, max_usage_percent = profile.min_free_margin_percent, profile.max_margin_usage_percent
         try:
             equity = float(account_info.get('equity', 0))
             if equity == 0:
@@ -682,15 +755,15 @@ class RiskManagerService:
             logger.info(f"   - New Order Margin: ${new_order_margin_usd:.2f}")
             logger.info(f"   - Total Margin Usage (Predicted): ${total_margin_usage:.2f} ({margin_usage_percent:.2f}%)")
             logger.info(f"   - Free Margin (Predicted): ${free_margin_after_trade:.2f} ({free_margin_percent:.2f}%)")
-            logger.info(f"   - Rule: Free > 50%, Usage < 40%")
+            logger.info(f"   - Rule: Free > {min_free_percent}%, Usage < {max_usage_percent}%")
             
-            if free_margin_percent <= 50:
-                reason = f"Predicted free margin ({free_margin_percent:.2f}%) would be <= 50%"
+            if free_margin_percent <= min_free_percent:
+                reason = f"Predicted free margin ({free_margin_percent:.2f}%) would be <= {min_free_percent}%"
                 logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. {reason}")
                 return False, reason
             
-            if margin_usage_percent >= 40:
-                reason = f"Predicted total margin usage ({margin_usage_percent:.2f}%) would be >= 40%"
+            if margin_usage_percent >= max_usage_percent:
+                reason = f"Predicted total margin usage ({margin_usage_percent:.2f}%) would be >= {max_usage_percent}%"
                 logger.warning(f"   -> ❌ KẾT QUẢ: Thất bại. {reason}")
                 return False, reason
             
@@ -750,3 +823,23 @@ class RiskManagerService:
             })
         
         return response
+
+
+# Process pool entry point: mỗi worker process khởi tạo 1 RiskManagerService riêng (lazy)
+_worker_service: Optional[RiskManagerService] = None
+
+
+def analyze_risk_task(params: dict) -> dict:
+    """
+    Chạy RiskManagerService.analyze_risk trong worker (hàm cấp module để pickle được)
+
+    Args:
+        params (dict): Giống RiskManagerService.analyze_risk
+
+    Returns:
+        dict: Risk analysis result
+    """
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = RiskManagerService()
+    return _worker_service.analyze_risk(params)
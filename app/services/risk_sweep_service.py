@@ -0,0 +1,166 @@
+"""
+Risk Sweep Service - what-if cho 1 tín hiệu + 1 tài khoản trên lưới tham số rủi ro
+Dùng để tinh chỉnh balance_config và các ngưỡng của RiskManagerService thay cho gọi /risk_manager nhiều lần
+
+- Portfolio được quét 1 lần; mỗi điểm lưới là 1 dòng của pipeline vectorized (MultiAccountRiskService)
+  với max_risk / total_max_risk / max_position / ngưỡng drawdown, hệ số giảm lot, ngưỡng margin riêng
+- Tham số không quét giữ giá trị hiện tại (balance_config + risk profile của tài khoản)
+  => điểm lưới trùng cấu hình hiện tại cho kết quả giống /risk_manager
+- Kết quả trả theo cột (status, lot_size, estimate_profit, estimate_loss) để lưới lớn vẫn gọn
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.logger import Logger
+from app.utils.margin_solver import _is_real
+from app.utils.risk_math import DEFAULT_RISK_RULES
+from app.services.multi_account_risk_service import STATUS_NAMES, MultiAccountRiskService, _CONTINUE
+
+
+# balance_config: tên tham số -> giá trị mặc định (giống _analyze_risk_enhanced)
+BALANCE_DEFAULTS = {'max_risk': 2.0, 'total_max_risk': 6.0, 'max_position': 5}
+SWEEP_PARAMETERS = tuple(BALANCE_DEFAULTS) + tuple(DEFAULT_RISK_RULES)
+
+
+class RiskSweepService:
+    """What-if lot / trạng thái / lãi lỗ dự kiến theo lưới tham số rủi ro"""
+
+    def __init__(self, multi_account_service: Optional[MultiAccountRiskService] = None, logger: Optional[Logger] = None):
+        """
+        Args:
+            multi_account_service: Pipeline vectorized dùng chung với /risk_manager/multi_account
+            logger: Optional logger instance
+        """
+        self.logger = logger or Logger("risk_sweep_service")
+        self.multi_account_service = multi_account_service or MultiAccountRiskService(logger=self.logger)
+
+    def sweep(self, params: dict) -> dict:
+        """
+        Chạy what-if trên toàn bộ lưới
+
+        Args:
+            params (dict): Giống /risk_manager + 'grid': {tên tham số: [giá trị, ...]} (tích Descartes)
+
+        Returns:
+            dict: {
+                'points': số điểm,
+                'grid': {tham số được quét: [giá trị theo điểm]},
+                'status', 'lot_size', 'estimate_profit', 'estimate_loss': [theo điểm],
+                'summary': {status: số điểm}
+            }
+
+        Raises:
+            ValueError: Lưới không hợp lệ / quá lớn hoặc dữ liệu ngoài phạm vi bản vectorized
+        """
+        service = self.multi_account_service
+        signal = params.get('proposed_signal_json') or {}
+        symbol = signal.get('symbol', 'UNKNOWN') if isinstance(signal, dict) else 'UNKNOWN'
+        account = {key: params.get(key) or {} for key in ('account_info_json', 'portfolio_exposure_json', 'balance_config')}
+        shared_params = {
+            'accounts': [account],
+            'symbol_info': params.get('symbol_info') or {},
+            'lot_size_to_margin_map': params.get('lot_size_to_margin_map'),
+            'margin_model': params.get('margin_model')
+        }
+        shared = service._prepare_signal(signal, shared_params['symbol_info'], params.get('correlation_groups_json') or {})
+        if shared is None:
+            raise ValueError("proposed_signal_json / symbol_info outside the sweep's numeric range")
+        features = service._collect_features([account], signal, symbol, shared)
+        if features['scalar'][0]:
+            raise ValueError("account_info_json / portfolio_exposure_json / balance_config / risk profile "
+                             "outside the sweep's numeric range")
+
+        grid = self._build_grid(params.get('grid') or {}, params.get('balance_config') or {},
+                                {name: float(features[name][0]) for name in DEFAULT_RISK_RULES})
+        points = len(next(iter(grid.values())))
+        self.logger.info(f"=== RISK SWEEP: {symbol}, {points} điểm, profile {features['profiles'][0].name} "
+                         f"({', '.join(params.get('grid') or {}) or 'cấu hình hiện tại'}) ===")
+        rows = service._take_rows(features, np.zeros(points, dtype=np.int64))
+        rows['vRisk'], rows['vTotalRiskCap'], rows['max_positions'] = (
+            grid['max_risk'], grid['total_max_risk'], grid['max_position']
+        )
+        service._index_cache.clear()
+        status = service._gate(rows, rows['max_positions'], rows['vTotalRiskCap'], rows['vRisk'])
+        sized = service._size_rows(rows, shared, status, shared_params, signal,
+                                   rules={name: grid[name] for name in DEFAULT_RISK_RULES})
+
+        accepted = sized['status'] == _CONTINUE
+        names = [STATUS_NAMES[code] for code in sized['status'].tolist()]
+        swept = [name for name in SWEEP_PARAMETERS if name in (params.get('grid') or {})]
+        result = {
+            'points': points,
+            'grid': {name: grid[name].tolist() for name in swept},
+            'status': names,
+            'lot_size': self._column(sized['lots'], accepted),
+            'estimate_profit': self._column(sized['estimate_profit'], accepted),
+            'estimate_loss': self._column(sized['estimate_loss'], accepted),
+            'summary': {name: names.count(name) for name in STATUS_NAMES}
+        }
+        self.logger.info(f"=== KẾT THÚC RISK SWEEP: {result['summary']} ===")
+        return result
+
+    @staticmethod
+    def _build_grid(grid: Dict[str, List[Any]], balance_config: dict, profile_rules: Dict[str, float]) -> Dict[str, np.ndarray]:
+        """
+        Tích Descartes của các tham số được quét, tham số còn lại giữ giá trị hiện tại
+
+        Args:
+            grid: {tên tham số: [giá trị, ...]}
+            balance_config: balance_config của request
+            profile_rules: Tham số luật từ risk profile của tài khoản
+
+        Returns:
+            dict: {tên tham số: np.ndarray theo điểm} cho mọi tham số trong SWEEP_PARAMETERS
+        """
+        unknown = sorted(set(grid) - set(SWEEP_PARAMETERS))
+        if unknown:
+            raise ValueError(f"Unknown sweep parameters: {', '.join(unknown)}")
+
+        axes = []
+        for name in SWEEP_PARAMETERS:
+            if name in grid:
+                values = grid[name]
+                if not isinstance(values, list) or not values or not all(_is_real(v) for v in values):
+                    raise ValueError(f"Sweep values for '{name}' must be a non-empty list of numbers")
+            elif name in BALANCE_DEFAULTS:
+                values = [balance_config.get(name, BALANCE_DEFAULTS[name])]
+                if not _is_real(values[0]):
+                    raise ValueError(f"balance_config.{name} must be a number")
+            else:
+                values = [profile_rules[name]]
+            axes.append(values)
+
+        points = int(np.prod([len(values) for values in axes]))
+        if points > settings.RISK_SWEEP_MAX_POINTS:
+            raise ValueError(f"Sweep grid has {points} points (max {settings.RISK_SWEEP_MAX_POINTS})")
+        # indexing='ij' => cùng thứ tự với itertools.product (tham số cuối thay đổi nhanh nhất)
+        columns = np.meshgrid(*[np.asarray(values, dtype=np.float64) for values in axes], indexing='ij')
+        return {name: column.ravel() for name, column in zip(SWEEP_PARAMETERS, columns)}
+
+    @staticmethod
+    def _column(values: np.ndarray, accepted: np.ndarray) -> list:
+        """Giá trị theo điểm, None ở điểm không vào lệnh"""
+        return [float(v) if ok else None for v, ok in zip(values.tolist(), accepted.tolist())]
+
+
+# Process pool entry point
+_worker_service: Optional[RiskSweepService] = None
+
+
+def sweep_risk_task(params: dict) -> dict:
+    """
+    Chạy RiskSweepService.sweep trong worker (hàm cấp module để pickle được)
+
+    Args:
+        params (dict): Giống RiskSweepService.sweep
+
+    Returns:
+        dict: Sweep result
+    """
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = RiskSweepService()
+    return _worker_service.sweep(params)
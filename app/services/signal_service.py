@@ -3,7 +3,8 @@ Signal Service with Redis caching for FX API
 """
 
 import asyncio
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, List, Optional
 from app.utils.logger import Logger
 from app.utils.redis_client import RedisClient
 from app.utils.response_handler import ResponseHandler
@@ -11,7 +12,23 @@ from app.utils.response_logger import response_logger
 from app.constants import ErrorCodes
 from app.services.prompt_service import PromptService
 from app.services.ai_service import AIService
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor
+from app.services.candle_store_service import candle_store_service
+from app.services.risk_manager_service import RiskManagerService
+from app.utils.candle_codec import RAW_KEYS
+from app.utils.correlation_engine import correlation_engines
+from app.utils.candle_resampler import build_timeframes, parse_timezone_offset, ResampleError, TIME_BASIS_UTC
+from app.utils.timeframe_config import get_timeframe_config
+from app.utils.market_hours import market_calendar
+from app.utils.signal_screener import signal_screener
+from app.utils.signal_change_detector import extract_fingerprint, signal_change_detector
+from app.utils.signal_postprocessor import signal_postprocessor
+from app.utils.prompt_batch import BatchSlot, PromptBatch
 from app.core.config import settings
+from app.core.executor import executor_manager, ExecutorQueueFullError
+
+
+CACHE_WAIT_POLL_INTERVAL = 0.1  # Giây giữa 2 lần kiểm tra cache khi request trùng chờ process khác
 
 
 class SignalService:
@@ -28,6 +45,10 @@ class SignalService:
         self.redis_client = redis_client or RedisClient()
         self.prompt_service = PromptService()
         self.ai_service = AIService()
+        self.multi_timeframes_processor = MultiTimeframesProcessor(self.logger)
+        self.risk_manager = RiskManagerService()
+        self.pre_check_stops = 0  # Số request trả "no trade" ngay, không gọi AI
+        self.market_closed_stops = 0  # Số request ngoài giờ giao dịch, không gọi AI
         
         # Cache settings - Sử dụng config từ settings
         self.cache_ttl = settings.SIGNAL_SERVICE_CACHE_TTL
@@ -60,12 +81,21 @@ class SignalService:
         """
         return f"lock:{cache_key}"
     
-    async def analyze_signal(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _generate_basis_key(self, request_data: Dict[str, Any]) -> Optional[str]:
+        """Key lưu signal + fingerprint của lần gọi AI gần nhất (None nếu thiếu cache_key)"""
+        cache_key_data = request_data.get("cache_key") or {}
+        parts = [cache_key_data.get("timezone"), cache_key_data.get("timeframe"), cache_key_data.get("symbol")]
+        if not all(parts):
+            return None
+        return f"signal_basis:{self._generate_cache_key(*parts)}"
+    
+    async def analyze_signal(self, request_data: Dict[str, Any], batch_slot: Optional[BatchSlot] = None) -> Dict[str, Any]:
         """
         Analyze signal with caching and distributed locking
         
         Args:
             request_data: Request data from API
+            batch_slot: Chỗ trong PromptBatch (analyze_signal_batch) - gọi AI chung với các symbol khác
             
         Returns:
             Signal analysis result
@@ -88,13 +118,23 @@ class SignalService:
             
             self.logger.info(f"Processing signal request: {cache_key}")
             
+            # Ngoài giờ giao dịch (theo giờ broker) => signal đang cache hoặc HOLD, không gọi AI
+            market_closed = await self._market_closed_response(request_data, timezone, cache_key)
+            if market_closed:
+                return market_closed
+            
+            # Portfolio không cho vào lệnh với bất kỳ tín hiệu nào => trả "no trade" ngay, không gọi AI
+            no_trade = self._pre_check(request_data)
+            if no_trade:
+                return no_trade
+            
             # Check if Redis is available
-            if not self.redis_client.is_connected():
+            if not await executor_manager.run_io(self.redis_client.is_connected):
                 self.logger.warning("Redis not available, processing without cache")
-                return await self._process_signal_direct(request_data)
+                return await self._process_signal_direct(request_data, batch_slot)
             
             # Try to get from cache first
-            cached_result = self.redis_client.get(cache_key)
+            cached_result = await executor_manager.run_io(self.redis_client.get, cache_key)
             if cached_result:
                 self.logger.info(f"Cache hit: {cache_key}")
                 # For cached results, we need to find the actual log folder that was created
@@ -104,7 +144,7 @@ class SignalService:
                 symbol = cache_key_data.get("symbol", "UNKNOWN")
                 
                 # Try to find the actual log folder that was created
-                log_folder_path = self._find_actual_log_folder(timezone, timeframe, symbol)
+                log_folder_path = await executor_manager.run_io(self._find_actual_log_folder, timezone, timeframe, symbol)
                 
                 return ResponseHandler.success(
                     data=cached_result,
@@ -114,13 +154,13 @@ class SignalService:
             self.logger.info(f"Cache miss: {cache_key}")
             
             # Try to acquire lock
-            lock_identifier = self.redis_client.acquire_lock(lock_key, self.lock_timeout)
+            lock_identifier = await executor_manager.run_io(self.redis_client.acquire_lock, lock_key, self.lock_timeout)
             
             if lock_identifier:
                 # We got the lock, process the signal
                 self.logger.info(f"Lock acquired, processing signal: {cache_key}")
                 try:
-                    result = await self._process_signal_direct(request_data)
+                    result = await self._process_signal_direct(request_data, batch_slot)
                     
                     # Cache the result if successful
                     if result.get("success"):
@@ -128,18 +168,23 @@ class SignalService:
                         cache_data["cache_key"] = cache_key
                         cache_data["timestamp"] = self._get_current_timestamp()
                         
-                        self.redis_client.set(cache_key, cache_data, self.cache_ttl)
+                        await executor_manager.run_io(self.redis_client.set, cache_key, cache_data, self.cache_ttl)
                         self.logger.info(f"Result cached: {cache_key}")
                     
                     return result
                     
                 finally:
-                    # Always release the lock
-                    self.redis_client.release_lock(lock_key, lock_identifier)
+                    # Always release the lock (queue đầy thì release ngoài pool để không giữ lock tới timeout)
+                    try:
+                        await executor_manager.run_io(self.redis_client.release_lock, lock_key, lock_identifier)
+                    except ExecutorQueueFullError:
+                        await asyncio.to_thread(self.redis_client.release_lock, lock_key, lock_identifier)
             else:
                 # Lock acquisition failed, wait for cache
                 self.logger.info(f"Lock acquisition failed, waiting for cache: {cache_key}")
-                cached_result = self.redis_client.wait_for_cache(cache_key, self.cache_wait_timeout)
+                if batch_slot:
+                    batch_slot.leave()  # Không bắt cả batch chờ cache của process khác
+                cached_result = await self._wait_for_cache(cache_key)
                 
                 if cached_result:
                     self.logger.info(f"Cache populated by another process: {cache_key}")
@@ -150,7 +195,7 @@ class SignalService:
                     symbol = cache_key_data.get("symbol", "UNKNOWN")
                     
                     # Try to find the actual log folder that was created
-                    log_folder_path = self._find_actual_log_folder(timezone, timeframe, symbol)
+                    log_folder_path = await executor_manager.run_io(self._find_actual_log_folder, timezone, timeframe, symbol)
                     
                     return ResponseHandler.success(
                         data=cached_result,
@@ -160,35 +205,233 @@ class SignalService:
                     self.logger.error(f"Cache wait timeout: {cache_key}")
                     return ResponseHandler.redis_lock_timeout()
                     
+        except ExecutorQueueFullError as e:
+            self.logger.warning(f"Signal request rejected: {e}")
+            return ResponseHandler.executor_queue_full(e.pool)
         except Exception as e:
             self.logger.error(f"Signal analysis error: {str(e)}")
             return ResponseHandler.signal_service_error(str(e))
     
-    async def _process_signal_direct(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _wait_for_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Chờ process đang giữ lock ghi cache (poll trên event loop, mỗi lần poll chỉ 1 GET ngắn trên IO pool)
+        
+        Request chờ không giữ thread của IO pool => nhiều request trùng không chiếm hết pool của Redis I/O khác
+        
+        Returns:
+            Cached data hoặc None nếu hết cache_wait_timeout
+        """
+        deadline = time.monotonic() + self.cache_wait_timeout
+        while True:
+            try:
+                cached_result = await executor_manager.run_io(self.redis_client.get, cache_key)
+            except ExecutorQueueFullError:
+                cached_result = None  # Pool đang bận => thử lại ở lần poll sau
+            if cached_result:
+                return cached_result
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(CACHE_WAIT_POLL_INTERVAL)
+    
+    def _pre_check(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Pre-flight portfolio gate (luật pre-flight của risk manager: giới hạn số vị thế, trần rủi ro portfolio...)
+        
+        Args:
+            request_data: Request data (bỏ key pre_check)
+            
+        Returns:
+            Response HOLD (status STOP_TRADE / SKIP) nếu /risk_manager chắc chắn từ chối mọi tín hiệu, ngược lại None
+        """
+        enabled = request_data.pop("pre_check", None)
+        if not (settings.SIGNAL_PRE_CHECK_ENABLED if enabled is None else enabled):
+            return None
+        account_info = request_data.get("account_info")
+        portfolio_exposure = request_data.get("portfolio_exposure")
+        if not isinstance(account_info, dict) or portfolio_exposure is None:
+            return None
+        
+        symbol = request_data.get("symbol", "UNKNOWN")
+        # Cùng giới hạn số vị thế với /risk_manager (balance_config), không dùng max_positions của request
+        status, reason = self.risk_manager.pre_check(
+            symbol, account_info, portfolio_exposure, request_data.get("balance_config")
+        )
+        if status == "CONTINUE":
+            return None
+        
+        self.pre_check_stops += 1
+        self.logger.info(f"Pre-check {status} for {symbol}: {reason} - skip AI call")
+        return ResponseHandler.success(
+            data=self._hold_signal(symbol, f"Pre-check {status}: {reason}"),
+            pre_check={"status": status, "reason": reason}
+        )
+    
+    async def _market_closed_response(self, request_data: Dict[str, Any], timezone: str, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Market calendar gate (phiên tuần UTC + ngày nghỉ theo giờ broker của cache_key.timezone)
+        
+        Args:
+            request_data: Request data
+            timezone: cache_key.timezone (giờ broker)
+            cache_key: Signal cache key
+            
+        Returns:
+            Signal đang cache hoặc HOLD kèm market_closed nếu thị trường đóng, ngược lại None
+        """
+        if not settings.MARKET_CALENDAR_ENABLED:
+            return None
+        offset = parse_timezone_offset(timezone)
+        is_open, reason = market_calendar.status(utc_offset_seconds=offset)
+        if is_open:
+            return None
+        
+        self.market_closed_stops += 1
+        market_closed = {"reason": reason, "next_open": market_calendar.next_open(utc_offset_seconds=offset)}
+        cached_result = None
+        if await executor_manager.run_io(self.redis_client.is_connected):
+            cached_result = await executor_manager.run_io(self.redis_client.get, cache_key)
+        self.logger.info(f"{reason}: {cache_key} - {'cached signal' if cached_result else 'HOLD'}, skip AI call")
+        if cached_result:
+            return ResponseHandler.success(data=cached_result, market_closed=market_closed)
+        return ResponseHandler.success(
+            data=self._hold_signal(request_data.get("symbol", "UNKNOWN"), reason),
+            market_closed=market_closed
+        )
+    
+    async def _reuse_previous_signal(self, basis_key: Optional[str], fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Change detector: so fingerprint của request với fingerprint lưu cùng kết quả AI lần trước
+        
+        Args:
+            basis_key: Key của _generate_basis_key
+            fingerprint: extract_fingerprint của request
+            
+        Returns:
+            {'signal', 'analyzed_at', 'max_change'} nếu phát lại được, ngược lại None
+        """
+        if not signal_change_detector.enabled or not basis_key or not fingerprint:
+            return None
+        try:
+            if not await executor_manager.run_io(self.redis_client.is_connected):
+                return None
+            basis = await executor_manager.run_io(self.redis_client.get, basis_key)
+        except Exception as e:
+            self.logger.warning(f"Failed to load signal basis {basis_key}: {e}")
+            return None
+        reused = signal_change_detector.check(basis, fingerprint)
+        if reused:
+            self.logger.info(f"Inputs unchanged since {reused['analyzed_at']} (max change {reused['max_change']}x tolerance): "
+                             f"{basis_key} - reuse previous signal, skip AI call")
+        return reused
+    
+    async def _store_signal_basis(self, basis_key: Optional[str], signal_data: Dict[str, Any], fingerprint: Dict[str, Any]):
+        """Lưu signal vừa phân tích + fingerprint của input (TTL SIGNAL_REUSE_MAX_AGE) cho change detector"""
+        if not signal_change_detector.enabled or not basis_key or not fingerprint:
+            return
+        basis = {"signal": dict(signal_data), "fingerprint": fingerprint, "analyzed_at": self._get_current_timestamp()}
+        try:
+            if await executor_manager.run_io(self.redis_client.is_connected):
+                await executor_manager.run_io(self.redis_client.set, basis_key, basis, signal_change_detector.max_age)
+        except Exception as e:
+            self.logger.warning(f"Failed to store signal basis {basis_key}: {e}")
+    
+    @staticmethod
+    def _hold_signal(symbol: str, reasoning: str) -> Dict[str, Any]:
+        """Signal HOLD cùng định dạng với kết quả AI (xem _parse_ai_response)"""
+        return {
+            "symbol": symbol,
+            "signal_type": "HOLD",
+            "order_type_proposed": None,
+            "entry_price_proposed": None,
+            "stop_loss_proposed": None,
+            "take_profit_proposed": None,
+            "estimate_win_probability": None,
+            "risk_reward_ratio": None,
+            "trailing_stop_loss": None,
+            "pips_to_take_profit": None,
+            "technical_reasoning": reasoning
+        }
+    
+    async def _process_signal_direct(self, request_data: Dict[str, Any], batch_slot: Optional[BatchSlot] = None) -> Dict[str, Any]:
         """
         Process signal directly without cache (fallback)
         
         Args:
             request_data: Request data
+            batch_slot: Chỗ trong PromptBatch (None => gọi AI riêng)
             
         Returns:
             Signal analysis result
         """
         try:
-            # Generate prompt
-            prompt = self.prompt_service.create_prompt_for_signal_analyst(request_data)
-            if not prompt:
-                return ResponseHandler.error(ErrorCodes.PROMPT_SERVICE_ERROR, details="Failed to generate prompt")
+            # Server-side price action: client chỉ cần gửi nến thô (đầy đủ, delta hoặc 1 chuỗi gốc để resample)
+            candle_sync = None
+            if self.multi_timeframes_processor.has_raw_data(request_data.get("multi_timeframes")):
+                candles = await self._sync_candles(request_data)
+                if candles.get("error_response"):
+                    return candles["error_response"]
+                candle_sync = candles.get("acks") or None
+
+                processing_result = await self.multi_timeframes_processor.process_multi_timeframes_async(
+                    symbol_origin_name=request_data.get("symbol", "UNKNOWN"),
+                    symbol_info=request_data.get("symbol_info", {}),
+                    multi_timeframes=request_data.get("multi_timeframes", {}),
+                    context="signal_generation",
+                    columns_by_tf=candles.get("columns"),
+                    roles=self._timeframe_roles(request_data.get("timeframe")),
+                    namespace=(request_data.get("cache_key") or {}).get("timezone")
+                )
+                if not processing_result.get("success"):
+                    return ResponseHandler.error(ErrorCodes.PROMPT_SERVICE_ERROR, details=processing_result.get("error"))
+
+            # Setup chấm điểm thấp => HOLD, không gọi AI (shadow: chỉ ghi thống kê)
+            screen = signal_screener.screen(request_data.get("multi_timeframes"), request_data.get("timeframe"))
+            if screen and screen["skip"]:
+                self.logger.info(f"Screener HOLD for {request_data.get('symbol')}: score {screen['score']} - {'; '.join(screen['reasons'])}")
+                extra_fields = {"candle_sync": candle_sync} if candle_sync else {}
+                return ResponseHandler.success(
+                    data=self._hold_signal(request_data.get("symbol", "UNKNOWN"),
+                                           f"Screener score {screen['score']} < {signal_screener.threshold}: {'; '.join(screen['reasons'])}"),
+                    screener={"score": screen["score"], "bias": screen["bias"], "reasons": screen["reasons"]},
+                    **extra_fields
+                )
             
-            # Call AI service
-            ai_response = await self.ai_service.generate_response(prompt)
-            if not ai_response:
-                return ResponseHandler.ai_error("AI service returned empty response")
+            # Input chưa đổi đáng kể so với lần gọi AI trước => phát lại signal đó, không gọi AI
+            fingerprint = extract_fingerprint(request_data.get("multi_timeframes"))
+            basis_key = self._generate_basis_key(request_data)
+            reused = await self._reuse_previous_signal(basis_key, fingerprint)
+            if reused:
+                extra_fields = {"candle_sync": candle_sync} if candle_sync else {}
+                signal = dict(reused["signal"], timestamp=self._get_current_timestamp())
+                return ResponseHandler.success(
+                    data=signal,
+                    reused_signal={"analyzed_at": reused["analyzed_at"], "max_change": reused["max_change"]},
+                    **extra_fields
+                )
             
-            # Parse AI response
-            signal_data = self._parse_ai_response(ai_response)
-            if not signal_data:
-                return ResponseHandler.ai_error("Failed to parse AI response")
+            # Batch mode: 1 lần gọi AI cho cả nhóm symbol (None => entry lỗi / batch 1 request, gọi AI riêng)
+            batched = await batch_slot.submit(request_data) if batch_slot else None
+            if batched:
+                prompt, signal_data = batched["prompt"], batched["signal"]
+            else:
+                # Generate prompt
+                prompt = await executor_manager.run_io(self.prompt_service.create_prompt_for_signal_analyst, request_data)
+                if not prompt:
+                    return ResponseHandler.error(ErrorCodes.PROMPT_SERVICE_ERROR, details="Failed to generate prompt")
+                
+                # Call AI service
+                ai_response = await self.ai_service.generate_response(prompt)
+                if not ai_response:
+                    return ResponseHandler.ai_error("AI service returned empty response")
+                
+                # Parse AI response
+                signal_data = self._parse_ai_response(ai_response)
+                if not signal_data:
+                    return ResponseHandler.ai_error("Failed to parse AI response")
+            # SL buffer / R:R / pips / trailing stop tính chính xác từ ATR + symbol_info.digits
+            signal_postprocessor.process(signal_data, request_data)
+            signal_screener.record(screen, signal_data.get("signal_type"))
+            await self._store_signal_basis(basis_key, signal_data, fingerprint)
             
             # Log response với prompt content và get log path
             log_folder_path = None
@@ -200,7 +443,8 @@ class SignalService:
                 symbol = cache_key_data.get("symbol", "UNKNOWN")
                 
                 # Log response và lấy đường dẫn folder thực tế đã lưu
-                log_file_path = response_logger.log_signal_response(
+                log_file_path = await executor_manager.run_io(
+                    response_logger.log_signal_response,
                     timezone=timezone,
                     timeframe=timeframe,
                     symbol=symbol,
@@ -222,13 +466,19 @@ class SignalService:
                 self.logger.warning(f"Failed to log response: {log_error}")
             
             # Create success response with actual log folder path
+            extra_fields = {"candle_sync": candle_sync} if candle_sync else {}
+            if batched:
+                extra_fields["prompt_batch"] = {"size": batched["size"]}
             success_response = ResponseHandler.success(
                 data=signal_data,
-                tracking_path_signal=log_folder_path  # Đường dẫn folder thực tế đã lưu log
+                tracking_path_signal=log_folder_path,  # Đường dẫn folder thực tế đã lưu log
+                **extra_fields  # Timestamp nến cuối đã lưu theo timeframe (dùng làm since cho raw_delta)
             )
             
             return success_response
             
+        except ExecutorQueueFullError:
+            raise
         except Exception as e:
             self.logger.error(f"Direct signal processing error: {str(e)}")
             error_response = ResponseHandler.signal_service_error(str(e))
@@ -254,6 +504,156 @@ class SignalService:
             
             return error_response
     
+    async def analyze_signal_batch(self, requests_data: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Phân tích nhiều symbol: mỗi request đi qua đúng luồng của analyze_signal (gate, cache, lock, screener,
+        change detector...), các request cần gọi AI cùng main timeframe được gom tối đa batch_size / 1 lần gọi AI
+        
+        Args:
+            requests_data: Danh sách request /signal
+            batch_size: Số symbol tối đa mỗi prompt (mặc định SIGNAL_BATCH_SIZE)
+            
+        Returns:
+            Response /signal của từng request theo thứ tự gửi lên
+        """
+        size = max(batch_size or settings.SIGNAL_BATCH_SIZE, 1)
+        groups: Dict[str, List[int]] = {}
+        for index, request_data in enumerate(requests_data):
+            groups.setdefault(request_data.get("timeframe") or "", []).append(index)
+        
+        slots: List[Optional[BatchSlot]] = [None] * len(requests_data)
+        for indexes in groups.values():
+            for start in range(0, len(indexes), size):
+                chunk = indexes[start:start + size]
+                batch = PromptBatch(len(chunk), self._analyze_prompt_batch)
+                for index in chunk:
+                    slots[index] = batch.slot()
+        
+        async def run(request_data: Dict[str, Any], slot: BatchSlot) -> Dict[str, Any]:
+            try:
+                return await self.analyze_signal(request_data, slot)
+            finally:
+                slot.leave()
+        
+        return list(await asyncio.gather(*(run(request_data, slot) for request_data, slot in zip(requests_data, slots))))
+    
+    async def _analyze_prompt_batch(self, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Flush của PromptBatch: 1 prompt + 1 lần gọi AI cho các symbol của batch
+        
+        Args:
+            items: Request data của các symbol (đã xử lý multi_timeframes)
+            
+        Returns:
+            {'prompt', 'signal', 'size'} theo thứ tự items, None cho entry thiếu / không hợp lệ (gọi AI riêng)
+        """
+        prompt = await executor_manager.run_io(self.prompt_service.create_prompt_for_signal_batch, items)
+        ai_response = await self.ai_service.generate_response(prompt) if prompt else None
+        if not ai_response:
+            self.logger.warning(f"Batch AI call for {len(items)} symbols returned empty response")
+            return [None] * len(items)
+        
+        signals = self._parse_ai_batch_response(ai_response, [item.get("symbol") for item in items])
+        self.logger.info(f"Batch AI call: {sum(s is not None for s in signals)}/{len(items)} symbols parsed")
+        return [{"prompt": prompt, "signal": signal, "size": len(items)} if signal else None for signal in signals]
+    
+    def _parse_ai_batch_response(self, ai_response: str, symbols: List[Optional[str]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Parse JSON array của prompt batch, kiểm tra từng entry như _parse_ai_response
+        
+        Args:
+            ai_response: Raw AI response string
+            symbols: Symbol của từng request trong batch
+            
+        Returns:
+            Signal theo thứ tự symbols (None nếu thiếu, trùng hoặc không hợp lệ)
+        """
+        import json
+        import re
+        
+        json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
+        try:
+            entries = json.loads(json_match.group(0)) if json_match else None
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Batch JSON parsing error: {str(e)}")
+            entries = None
+        if not isinstance(entries, list):
+            self.logger.error(f"Batch AI response is not a JSON array: {ai_response[:500]}...")
+            return [None] * len(symbols)
+        
+        by_symbol: Dict[str, Optional[Dict[str, Any]]] = {}
+        for entry in entries:
+            if not self._validate_signal_data(entry):
+                continue
+            symbol = entry["symbol"]
+            # Trùng symbol => không biết entry nào đúng, gọi AI riêng cho symbol đó
+            by_symbol[symbol] = None if symbol in by_symbol else entry
+        return [by_symbol.get(symbol) for symbol in symbols]
+    
+    async def _sync_candles(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Đồng bộ nến của request với candle store.
+        Nếu request khai báo base_timeframe (M30/H1), dựng các timeframe của get_timeframe_config
+        từ chuỗi gốc đó và thay multi_timeframes trong request_data bằng các timeframe đã dựng.
+        
+        Args:
+            request_data: Request data
+            
+        Returns:
+            dict: {'columns': {tf: CandleColumns}, 'acks': {tf: timestamp}, 'error_response': Optional[dict]}
+        """
+        symbol = request_data.get("symbol", "UNKNOWN")
+        timezone = request_data.get("cache_key", {}).get("timezone", "UNKNOWN")
+        multi_timeframes = request_data.get("multi_timeframes", {})
+        base_timeframe = request_data.get("base_timeframe")
+        
+        if base_timeframe and base_timeframe not in multi_timeframes:
+            return {"error_response": ResponseHandler.error(ErrorCodes.INVALID_TIMEFRAME, timeframe=base_timeframe)}
+        
+        sync_result = await candle_store_service.sync_timeframes(
+            namespace=timezone,
+            symbol=symbol,
+            multi_timeframes={base_timeframe: multi_timeframes[base_timeframe]} if base_timeframe else multi_timeframes,
+            window_size=settings.RESAMPLE_BASE_WINDOW if base_timeframe else None
+        )
+        if sync_result.get("resync"):
+            self.logger.warning(sync_result.get("error"))
+            return {"error_response": ResponseHandler.candle_resync_required(sync_result["resync"])}
+        if not sync_result.get("success"):
+            return {"error_response": ResponseHandler.error(ErrorCodes.PROMPT_SERVICE_ERROR, details=sync_result.get("error"))}
+        correlation_engines.observe(timezone, symbol, sync_result["columns"])
+        if not base_timeframe:
+            return {"columns": sync_result["columns"], "acks": sync_result["acks"]}
+        
+        # Resample: 1 chuỗi gốc => higher/main/lower timeframe
+        tf_config = get_timeframe_config(request_data.get("timeframe"))
+        targets = [tf_config["higher_timeframe"], tf_config["main_timeframe"], tf_config["lower_timeframe"]]
+        utc_offset = parse_timezone_offset(timezone) if request_data.get("base_time_basis") == TIME_BASIS_UTC else 0
+        try:
+            columns = build_timeframes(
+                sync_result["columns"][base_timeframe], base_timeframe, targets,
+                utc_offset_seconds=utc_offset, max_bars=settings.RESAMPLE_OUTPUT_BARS
+            )
+        except ResampleError as e:
+            self.logger.error(f"Resample failed for {symbol}: {e}")
+            return {"error_response": ResponseHandler.error(ErrorCodes.INVALID_TIMEFRAME, timeframe=f"{base_timeframe} -> {', '.join(targets)}")}
+        
+        # Giữ indicators client gửi (nếu có) cho từng timeframe, bỏ nến thô của chuỗi gốc
+        request_data["multi_timeframes"] = {
+            tf: {key: value for key, value in (multi_timeframes.get(tf) or {}).items() if key not in RAW_KEYS}
+            for tf in targets
+        }
+        self.logger.info(f"Resampled {symbol} {base_timeframe} -> {', '.join(targets)}")
+        if base_timeframe != correlation_engines.timeframe:
+            correlation_engines.observe(timezone, symbol, columns)
+        return {"columns": columns, "acks": sync_result["acks"]}
+    
+    @staticmethod
+    def _timeframe_roles(main_timeframe: Optional[str]) -> Dict[str, str]:
+        """Vai trò của từng timeframe trong request ({tf: "higher"/"main"/"lower"}) cho thống kê analysis cache"""
+        tf_config = get_timeframe_config(main_timeframe)
+        return {tf_config[f"{role}_timeframe"]: role for role in ("lower", "main", "higher")}
+    
     def _parse_ai_response(self, ai_response: str) -> Optional[Dict[str, Any]]:
         """
         Parse AI response into signal data according to prompt_signal_analyst.py format
@@ -307,33 +707,9 @@ class SignalService:
             # Parse JSON
             signal_data = json.loads(json_str)
             
-            # Validate required fields
-            required_fields = ["symbol", "signal_type", "technical_reasoning"]
-            for field in required_fields:
-                if field not in signal_data:
-                    self.logger.error(f"Missing required field: {field}")
-                    return None
-            
-            # Validate signal_type
-            valid_signals = ["BUY", "SELL", "HOLD"]
-            if signal_data["signal_type"] not in valid_signals:
-                self.logger.error(f"Invalid signal_type: {signal_data['signal_type']}")
+            if not self._validate_signal_data(signal_data):
                 return None
             
-            # Validate order_type_proposed if present
-            if signal_data.get("order_type_proposed"):
-                valid_order_types = ["MARKET", "LIMIT", "STOP"]
-                if signal_data["order_type_proposed"] not in valid_order_types:
-                    self.logger.error(f"Invalid order_type_proposed: {signal_data['order_type_proposed']}")
-                    return None
-            
-            # Validate estimate_win_probability if present
-            if signal_data.get("estimate_win_probability") is not None:
-                prob = signal_data["estimate_win_probability"]
-                if not isinstance(prob, int) or prob < 20 or prob > 85:
-                    self.logger.error(f"Invalid estimate_win_probability: {prob}")
-                    return None
-            
             # Log successful parsing
             self.logger.info(f"Successfully parsed AI response: {signal_data['signal_type']} for {signal_data['symbol']}")
             
@@ -348,6 +724,49 @@ class SignalService:
             self.logger.error(f"Raw AI response: {ai_response[:500]}...")
             return None
     
+    def _validate_signal_data(self, signal_data: Any) -> bool:
+        """
+        Kiểm tra 1 signal đã parse theo định dạng của prompt_signal_analyst
+        
+        Args:
+            signal_data: Signal object từ AI response
+            
+        Returns:
+            True nếu hợp lệ
+        """
+        if not isinstance(signal_data, dict):
+            self.logger.error(f"Invalid signal object: {type(signal_data).__name__}")
+            return False
+        
+        # Validate required fields
+        required_fields = ["symbol", "signal_type", "technical_reasoning"]
+        for field in required_fields:
+            if field not in signal_data:
+                self.logger.error(f"Missing required field: {field}")
+                return False
+        
+        # Validate signal_type
+        valid_signals = ["BUY", "SELL", "HOLD"]
+        if signal_data["signal_type"] not in valid_signals:
+            self.logger.error(f"Invalid signal_type: {signal_data['signal_type']}")
+            return False
+        
+        # Validate order_type_proposed if present
+        if signal_data.get("order_type_proposed"):
+            valid_order_types = ["MARKET", "LIMIT", "STOP"]
+            if signal_data["order_type_proposed"] not in valid_order_types:
+                self.logger.error(f"Invalid order_type_proposed: {signal_data['order_type_proposed']}")
+                return False
+        
+        # Validate estimate_win_probability if present
+        if signal_data.get("estimate_win_probability") is not None:
+            prob = signal_data["estimate_win_probability"]
+            if not isinstance(prob, int) or prob < 20 or prob > 85:
+                self.logger.error(f"Invalid estimate_win_probability: {prob}")
+                return False
+        
+        return True
+    
     def _get_current_timestamp(self) -> str:
         """Get current timestamp in ISO format"""
         from datetime import datetime
@@ -0,0 +1,104 @@
+"""
+Analysis Cache
+Cache kết quả phân tích theo timeframe (analyze_price_action) dùng chung giữa các request
+
+Cùng 1 symbol/timeframe xuất hiện ở nhiều vai trò (W1 là higher của H4/H8/D1, H4 là main của H4 và lower của D1...)
+và nến của higher timeframe ít đổi giữa 2 lần gọi /signal, nên 1 block phân tích có thể được tái sử dụng thay vì tính lại.
+Key gồm nến cuối (time + close) và digest của toàn bộ giá => nến mới hoặc nến đang hình thành đổi giá sẽ tạo key mới.
+"""
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.candle_codec import PRICE_DTYPE
+
+
+ROLE_UNKNOWN = "unknown"
+
+
+class AnalysisCache:
+    """LRU cache in-process cho block phân tích theo (symbol, timeframe, cửa sổ nến)"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: Số block tối đa (mặc định ANALYSIS_CACHE_MAX_ENTRIES)
+        """
+        self.max_entries = max_entries or settings.ANALYSIS_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(symbol: str, timeframe: str, columns, pip_size: float) -> Optional[Tuple]:
+        """
+        Key của block phân tích
+
+        Args:
+            symbol, timeframe: Symbol / timeframe
+            columns: CandleColumns của timeframe
+            pip_size: Pip size dùng cho phân tích
+
+        Returns:
+            tuple hoặc None nếu không có nến
+        """
+        if columns.size == 0:
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        for col in columns[1:]:
+            digest.update(np.ascontiguousarray(col, dtype=PRICE_DTYPE).tobytes())
+        return (
+            symbol, timeframe, columns.size, str(columns.times[0]), str(columns.times[-1]),
+            float(columns.closes[-1]), float(pip_size), digest.hexdigest()
+        )
+
+    def get(self, key: Optional[Tuple], role: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Lấy bản copy của block đã cache (request được sửa tự do, block trong cache không đổi)
+
+        Args:
+            key: Key từ make_key
+            role: Vai trò timeframe trong request (higher/main/lower) để thống kê hit-rate
+        """
+        with self._lock:
+            block = self._entries.get(key) if key is not None else None
+            if block is not None:
+                self._entries.move_to_end(key)
+            stats = self._stats.setdefault(role or ROLE_UNKNOWN, {"hits": 0, "misses": 0})
+            stats["hits" if block is not None else "misses"] += 1
+        return copy.deepcopy(block)
+
+    def put(self, key: Optional[Tuple], block: Dict[str, Any]):
+        """Lưu bản copy của block phân tích (analyze_price_action) - request gốc vẫn giữ và sửa object của nó"""
+        if key is None:
+            return
+        block = copy.deepcopy(block)
+        with self._lock:
+            self._entries[key] = block
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Hit-rate theo vai trò timeframe"""
+        with self._lock:
+            roles = {}
+            for role, stats in self._stats.items():
+                total = stats["hits"] + stats["misses"]
+                roles[role] = dict(stats, hit_rate=round(stats["hits"] / total, 4) if total else 0.0)
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "roles": roles}
+
+
+# Global analysis cache instance
+analysis_cache = AnalysisCache()
@@ -0,0 +1,167 @@
+"""
+Candle Codec
+Giải mã dữ liệu nến của /signal thành các mảng NumPy song song (columnar)
+
+Hỗ trợ 3 format cho mỗi timeframe trong multi_timeframes:
+1. raw_data (cũ): list các dict {time, open, high, low, close, tick_volume}
+2. raw_columns, encoding "list": mảng song song
+    {"time": [...], "open": [...], "high": [...], "low": [...], "close": [...], "tick_volume": [...]}
+3. raw_columns, encoding "base64": buffer little-endian đóng gói base64
+    {"encoding": "base64", "time": "<int64>", "open": "<float64>", ..., "tick_volume": "<int64 | float64>"}
+   Giải mã bằng np.frombuffer => view trực tiếp trên buffer, không tạo object Python cho từng nến.
+4. raw_delta: chỉ các nến sau timestamp client đã được ack, cùng format với raw_columns + "since"
+    {"since": 1726000000, "encoding": "base64", "time": "...", ...}
+   Cửa sổ đầy đủ được dựng lại từ CandleStoreService (app/services/candle_store_service.py).
+"""
+
+import base64
+import binascii
+from typing import Any, Dict, NamedTuple
+
+import numpy as np
+
+
+# ===== CẤU HÌNH FORMAT (khai báo ở đầu file để dễ bảo trì) =====
+RAW_ROWS_KEY = 'raw_data'
+RAW_COLUMNS_KEY = 'raw_columns'
+RAW_DELTA_KEY = 'raw_delta'
+RAW_KEYS = (RAW_ROWS_KEY, RAW_COLUMNS_KEY, RAW_DELTA_KEY)
+ENCODING_LIST = 'list'
+ENCODING_BASE64 = 'base64'
+
+TIME_DTYPE = np.dtype('<i8')
+PRICE_DTYPE = np.dtype('<f8')
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+VOLUME_FIELD = 'tick_volume'
+
+
+class CandleDecodeError(ValueError):
+    """Payload nến không hợp lệ"""
+
+
+class CandleColumns(NamedTuple):
+    """Các mảng OHLCV song song của 1 timeframe"""
+    times: Any
+    opens: np.ndarray
+    highs: np.ndarray
+    lows: np.ndarray
+    closes: np.ndarray
+    volumes: np.ndarray
+
+    @property
+    def size(self) -> int:
+        """Số nến"""
+        return len(self.closes)
+
+
+def has_candles(tf_data: Any) -> bool:
+    """Timeframe có dữ liệu nến thô (raw_data, raw_columns hoặc raw_delta)"""
+    return isinstance(tf_data, dict) and any(key in tf_data for key in RAW_KEYS)
+
+
+def decode_timeframe(tf_data: Dict[str, Any]) -> CandleColumns:
+    """
+    Giải mã dữ liệu nến của 1 timeframe (ưu tiên raw_columns)
+
+    Args:
+        tf_data: Dữ liệu timeframe từ request
+
+    Returns:
+        CandleColumns
+
+    Raises:
+        CandleDecodeError: Payload sai format / độ dài cột không khớp
+    """
+    if RAW_COLUMNS_KEY in tf_data:
+        return decode_columns(tf_data[RAW_COLUMNS_KEY])
+    if RAW_ROWS_KEY not in tf_data and RAW_DELTA_KEY in tf_data:
+        raise CandleDecodeError("raw_delta must be merged through the candle store")
+    return rows_to_columns(tf_data.get(RAW_ROWS_KEY))
+
+
+def decode_columns(payload: Any) -> CandleColumns:
+    """Giải mã raw_columns (list hoặc base64)"""
+    if not isinstance(payload, dict):
+        raise CandleDecodeError("raw_columns must be an object")
+
+    encoding = payload.get('encoding', ENCODING_LIST)
+    if encoding == ENCODING_BASE64:
+        times = _decode_buffer(payload, 'time', TIME_DTYPE)
+        prices = [_decode_buffer(payload, field, PRICE_DTYPE) for field in PRICE_FIELDS]
+        volumes = _decode_volume_buffer(payload) if VOLUME_FIELD in payload else np.zeros(len(prices[-1]))
+    elif encoding == ENCODING_LIST:
+        times = _as_array(payload, 'time', None)
+        prices = [_as_array(payload, field, PRICE_DTYPE) for field in PRICE_FIELDS]
+        volumes = _as_array(payload, VOLUME_FIELD, PRICE_DTYPE) if VOLUME_FIELD in payload else np.zeros(len(prices[-1]))
+    else:
+        raise CandleDecodeError(f"Unsupported raw_columns encoding: {encoding}")
+
+    columns = CandleColumns(times, *prices, volumes)
+    lengths = {len(col) for col in columns}
+    if len(lengths) != 1:
+        raise CandleDecodeError(f"raw_columns length mismatch: {sorted(lengths)}")
+    return columns
+
+
+def rows_to_columns(raw_list: Any) -> CandleColumns:
+    """Chuyển raw_data (list dict) sang cột, không tạo dict trung gian cho từng nến"""
+    if not isinstance(raw_list, list):
+        raise CandleDecodeError("raw_data must be a list")
+    try:
+        times = [c.get('time') for c in raw_list]
+        prices = [np.fromiter((c.get(field) for c in raw_list), dtype=PRICE_DTYPE, count=len(raw_list))
+                  for field in PRICE_FIELDS]
+        volumes = np.fromiter((c.get(VOLUME_FIELD) or 0 for c in raw_list), dtype=PRICE_DTYPE, count=len(raw_list))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise CandleDecodeError(f"Malformed raw_data record: {e}")
+    return CandleColumns(times, *prices, volumes)
+
+
+def encode_columns(columns: CandleColumns) -> Dict[str, str]:
+    """Đóng gói cột thành payload base64 (dùng cho client/test)"""
+    payload = {'encoding': ENCODING_BASE64, 'time': _encode(np.asarray(columns.times, dtype=TIME_DTYPE))}
+    for field, col in zip(PRICE_FIELDS, columns[1:5]):
+        payload[field] = _encode(np.asarray(col, dtype=PRICE_DTYPE))
+    payload[VOLUME_FIELD] = _encode(np.asarray(columns.volumes, dtype=PRICE_DTYPE))
+    return payload
+
+
+def _encode(array: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+
+def _decode_buffer(payload: Dict[str, Any], field: str, dtype: np.dtype) -> np.ndarray:
+    raw = _b64(payload, field)
+    if len(raw) % dtype.itemsize:
+        raise CandleDecodeError(f"raw_columns.{field} buffer size is not a multiple of {dtype.itemsize}")
+    return np.frombuffer(raw, dtype=dtype)
+
+
+def _decode_volume_buffer(payload: Dict[str, Any]) -> np.ndarray:
+    """tick_volume có thể gửi int64 hoặc float64 (khai báo qua tick_volume_dtype)"""
+    if payload.get('tick_volume_dtype') == 'int64':
+        return _decode_buffer(payload, VOLUME_FIELD, TIME_DTYPE).astype(PRICE_DTYPE)
+    return _decode_buffer(payload, VOLUME_FIELD, PRICE_DTYPE)
+
+
+def _b64(payload: Dict[str, Any], field: str) -> bytes:
+    value = payload.get(field)
+    if not isinstance(value, str):
+        raise CandleDecodeError(f"raw_columns.{field} is missing")
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise CandleDecodeError(f"raw_columns.{field} is not valid base64: {e}")
+
+
+def _as_array(payload: Dict[str, Any], field: str, dtype) -> Any:
+    value = payload.get(field)
+    if not isinstance(value, list):
+        raise CandleDecodeError(f"raw_columns.{field} is missing")
+    if dtype is None:
+        # time có thể là epoch (int) hoặc string => giữ nguyên list nếu không phải số
+        return np.asarray(value, dtype=TIME_DTYPE) if all(isinstance(v, int) for v in value) else value
+    try:
+        return np.asarray(value, dtype=dtype)
+    except (TypeError, ValueError) as e:
+        raise CandleDecodeError(f"raw_columns.{field} is not numeric: {e}")
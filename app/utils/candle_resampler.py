@@ -0,0 +1,137 @@
+"""
+Candle Resampler
+Dựng nến H2/H4/H8/D1/W1 từ 1 chuỗi nến gốc (M30 hoặc H1) bằng NumPy (reduceat), không lặp từng nến
+
+- Biên nến theo giờ server của broker: nếu time gốc là UTC thật, dịch theo offset của cache_key.timezone
+- Nến W1 bắt đầu từ Chủ nhật 00:00 giờ server (giống MT5)
+- Khoảng nghỉ cuối tuần / ngày lễ: bucket không có nến gốc thì không sinh nến
+"""
+
+import re
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from app.utils.candle_codec import CandleColumns, TIME_DTYPE
+
+
+# ===== CẤU HÌNH RESAMPLE (khai báo ở đầu file để dễ bảo trì) =====
+TIMEFRAME_SECONDS = {
+    "M30": 30 * 60,
+    "H1": 60 * 60,
+    "H2": 2 * 60 * 60,
+    "H4": 4 * 60 * 60,
+    "H8": 8 * 60 * 60,
+    "D1": 24 * 60 * 60,
+    "W1": 7 * 24 * 60 * 60,
+}
+BASE_TIMEFRAMES = ("M30", "H1")
+WEEK_ANCHOR_SECONDS = 3 * 24 * 60 * 60  # 1970-01-04 là Chủ nhật (epoch 0 là Thứ năm)
+
+TIME_BASIS_SERVER = "server"  # time dạng MT5: giờ server của broker ghi như UTC (mặc định)
+TIME_BASIS_UTC = "utc"        # time là UTC thật => cần dịch theo timezone của broker
+
+_TIMEZONE_PATTERN = re.compile(r"^(?:GMT|UTC)?\s*([+-])\s*(\d{1,2})(?:[.:](\d{1,2}))?$", re.IGNORECASE)
+
+
+class ResampleError(ValueError):
+    """Không resample được (timeframe không hỗ trợ / chuỗi gốc không hợp lệ)"""
+
+
+def parse_timezone_offset(timezone: Optional[str]) -> int:
+    """
+    Chuyển timezone của cache_key thành offset giây
+
+    Args:
+        timezone: Ví dụ "GMT+3.0", "GMT-5", "UTC+05:30", "GMT+5.5"
+
+    Returns:
+        int: Offset so với UTC (giây), 0 nếu không parse được
+    """
+    if not timezone:
+        return 0
+    text = timezone.strip()
+    if text.upper() in ("GMT", "UTC"):
+        return 0
+    match = _TIMEZONE_PATTERN.match(text)
+    if not match:
+        return 0
+    sign, hours, fraction = match.groups()
+    minutes = 0
+    if fraction:
+        # "5.5" => 30 phút, "05:30" => 30 phút
+        minutes = int(round(float(f"0.{fraction}") * 60)) if "." in text else int(fraction)
+    offset = int(hours) * 3600 + minutes * 60
+    return -offset if sign == "-" else offset
+
+
+def resample(columns: CandleColumns, base_timeframe: str, target_timeframe: str,
+             utc_offset_seconds: int = 0) -> CandleColumns:
+    """
+    Gộp chuỗi nến gốc thành timeframe lớn hơn
+
+    Args:
+        columns: Chuỗi nến gốc (time epoch tăng dần)
+        base_timeframe: Timeframe của chuỗi gốc (M30, H1, ...)
+        target_timeframe: Timeframe cần dựng
+        utc_offset_seconds: Offset giờ server so với time của chuỗi gốc (0 nếu time đã là giờ server)
+
+    Returns:
+        CandleColumns: time = thời điểm mở bucket (cùng hệ time với input)
+
+    Raises:
+        ResampleError: Timeframe không hỗ trợ hoặc không chia hết
+    """
+    base_seconds = TIMEFRAME_SECONDS.get(base_timeframe)
+    target_seconds = TIMEFRAME_SECONDS.get(target_timeframe)
+    if base_seconds is None or target_seconds is None:
+        raise ResampleError(f"Unsupported timeframe: {base_timeframe} -> {target_timeframe}")
+    if target_seconds < base_seconds or target_seconds % base_seconds:
+        raise ResampleError(f"Cannot build {target_timeframe} from {base_timeframe}")
+
+    times = np.asarray(columns.times, dtype=TIME_DTYPE)
+    if target_seconds == base_seconds or times.size == 0:
+        return columns._replace(times=times)
+
+    anchor = WEEK_ANCHOR_SECONDS if target_timeframe == "W1" else 0
+    buckets = (times + utc_offset_seconds - anchor) // target_seconds
+    if np.any(np.diff(buckets) < 0):
+        raise ResampleError("Base series must be sorted by time")
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [times.size])) - 1
+    return CandleColumns(
+        buckets[starts] * target_seconds + anchor - utc_offset_seconds,
+        np.asarray(columns.opens)[starts],
+        np.maximum.reduceat(columns.highs, starts),
+        np.minimum.reduceat(columns.lows, starts),
+        np.asarray(columns.closes)[ends],
+        np.add.reduceat(columns.volumes, starts)
+    )
+
+
+def build_timeframes(columns: CandleColumns, base_timeframe: str, targets: Iterable[str],
+                     utc_offset_seconds: int = 0, max_bars: Optional[int] = None) -> Dict[str, CandleColumns]:
+    """
+    Dựng nhiều timeframe từ 1 chuỗi gốc
+
+    Args:
+        columns: Chuỗi nến gốc
+        base_timeframe: M30 hoặc H1
+        targets: Các timeframe cần dựng (vd. lower/main/higher của get_timeframe_config)
+        utc_offset_seconds: Offset giờ server (xem resample)
+        max_bars: Giữ tối đa N nến cuối cho mỗi timeframe (None = giữ hết)
+
+    Returns:
+        dict: {timeframe: CandleColumns}
+    """
+    if base_timeframe not in BASE_TIMEFRAMES:
+        raise ResampleError(f"Base timeframe must be one of {', '.join(BASE_TIMEFRAMES)}")
+
+    result = {}
+    for tf in targets:
+        built = resample(columns, base_timeframe, tf, utc_offset_seconds)
+        if max_bars and built.size > max_bars:
+            built = CandleColumns(*(col[-max_bars:] for col in built))
+        result[tf] = built
+    return result
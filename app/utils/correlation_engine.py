@@ -0,0 +1,401 @@
+"""
+Rolling Correlation Engine
+Tương quan lợi suất (log return) cuốn chiếu giữa các symbol, tính từ nến đã lưu trong candle store
+
+Thay cho correlation_groups_json cố định của client:
+- Mỗi namespace (cache_key.timezone) có 1 engine cho timeframe CORRELATION_TIMEFRAME
+- Nến được đưa vào mỗi lần /signal đồng bộ nến; chỉ nến đã đóng (bỏ nến cuối đang hình thành)
+- Các symbol được căn theo mốc thời gian chung (hợp các mốc, thiếu nến => giữ giá đóng cửa trước đó);
+  1 mốc chỉ được chốt khi mọi symbol còn cập nhật đã có nến đóng tại/sau mốc đó
+- Mỗi mốc mới cập nhật tổng Σr, Σr·rᵀ của cửa sổ CORRELATION_WINDOW lợi suất: O(N²) mỗi nến thay vì tính lại O(W·N²);
+  tổng được tính lại từ buffer sau mỗi W mốc để không tích lũy sai số
+- Ma trận tương quan, cụm (liên thông theo |ρ| >= ngưỡng) và nhóm tương quan của 1 symbol theo ngưỡng
+  (cùng format correlation_groups_json để RiskManagerService dùng trực tiếp)
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.candle_codec import CandleColumns
+
+
+ROLLING_GROUP_PREFIX = "ROLLING:"   # Tên nhóm tương quan dựng từ engine: ROLLING:<symbol>
+SERIES_SLACK = 2                    # Giữ tối đa SERIES_SLACK * window nến đóng cho mỗi symbol (dựng lại khi cần)
+MIN_VARIANCE = 1e-18                # Phương sai nhỏ hơn => giá không đổi, không có hệ số tương quan
+
+
+class RollingCorrelationEngine:
+    """Tương quan lợi suất cuốn chiếu của 1 tập symbol trên cùng timeframe"""
+
+    def __init__(self, window: int, min_bars: int, max_symbols: int, stale_bars: int):
+        """
+        Args:
+            window: Số lợi suất trong cửa sổ tương quan
+            min_bars: Số lợi suất tối thiểu để có hệ số tương quan
+            max_symbols: Số symbol tối đa theo dõi
+            stale_bars: Symbol chậm hơn symbol mới nhất quá số nến này không chặn việc chốt mốc mới
+        """
+        self.window = window
+        self.min_bars = min_bars
+        self.max_symbols = max_symbols
+        self.stale_bars = stale_bars
+        self.symbols: List[str] = []
+        self._position: Dict[str, int] = {}
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # symbol -> (times, log close) các nến đã đóng
+        self._reset()
+        self.rebuilds = 0
+        self.updates = 0
+
+    def _reset(self):
+        """Xóa trạng thái cửa sổ (giữ chuỗi nến của các symbol)"""
+        n = len(self.symbols)
+        self._returns = np.zeros((self.window, n))
+        self._head = 0                          # Vị trí ghi tiếp theo trong ring buffer
+        self._count = 0
+        self._sum = np.zeros(n)
+        self._cross = np.zeros((n, n))
+        self._last_log_close = np.full(n, np.nan)
+        self._last_time: Optional[int] = None
+        self._since_rebase = 0
+        self.version = 0
+        self._matrix: Optional[Tuple[int, Optional[np.ndarray]]] = None
+
+    @property
+    def bars(self) -> int:
+        """Số lợi suất trong cửa sổ hiện tại"""
+        return self._count
+
+    # ------------------------------------------------------------------
+    # Cập nhật
+    # ------------------------------------------------------------------
+    def update(self, symbol: str, columns: CandleColumns) -> bool:
+        """
+        Đưa cửa sổ nến mới nhất của symbol vào engine
+
+        Args:
+            symbol: Symbol name
+            columns: Cửa sổ nến (time epoch int64), nến cuối coi là đang hình thành
+
+        Returns:
+            bool: False nếu bỏ qua (time không phải epoch, không có nến đóng, vượt max_symbols)
+        """
+        series = self._closed_series(columns)
+        if series is None:
+            return False
+        times, log_close = series
+        self.updates += 1
+
+        if symbol not in self._position:
+            if len(self.symbols) >= self.max_symbols:
+                return False
+            self._position[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self._series[symbol] = series
+            self._rebuild()
+            return True
+
+        previous_times = self._series[symbol][0]
+        self._series[symbol] = series
+        # Symbol bị coi là chậm (mốc đã chốt bằng giá cũ) nay có nến mới => tính lại cửa sổ
+        if self._last_time is not None and previous_times[-1] < self._last_time and times[-1] > previous_times[-1]:
+            self._rebuild()
+        else:
+            self._advance()
+        return True
+
+    def _closed_series(self, columns: CandleColumns) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(times, log close) của các nến đã đóng, bỏ nến giá không hợp lệ"""
+        times, closes = columns.times, columns.closes
+        if not isinstance(times, np.ndarray) or times.dtype.kind not in 'iu' or times.size < 2:
+            return None
+        times = times[:-1].astype(np.int64)
+        closes = np.asarray(closes[:-1], dtype=np.float64)
+        valid = np.isfinite(closes) & (closes > 0)
+        if not valid.all():
+            times, closes = times[valid], closes[valid]
+        if times.size == 0:
+            return None
+        keep = SERIES_SLACK * self.window + 1
+        return times[-keep:], np.log(closes[-keep:])
+
+    def _frontier(self) -> int:
+        """Mốc mới nhất có thể chốt: nến đóng cuối cùng chậm nhất trong các symbol còn cập nhật"""
+        last_times = [times[-1] for times, _ in self._series.values()]
+        newest = max(last_times)
+        fresh = []
+        for times, _ in self._series.values():
+            step = int(np.median(np.diff(times))) if times.size > 1 else 0
+            if step <= 0 or newest - times[-1] <= self.stale_bars * step:
+                fresh.append(times[-1])
+        return int(min(fresh)) if fresh else int(newest)
+
+    def _aligned_log_close(self, timeline: np.ndarray) -> np.ndarray:
+        """Log close của mọi symbol tại các mốc (thiếu nến => giá đóng cửa trước đó, chưa có => NaN)"""
+        aligned = np.full((timeline.size, len(self.symbols)), np.nan)
+        for symbol, column in self._position.items():
+            times, log_close = self._series[symbol]
+            index = np.searchsorted(times, timeline, side='right') - 1
+            present = index >= 0
+            aligned[present, column] = log_close[index[present]]
+        return aligned
+
+    def _timeline(self, start_exclusive: Optional[int], end: int) -> np.ndarray:
+        """Hợp các mốc nến đóng của mọi symbol trong (start_exclusive, end]"""
+        parts = []
+        for times, _ in self._series.values():
+            lo = 0 if start_exclusive is None else int(np.searchsorted(times, start_exclusive, side='right'))
+            hi = int(np.searchsorted(times, end, side='right'))
+            parts.append(times[lo:hi])
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def _rebuild(self):
+        """Tính lại cửa sổ từ chuỗi nến đã lưu (symbol mới / symbol chậm quay lại / thiếu quá nhiều mốc)"""
+        self.rebuilds += 1
+        self._reset()
+        if not self.symbols:
+            return
+        frontier = self._frontier()
+        # Chỉ dùng đoạn mọi symbol đều đã có giá
+        common_start = max(int(times[0]) for times, _ in self._series.values())
+        timeline = self._timeline(common_start - 1, frontier)
+        if timeline.size == 0:
+            return
+        timeline = timeline[-(self.window + 1):]
+        aligned = self._aligned_log_close(timeline)
+        self._last_time = int(timeline[-1])
+        self._last_log_close = aligned[-1].copy()
+        if timeline.size < 2:
+            return
+        returns = np.diff(aligned, axis=0)
+        self._count = returns.shape[0]
+        self._returns[:self._count] = returns
+        self._head = self._count % self.window
+        self._rebase()
+        self.version += 1
+
+    def _advance(self):
+        """Chốt các mốc mới từ sau mốc cuối đến frontier, cập nhật tổng theo từng mốc"""
+        if self._last_time is None:
+            self._rebuild()
+            return
+        frontier = self._frontier()
+        if frontier <= self._last_time:
+            return
+        timeline = self._timeline(self._last_time, frontier)
+        if timeline.size == 0:
+            return
+        if timeline.size > self.window:
+            self._rebuild()
+            return
+
+        aligned = self._aligned_log_close(timeline)
+        previous = self._last_log_close
+        for row in aligned:
+            # Symbol chưa từng có giá trước mốc đầu tiên (không xảy ra sau _rebuild) => lợi suất 0
+            returns = np.nan_to_num(row - previous)
+            self._push(returns)
+            previous = row
+        self._last_log_close = previous.copy()
+        self._last_time = int(timeline[-1])
+        self.version += 1
+
+    def _push(self, returns: np.ndarray):
+        """Thêm 1 dòng lợi suất vào cửa sổ, bỏ dòng cũ nhất nếu đầy"""
+        if self._count == self.window:
+            oldest = self._returns[self._head]
+            self._sum -= oldest
+            self._cross -= np.outer(oldest, oldest)
+        else:
+            self._count += 1
+        self._returns[self._head] = returns
+        self._head = (self._head + 1) % self.window
+        self._sum += returns
+        self._cross += np.outer(returns, returns)
+        self._since_rebase += 1
+        if self._since_rebase >= self.window:
+            self._rebase()
+
+    def _rebase(self):
+        """Tính lại tổng từ buffer (loại sai số tích lũy của cộng/trừ liên tiếp)"""
+        window = self._returns if self._count == self.window else self._returns[:self._count]
+        self._sum = window.sum(axis=0)
+        self._cross = window.T @ window
+        self._since_rebase = 0
+
+    # ------------------------------------------------------------------
+    # Truy vấn
+    # ------------------------------------------------------------------
+    def matrix(self) -> Optional[np.ndarray]:
+        """
+        Ma trận tương quan theo thứ tự self.symbols
+
+        Returns:
+            np.ndarray (N, N), NaN ở symbol giá không đổi; None nếu chưa đủ min_bars lợi suất
+        """
+        if self._matrix is not None and self._matrix[0] == self.version:
+            return self._matrix[1]
+        corr = None
+        n = self._count
+        if n >= max(self.min_bars, 2):
+            mean = self._sum / n
+            cov = self._cross / n - np.outer(mean, mean)
+            variance = np.diag(cov).copy()
+            valid = variance > MIN_VARIANCE
+            std = np.sqrt(np.where(valid, variance, 1.0))
+            corr = np.clip(cov / np.outer(std, std), -1.0, 1.0)
+            corr[~valid, :] = np.nan
+            corr[:, ~valid] = np.nan
+            np.fill_diagonal(corr, np.where(valid, 1.0, np.nan))
+        self._matrix = (self.version, corr)
+        return corr
+
+    def correlations(self, symbol: str) -> Optional[Dict[str, float]]:
+        """Hệ số tương quan của symbol với các symbol khác (None nếu symbol chưa có / chưa đủ dữ liệu)"""
+        corr = self.matrix()
+        column = self._position.get(symbol)
+        if corr is None or column is None or np.isnan(corr[column, column]):
+            return None
+        return {
+            other: float(corr[column, i]) for other, i in self._position.items()
+            if i != column and not np.isnan(corr[column, i])
+        }
+
+    def correlated(self, symbol: str, threshold: float) -> Optional[List[str]]:
+        """Symbol có |ρ| >= threshold với symbol (thứ tự |ρ| giảm dần)"""
+        correlations = self.correlations(symbol)
+        if correlations is None:
+            return None
+        matched = [(other, rho) for other, rho in correlations.items() if abs(rho) >= threshold]
+        return [other for other, _ in sorted(matched, key=lambda item: -abs(item[1]))]
+
+    def clusters(self, threshold: float) -> List[List[str]]:
+        """Cụm symbol liên thông theo |ρ| >= threshold (chỉ cụm từ 2 symbol)"""
+        corr = self.matrix()
+        if corr is None:
+            return []
+        parent = list(range(len(self.symbols)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        rows, cols = np.nonzero(np.triu(np.abs(np.nan_to_num(corr)) >= threshold, k=1))
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            parent[find(i)] = find(j)
+        members: Dict[int, List[str]] = {}
+        for i, symbol in enumerate(self.symbols):
+            members.setdefault(find(i), []).append(symbol)
+        return [group for group in members.values() if len(group) > 1]
+
+
+class CorrelationEngineRegistry:
+    """Engine tương quan theo namespace (cache_key.timezone) cho timeframe CORRELATION_TIMEFRAME"""
+
+    def __init__(self, timeframe: Optional[str] = None, window: Optional[int] = None, min_bars: Optional[int] = None,
+                 max_symbols: Optional[int] = None, stale_bars: Optional[int] = None):
+        """
+        Args:
+            timeframe: Timeframe dùng để tính tương quan (mặc định CORRELATION_TIMEFRAME)
+            window, min_bars, max_symbols, stale_bars: Xem RollingCorrelationEngine (mặc định theo settings)
+        """
+        self.timeframe = timeframe or settings.CORRELATION_TIMEFRAME
+        self.window = window or settings.CORRELATION_WINDOW
+        self.min_bars = min_bars or settings.CORRELATION_MIN_BARS
+        self.max_symbols = max_symbols or settings.CORRELATION_MAX_SYMBOLS
+        self.stale_bars = stale_bars or settings.CORRELATION_STALE_BARS
+        self._engines: Dict[str, RollingCorrelationEngine] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, namespace: str, symbol: str, columns: Dict[str, CandleColumns]) -> bool:
+        """
+        Đưa nến vừa đồng bộ của 1 request vào engine của namespace
+
+        Args:
+            namespace: cache_key.timezone
+            symbol: Symbol name
+            columns: {timeframe: CandleColumns} (chỉ dùng timeframe của registry)
+
+        Returns:
+            bool: True nếu engine được cập nhật
+        """
+        window = (columns or {}).get(self.timeframe)
+        if not settings.CORRELATION_ENGINE_ENABLED or window is None:
+            return False
+        with self._lock:
+            engine = self._engines.get(namespace)
+            if engine is None:
+                engine = self._engines[namespace] = RollingCorrelationEngine(
+                    self.window, self.min_bars, self.max_symbols, self.stale_bars
+                )
+            return engine.update(symbol, window)
+
+    def engine(self, namespace: str) -> Optional[RollingCorrelationEngine]:
+        """Engine của namespace (None nếu chưa có nến nào)"""
+        return self._engines.get(namespace)
+
+    def correlation_groups(self, namespace: str, symbol: str, threshold: Optional[float] = None) -> Optional[Dict[str, List[str]]]:
+        """
+        Nhóm tương quan của symbol theo ngưỡng, cùng format correlation_groups_json
+
+        Args:
+            namespace: cache_key.timezone
+            symbol: Symbol của tín hiệu
+            threshold: |ρ| tối thiểu (mặc định CORRELATION_THRESHOLD)
+
+        Returns:
+            dict: {"ROLLING:<symbol>": [symbol, các symbol tương quan...]} hoặc None nếu engine chưa đủ dữ liệu
+        """
+        engine = self._engines.get(namespace)
+        if engine is None:
+            return None
+        with self._lock:
+            correlated = engine.correlated(symbol, settings.CORRELATION_THRESHOLD if threshold is None else threshold)
+        if correlated is None:
+            return None
+        return {f"{ROLLING_GROUP_PREFIX}{symbol}": [symbol] + correlated}
+
+    def snapshot(self, namespace: str, threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Ma trận tương quan + cụm của namespace
+
+        Returns:
+            dict: {'timeframe', 'window', 'bars', 'symbols', 'matrix' (None nếu chưa đủ dữ liệu), 'clusters'}
+        """
+        threshold = settings.CORRELATION_THRESHOLD if threshold is None else threshold
+        engine = self._engines.get(namespace)
+        result = {'timeframe': self.timeframe, 'window': self.window, 'threshold': threshold,
+                  'bars': 0, 'symbols': [], 'matrix': None, 'clusters': []}
+        if engine is None:
+            return result
+        with self._lock:
+            corr = engine.matrix()
+            result.update(
+                bars=engine.bars,
+                symbols=list(engine.symbols),
+                matrix=None if corr is None else [
+                    [None if np.isnan(value) else round(float(value), 6) for value in row] for row in corr
+                ],
+                clusters=engine.clusters(threshold)
+            )
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số symbol / lợi suất của từng namespace"""
+        return {
+            'timeframe': self.timeframe,
+            'window': self.window,
+            'namespaces': {
+                namespace: {'symbols': len(engine.symbols), 'bars': engine.bars,
+                            'updates': engine.updates, 'rebuilds': engine.rebuilds}
+                for namespace, engine in list(self._engines.items())
+            }
+        }
+
+
+# Global registry (process chính - nơi candle store nhận nến)
+correlation_engines = CorrelationEngineRegistry()
@@ -0,0 +1,159 @@
+"""
+Correlation Index
+Inverted index symbol -> nhóm tương quan cho correlation_groups_json
+
+Nhóm tương quan gần như không đổi giữa các request nhưng trước đây mỗi request phải duyệt toàn bộ nhóm để tìm nhóm
+của symbol rồi kiểm tra "symbol in list" cho từng vị thế. Index được dựng 1 lần cho mỗi nội dung
+correlation_groups_json và dùng lại giữa các request trong cùng process:
+
+- Key = tuple tên nhóm theo thứ tự; index chỉ được dùng khi các nhóm quyết định kết quả (từ đầu đến nhóm đầu tiên
+  chứa symbol) có cùng nội dung với bản đã lưu (so sánh list trong C, không serialize)
+- Cùng object với lần gọi trước (nhiều tài khoản / tín hiệu trong 1 request) => dùng lại ngay
+- Vị thế tương quan tra bằng frozenset thay vì "in list"
+
+Cùng kết quả với cách duyệt cũ: nhóm đầu tiên (theo thứ tự khai báo) chứa symbol, tên nhóm rỗng => không thuộc nhóm.
+correlation_groups_json không phải {tên: [symbol chuỗi, ...]} => NOT_INDEXED (caller dùng lại cách duyệt cũ).
+"""
+
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+
+CORRELATION_INDEX_CACHE_SIZE = 256  # Số bộ correlation_groups_json khác nhau giữ trong memory (LRU)
+NOT_INDEXED = object()              # Kết quả của lookup khi không dùng được index
+
+CorrelationGroup = Tuple[List[str], FrozenSet[str]]
+
+
+class CorrelationIndex:
+    """symbol -> các nhóm chứa symbol (theo thứ tự khai báo) + tập symbol của từng nhóm"""
+
+    __slots__ = ('names', 'groups', 'groups_of', '_first_position')
+
+    def __init__(self, correlation_groups: Dict[str, List[str]]):
+        """
+        Args:
+            correlation_groups: {tên nhóm: [symbol, ...]} (đã kiểm tra bởi CorrelationIndexCache.is_indexable)
+        """
+        self.names: Tuple[str, ...] = tuple(correlation_groups)
+        self.groups: List[CorrelationGroup] = [(list(symbols), frozenset(symbols)) for symbols in correlation_groups.values()]
+        self.groups_of: Dict[str, Tuple[str, ...]] = {}
+        self._first_position: Dict[str, int] = {}
+        for position, (name, symbols) in enumerate(correlation_groups.items()):
+            for symbol in symbols:
+                groups = self.groups_of.get(symbol, ())
+                if name not in groups:
+                    self.groups_of[symbol] = groups + (name,)
+                self._first_position.setdefault(symbol, position)
+
+    def group(self, symbol: str) -> Optional[CorrelationGroup]:
+        """
+        Nhóm tương quan của symbol dùng cho correlation control
+
+        Returns:
+            tuple: (danh sách symbol của nhóm, frozenset) hoặc None nếu symbol không thuộc nhóm nào
+        """
+        position = self._first_position.get(symbol)
+        if position is None or not self.names[position]:
+            return None
+        return self.groups[position]
+
+    def span(self, symbol: str) -> int:
+        """Số nhóm quyết định kết quả của symbol: từ đầu đến nhóm đầu tiên chứa symbol (toàn bộ nếu không có)"""
+        position = self._first_position.get(symbol)
+        return len(self.names) if position is None else position + 1
+
+    def matches(self, correlation_groups: Dict[str, Any], upto: int) -> bool:
+        """upto nhóm đầu của correlation_groups (cùng tên nhóm theo thứ tự) có cùng nội dung với index"""
+        for incoming, (stored, _) in zip(islice(correlation_groups.values(), upto), self.groups):
+            if incoming != stored:
+                return False
+        return True
+
+
+class CorrelationIndexCache:
+    """LRU cache in-process của CorrelationIndex theo nội dung correlation_groups_json"""
+
+    def __init__(self, max_entries: int = CORRELATION_INDEX_CACHE_SIZE):
+        """
+        Args:
+            max_entries: Số index tối đa
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, ...], List[CorrelationIndex]]" = OrderedDict()
+        self._size = 0
+        # Object gần nhất + số nhóm đã xác nhận (giữ tham chiếu => id không bị tái sử dụng)
+        self._last: Optional[Tuple[dict, CorrelationIndex, int]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_indexable(correlation_groups: Any) -> bool:
+        """Chỉ {tên nhóm: [symbol chuỗi, ...]} cho cùng kết quả khi tra bằng set thay vì 'in list'"""
+        return isinstance(correlation_groups, dict) and all(
+            isinstance(name, str) and isinstance(symbols, list) and all(isinstance(s, str) for s in symbols)
+            for name, symbols in correlation_groups.items()
+        )
+
+    def lookup(self, correlation_groups: Any, symbol: Any) -> Any:
+        """
+        Nhóm tương quan của symbol qua index (dựng index nếu chưa có)
+
+        Returns:
+            CorrelationGroup / None (không thuộc nhóm) hoặc NOT_INDEXED nếu không dùng được index
+        """
+        if not isinstance(correlation_groups, dict) or not isinstance(symbol, str):
+            return NOT_INDEXED
+        last = self._last
+        if last is not None and last[0] is correlation_groups and last[1].span(symbol) <= last[2]:
+            # correlation_groups_json không bị sửa trong lúc xử lý request
+            self.hits += 1
+            return last[1].group(symbol)
+
+        key = tuple(correlation_groups)
+        with self._lock:
+            for index in self._entries.get(key, ()):
+                upto = index.span(symbol)
+                if index.matches(correlation_groups, upto):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if last is not None and last[0] is correlation_groups and last[1] is index:
+                        upto = max(upto, last[2])
+                    self._last = (correlation_groups, index, upto)
+                    return index.group(symbol)
+            self.misses += 1
+
+        if not self.is_indexable(correlation_groups):
+            return NOT_INDEXED
+        index = CorrelationIndex(correlation_groups)
+        with self._lock:
+            self._entries.setdefault(key, []).append(index)
+            self._entries.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            self._last = (correlation_groups, index, len(index.names))
+        return index.group(symbol)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số index và hit-rate"""
+        total = self.hits + self.misses
+        return {
+            'entries': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# Global cache instance (mỗi worker process có 1 bản)
+correlation_index_cache = CorrelationIndexCache()
+
+
+def lookup_correlation_group(correlation_groups: Any, symbol: Any) -> Any:
+    """Nhóm tương quan của symbol qua index dùng chung (NOT_INDEXED => caller duyệt nhóm như cũ)"""
+    return correlation_index_cache.lookup(correlation_groups, symbol)
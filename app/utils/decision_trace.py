@@ -0,0 +1,82 @@
+"""
+Decision Trace
+Ghi lại quyết định của RiskManagerService dưới dạng trường có cấu trúc thay cho ~50 dòng log mỗi request
+
+- Dùng thay logger trong các bước của RiskManagerService (cùng interface debug/info/warning/error/critical)
+- Mặc định (verbose=False): info/debug bị bỏ qua, warning được giữ trong trace, error vẫn ghi ngay
+- verbose=True (request có "trace": true hoặc RISK_MANAGER_TRACE): ghi log chi tiết như trước
+- Trường quyết định (profile, pre-flight, điều chỉnh lot, margin, kết quả) ghi qua record_trace(),
+  render thành 1 dòng log và 1 dict cho response log ở cuối request
+"""
+
+from typing import Any, Dict, List, Tuple
+
+
+class DecisionTrace:
+    """Trace của 1 request risk manager (logger-compatible)"""
+
+    __slots__ = ('logger', 'verbose', 'fields', 'events')
+
+    def __init__(self, logger: Any, verbose: bool = False):
+        """
+        Args:
+            logger: Logger thật (nhận log chi tiết khi verbose, lỗi và dòng tổng kết)
+            verbose: Ghi log chi tiết từng bước
+        """
+        self.logger = logger
+        self.verbose = verbose
+        self.fields: Dict[str, Any] = {}
+        self.events: List[Tuple[str, str]] = []  # (level, message) của warning / error
+
+    def record(self, **fields: Any):
+        """Ghi các trường quyết định (ghi đè nếu trùng tên)"""
+        self.fields.update(fields)
+
+    def debug(self, message):
+        if self.verbose:
+            self.logger.debug(message)
+
+    def info(self, message):
+        if self.verbose:
+            self.logger.info(message)
+
+    def warning(self, message, exc_info=False):
+        self.events.append(('warning', str(message)))
+        if self.verbose:
+            self.logger.warning(message, exc_info=exc_info)
+
+    def error(self, message, exc_info=False):
+        self.events.append(('error', str(message)))
+        self.logger.error(message, exc_info=exc_info)
+
+    def critical(self, message, exc_info=False):
+        self.events.append(('critical', str(message)))
+        self.logger.critical(message, exc_info=exc_info)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Trace dạng dict (cho response log)"""
+        trace = dict(self.fields)
+        if self.events:
+            trace['events'] = [{'level': level, 'message': message} for level, message in self.events]
+        return trace
+
+    def summary(self) -> str:
+        """Trace dạng 1 dòng: key=value theo thứ tự ghi"""
+        parts = [f"{key}={_compact(value)}" for key, value in self.fields.items()]
+        parts.extend(f"{level}: {message.strip()}" for level, message in self.events)
+        return " | ".join(parts)
+
+
+def record_trace(logger: Any, **fields: Any):
+    """Ghi trường quyết định nếu logger là DecisionTrace (NullLogger / Logger thường => bỏ qua)"""
+    if isinstance(logger, DecisionTrace):
+        logger.fields.update(fields)
+
+
+def _compact(value: Any) -> str:
+    """Giá trị ngắn gọn cho dòng tổng kết (float làm tròn 4 chữ số)"""
+    if isinstance(value, float):
+        return f"{value:.4g}" if abs(value) < 1e-4 else f"{round(value, 4)}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_compact(v) for v in value) + "]"
+    return str(value)
@@ -0,0 +1,472 @@
+"""
+Incremental Indicator Engine
+Tính các chỉ báo mà prompt sử dụng (sma_100, sma_200, rsi, macd, bollinger_bands, atr, adx, volume_sma_250)
+cho từng (namespace, symbol, timeframe) với rolling state cập nhật O(1) mỗi khi có nến mới.
+Namespace là cache_key.timezone (giờ server của broker) như candle store / correlation engine: 2 broker khác timezone
+gửi cùng symbol/timeframe giữ state riêng. Số state giới hạn theo INDICATOR_ENGINE_MAX_STATES (LRU).
+
+- State nguội (lần đầu / mất liên tục dữ liệu): tính batch vectorized bằng NumPy
+- State nóng: chỉ đẩy các nến mới vào rolling state
+- Nến cuối có thể là nến đang hình thành: nếu cùng time nhưng giá khác, state được rollback 1 nến rồi cập nhật lại
+
+Format output giống dữ liệu client upload trước đây:
+    macd = [macd, signal, histogram], bollinger_bands = [middle, upper, lower], adx = [adx, plus_di, minus_di]
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+# ===== CẤU HÌNH CHỈ BÁO (khai báo ở đầu file để dễ bảo trì) =====
+SMA_FAST_PERIOD = 100
+SMA_SLOW_PERIOD = 200
+RSI_PERIOD = 14
+MACD_FAST_PERIOD = 12
+MACD_SLOW_PERIOD = 26
+MACD_SIGNAL_PERIOD = 9
+BB_PERIOD = 20
+BB_STD_MULTIPLIER = 2.0
+ATR_PERIOD = 14                  # ATR = trung bình đơn giản của True Range (giống MT5 iATR)
+ADX_PERIOD = 14                  # ADX/DI dùng Wilder smoothing
+VOLUME_SMA_PERIOD = 250
+
+EWM_CHUNK_SIZE = 64              # Kích thước block cho EMA vectorized (giữ sai số float nhỏ)
+DEFAULT_NAMESPACE = "default"    # Request không có cache_key.timezone
+
+
+class RollingWindow:
+    """Cửa sổ trượt kích thước cố định với running sum / sum of squares (push O(1), undo 1 bước)"""
+
+    __slots__ = ("period", "buffer", "head", "count", "total", "total_sq", "_undo")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.buffer = [0.0] * period
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._undo = None
+
+    @classmethod
+    def from_values(cls, period: int, values: np.ndarray) -> "RollingWindow":
+        """Khởi tạo từ tối đa `period` giá trị cuối của mảng"""
+        window = cls(period)
+        tail = [float(v) for v in values[-period:]]
+        window.buffer[:len(tail)] = tail
+        window.count = len(tail)
+        window.head = len(tail) % period
+        window._recompute()
+        return window
+
+    def push(self, value: float):
+        outgoing = self.buffer[self.head] if self.count == self.period else 0.0
+        self._undo = (self.head, self.count, self.total, self.total_sq, self.buffer[self.head])
+        self.buffer[self.head] = value
+        self.head = (self.head + 1) % self.period
+        if self.count < self.period:
+            self.count += 1
+        self.total += value - outgoing
+        self.total_sq += value * value - outgoing * outgoing
+        if self.head == 0:
+            # Mỗi vòng buffer tính lại tổng để tránh tích lũy sai số float (amortized O(1))
+            self._recompute()
+
+    def undo(self):
+        head, count, total, total_sq, previous = self._undo
+        self.buffer[head] = previous
+        self.head, self.count, self.total, self.total_sq = head, count, total, total_sq
+        self._undo = None
+
+    def _recompute(self):
+        values = self.buffer[:self.count] if self.count < self.period else self.buffer
+        self.total = math.fsum(values)
+        self.total_sq = math.fsum(v * v for v in values)
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == self.period
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.period if self.is_full else None
+
+    def std(self) -> Optional[float]:
+        """Population standard deviation (giống Bollinger Bands chuẩn)"""
+        if not self.is_full:
+            return None
+        mean = self.total / self.period
+        return math.sqrt(max(self.total_sq / self.period - mean * mean, 0.0))
+
+
+class Smoother:
+    """
+    EMA / Wilder smoothing cập nhật O(1)
+
+    - seed_with_mean=False: EMA seed bằng giá trị đầu tiên (adjust=False)
+    - seed_with_mean=True: Wilder, seed bằng trung bình `period` giá trị đầu tiên
+    """
+
+    __slots__ = ("period", "alpha", "seed_with_mean", "value", "count", "seed_sum", "_undo")
+
+    def __init__(self, period: int, alpha: float, seed_with_mean: bool):
+        self.period = period
+        self.alpha = alpha
+        self.seed_with_mean = seed_with_mean
+        self.value = None
+        self.count = 0
+        self.seed_sum = 0.0
+        self._undo = None
+
+    @classmethod
+    def ema(cls, period: int) -> "Smoother":
+        return cls(period, 2.0 / (period + 1), seed_with_mean=False)
+
+    @classmethod
+    def wilder(cls, period: int) -> "Smoother":
+        return cls(period, 1.0 / period, seed_with_mean=True)
+
+    def push(self, x: float):
+        self._undo = (self.value, self.count, self.seed_sum)
+        self.count += 1
+        if self.seed_with_mean and self.count <= self.period:
+            self.seed_sum += x
+            if self.count == self.period:
+                self.value = self.seed_sum / self.period
+        elif self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+
+    def undo(self):
+        self.value, self.count, self.seed_sum = self._undo
+        self._undo = None
+
+    def load_batch(self, values: np.ndarray):
+        """Khởi tạo state từ toàn bộ lịch sử (vectorized)"""
+        self.count = len(values)
+        self.seed_sum = float(values[:self.period].sum()) if self.seed_with_mean else 0.0
+        smoothed = smooth_batch(values, self.period, self.alpha, self.seed_with_mean)
+        self.value = None if len(smoothed) == 0 or np.isnan(smoothed[-1]) else float(smoothed[-1])
+        self._undo = None
+        return smoothed
+
+
+def smooth_batch(values: np.ndarray, period: int, alpha: float, seed_with_mean: bool) -> np.ndarray:
+    """
+    EMA/Wilder vectorized theo block: trong mỗi block dùng closed-form
+        y_k = (1-a)^(k+1) * y_prev + a * sum_j (1-a)^(k-j) * x_j
+    Kết quả trùng với Smoother.push lặp từng phần tử.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    out = np.full(n, np.nan)
+    if seed_with_mean:
+        if n < period:
+            return out
+        start = period
+        out[period - 1] = values[:period].mean()
+    else:
+        if n == 0:
+            return out
+        start = 1
+        out[0] = values[0]
+
+    decay = 1.0 - alpha
+    prev = out[start - 1]
+    for chunk_start in range(start, n, EWM_CHUNK_SIZE):
+        chunk = values[chunk_start:chunk_start + EWM_CHUNK_SIZE]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        weighted = np.cumsum(chunk / powers * alpha)
+        result = powers * (prev + weighted)
+        out[chunk_start:chunk_start + len(chunk)] = result
+        prev = result[-1]
+    return out
+
+
+class IndicatorState:
+    """Rolling state cho 1 cặp (symbol, timeframe)"""
+
+    def __init__(self):
+        self.sma_fast = RollingWindow(SMA_FAST_PERIOD)
+        self.sma_slow = RollingWindow(SMA_SLOW_PERIOD)
+        self.bollinger = RollingWindow(BB_PERIOD)
+        self.volume_sma = RollingWindow(VOLUME_SMA_PERIOD)
+        self.atr = RollingWindow(ATR_PERIOD)
+        self.macd_fast = Smoother.ema(MACD_FAST_PERIOD)
+        self.macd_slow = Smoother.ema(MACD_SLOW_PERIOD)
+        self.macd_signal = Smoother.ema(MACD_SIGNAL_PERIOD)
+        self.rsi_gain = Smoother.wilder(RSI_PERIOD)
+        self.rsi_loss = Smoother.wilder(RSI_PERIOD)
+        self.adx_tr = Smoother.wilder(ADX_PERIOD)
+        self.adx_plus_dm = Smoother.wilder(ADX_PERIOD)
+        self.adx_minus_dm = Smoother.wilder(ADX_PERIOD)
+        self.adx_dx = Smoother.wilder(ADX_PERIOD)
+
+        self.bar_count = 0
+        self.last_time = None
+        self.last_bar: Optional[Tuple[float, float, float, float, float]] = None  # open, high, low, close, volume
+        self.prev_bar: Optional[Tuple[float, float, float, float, float]] = None
+        self._undo = None
+
+    # ------------------------------------------------------------------
+    # Incremental update
+    # ------------------------------------------------------------------
+    def push(self, time_value, o: float, h: float, l: float, c: float, v: float):
+        """Đẩy 1 nến đã đóng vào state (O(1))"""
+        pushed = [self.sma_fast, self.sma_slow, self.bollinger, self.volume_sma, self.macd_fast, self.macd_slow]
+        self.sma_fast.push(c)
+        self.sma_slow.push(c)
+        self.bollinger.push(c)
+        self.volume_sma.push(v)
+        self.macd_fast.push(c)
+        self.macd_slow.push(c)
+        self.macd_signal.push(self.macd_fast.value - self.macd_slow.value)
+        pushed.append(self.macd_signal)
+
+        if self.last_bar is not None:
+            _, prev_h, prev_l, prev_c, _ = self.last_bar
+            change = c - prev_c
+            self.rsi_gain.push(max(change, 0.0))
+            self.rsi_loss.push(max(-change, 0.0))
+            true_range = max(h - l, abs(h - prev_c), abs(l - prev_c))
+            up_move = h - prev_h
+            down_move = prev_l - l
+            self.atr.push(true_range)
+            self.adx_tr.push(true_range)
+            self.adx_plus_dm.push(up_move if up_move > down_move and up_move > 0 else 0.0)
+            self.adx_minus_dm.push(down_move if down_move > up_move and down_move > 0 else 0.0)
+            pushed += [self.rsi_gain, self.rsi_loss, self.atr, self.adx_tr, self.adx_plus_dm, self.adx_minus_dm]
+
+            dx = self._dx()
+            if dx is not None:
+                self.adx_dx.push(dx)
+                pushed.append(self.adx_dx)
+
+        self._undo = (pushed, self.bar_count, self.last_time, self.last_bar, self.prev_bar)
+        self.bar_count += 1
+        self.prev_bar = self.last_bar
+        self.last_bar = (o, h, l, c, v)
+        self.last_time = time_value
+
+    def undo(self) -> bool:
+        """Rollback nến cuối cùng (dùng khi nến đang hình thành thay đổi giá)"""
+        if self._undo is None:
+            return False
+        pushed, self.bar_count, self.last_time, self.last_bar, self.prev_bar = self._undo
+        for component in reversed(pushed):
+            component.undo()
+        self._undo = None
+        return True
+
+    def _dx(self) -> Optional[float]:
+        plus_di, minus_di = self._directional_indicators()
+        if plus_di is None:
+            return None
+        total = plus_di + minus_di
+        return 100.0 * abs(plus_di - minus_di) / total if total > 0 else 0.0
+
+    def _directional_indicators(self):
+        tr = self.adx_tr.value
+        if tr is None or self.adx_plus_dm.value is None or self.adx_minus_dm.value is None:
+            return None, None
+        if tr == 0:
+            return 0.0, 0.0
+        return 100.0 * self.adx_plus_dm.value / tr, 100.0 * self.adx_minus_dm.value / tr
+
+    # ------------------------------------------------------------------
+    # Cold start (vectorized batch)
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_arrays(cls, times: Sequence, opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                    closes: np.ndarray, volumes: np.ndarray) -> "IndicatorState":
+        """
+        Tính state từ toàn bộ lịch sử bằng NumPy. Nến cuối được đẩy incremental
+        để state có checkpoint rollback cho nến đang hình thành.
+        """
+        state = cls()
+        n = len(closes)
+        if n == 0:
+            return state
+        head = n - 1  # số nến xử lý batch
+
+        c = closes[:head]
+        state.sma_fast = RollingWindow.from_values(SMA_FAST_PERIOD, c)
+        state.sma_slow = RollingWindow.from_values(SMA_SLOW_PERIOD, c)
+        state.bollinger = RollingWindow.from_values(BB_PERIOD, c)
+        state.volume_sma = RollingWindow.from_values(VOLUME_SMA_PERIOD, volumes[:head])
+
+        if head > 0:
+            fast = state.macd_fast.load_batch(c)
+            slow = state.macd_slow.load_batch(c)
+            state.macd_signal.load_batch(fast - slow)
+
+        if head > 1:
+            prev_c = closes[:head - 1]
+            h, l = highs[1:head], lows[1:head]
+            change = np.diff(c)
+            state.rsi_gain.load_batch(np.maximum(change, 0.0))
+            state.rsi_loss.load_batch(np.maximum(-change, 0.0))
+
+            true_range = np.maximum.reduce([h - l, np.abs(h - prev_c), np.abs(l - prev_c)])
+            up_move = h - highs[:head - 1]
+            down_move = lows[:head - 1] - l
+            plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+            minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+            state.atr = RollingWindow.from_values(ATR_PERIOD, true_range)
+            tr_s = state.adx_tr.load_batch(true_range)
+            plus_s = state.adx_plus_dm.load_batch(plus_dm)
+            minus_s = state.adx_minus_dm.load_batch(minus_dm)
+
+            ready = ~np.isnan(tr_s)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                plus_di = np.where(tr_s > 0, 100.0 * plus_s / tr_s, 0.0)
+                minus_di = np.where(tr_s > 0, 100.0 * minus_s / tr_s, 0.0)
+                di_sum = plus_di + minus_di
+                dx = np.where(di_sum > 0, 100.0 * np.abs(plus_di - minus_di) / di_sum, 0.0)
+            state.adx_dx.load_batch(dx[ready])
+
+        state.bar_count = head
+        if head > 0:
+            state.last_bar = cls._bar(opens, highs, lows, closes, volumes, head - 1)
+            state.last_time = times[head - 1]
+        if head > 1:
+            state.prev_bar = cls._bar(opens, highs, lows, closes, volumes, head - 2)
+
+        state.push(times[head], *cls._bar(opens, highs, lows, closes, volumes, head))
+        return state
+
+    @staticmethod
+    def _bar(opens, highs, lows, closes, volumes, i):
+        return float(opens[i]), float(highs[i]), float(lows[i]), float(closes[i]), float(volumes[i])
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+    def snapshot(self) -> Dict[str, Any]:
+        """Giá trị chỉ báo hiện tại theo format prompt sử dụng (None nếu chưa đủ dữ liệu)"""
+        rsi = None
+        if self.rsi_gain.value is not None and self.rsi_loss.value is not None:
+            avg_gain, avg_loss = self.rsi_gain.value, self.rsi_loss.value
+            rsi = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+        macd = None
+        if self.macd_slow.count >= MACD_SLOW_PERIOD and self.macd_signal.count >= MACD_SLOW_PERIOD + MACD_SIGNAL_PERIOD - 1:
+            macd_line = self.macd_fast.value - self.macd_slow.value
+            macd = [macd_line, self.macd_signal.value, macd_line - self.macd_signal.value]
+
+        bollinger_bands = None
+        middle = self.bollinger.mean()
+        if middle is not None:
+            band = BB_STD_MULTIPLIER * self.bollinger.std()
+            bollinger_bands = [middle, middle + band, middle - band]
+
+        adx = None
+        if self.adx_dx.value is not None:
+            plus_di, minus_di = self._directional_indicators()
+            adx = [self.adx_dx.value, plus_di, minus_di]
+
+        return {
+            "rsi": rsi,
+            "macd": macd,
+            "bollinger_bands": bollinger_bands,
+            "atr": self.atr.mean(),
+            "adx": adx,
+            "sma_100": self.sma_fast.mean(),
+            "sma_200": self.sma_slow.mean(),
+            "volume_sma_250": self.volume_sma.mean()
+        }
+
+
+class IndicatorEngine:
+    """Quản lý IndicatorState theo (namespace, symbol, timeframe), dùng chung trong process (LRU)"""
+
+    def __init__(self, max_states: Optional[int] = None):
+        """
+        Args:
+            max_states: Số state tối đa (mặc định INDICATOR_ENGINE_MAX_STATES)
+        """
+        self.max_states = max_states or settings.INDICATOR_ENGINE_MAX_STATES
+        self._states: "OrderedDict[Tuple[str, str, str], IndicatorState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"cold_builds": 0, "incremental_updates": 0, "bars_pushed": 0, "evictions": 0}
+
+    def update(self, symbol: str, timeframe: str, times: Sequence, opens: np.ndarray, highs: np.ndarray,
+               lows: np.ndarray, closes: np.ndarray, volumes: np.ndarray, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Cập nhật state với chuỗi nến mới nhất của client và trả về giá trị chỉ báo hiện tại
+
+        Args:
+            symbol, timeframe: Khóa state
+            times: Thời gian nến tăng dần (epoch hoặc string cùng format)
+            opens, highs, lows, closes, volumes: Mảng float64 song song
+            namespace: cache_key.timezone của broker (None => DEFAULT_NAMESPACE)
+
+        Returns:
+            dict: Giá trị chỉ báo (xem IndicatorState.snapshot)
+        """
+        key = (namespace or DEFAULT_NAMESPACE, symbol, timeframe)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or not self._extend(state, times, opens, highs, lows, closes, volumes):
+                state = IndicatorState.from_arrays(times, opens, highs, lows, closes, volumes)
+                self._states[key] = state
+                self.stats["cold_builds"] += 1
+            else:
+                self.stats["incremental_updates"] += 1
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+                self.stats["evictions"] += 1
+            return state.snapshot()
+
+    def _extend(self, state: IndicatorState, times, opens, highs, lows, closes, volumes) -> bool:
+        """Đẩy các nến sau state.last_time; trả về False nếu dữ liệu không liên tục (cần build lại)"""
+        n = len(closes)
+        if n == 0 or state.last_time is None:
+            return False
+
+        # Quét từ cuối, dừng ở nến khớp đầu tiên (thường chỉ vài nến mới => O(1))
+        idx = next((i for i in range(n - 1, -1, -1) if times[i] == state.last_time), None)
+        if idx is None:
+            return False
+
+        # Nến trước nến cuối của state phải khớp, đảm bảo cùng một nguồn dữ liệu
+        if idx > 0 and state.prev_bar is not None and not math.isclose(float(closes[idx - 1]), state.prev_bar[3], rel_tol=0, abs_tol=1e-12):
+            return False
+
+        bar = IndicatorState._bar(opens, highs, lows, closes, volumes, idx)
+        if bar != state.last_bar:
+            # Nến cuối đang hình thành đã thay đổi => rollback rồi đẩy lại
+            if not state.undo():
+                return False
+            state.push(times[idx], *bar)
+            self.stats["bars_pushed"] += 1
+
+        for i in range(idx + 1, n):
+            state.push(times[i], *IndicatorState._bar(opens, highs, lows, closes, volumes, i))
+            self.stats["bars_pushed"] += 1
+        return True
+
+    def get_snapshot(self, symbol: str, timeframe: str, namespace: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Lấy giá trị chỉ báo hiện tại của broker (namespace) - None nếu chưa có state"""
+        with self._lock:
+            state = self._states.get((namespace or DEFAULT_NAMESPACE, symbol, timeframe))
+            return state.snapshot() if state else None
+
+    def reset(self, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """Xóa state (toàn bộ hoặc theo symbol/timeframe, mọi namespace)"""
+        with self._lock:
+            for key in list(self._states):
+                if (symbol is None or key[1] == symbol) and (timeframe is None or key[2] == timeframe):
+                    del self._states[key]
+
+
+# Global engine instance
+indicator_engine = IndicatorEngine()
@@ -117,3 +117,22 @@ class Logger:
         self._initialized = False
         self._setup_logger()
         self.info(f"Database logging {'enabled' if enabled else 'disabled'} for {self.feature_folder}")
+
+
+class NullLogger:
+    """Logger bỏ qua mọi message - dùng khi gọi lại các bước có log chi tiết trong đường xử lý hàng loạt (batch/sweep)"""
+
+    def debug(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def warning(self, message, exc_info=False):
+        pass
+
+    def error(self, message, exc_info=False):
+        pass
+
+    def critical(self, message, exc_info=False):
+        pass
@@ -0,0 +1,410 @@
+"""
+Margin Solver
+Tìm lot lớn nhất thỏa điều kiện an toàn ký quỹ (thay cho vòng lặp giảm dần từng volume_step)
+
+- Lot được biểu diễn bằng số nguyên bước 0.01 (unit) => tra map bằng searchsorted thay vì format chuỗi
+- Margin theo lot không giảm => điều kiện an toàn đơn điệu => binary search (O(log n) lần kiểm tra)
+- Map không đơn điệu: kiểm tra toàn bộ ứng viên bằng NumPy, vẫn chọn đúng lot lớn nhất như vòng lặp cũ
+- Không có lot_size_to_margin_map: margin = round(lot * contract_size * entry_price / leverage, 2)
+  (cùng công thức với update_test_cases_with_margin_map.py), hoặc theo margin_model client gửi
+  (contract size, leverage, tỉ giá margin currency, giá, bậc leverage của broker) - cache theo account/symbol
+
+- Nhiều tài khoản cùng lúc (copy trading): solve_max_safe_lots chạy binary search song song trên mảng
+
+Trả None khi input nằm ngoài phạm vi solver hỗ trợ => caller dùng lại vòng lặp tuyến tính
+"""
+
+import math
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.utils.risk_math import round_like_python
+
+
+# ===== CẤU HÌNH SOLVER =====
+LOT_DECIMALS = 2
+LOT_SCALE = 10 ** LOT_DECIMALS  # 1 unit = 0.01 lot
+MARGIN_MODEL_CACHE_SIZE = 1024  # Số margin model (account/symbol) giữ trong mỗi process
+MARGIN_MODEL_MEMO_SIZE = 4096   # Số lot đã tính margin giữ trong mỗi model
+
+
+class MarginSolution(NamedTuple):
+    """Kết quả solver: lot=None nghĩa là không có lot nào đủ ký quỹ"""
+    lot: Optional[float]
+    margin: Optional[float]
+    probes: int
+
+
+def _is_real(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def closed_form_margin(lot: float, contract_size: float, entry_price: float, leverage: float) -> float:
+    """
+    Margin = (Lot × Contract Size × Entry Price) / Leverage, làm tròn 2 chữ số
+
+    Returns:
+        float: Margin (USD)
+    """
+    return round((lot * contract_size * entry_price) / leverage, 2)
+
+
+def margin_rule_passes(equity, existing_margin, new_margin, min_free_percent: float, max_usage_percent: float):
+    """
+    Điều kiện an toàn ký quỹ (cùng phép tính với RiskManagerService._check_margin_safety)
+
+    Args:
+        equity, existing_margin: Equity và margin đang dùng của portfolio
+        new_margin: Margin của lệnh mới (float hoặc np.ndarray)
+        min_free_percent: Free margin sau lệnh phải > ngưỡng này (% equity)
+        max_usage_percent: Tổng margin sau lệnh phải < ngưỡng này (% equity)
+
+    Returns:
+        bool hoặc mảng bool
+    """
+    total_margin_usage = existing_margin + new_margin
+    free_margin_percent = ((equity - total_margin_usage) / equity) * 100
+    margin_usage_percent = (total_margin_usage / equity) * 100
+    return (free_margin_percent > min_free_percent) & (margin_usage_percent < max_usage_percent)
+
+
+class MarginModel:
+    """
+    Margin theo tham số thay cho lot_size_to_margin_map
+
+    margin(lot) = round(sum(phần lot trong từng bậc * contract_size * price * margin_rate / leverage của bậc), 2)
+    Không có tiers => round(lot * contract_size * price * margin_rate / leverage, 2)
+    """
+
+    def __init__(self, contract_size: float, leverage: float, price: float, margin_rate: float = 1.0,
+                 tiers: Optional[List[Tuple[Optional[float], float]]] = None):
+        """
+        Args:
+            contract_size: Contract size của symbol
+            leverage: Leverage của account (áp dụng cho phần lot vượt bậc cuối)
+            price: Giá dùng tính margin (thường là entry price)
+            margin_rate: Tỉ giá quy đổi margin currency sang account currency
+            tiers: [(up_to_lot, leverage), ...] tăng dần; up_to_lot None = không giới hạn
+        """
+        self.contract_size = contract_size
+        self.leverage = leverage
+        self.price = price
+        self.margin_rate = margin_rate
+        self.tiers = tiers or []
+        self._memo: "OrderedDict[float, float]" = OrderedDict()
+
+    @classmethod
+    def from_dict(cls, model: Dict[str, Any], entry_price: Optional[float] = None) -> Optional["MarginModel"]:
+        """
+        Dựng model từ margin_model của request
+
+        Args:
+            model: {"contract_size", "leverage", "margin_rate"?, "price"?, "tiers"?: [{"up_to_lot", "leverage"}]}
+            entry_price: Giá mặc định khi model không có price
+
+        Returns:
+            MarginModel hoặc None nếu tham số không hợp lệ
+        """
+        try:
+            price = model.get('price')
+            params = [float(model['contract_size']), float(model['leverage']),
+                      float(price if price is not None else entry_price),
+                      float(model.get('margin_rate') if model.get('margin_rate') is not None else 1.0)]
+            tiers = []
+            for tier in model.get('tiers') or []:
+                up_to = tier.get('up_to_lot')
+                tiers.append((float(up_to) if up_to is not None else None, float(tier['leverage'])))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return None
+
+        bounds = [up_to for up_to, _ in tiers]
+        if not all(math.isfinite(v) and v > 0 for v in params + [lev for _, lev in tiers] + [b for b in bounds if b is not None]):
+            return None
+        # Bậc phải tăng dần, chỉ bậc cuối được không giới hạn
+        if None in bounds[:-1] or any(b2 <= b1 for b1, b2 in zip(bounds, bounds[1:]) if b2 is not None):
+            return None
+        return cls(params[0], params[1], params[2], params[3], tiers)
+
+    def cache_key(self) -> tuple:
+        return (self.contract_size, self.leverage, self.price, self.margin_rate, tuple(self.tiers))
+
+    def margin(self, lot: float) -> float:
+        """Margin (account currency) cho lot, memo theo lot"""
+        cached = self._memo.get(lot)
+        if cached is not None:
+            return cached
+
+        notional = self.contract_size * self.price * self.margin_rate
+        if not self.tiers:
+            value = round((lot * self.contract_size * self.price * self.margin_rate) / self.leverage, 2)
+        else:
+            value, lower = 0.0, 0.0
+            for up_to, leverage in self.tiers:
+                if lot <= lower:
+                    break
+                upper = lot if up_to is None else min(lot, up_to)
+                value += (upper - lower) * notional / leverage
+                lower = upper if up_to is not None else lot
+            if lot > lower:
+                value += (lot - lower) * notional / self.leverage
+            value = round(value, 2)
+
+        self._memo[lot] = value
+        if len(self._memo) > MARGIN_MODEL_MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return value
+
+
+_model_cache: "OrderedDict[tuple, MarginModel]" = OrderedDict()
+
+
+def get_margin_model(account: Any, symbol: str, model: Dict[str, Any],
+                     entry_price: Optional[float] = None) -> Optional[MarginModel]:
+    """
+    MarginModel đã cache theo (account, symbol); dựng lại khi tham số thay đổi
+
+    Args:
+        account: Login của account
+        symbol: Symbol name
+        model: margin_model của request
+        entry_price: Giá mặc định khi model không có price
+
+    Returns:
+        MarginModel hoặc None nếu tham số không hợp lệ
+    """
+    built = MarginModel.from_dict(model, entry_price)
+    if built is None:
+        return None
+    key = (account, symbol) + built.cache_key()
+    cached = _model_cache.get(key)
+    if cached is not None:
+        _model_cache.move_to_end(key)
+        return cached
+    _model_cache[key] = built
+    while len(_model_cache) > MARGIN_MODEL_CACHE_SIZE:
+        _model_cache.popitem(last=False)
+    return built
+
+
+class MarginIndex:
+    """lot_size_to_margin_map sắp xếp theo unit (số nguyên bước 0.01)"""
+
+    def __init__(self, units: np.ndarray, margins: np.ndarray):
+        self.units = units
+        self.margins = margins
+
+    @classmethod
+    def from_map(cls, lot_size_to_margin_map: Dict[str, Any]) -> Optional["MarginIndex"]:
+        """
+        Dựng index từ map {"0.01": margin, ...}
+
+        Chỉ giữ key dạng f"{lot:.2f}" (vòng lặp cũ chỉ tra đúng format này) và bỏ qua value None.
+
+        Returns:
+            MarginIndex hoặc None nếu map có margin không phải số hữu hạn
+        """
+        units, margins = [], []
+        for key, value in lot_size_to_margin_map.items():
+            if value is None:
+                continue
+            try:
+                lot = float(key)
+            except (TypeError, ValueError):
+                continue
+            if not math.isfinite(lot) or f"{lot:.{LOT_DECIMALS}f}" != key:
+                continue
+            if not _is_real(value):
+                return None
+            units.append(int(round(lot * LOT_SCALE)))
+            margins.append(float(value))
+
+        order = np.argsort(np.asarray(units, dtype=np.int64), kind="stable")
+        return cls(np.asarray(units, dtype=np.int64)[order], np.asarray(margins, dtype=np.float64)[order])
+
+    def lookup(self, units: np.ndarray):
+        """
+        Returns:
+            (mask có trong map, margin tương ứng của các unit có trong map)
+        """
+        if self.units.size == 0:
+            return np.zeros(units.shape, dtype=bool), np.empty(0, dtype=np.float64)
+        pos = np.searchsorted(self.units, units)
+        clipped = np.minimum(pos, self.units.size - 1)
+        found = (pos < self.units.size) & (self.units[clipped] == units)
+        return found, self.margins[clipped[found]]
+
+
+def candidate_units(initial_lot: float, volume_min: float, volume_step: float) -> Optional[np.ndarray]:
+    """
+    Các lot vòng lặp cũ sẽ kiểm tra (initial_lot, initial_lot - step, ... >= volume_min), giảm dần, dạng unit
+
+    Returns:
+        np.ndarray hoặc None nếu lot/step không biểu diễn được bằng bước 0.01
+    """
+    if not (_is_real(initial_lot) and _is_real(volume_min) and _is_real(volume_step)):
+        return None
+    start = int(round(initial_lot * LOT_SCALE))
+    step = int(round(volume_step * LOT_SCALE))
+    if step < 1 or start / LOT_SCALE != initial_lot or abs(volume_step * LOT_SCALE - step) > 1e-9:
+        return None
+    if start < 0:
+        return np.empty(0, dtype=np.int64)
+    units = np.arange(start, -1, -step, dtype=np.int64)
+    return units[units / LOT_SCALE >= volume_min]
+
+
+def solve_max_safe_lot(initial_lot: float, volume_min: float, volume_step: float,
+                       equity: float, existing_margin: float,
+                       min_free_percent: float, max_usage_percent: float,
+                       margin_index: Optional[MarginIndex] = None,
+                       margin_fn: Optional[Callable[[float], float]] = None) -> Optional[MarginSolution]:
+    """
+    Lot lớn nhất (tính từ initial_lot giảm dần theo volume_step) thỏa margin_rule_passes
+
+    Args:
+        initial_lot: Lot ban đầu đã lượng tử hóa
+        volume_min, volume_step: Giới hạn của symbol
+        equity, existing_margin: Trạng thái tài khoản
+        min_free_percent, max_usage_percent: Ngưỡng an toàn ký quỹ
+        margin_index: Index từ lot_size_to_margin_map
+        margin_fn: Hàm margin(lot) đơn điệu không giảm (closed form) khi không có map
+
+    Returns:
+        MarginSolution, hoặc None nếu input ngoài phạm vi solver (caller dùng vòng lặp tuyến tính)
+    """
+    if not (_is_real(equity) and _is_real(existing_margin)) or equity <= 0:
+        return None
+    units = candidate_units(initial_lot, volume_min, volume_step)
+    if units is None or (margin_index is None) == (margin_fn is None):
+        return None
+
+    def passes(margin: float) -> bool:
+        return bool(margin_rule_passes(equity, existing_margin, margin, min_free_percent, max_usage_percent))
+
+    if margin_index is not None:
+        found, margins = margin_index.lookup(units)
+        units = units[found]
+        margin_at = margins.__getitem__
+        # Lot giảm dần => margin phải không tăng thì điều kiện mới đơn điệu
+        if margins.size > 1 and np.any(np.diff(margins) > 0):
+            safe = np.flatnonzero(margin_rule_passes(equity, existing_margin, margins,
+                                                     min_free_percent, max_usage_percent))
+            if safe.size == 0:
+                return MarginSolution(None, None, int(units.size))
+            first = int(safe[0])
+            return MarginSolution(float(units[first]) / LOT_SCALE, float(margins[first]), int(units.size))
+    else:
+        margin_at = lambda i: margin_fn(units[i] / LOT_SCALE)
+
+    # Binary search: [unsafe ... unsafe, safe ... safe] => tìm vị trí safe đầu tiên
+    lo, hi, probes = 0, int(units.size), 0
+    cache: Dict[int, float] = {}
+    while lo < hi:
+        mid = (lo + hi) // 2
+        cache[mid] = float(margin_at(mid))
+        probes += 1
+        if passes(cache[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+
+    if lo >= units.size:
+        return MarginSolution(None, None, probes)
+    margin = cache[lo] if lo in cache else float(margin_at(lo))
+    return MarginSolution(float(units[lo]) / LOT_SCALE, margin, probes)
+
+
+def _step_units(volume_step: Any) -> Optional[int]:
+    """volume_step dạng unit, None nếu không phải bội của 0.01"""
+    if not _is_real(volume_step):
+        return None
+    step = int(round(volume_step * LOT_SCALE))
+    if step < 1 or abs(volume_step * LOT_SCALE - step) > 1e-9:
+        return None
+    return step
+
+
+def _lowest_unit(volume_min: float) -> int:
+    """Unit nhỏ nhất thỏa unit / LOT_SCALE >= volume_min (cùng phép so sánh với candidate_units)"""
+    unit = max(0, int(math.ceil(volume_min * LOT_SCALE)))
+    while unit > 0 and (unit - 1) / LOT_SCALE >= volume_min:
+        unit -= 1
+    while unit / LOT_SCALE < volume_min:
+        unit += 1
+    return unit
+
+
+def solve_max_safe_lots(initial_lots: np.ndarray, volume_min: float, volume_step: float,
+                        equity: np.ndarray, existing_margin: np.ndarray,
+                        min_free_percent: float, max_usage_percent: float,
+                        margin_index: Optional[MarginIndex] = None,
+                        margin_params: Optional[Tuple[np.ndarray, ...]] = None):
+    """
+    solve_max_safe_lot cho nhiều tài khoản cùng 1 symbol: binary search song song trên mảng
+
+    Args:
+        initial_lots: Lot ban đầu đã lượng tử hóa của từng tài khoản
+        volume_min, volume_step: Giới hạn của symbol
+        equity, existing_margin: Trạng thái từng tài khoản (equity > 0)
+        min_free_percent, max_usage_percent: Ngưỡng an toàn ký quỹ (float hoặc mảng theo tài khoản)
+        margin_index: Index của lot_size_to_margin_map dùng chung (margin không giảm theo lot)
+        margin_params: (contract_size, price, margin_rate, leverage) từng tài khoản - công thức không có bậc
+
+    Returns:
+        tuple (lots, margins) - NaN ở tài khoản không có lot nào đủ ký quỹ,
+        hoặc None nếu input ngoài phạm vi (caller giải từng tài khoản)
+    """
+    step = _step_units(volume_step)
+    if step is None or not _is_real(volume_min) or (margin_index is None) == (margin_params is None):
+        return None
+    initial_lots = np.asarray(initial_lots, dtype=np.float64)
+    starts = np.rint(initial_lots * LOT_SCALE).astype(np.int64)
+    if np.any(starts / LOT_SCALE != initial_lots):
+        return None
+    if margin_index is not None and (step != 1 or np.any(np.diff(margin_index.margins) < 0)):
+        return None
+
+    lowest = _lowest_unit(volume_min)
+
+    def passes(margins):
+        return margin_rule_passes(equity, existing_margin, margins, min_free_percent, max_usage_percent)
+
+    if margin_index is not None:
+        # Ứng viên = các unit có trong map thuộc [lowest, start]; margin tăng theo unit
+        # => lot an toàn là 1 đoạn đầu, tìm vị trí không an toàn đầu tiên
+        units, table = margin_index.units, margin_index.margins
+        if units.size == 0:
+            return np.full(starts.shape, np.nan), np.full(starts.shape, np.nan)
+        first = int(np.searchsorted(units, lowest, side='left'))
+        lo = np.full(starts.shape, first, dtype=np.int64)
+        hi = np.searchsorted(units, starts, side='right').astype(np.int64)
+        while np.any(lo < hi):
+            active = lo < hi
+            mid = (lo + hi) // 2
+            ok = passes(table[np.minimum(mid, units.size - 1)])
+            lo = np.where(active & ok, mid + 1, lo)
+            hi = np.where(active & ~ok, mid, hi)
+        found = lo > first
+        pick = np.maximum(lo - 1, 0)
+        return np.where(found, units[pick] / LOT_SCALE, np.nan), np.where(found, table[pick], np.nan)
+
+    contract_size, price, margin_rate, leverage = (np.asarray(v, dtype=np.float64) for v in margin_params)
+
+    def margin_at(j):
+        lots = (starts - j * step) / LOT_SCALE
+        return lots, round_like_python((lots * contract_size * price * margin_rate) / leverage, 2)
+
+    # Ứng viên j = 0..count-1 (lot = start - j*step giảm dần) => an toàn là 1 đoạn cuối, tìm j an toàn đầu tiên
+    count = np.where(starts >= lowest, (starts - lowest) // step + 1, 0)
+    lo, hi = np.zeros(starts.shape, dtype=np.int64), count.copy()
+    while np.any(lo < hi):
+        active = lo < hi
+        mid = (lo + hi) // 2
+        ok = passes(margin_at(mid)[1])
+        hi = np.where(active & ok, mid, hi)
+        lo = np.where(active & ~ok, mid + 1, lo)
+    lots, margins = margin_at(lo)
+    found = lo < count
+    return np.where(found, lots, np.nan), np.where(found, margins, np.nan)
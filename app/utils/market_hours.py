@@ -3,42 +3,115 @@ Market Hours Utility Module
 Provides functions to check if forex market is open/closed
 """
 
-from datetime import datetime, timezone
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+WEEKDAY_CODES = ('MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN')
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_week_time(text: str) -> int:
+    """
+    "FRI 17:00" => số giây tính từ thứ Hai 00:00
+
+    Raises:
+        ValueError: Sai định dạng
+    """
+    day, _, clock = text.strip().upper().partition(' ')
+    hours, _, minutes = clock.strip().partition(':')
+    if day not in WEEKDAY_CODES or not hours.isdigit() or not (minutes or '0').isdigit():
+        raise ValueError(f"Invalid week time: {text!r} (expected e.g. 'FRI 17:00')")
+    return WEEKDAY_CODES.index(day) * DAY_SECONDS + int(hours) * 3600 + int(minutes or 0) * 60
 
 
 class MarketHours:
-    """Utility class for checking forex market trading hours"""
-    
+    """
+    Giờ giao dịch FX: phiên tuần theo giờ địa phương của session_timezone (mặc định New York 17:00 - tự theo DST,
+    tức 21:00 UTC mùa hè / 22:00 UTC mùa đông) + ngày nghỉ theo ngày của broker
+    """
+
+    def __init__(self, weekly_close: str = "FRI 17:00", weekly_open: str = "SUN 17:00",
+                 session_timezone: str = "America/New_York", holidays: Iterable[str] = ()):
+        """
+        Args:
+            weekly_close: Giờ đóng cửa cuối tuần theo session_timezone, vd "FRI 17:00"
+            weekly_open: Giờ mở cửa đầu tuần theo session_timezone, vd "SUN 17:00"
+            session_timezone: Timezone IANA neo phiên tuần ("UTC" => giờ cố định)
+            holidays: Ngày nghỉ "YYYY-MM-DD" theo giờ broker (cả ngày)
+        """
+        self.close_at = parse_week_time(weekly_close)
+        self.open_at = parse_week_time(weekly_open)
+        self.session_tz = ZoneInfo(session_timezone)
+        self.holidays = frozenset(date.fromisoformat(day.strip()).toordinal() for day in holidays if day.strip())
+
+    def _local_week_second(self, timestamp: int) -> Tuple[datetime, int]:
+        """Giờ địa phương của phiên + số giây tính từ thứ Hai 00:00 (giờ địa phương)"""
+        local = datetime.fromtimestamp(timestamp, self.session_tz)
+        return local, local.weekday() * DAY_SECONDS + local.hour * 3600 + local.minute * 60 + local.second
+
+    def _in_weekend(self, week_second: int) -> bool:
+        if self.close_at <= self.open_at:
+            return self.close_at <= week_second < self.open_at
+        return week_second >= self.close_at or week_second < self.open_at
+
+    def is_weekend_closed(self, timestamp: int) -> bool:
+        """Timestamp (UTC) nằm trong khoảng nghỉ cuối tuần"""
+        return self._in_weekend(self._local_week_second(timestamp)[1])
+
+    def is_holiday(self, timestamp: int, utc_offset_seconds: int = 0) -> bool:
+        """Ngày của broker (UTC + offset) là ngày nghỉ"""
+        return bool(self.holidays) and EPOCH_ORDINAL + (timestamp + utc_offset_seconds) // DAY_SECONDS in self.holidays
+
+    def status(self, timestamp: Optional[float] = None, utc_offset_seconds: int = 0) -> Tuple[bool, str]:
+        """
+        Args:
+            timestamp: Epoch giây (mặc định hiện tại)
+            utc_offset_seconds: Offset giờ broker so với UTC
+
+        Returns:
+            tuple: (is_open: bool, reason: str)
+        """
+        ts = int(time.time() if timestamp is None else timestamp)
+        if self.is_weekend_closed(ts):
+            return False, "Market closed - Weekend"
+        if self.is_holiday(ts, utc_offset_seconds):
+            local_day = date.fromordinal(EPOCH_ORDINAL + (ts + utc_offset_seconds) // DAY_SECONDS)
+            return False, f"Market closed - Holiday {local_day.isoformat()}"
+        return True, "Market is open"
+
+    def next_open(self, timestamp: Optional[float] = None, utc_offset_seconds: int = 0) -> int:
+        """Epoch giây (UTC) sớm nhất từ timestamp mà thị trường mở"""
+        ts = int(time.time() if timestamp is None else timestamp)
+        for _ in range(len(self.holidays) + 2):
+            local, week_second = self._local_week_second(ts)
+            if self._in_weekend(week_second):
+                # Cộng theo giờ địa phương (wall clock) => giờ mở đúng kể cả khi DST đổi trong cuối tuần
+                opens = local.replace(tzinfo=None) + timedelta(seconds=(self.open_at - week_second) % WEEK_SECONDS)
+                ts = int(opens.replace(tzinfo=self.session_tz).timestamp())
+            if not self.is_holiday(ts, utc_offset_seconds):
+                return ts
+            # Sang 00:00 ngày kế tiếp của broker
+            ts += DAY_SECONDS - (ts + utc_offset_seconds) % DAY_SECONDS
+        return ts
+
     @staticmethod
     def is_market_open() -> bool:
         """
         Check if forex market is currently open
-        
-        Forex Market Hours (UTC):
-        - Monday 00:00 UTC (Sydney open) to Friday 22:00 UTC (New York close)
-        - Closed: Saturday 22:00 UTC to Sunday 22:00 UTC
-        
+
+        Phiên tuần theo market_calendar (mặc định New York: thứ Sáu 17:00 đóng, Chủ nhật 17:00 mở, tự theo DST)
+
         Returns:
             bool: True if market is open, False if closed
         """
-        current_time_utc = datetime.now(timezone.utc)
-        weekday = current_time_utc.weekday()  # 0=Monday, 6=Sunday
-        hour = current_time_utc.hour
-        
-        # Saturday (5) and Sunday (6) - Market closed
-        if weekday == 5:  # Saturday
-            return False
-        elif weekday == 6:  # Sunday
-            # Sunday before 22:00 UTC - Market closed
-            # Sunday after 22:00 UTC - Market opens (Sydney)
-            return hour >= 22
-        else:  # Monday (0) to Friday (4)
-            if weekday == 4:  # Friday
-                # Friday after 22:00 UTC - Market closed
-                return hour < 22
-            else:  # Monday to Thursday
-                return True
-    
+        return not market_calendar.is_weekend_closed(int(time.time()))
+
     @staticmethod
     def is_trading_time_london_ny() -> bool:
         """
@@ -152,6 +225,13 @@ class MarketHours:
             return False, "Market is open (Broker check error)"
 
 
+# Global calendar instance (MARKET_WEEKLY_CLOSE / MARKET_WEEKLY_OPEN / MARKET_SESSION_TIMEZONE / MARKET_HOLIDAYS)
+market_calendar = MarketHours(
+    settings.MARKET_WEEKLY_CLOSE, settings.MARKET_WEEKLY_OPEN, settings.MARKET_SESSION_TIMEZONE,
+    settings.MARKET_HOLIDAYS.split(',')
+)
+
+
 # Convenience functions for backward compatibility
 def is_market_open() -> bool:
     """Check if forex market is currently open"""
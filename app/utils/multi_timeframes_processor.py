@@ -3,10 +3,31 @@ Multi Timeframes Processor Utility
 Tái sử dụng logic từ signalGeneratorBot._process_multi_timeframes
 """
 
-import copy
+import asyncio
 from typing import Dict, Any, Optional
-from utils.logger import Logger
-from utils.price_action_analyzer import PriceActionAnalyzer
+from app.core.config import settings
+from app.core.executor import executor_manager, ExecutorQueueFullError
+from app.utils.logger import Logger
+from app.utils.price_action_analyzer import PriceActionAnalyzer
+from app.utils.indicator_engine import indicator_engine
+from app.utils.analysis_cache import analysis_cache
+from app.utils.candle_codec import (
+    CandleDecodeError, has_candles, decode_timeframe, RAW_KEYS
+)
+
+
+def analyze_timeframe(columns, pip_size: float) -> Dict[str, Any]:
+    """
+    Phân tích price action cho 1 timeframe (hàm cấp module để chạy được trong process pool)
+
+    Args:
+        columns: CandleColumns của timeframe
+        pip_size: Giá trị 1 pip của symbol
+
+    Returns:
+        dict: Kết quả analyze_price_action
+    """
+    return PriceActionAnalyzer().analyze_arrays(*columns, instrument_pip_size=pip_size)
 
 
 class MultiTimeframesProcessor:
@@ -40,9 +61,26 @@ class MultiTimeframesProcessor:
         except Exception:
             pass
         return 0.0001
-    
+
+    @staticmethod
+    def has_raw_data(multi_timeframes: dict) -> bool:
+        """
+        Kiểm tra request có gửi nến thô (raw_data hoặc raw_columns) cần phân tích phía server hay không
+
+        Args:
+            multi_timeframes: Multi timeframes data từ request
+
+        Returns:
+            bool: True nếu có ít nhất 1 timeframe chứa raw_data
+        """
+        if not isinstance(multi_timeframes, dict):
+            return False
+        return any(has_candles(tf_data) for tf_data in multi_timeframes.values())
+
     def process_multi_timeframes(self, symbol_origin_name: str, symbol_info: dict, 
-                               multi_timeframes: dict, context: str = "general") -> dict:
+                               multi_timeframes: dict, context: str = "general",
+                               columns_by_tf: Optional[Dict[str, Any]] = None,
+                               roles: Optional[Dict[str, str]] = None, namespace: Optional[str] = None) -> dict:
         """
         Phân tích price action cho từng timeframe
         
@@ -51,6 +89,9 @@ class MultiTimeframesProcessor:
             symbol_info: Symbol information
             multi_timeframes: Multi timeframes data
             context: Context sử dụng ("signal_generation" hoặc "review_loss_order")
+            columns_by_tf: CandleColumns đã dựng sẵn theo timeframe (vd. từ CandleStoreService), bỏ qua bước decode
+            roles: Vai trò của từng timeframe ({tf: "higher"/"main"/"lower"}) cho thống kê analysis cache
+            namespace: cache_key.timezone (namespace state của indicator engine)
             
         Returns:
             dict: {
@@ -62,6 +103,53 @@ class MultiTimeframesProcessor:
                 'raw_data_counts': dict
             }
         """
+        prepared = self._prepare(symbol_origin_name, symbol_info, multi_timeframes, context, columns_by_tf, roles)
+        if not prepared.get('success'):
+            return prepared
+
+        try:
+            analyses = {
+                tf: analyze_timeframe(prepared['columns'][tf], prepared['pip_size'])
+                for tf in prepared['pending']
+            }
+        except Exception as e:
+            return self._analysis_exception(symbol_origin_name, e)
+
+        return self._attach_results(symbol_origin_name, multi_timeframes, prepared, analyses, context, namespace)
+
+    async def process_multi_timeframes_async(self, symbol_origin_name: str, symbol_info: dict,
+                                             multi_timeframes: dict, context: str = "general",
+                                             columns_by_tf: Optional[Dict[str, Any]] = None,
+                                             roles: Optional[Dict[str, str]] = None,
+                                             namespace: Optional[str] = None) -> dict:
+        """
+        Giống process_multi_timeframes nhưng phân tích các timeframe song song trong process pool
+        (không block event loop). Indicator engine vẫn chạy trong process chính để giữ rolling state.
+
+        Raises:
+            ExecutorQueueFullError: Process pool đã đầy
+        """
+        prepared = self._prepare(symbol_origin_name, symbol_info, multi_timeframes, context, columns_by_tf, roles)
+        if not prepared.get('success'):
+            return prepared
+
+        timeframes = prepared['pending']
+        try:
+            results = await asyncio.gather(*(
+                executor_manager.run_cpu(analyze_timeframe, prepared['columns'][tf], prepared['pip_size'])
+                for tf in timeframes
+            ))
+        except ExecutorQueueFullError:
+            raise
+        except Exception as e:
+            return self._analysis_exception(symbol_origin_name, e)
+
+        return self._attach_results(symbol_origin_name, multi_timeframes, prepared,
+                                    dict(zip(timeframes, results)), context, namespace)
+
+    def _prepare(self, symbol_origin_name: str, symbol_info: dict, multi_timeframes: dict, context: str,
+                 columns_by_tf: Optional[Dict[str, Any]] = None, roles: Optional[Dict[str, str]] = None) -> dict:
+        """Validate input, giải mã nến của từng timeframe thành cột và tra analysis cache"""
         self.logger.info(f"Processing multi_timeframes for {symbol_origin_name} (context: {context})")
         
         # Validate input
@@ -72,63 +160,98 @@ class MultiTimeframesProcessor:
                 "title": "Multi Timeframes Processing Failed"
             }
         
-        # Initialize analyzer
-        analyzer = PriceActionAnalyzer()
         pip_size = self._derive_pip_size(symbol_info or {})
         self.price_action_logger.info(f"Begin price action analysis for {symbol_origin_name} with pip_size={pip_size}")
-        
-        try:
-            # Process each timeframe
-            for tf, tf_data in multi_timeframes.items():
-                raw_list = tf_data.get('raw_data')
-                if not isinstance(raw_list, list) or len(raw_list) < 20:
-                    err = f"Price action input not enough candles (<20) for {symbol_origin_name} @ {tf}"
-                    self.logger.critical(err)
-                    return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
 
-                # Chuẩn hóa dữ liệu đầu vào cho analyzer: map tick_volume -> volume
-                mapped = []
-                for c in raw_list:
+        prebuilt = columns_by_tf
+        columns_by_tf = {}
+        for tf, tf_data in multi_timeframes.items():
+            try:
+                if prebuilt and tf in prebuilt:
+                    columns = prebuilt[tf]
+                else:
+                    columns = decode_timeframe(tf_data) if has_candles(tf_data) else None
+            except CandleDecodeError as e:
+                err = f"Malformed candle payload for {symbol_origin_name} @ {tf}: {e}"
+                self.logger.critical(err)
+                return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
+
+            if columns is None or columns.size < 20:
+                err = f"Price action input not enough candles (<20) for {symbol_origin_name} @ {tf}"
+                self.logger.critical(err)
+                return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
+            columns_by_tf[tf] = columns
+
+        # Timeframe có nến không đổi so với request trước => dùng lại block phân tích đã cache
+        cached, cache_keys = {}, {}
+        if settings.ANALYSIS_CACHE_ENABLED:
+            for tf, columns in columns_by_tf.items():
+                cache_keys[tf] = analysis_cache.make_key(symbol_origin_name, tf, columns, pip_size)
+                block = analysis_cache.get(cache_keys[tf], (roles or {}).get(tf))
+                if block is not None:
+                    cached[tf] = block
+
+        return {
+            "success": True,
+            "pip_size": pip_size,
+            "columns": columns_by_tf,
+            "cached": cached,
+            "cache_keys": cache_keys,
+            "pending": [tf for tf in columns_by_tf if tf not in cached]
+        }
+
+    def _analysis_exception(self, symbol_origin_name: str, e: Exception) -> dict:
+        err = f"Exception during price action analysis for {symbol_origin_name}: {e}"
+        self.logger.critical(err)
+        return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
+
+    def _attach_results(self, symbol_origin_name: str, multi_timeframes: dict, prepared: dict,
+                        analyses: dict, context: str, namespace: Optional[str] = None) -> dict:
+        """Kiểm tra kết quả phân tích, gắn vào từng timeframe (kể cả block lấy từ cache) và chuẩn bị output theo context"""
+        columns_by_tf, cached = prepared['columns'], prepared['cached']
+        for tf in columns_by_tf:
+            tf_data = multi_timeframes[tf]
+            if tf in cached:
+                # analysis_cache.get trả bản copy => request này sửa block không ảnh hưởng request khác
+                tf_data['analyze_price_action'] = cached[tf]['analyze_price_action']
+                # Client không gửi indicators => vẫn đẩy nến vào engine (snapshot của postprocessor không bị cũ)
+                if not tf_data.get('indicators'):
                     try:
-                        mapped.append({
-                            'open': c.get('open'),
-                            'high': c.get('high'),
-                            'low': c.get('low'),
-                            'close': c.get('close'),
-                            'volume': c.get('tick_volume', 0),
-                            'time': c.get('time')
-                        })
-                    except Exception:
-                        err = f"Malformed raw_data record for {symbol_origin_name} @ {tf}"
-                        self.logger.critical(err)
-                        return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
-
-                # Analyze price action
-                analysis = analyzer.analyze_price_action(mapped, instrument_pip_size=pip_size)
-
-                # Kiểm tra kết quả hợp lệ (tránh default-analysis)
-                try:
-                    if (
-                        not isinstance(analysis, dict) or
-                        analysis.get('volume_context', {}).get('status') == 'N/A' or
-                        float(analysis.get('current_price_context', {}).get('price', 0) or 0) == 0
-                    ):
-                        err = f"Price action returned invalid/default analysis for {symbol_origin_name} @ {tf}"
-                        self.logger.critical(err)
-                        return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
-                except Exception:
-                    err = f"Price action post-check failed for {symbol_origin_name} @ {tf}"
+                        tf_data['indicators'] = indicator_engine.update(symbol_origin_name, tf, *columns_by_tf[tf], namespace=namespace)
+                    except Exception as e:
+                        return self._analysis_exception(symbol_origin_name, e)
+                self.price_action_logger.info(f"Reused cached analysis for {symbol_origin_name} @ {tf}")
+                continue
+            analysis = analyses[tf]
+
+            # Kiểm tra kết quả hợp lệ (tránh default-analysis)
+            try:
+                if (
+                    not isinstance(analysis, dict) or
+                    analysis.get('volume_context', {}).get('status') == 'N/A' or
+                    float(analysis.get('current_price_context', {}).get('price', 0) or 0) == 0
+                ):
+                    err = f"Price action returned invalid/default analysis for {symbol_origin_name} @ {tf}"
                     self.logger.critical(err)
                     return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
+            except Exception:
+                err = f"Price action post-check failed for {symbol_origin_name} @ {tf}"
+                self.logger.critical(err)
+                return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
 
-                # Gắn kết quả vào cấu trúc timeframe
-                tf_data['analyze_price_action'] = analysis
-                self.price_action_logger.info(f"Analyzed {symbol_origin_name} @ {tf} OK with {len(mapped)} candles")
+            # Gắn kết quả vào cấu trúc timeframe
+            tf_data['analyze_price_action'] = analysis
 
-        except Exception as e:
-            err = f"Exception during price action analysis for {symbol_origin_name}: {e}"
-            self.logger.critical(err)
-            return {"success": False, "error": err, "title": "Price Action Analysis Failed"}
+            # Client không gửi indicators => tính incremental phía server
+            if not tf_data.get('indicators'):
+                try:
+                    tf_data['indicators'] = indicator_engine.update(symbol_origin_name, tf, *columns_by_tf[tf], namespace=namespace)
+                except Exception as e:
+                    return self._analysis_exception(symbol_origin_name, e)
+            if tf in prepared['cache_keys']:
+                # Indicators không cache: engine luôn được cập nhật theo nến của request
+                analysis_cache.put(prepared['cache_keys'][tf], {'analyze_price_action': analysis})
+            self.price_action_logger.info(f"Analyzed {symbol_origin_name} @ {tf} OK with {columns_by_tf[tf].size} candles")
 
         # Prepare result based on context
         result = {
@@ -140,24 +263,23 @@ class MultiTimeframesProcessor:
         }
         
         # Calculate raw_data_counts
-        for tf, data in multi_timeframes.items():
-            if data and isinstance(data.get('raw_data'), list):
-                result['raw_data_counts'][tf] = len(data['raw_data'])
-            else:
-                result['raw_data_counts'][tf] = 0
+        for tf in multi_timeframes:
+            result['raw_data_counts'][tf] = columns_by_tf[tf].size if tf in columns_by_tf else 0
         
-        # For signal_generation context, create tmp_multi_timeframes (copy with raw_data)
+        # For signal_generation context, create tmp_multi_timeframes (copy with raw_data / raw_columns)
         if context == "signal_generation":
-            tmp_multi_timeframes = copy.deepcopy(multi_timeframes)
+            # Shallow copy từng timeframe là đủ: nến thô không bị sửa, chỉ bị gỡ khỏi cấu trúc prompt
+            tmp_multi_timeframes = {
+                _tf: dict(_data) if isinstance(_data, dict) else _data
+                for _tf, _data in multi_timeframes.items()
+            }
             result['tmp_multi_timeframes'] = tmp_multi_timeframes
             
-            # Xóa raw_data khỏi cấu trúc dùng cho prompt (chỉ giữ trong tmp)
-            for _tf, _data in multi_timeframes.items():
-                if isinstance(_data, dict) and 'raw_data' in _data:
-                    try:
-                        del _data['raw_data']
-                    except Exception:
-                        pass
+            # Xóa nến thô khỏi cấu trúc dùng cho prompt (chỉ giữ trong tmp)
+            for _data in multi_timeframes.values():
+                if isinstance(_data, dict):
+                    for raw_key in RAW_KEYS:
+                        _data.pop(raw_key, None)
         
         self.logger.info(f"Multi timeframes processing completed for {symbol_origin_name}")
         return result
@@ -0,0 +1,410 @@
+"""
+Price Action Analyzer
+Phân tích price action phía server trên mảng OHLCV NumPy (vectorized)
+
+Output khớp schema `analyze_price_action` mà prompt_signal_analyst sử dụng:
+    - time_context
+    - key_levels (period_high, period_low, resistance, support)
+    - price_patterns (all_detected_on_last, last_single_candle_pattern, last_multi_candle_pattern)
+    - volume_context
+    - current_price_context
+"""
+
+import math
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# ===== CẤU HÌNH PHÂN TÍCH (khai báo ở đầu file để dễ bảo trì) =====
+MIN_CANDLES = 20                 # Số nến tối thiểu để phân tích
+SWING_WINDOW = 5                 # Số nến mỗi bên để xác định swing high/low (fractal)
+LEVEL_CLUSTER_PIPS = 3.0         # Các level cách nhau <= X pips được gộp thành 1 cluster
+ROUND_NUMBER_STEP_PIPS = 50      # Bước round number (50 pips: 1.175, 1.18, ...)
+ROUND_NUMBER_COUNT = 4           # Số round number mỗi phía của giá hiện tại
+RECENCY_HISTORIC_RATIO = 0.2     # Swing nằm trong 20% đầu chuỗi => historic
+RECENCY_RECENT_RATIO = 0.8       # Swing nằm trong 20% cuối chuỗi => recent
+PATTERN_LOOKBACK = 10            # Số nến trước đó để tính body/range trung bình (giống TA-Lib)
+VOLUME_LOOKBACK = 20             # Số nến để tính volume trung bình
+VOLUME_HIGH_RATIO = 1.5          # last_volume / avg >= 1.5 => Above Average
+VOLUME_LOW_RATIO = 0.7           # last_volume / avg <= 0.7 => Below Average
+
+# Các pattern được xem là "single candle" khi chọn last_single_candle_pattern.
+# Tất cả pattern còn lại được xếp vào last_multi_candle_pattern.
+SINGLE_CANDLE_PATTERNS = ("DOJI", "HAMMER", "MARUBOZU", "SHOOTINGSTAR", "SPINNINGTOP")
+
+VOLUME_CONTEXT = {
+    "Above Average": "High volume suggests strong conviction behind the last move.",
+    "Below Average": "Low volume suggests lack of interest or conviction.",
+    "Normal": "Volume is at an average level.",
+    "N/A": "Volume data is not available.",
+}
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class PriceActionAnalyzer:
+    """
+    Vectorized price action analyzer.
+
+    Dùng được với 2 dạng input:
+        - analyze_price_action(candles): list các dict {open, high, low, close, volume, time}
+        - analyze_arrays(time, open, high, low, close, volume): các mảng NumPy song song
+    """
+
+    def analyze_price_action(self, candles: Sequence[Dict[str, Any]], instrument_pip_size: float = 0.0001) -> Dict[str, Any]:
+        """
+        Phân tích price action từ list nến (tương thích với MultiTimeframesProcessor)
+
+        Args:
+            candles: List nến, mỗi nến có open/high/low/close/volume/time
+            instrument_pip_size: Giá trị 1 pip của symbol
+
+        Returns:
+            dict: Kết quả theo schema analyze_price_action
+        """
+        if not candles or len(candles) < MIN_CANDLES:
+            return self._default_analysis()
+
+        try:
+            opens = np.array([c.get('open') for c in candles], dtype=np.float64)
+            highs = np.array([c.get('high') for c in candles], dtype=np.float64)
+            lows = np.array([c.get('low') for c in candles], dtype=np.float64)
+            closes = np.array([c.get('close') for c in candles], dtype=np.float64)
+            volumes = np.array([c.get('volume') or 0 for c in candles], dtype=np.float64)
+        except (TypeError, ValueError):
+            return self._default_analysis()
+
+        times = [c.get('time') for c in candles]
+        return self.analyze_arrays(times, opens, highs, lows, closes, volumes, instrument_pip_size)
+
+    def analyze_arrays(self, times, opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                       closes: np.ndarray, volumes: Optional[np.ndarray], instrument_pip_size: float = 0.0001) -> Dict[str, Any]:
+        """
+        Phân tích price action trên các mảng OHLCV song song
+
+        Args:
+            times: Mảng thời gian (epoch seconds hoặc string)
+            opens, highs, lows, closes: Mảng giá float64
+            volumes: Mảng tick volume (có thể None)
+            instrument_pip_size: Giá trị 1 pip của symbol
+
+        Returns:
+            dict: Kết quả theo schema analyze_price_action
+        """
+        n = len(closes)
+        if n < MIN_CANDLES or np.isnan(closes).any() or np.isnan(highs).any() or np.isnan(lows).any():
+            return self._default_analysis()
+
+        pip_size = float(instrument_pip_size) if instrument_pip_size and instrument_pip_size > 0 else 0.0001
+        digits = max(int(round(-math.log10(pip_size))) + 1, 0)
+        current_price = round(float(closes[-1]), digits)
+
+        resistance, support = self._find_key_levels(times, highs, lows, current_price, pip_size, digits)
+        nearest_resistance = next((lv for lv in resistance if lv['price'] > current_price), None)
+        nearest_support = next((lv for lv in support if lv['price'] < current_price), None)
+
+        period_high_idx = int(np.argmax(highs))
+        period_low_idx = int(np.argmin(lows))
+
+        return {
+            "time_context": {
+                "start_time": f"{self._format_time(times[0])} UTC",
+                "end_time": f"{self._format_time(times[-1])} UTC",
+                "total_candles": n
+            },
+            "key_levels": {
+                "period_high": {
+                    "price": round(float(highs[period_high_idx]), digits),
+                    "time": self._format_time(times[period_high_idx])
+                },
+                "period_low": {
+                    "price": round(float(lows[period_low_idx]), digits),
+                    "time": self._format_time(times[period_low_idx])
+                },
+                "resistance": resistance,
+                "support": support
+            },
+            "price_patterns": self._detect_patterns(opens, highs, lows, closes),
+            "volume_context": self._volume_context(volumes),
+            "current_price_context": {
+                "price": current_price,
+                "position_relative_to_levels": self._describe_position(current_price, nearest_resistance, nearest_support),
+                "nearest_resistance": nearest_resistance,
+                "nearest_support": nearest_support
+            }
+        }
+
+    # ------------------------------------------------------------------
+    # Key levels
+    # ------------------------------------------------------------------
+    def _find_key_levels(self, times, highs: np.ndarray, lows: np.ndarray, current_price: float,
+                         pip_size: float, digits: int):
+        """Tìm swing high/low (fractal), gộp cluster và bổ sung round numbers"""
+        n = len(highs)
+        window = 2 * SWING_WINDOW + 1
+
+        swing_high_idx = np.empty(0, dtype=np.int64)
+        swing_low_idx = np.empty(0, dtype=np.int64)
+        if n >= window:
+            # Nến ở giữa cửa sổ là cực trị của cả cửa sổ => swing point
+            centers = np.arange(SWING_WINDOW, n - SWING_WINDOW)
+            high_max = sliding_window_view(highs, window).max(axis=1)
+            low_min = sliding_window_view(lows, window).min(axis=1)
+            swing_high_idx = centers[highs[centers] >= high_max]
+            swing_low_idx = centers[lows[centers] <= low_min]
+
+        tolerance = LEVEL_CLUSTER_PIPS * pip_size
+        resistance = self._cluster_levels(times, highs, swing_high_idx, n, tolerance, "swing_high", digits)
+        support = self._cluster_levels(times, lows, swing_low_idx, n, tolerance, "swing_low", digits)
+
+        # Round numbers quanh giá hiện tại
+        step = ROUND_NUMBER_STEP_PIPS * pip_size
+        base = math.floor(current_price / step)
+        round_above = [round((base + k) * step, digits) for k in range(1, ROUND_NUMBER_COUNT + 1)]
+        round_below = [round((base - k) * step, digits) for k in range(0, ROUND_NUMBER_COUNT)]
+
+        existing = [lv['price'] for lv in resistance + support]
+        for price in round_above:
+            if price > current_price and not self._is_near(price, existing, tolerance):
+                resistance.append(self._round_level(price))
+        for price in round_below:
+            if price < current_price and not self._is_near(price, existing, tolerance):
+                support.append(self._round_level(price))
+
+        resistance.sort(key=lambda lv: lv['price'])
+        support.sort(key=lambda lv: lv['price'], reverse=True)
+        return resistance, support
+
+    def _cluster_levels(self, times, prices: np.ndarray, idx: np.ndarray, n: int, tolerance: float,
+                        level_type: str, digits: int) -> List[Dict[str, Any]]:
+        """Gộp các swing point có giá gần nhau; mỗi cluster giữ swing gần nhất về thời gian"""
+        if idx.size == 0:
+            return []
+
+        order = np.argsort(prices[idx], kind='stable')
+        sorted_idx = idx[order]
+        sorted_prices = prices[sorted_idx]
+
+        # Cluster mới bắt đầu khi khoảng cách với level trước > tolerance
+        cluster_id = np.concatenate(([0], np.cumsum(np.diff(sorted_prices) > tolerance)))
+        levels = []
+        for cid in range(int(cluster_id[-1]) + 1):
+            members = sorted_idx[cluster_id == cid]
+            latest = int(members.max())
+            levels.append({
+                "price": round(float(prices[latest]), digits),
+                "type": level_type,
+                "time": self._format_time(times[latest]),
+                "recency": self._recency(latest, n)
+            })
+        return levels
+
+    @staticmethod
+    def _round_level(price: float) -> Dict[str, Any]:
+        return {"price": price, "type": "round_number", "time": None, "recency": "historic"}
+
+    @staticmethod
+    def _is_near(price: float, existing: List[float], tolerance: float) -> bool:
+        return any(abs(price - other) <= tolerance for other in existing)
+
+    @staticmethod
+    def _recency(index: int, n: int) -> str:
+        position = index / max(n - 1, 1)
+        if position >= RECENCY_RECENT_RATIO:
+            return "recent"
+        if position < RECENCY_HISTORIC_RATIO:
+            return "historic"
+        return "intermediate"
+
+    @staticmethod
+    def _describe_position(price: float, nearest_resistance: Optional[Dict[str, Any]],
+                           nearest_support: Optional[Dict[str, Any]]) -> str:
+        """Mô tả vị trí giá so với level gần nhất"""
+        if nearest_resistance is None and nearest_support is None:
+            return "Price is trading in open space with no nearby key levels."
+        if nearest_support is None:
+            return f"Price is approaching resistance at {nearest_resistance['price']}."
+        if nearest_resistance is None:
+            return f"Price is testing support at {nearest_support['price']}."
+
+        if (nearest_resistance['price'] - price) < (price - nearest_support['price']):
+            return f"Price is approaching resistance at {nearest_resistance['price']}."
+        return f"Price is testing support at {nearest_support['price']}."
+
+    # ------------------------------------------------------------------
+    # Candlestick patterns
+    # ------------------------------------------------------------------
+    def _detect_patterns(self, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray) -> Dict[str, Any]:
+        """
+        Nhận diện pattern nến trên toàn chuỗi (vectorized), trả về các pattern của nến cuối.
+        Tên pattern theo quy ước TA-Lib (CDL*) mà client trước đây upload.
+        """
+        n = len(c)
+        body = np.abs(c - o)
+        rng = h - l
+        upper = h - np.maximum(o, c)
+        lower = np.minimum(o, c) - l
+        bullish = c >= o
+
+        # Trung bình body/range của PATTERN_LOOKBACK nến TRƯỚC đó (không gồm nến hiện tại)
+        avg_body = self._trailing_mean(body, PATTERN_LOOKBACK)
+        avg_range = self._trailing_mean(rng, PATTERN_LOOKBACK)
+
+        long_body = body > avg_body
+        short_body = body < avg_body * 0.5
+        doji = body <= 0.1 * avg_range
+        tiny_upper = upper <= 0.05 * rng
+        tiny_lower = lower <= 0.05 * rng
+        long_upper = upper > avg_body
+        long_lower = lower > avg_body
+
+        def prev(arr, k=1, fill=False):
+            out = np.empty_like(arr)
+            out[:k] = fill
+            out[k:] = arr[:-k]
+            return out
+
+        body_top = np.maximum(o, c)
+        body_bottom = np.minimum(o, c)
+        prev_bullish = prev(bullish)
+        prev_bearish = prev(~bullish)
+
+        # (name, mask, direction) - direction: True=Bullish, False=Bearish, None=theo màu nến
+        engulfing = (bullish != prev_bullish) & (body_top >= prev(body_top, fill=0.0)) & \
+            (body_bottom <= prev(body_bottom, fill=0.0)) & (body > prev(body, fill=0.0))
+        harami = prev(long_body) & (body_top < prev(body_top, fill=0.0)) & (body_bottom > prev(body_bottom, fill=0.0))
+        inside_bar = (h < prev(h, fill=0.0)) & (l > prev(l, fill=0.0))
+
+        patterns = [
+            ("DOJI", doji, True),
+            ("LONGLEGGEDDOJI", doji & (long_upper | long_lower), True),
+            ("RICKSHAWMAN", doji & long_upper & long_lower & (np.abs((o + c) / 2 - (h + l) / 2) <= 0.1 * rng), True),
+            ("GRAVESTONEDOJI", doji & tiny_lower & long_upper, True),
+            ("DRAGONFLYDOJI", doji & tiny_upper & long_lower, True),
+            ("MARUBOZU", long_body & tiny_upper & tiny_lower, None),
+            ("CLOSINGMARUBOZU", long_body & np.where(bullish, tiny_upper, tiny_lower), None),
+            ("BELTHOLD", long_body & np.where(bullish, tiny_lower, tiny_upper), None),
+            ("LONGLINE", long_body & (upper < body * 0.25) & (lower < body * 0.25), None),
+            ("SHORTLINE", short_body & ~doji & (upper < body) & (lower < body), None),
+            ("SPINNINGTOP", ~long_body & ~doji & (upper > body) & (lower > body), None),
+            ("HIGHWAVE", short_body & (upper > 2 * body) & (lower > 2 * body) & (upper + lower > avg_range), None),
+            ("HAMMER", ~long_body & ~doji & (lower >= 2 * body) & (upper <= 0.1 * rng), True),
+            ("SHOOTINGSTAR", ~long_body & ~doji & (upper >= 2 * body) & (lower <= 0.1 * rng), False),
+            ("ENGULFING", engulfing, None),
+            ("HARAMI", harami & ~doji, ~prev_bullish),
+            ("HARAMICROSS", harami & doji, ~prev_bullish),
+            ("3OUTSIDE", prev(engulfing) & np.where(prev_bullish, c > prev(c, fill=0.0), c < prev(c, fill=0.0)), prev_bullish),
+            ("3INSIDE", prev(harami) & np.where(prev_bullish, c > prev(o, 2, fill=0.0), c < prev(o, 2, fill=0.0)) &
+             (prev(bullish, 2) != prev_bullish), prev_bullish),
+            ("MORNINGSTAR", prev(long_body, 2) & prev(~bullish, 2) & prev(short_body) &
+             (prev(body_top, fill=0.0) < prev(body_bottom, 2, fill=0.0)) & bullish &
+             (c > (prev(o, 2, fill=0.0) + prev(c, 2, fill=0.0)) / 2), True),
+            ("EVENINGSTAR", prev(long_body, 2) & prev(bullish, 2) & prev(short_body) &
+             (prev(body_bottom, fill=0.0) > prev(body_top, 2, fill=0.0)) & ~bullish &
+             (c < (prev(o, 2, fill=0.0) + prev(c, 2, fill=0.0)) / 2), False),
+            ("PIERCING", prev_bearish & prev(long_body) & bullish & (o < prev(l, fill=0.0)) &
+             (c > (prev(o, fill=0.0) + prev(c, fill=0.0)) / 2) & (c < prev(o, fill=0.0)), True),
+            ("DARKCLOUDCOVER", prev_bullish & prev(long_body) & ~bullish & (o > prev(h, fill=0.0)) &
+             (c < (prev(o, fill=0.0) + prev(c, fill=0.0)) / 2) & (c > prev(o, fill=0.0)), False),
+            ("MATCHINGLOW", prev_bearish & ~bullish & np.isclose(c, prev(c, fill=np.nan)), True),
+            ("HIKKAKE", prev(inside_bar) & (((h < prev(h, fill=0.0)) & (l < prev(l, fill=0.0))) |
+                                            ((h > prev(h, fill=0.0)) & (l > prev(l, fill=0.0)))),
+             (h < prev(h, fill=0.0)) & (l < prev(l, fill=0.0))),
+        ]
+
+        last = n - 1
+        detected = []
+        for name, mask, direction in patterns:
+            # Bỏ qua các nến đầu chưa đủ lookback
+            if last < PATTERN_LOOKBACK or not bool(mask[last]):
+                continue
+            if direction is None:
+                is_bullish = bool(bullish[last])
+            elif isinstance(direction, np.ndarray):
+                is_bullish = bool(direction[last])
+            else:
+                is_bullish = direction
+            detected.append((name, f"{'Bullish' if is_bullish else 'Bearish'} {name}"))
+
+        detected.sort(key=lambda item: item[0])
+        labels = [label for _, label in detected]
+        single = next((label for name, label in detected if name in SINGLE_CANDLE_PATTERNS), "N/A")
+        multi = next((label for name, label in detected if name not in SINGLE_CANDLE_PATTERNS), "N/A")
+
+        return {
+            "all_detected_on_last": labels,
+            "last_single_candle_pattern": single,
+            "last_multi_candle_pattern": multi
+        }
+
+    @staticmethod
+    def _trailing_mean(values: np.ndarray, lookback: int) -> np.ndarray:
+        """Trung bình `lookback` phần tử ngay trước mỗi vị trí (cumsum, O(n))"""
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        idx = np.arange(len(values))
+        start = np.maximum(idx - lookback, 0)
+        count = np.maximum(idx - start, 1)
+        return (csum[idx] - csum[start]) / count
+
+    # ------------------------------------------------------------------
+    # Volume
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _volume_context(volumes: Optional[np.ndarray]) -> Dict[str, str]:
+        """So sánh volume nến cuối với trung bình VOLUME_LOOKBACK nến trước đó"""
+        if volumes is None or len(volumes) < 2:
+            status = "N/A"
+        else:
+            history = volumes[-(VOLUME_LOOKBACK + 1):-1]
+            average = float(history.mean()) if history.size else 0.0
+            if average <= 0 or np.isnan(average):
+                status = "N/A"
+            else:
+                ratio = float(volumes[-1]) / average
+                if ratio >= VOLUME_HIGH_RATIO:
+                    status = "Above Average"
+                elif ratio <= VOLUME_LOW_RATIO:
+                    status = "Below Average"
+                else:
+                    status = "Normal"
+        return {"status": status, "interpretation": VOLUME_CONTEXT[status]}
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _format_time(value) -> Optional[str]:
+        """Chuẩn hóa thời gian nến: epoch seconds -> 'YYYY-mm-dd HH:MM:SS'"""
+        if value is None:
+            return None
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return datetime.fromtimestamp(int(value), tz=timezone.utc).strftime(TIME_FORMAT)
+        if isinstance(value, datetime):
+            return value.strftime(TIME_FORMAT)
+        text = str(value).strip()
+        if text.isdigit():
+            return datetime.fromtimestamp(int(text), tz=timezone.utc).strftime(TIME_FORMAT)
+        return text.replace("T", " ").replace(" UTC", "").rstrip("Z")
+
+    @staticmethod
+    def _default_analysis() -> Dict[str, Any]:
+        """Kết quả mặc định khi không đủ dữ liệu (MultiTimeframesProcessor sẽ từ chối kết quả này)"""
+        return {
+            "time_context": {"start_time": None, "end_time": None, "total_candles": 0},
+            "key_levels": {"period_high": None, "period_low": None, "resistance": [], "support": []},
+            "price_patterns": {
+                "all_detected_on_last": [],
+                "last_single_candle_pattern": "N/A",
+                "last_multi_candle_pattern": "N/A"
+            },
+            "volume_context": {"status": "N/A", "interpretation": VOLUME_CONTEXT["N/A"]},
+            "current_price_context": {
+                "price": 0,
+                "position_relative_to_levels": "N/A",
+                "nearest_resistance": None,
+                "nearest_support": None
+            }
+        }
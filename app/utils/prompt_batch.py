@@ -0,0 +1,110 @@
+"""
+Prompt Batch
+Gom các request /signal cùng nhóm (cùng main timeframe) tới bước gọi AI thành 1 lần gọi dùng chung phần hướng dẫn.
+
+Mỗi request giữ 1 BatchSlot: tới bước gọi AI thì submit, dừng sớm (cache hit, HOLD, lỗi...) thì leave.
+Khi mọi slot đã submit / leave, batch gọi hàm flush 1 lần cho các request đã submit; request nhận None
+(batch chỉ có 1 request, entry lỗi / thiếu trong kết quả) sẽ tự gọi AI như mode single.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.logger import Logger
+
+
+# ===== CẤU HÌNH PROMPT BATCH (khai báo ở đầu file để dễ bảo trì) =====
+MIN_BATCH_ITEMS = 2  # Ít hơn => gọi AI như mode single
+
+
+class PromptBatchMetrics:
+    """Thống kê batch: số lần gọi AI batch, số request được batch và số request phải fallback single"""
+
+    def __init__(self):
+        self._stats = {"batches": 0, "batched_items": 0, "fallbacks": 0, "single": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, count in counts.items():
+                self._stats[name] += count
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["batched_items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
+
+
+class PromptBatch:
+    """1 nhóm request chờ nhau tại bước gọi AI"""
+
+    def __init__(self, size: int, flush: Callable[[List[Any]], Awaitable[List[Optional[Any]]]]):
+        """
+        Args:
+            size: Số slot (request) của batch
+            flush: payloads -> kết quả theo thứ tự payloads (None = request đó tự gọi AI)
+        """
+        self._remaining = size
+        self._flush = flush
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self.logger = Logger("prompt_batch")
+
+    def slot(self) -> "BatchSlot":
+        return BatchSlot(self)
+
+    async def _submit(self, payload: Any) -> Optional[Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        self._settle()
+        return await future
+
+    def _settle(self):
+        self._remaining -= 1
+        if self._remaining == 0:
+            asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        pending, self._pending = self._pending, []
+        if len(pending) < MIN_BATCH_ITEMS:
+            prompt_batch_metrics.add(single=len(pending))
+            results = [None] * len(pending)
+        else:
+            try:
+                results = list(await self._flush([payload for payload, _ in pending]))
+            except Exception as e:
+                self.logger.error(f"Prompt batch of {len(pending)} failed, falling back to single calls: {e}")
+                prompt_batch_metrics.add(errors=1)
+                results = []
+            results += [None] * (len(pending) - len(results))
+            fallbacks = sum(result is None for result in results)
+            prompt_batch_metrics.add(batches=1, batched_items=len(pending) - fallbacks, fallbacks=fallbacks)
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class BatchSlot:
+    """Chỗ của 1 request trong PromptBatch (submit hoặc leave đúng 1 lần)"""
+
+    def __init__(self, batch: PromptBatch):
+        self._batch = batch
+        self._settled = False
+
+    async def submit(self, payload: Any) -> Optional[Any]:
+        """Chờ kết quả của lần gọi AI batch (None => tự gọi AI)"""
+        if self._settled:
+            return None
+        self._settled = True
+        return await self._batch._submit(payload)
+
+    def leave(self):
+        """Request không cần gọi AI nữa (hoặc chờ việc khác lâu) => batch không chờ request này"""
+        if not self._settled:
+            self._settled = True
+            self._batch._settle()
+
+
+# Global metrics instance
+prompt_batch_metrics = PromptBatchMetrics()
@@ -2,7 +2,7 @@
 Common response handler for FX API
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from app.constants import ErrorCodes, ERROR_MESSAGES
 
 
@@ -103,6 +103,30 @@ class ResponseHandler:
         """Risk manager service error"""
         return ResponseHandler.error(ErrorCodes.RISK_MANAGER_SERVICE_ERROR, details=details)
     
+    @staticmethod
+    def candle_resync_required(timeframes: List[str]) -> Dict[str, Any]:
+        """Candle store cannot rebuild window from delta => client must upload full history"""
+        response = ResponseHandler.error(ErrorCodes.CANDLE_RESYNC_REQUIRED, timeframes=", ".join(timeframes))
+        response["data"] = {"resync_timeframes": timeframes}
+        return response
+    
+    @staticmethod
+    def account_state_stale(login: Any, version: Any, current_version: Optional[int]) -> Dict[str, Any]:
+        """Account state store is not at the referenced version => client must upload full state"""
+        response = ResponseHandler.error(ErrorCodes.ACCOUNT_STATE_STALE, login=login, version=version)
+        response["data"] = {"current_version": current_version}
+        return response
+    
+    @staticmethod
+    def account_state_invalid(details: str) -> Dict[str, Any]:
+        """Malformed account state delta (unknown op / ticket) => client input error"""
+        return ResponseHandler.error(ErrorCodes.ACCOUNT_STATE_INVALID, details=details)
+    
+    @staticmethod
+    def executor_queue_full(pool: str) -> Dict[str, Any]:
+        """Executor queue full error"""
+        return ResponseHandler.error(ErrorCodes.EXECUTOR_QUEUE_FULL, pool=pool)
+    
     @staticmethod
     def internal_server_error() -> Dict[str, Any]:
         """Internal server error"""
@@ -231,7 +231,8 @@ class ResponseLogger:
     
     def log_risk_manager_response(self, symbol: str,
                                 response_data: Dict[str, Any], 
-                                request_data: Dict[str, Any] = None) -> str:
+                                request_data: Dict[str, Any] = None,
+                                decision_trace: Dict[str, Any] = None) -> str:
         """
         Lưu risk manager response (không cần timezone/timeframe)
         
@@ -239,6 +240,7 @@ class ResponseLogger:
             symbol: Tên symbol
             response_data: Dữ liệu response
             request_data: Dữ liệu request
+            decision_trace: Trường quyết định từng bước (DecisionTrace.to_dict)
             
         Returns:
             str: Đường dẫn file log đã tạo
@@ -253,6 +255,7 @@ class ResponseLogger:
                 "symbol": symbol,
                 "request_data": request_data,
                 "response_data": response_data,
+                "decision_trace": decision_trace,
                 "log_type": "risk_manager"
             }
             
@@ -0,0 +1,139 @@
+"""
+Risk Math
+Các bước tính toán không phụ thuộc portfolio của RiskManagerService dưới dạng mảng NumPy
+(cùng thứ tự phép tính với bản scalar => cùng kết quả float) để xử lý nhiều tín hiệu / tài khoản trong 1 lượt
+"""
+
+import math
+
+import numpy as np
+
+
+# ===== HẰNG SỐ (giống RiskManagerService) =====
+WIN_PROBABILITY_TIERS = (75, 65, 55)          # > 75, >= 65, >= 55, còn lại
+RISK_PERCENT_TIERS = (1.5, 1.2, 0.8, 0.5)     # Rủi ro cơ bản (% equity) tương ứng
+MAX_RISK_REWARD = 1.5                         # R:R > 1.5 => kéo TP về 1.5
+
+DRAWDOWN_THRESHOLD = 0.04        # Profit < -4% balance => giảm lot
+DRAWDOWN_FACTOR = 0.7
+CORRELATION_MIN_POSITIONS = 2    # >= 2 vị thế cùng nhóm tương quan => giảm lot
+CORRELATION_FACTOR = 0.5
+PENDING_ORDER_WEIGHT = 0.33      # Lệnh chờ tính 0.33 vị thế
+EFFECTIVE_POSITIONS_HIGH = 3     # >= 3 vị thế hiệu quả => x0.5
+EFFECTIVE_POSITIONS_HIGH_FACTOR = 0.5
+EFFECTIVE_POSITIONS_LOW = 1      # 1-3 vị thế hiệu quả => x0.7
+EFFECTIVE_POSITIONS_LOW_FACTOR = 0.7
+
+# Ngưỡng có thể thay đổi khi chạy what-if (giá trị mặc định = RiskManagerService)
+DEFAULT_RISK_RULES = {
+    'drawdown_threshold': DRAWDOWN_THRESHOLD,
+    'drawdown_factor': DRAWDOWN_FACTOR,
+    'correlation_factor': CORRELATION_FACTOR,
+    'high_positions_factor': EFFECTIVE_POSITIONS_HIGH_FACTOR,
+    'low_positions_factor': EFFECTIVE_POSITIONS_LOW_FACTOR,
+    'min_free_margin_percent': 50,
+    'max_margin_usage_percent': 40
+}
+
+_TIE_TOLERANCE = 1e-6            # Vùng quanh .5 cần làm tròn lại bằng round() của Python
+
+
+def base_risk_percent(win_probability) -> np.ndarray:
+    """Rủi ro cơ bản (% equity) theo estimate_win_probability (STEP 3a)"""
+    p = np.asarray(win_probability, dtype=np.float64)
+    high, medium, low = WIN_PROBABILITY_TIERS
+    return np.select([p > high, p >= medium, p >= low], RISK_PERCENT_TIERS[:3], default=RISK_PERCENT_TIERS[3])
+
+
+def expected_loss_per_lot(entry_price, stop_loss, tick_size, tick_value) -> np.ndarray:
+    """Thua lỗ (USD) của 1.0 lot khi chạm SL; 0 nếu tick_size = 0"""
+    entry_price, stop_loss = np.asarray(entry_price, dtype=np.float64), np.asarray(stop_loss, dtype=np.float64)
+    tick_size, tick_value = np.asarray(tick_size, dtype=np.float64), np.asarray(tick_value, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loss = (np.abs(entry_price - stop_loss) / tick_size) * tick_value
+    return np.where(tick_size == 0, 0.0, loss)
+
+
+def base_lot_size(equity, risk_percent, loss_per_lot) -> np.ndarray:
+    """Lot ban đầu = equity * risk% / loss_per_lot (NaN nếu loss_per_lot <= 0 => HOLD)"""
+    risk_in_usd = np.asarray(equity, dtype=np.float64) * (np.asarray(risk_percent, dtype=np.float64) / 100)
+    loss_per_lot = np.asarray(loss_per_lot, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(loss_per_lot > 0, risk_in_usd / loss_per_lot, np.nan)
+
+
+def adjust_take_profit(entry_price, stop_loss, take_profit, is_buy, max_risk_reward: float = MAX_RISK_REWARD):
+    """
+    Điều chỉnh TP theo _validate_and_adjust_rr_ratio
+
+    Returns:
+        tuple: (take_profit sau điều chỉnh, R:R trước, R:R sau) - R:R là NaN khi SL distance = 0
+    """
+    entry_price = np.asarray(entry_price, dtype=np.float64)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    sl_distance = np.abs(entry_price - np.asarray(stop_loss, dtype=np.float64))
+    valid = sl_distance > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rr_before = np.where(valid, np.abs(entry_price - take_profit) / sl_distance, np.nan)
+        new_tp_distance = sl_distance * max_risk_reward
+        capped = np.where(is_buy, entry_price + new_tp_distance, entry_price - new_tp_distance)
+        adjusted = np.where(valid & (rr_before > max_risk_reward), capped, take_profit)
+        rr_after = np.where(valid, np.abs(entry_price - adjusted) / sl_distance, np.nan)
+    return adjusted, rr_before, rr_after
+
+
+def round_like_python(values, ndigits: int = 2) -> np.ndarray:
+    """
+    np.round cho mảng nhưng kết quả giống hệt round() của Python
+
+    np.round nhân 10^ndigits rồi làm tròn => có thể lệch round() ở các giá trị sát .5;
+    các phần tử đó được làm tròn lại bằng round() (ít phần tử, không ảnh hưởng tốc độ).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, ndigits)
+    with np.errstate(invalid='ignore'):
+        scaled = values * 10 ** ndigits
+        near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < _TIE_TOLERANCE
+    for i in np.flatnonzero(near_tie & np.isfinite(values)):
+        rounded.flat[i] = round(float(values.flat[i]), ndigits)
+    return rounded
+
+
+def portfolio_adjusted_lot(base_lot, profit, balance, in_correlation_group, correlated_positions,
+                           active_positions, pending_orders,
+                           drawdown_threshold=DRAWDOWN_THRESHOLD, drawdown_factor=DRAWDOWN_FACTOR,
+                           correlation_factor=CORRELATION_FACTOR,
+                           high_positions_factor=EFFECTIVE_POSITIONS_HIGH_FACTOR,
+                           low_positions_factor=EFFECTIVE_POSITIONS_LOW_FACTOR) -> np.ndarray:
+    """
+    Điều chỉnh lot theo drawdown, tương quan và số vị thế hiệu quả (STEP 3c)
+
+    Các ngưỡng / hệ số nhận float hoặc mảng cùng kích thước (what-if theo từng điểm)
+    """
+    lots = np.asarray(base_lot, dtype=np.float64)
+    drawdown_limit = -(np.asarray(drawdown_threshold, dtype=np.float64) * np.asarray(balance, dtype=np.float64))
+    lots = np.where(np.asarray(profit, dtype=np.float64) < drawdown_limit, lots * drawdown_factor, lots)
+    lots = np.where(np.asarray(in_correlation_group, dtype=bool) &
+                    (np.asarray(correlated_positions) >= CORRELATION_MIN_POSITIONS), lots * correlation_factor, lots)
+    effective_positions = np.asarray(active_positions) + (np.asarray(pending_orders) * PENDING_ORDER_WEIGHT)
+    return np.select(
+        [effective_positions >= EFFECTIVE_POSITIONS_HIGH, effective_positions >= EFFECTIVE_POSITIONS_LOW],
+        [lots * high_positions_factor, lots * low_positions_factor],
+        default=lots
+    )
+
+
+def quantize_lots(lots, volume_min: float, volume_max: float, volume_step: float) -> np.ndarray:
+    """
+    Giống _quantize_and_validate_lot cho mảng
+
+    Returns:
+        np.ndarray: Lot hợp lệ, NaN nếu không hợp lệ (HOLD)
+    """
+    rounded = round_like_python(lots, 2)
+    with np.errstate(invalid='ignore'):
+        quantized = np.floor(rounded / volume_step) * volume_step
+    final = np.minimum(np.maximum(quantized, volume_min), volume_max)
+    if not volume_max >= volume_min or not math.isfinite(volume_step):
+        return np.full(final.shape, np.nan)
+    return np.where(np.isfinite(rounded), round_like_python(final, 2), np.nan)
@@ -0,0 +1,579 @@
+"""
+Risk Rules
+Luật quản lý rủi ro khai báo trong app/config/risk_rules.json, biên dịch thành pipeline 1 lượt
+
+- Profile = danh sách luật có thứ tự (pre-flight, điều chỉnh lot, margin) + tham số;
+  profile có thể "extends" profile khác và chỉ ghi đè tham số / bật tắt từng luật
+- PortfolioSnapshot quét active_positions / pending_orders đúng 1 lần (số vị thế, xung đột cùng symbol,
+  lệnh chờ cùng symbol, vị thế tương quan); các luật chỉ đọc snapshot
+- Mỗi luật được biên dịch thành 1 closure => không dựng log / không duyệt portfolio lại theo từng nhánh
+- Profile của tài khoản: balance_config.risk_profile > "accounts" trong file > "default_profile"; cache theo tài khoản
+- File được đọc lại khi mtime thay đổi (kiểm tra tối đa mỗi RISK_RULES_RELOAD_SECONDS); file lỗi => giữ bản cũ
+"""
+
+import copy
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.correlation_index import NOT_INDEXED, lookup_correlation_group
+from app.utils.logger import Logger
+from app.utils.risk_math import (
+    CORRELATION_FACTOR, CORRELATION_MIN_POSITIONS, DEFAULT_RISK_RULES, DRAWDOWN_FACTOR, DRAWDOWN_THRESHOLD,
+    EFFECTIVE_POSITIONS_HIGH, EFFECTIVE_POSITIONS_HIGH_FACTOR, EFFECTIVE_POSITIONS_LOW,
+    EFFECTIVE_POSITIONS_LOW_FACTOR, PENDING_ORDER_WEIGHT
+)
+
+
+# ===== LUẬT & THAM SỐ MẶC ĐỊNH =====
+PRE_FLIGHT_RULES = ('position_limit', 'same_symbol_conflict', 'pending_replacement', 'portfolio_risk_cap')
+SIZING_RULES = ('drawdown', 'correlation', 'weighted_positions')
+MARGIN_RULE = 'margin'
+
+RULE_PARAMETERS: Dict[str, Dict[str, Any]] = {
+    'position_limit': {},
+    'same_symbol_conflict': {},
+    'pending_replacement': {},
+    'portfolio_risk_cap': {},
+    'drawdown': {'threshold': DRAWDOWN_THRESHOLD, 'factor': DRAWDOWN_FACTOR},
+    'correlation': {'min_positions': CORRELATION_MIN_POSITIONS, 'factor': CORRELATION_FACTOR},
+    'weighted_positions': {
+        'pending_weight': PENDING_ORDER_WEIGHT,
+        'tiers': [[EFFECTIVE_POSITIONS_HIGH, EFFECTIVE_POSITIONS_HIGH_FACTOR],
+                  [EFFECTIVE_POSITIONS_LOW, EFFECTIVE_POSITIONS_LOW_FACTOR]]
+    },
+    'margin': {
+        'min_free_margin_percent': DEFAULT_RISK_RULES['min_free_margin_percent'],
+        'max_margin_usage_percent': DEFAULT_RISK_RULES['max_margin_usage_percent']
+    }
+}
+
+DEFAULT_PROFILE = 'default'
+DEFAULT_RULES_SPEC = {
+    'default_profile': DEFAULT_PROFILE,
+    'accounts': {},
+    'profiles': {DEFAULT_PROFILE: {'rules': [{'rule': name} for name in RULE_PARAMETERS]}}
+}
+ACCOUNT_PROFILE_CACHE_SIZE = 10000  # Số (tài khoản, profile yêu cầu) giữ trong cache
+
+PENDING_ORDER_TYPES = ('LIMIT', 'STOP')
+_NO_CORRELATION = object()  # Snapshot không cần phần tương quan (chỉ dùng cho pre-flight)
+
+
+class PortfolioSnapshot:
+    """
+    Tổng hợp portfolio sau 1 lượt quét, theo symbol / hướng của tín hiệu
+
+    Lỗi dữ liệu được ghi theo từng phần và chỉ ném ra khi luật cần phần đó (require),
+    giữ nguyên bước trả SKIP / HOLD như logic cũ.
+    """
+
+    __slots__ = ('portfolio_exposure', 'num_active', 'num_pending', 'conflict', 'pending_tickets',
+                 'in_correlation_group', 'correlated_symbols', 'errors')
+
+    def __init__(self):
+        self.portfolio_exposure: Any = None
+        self.num_active = 0
+        self.num_pending = 0
+        self.conflict: Optional[str] = None          # None / 'losing' / 'opposite'
+        self.pending_tickets: List[Any] = []
+        self.in_correlation_group = False
+        self.correlated_symbols: List[Any] = []
+        self.errors: Dict[str, Exception] = {}
+
+    @classmethod
+    def build(cls, portfolio_exposure: Any, symbol: str, signal_type: Any,
+              correlation_groups: Any = _NO_CORRELATION) -> "PortfolioSnapshot":
+        """
+        Args:
+            portfolio_exposure: portfolio_exposure_json của request
+            symbol, signal_type: Symbol / hướng của tín hiệu đề xuất
+            correlation_groups: correlation_groups_json (bỏ qua => không tính phần tương quan)
+
+        Returns:
+            PortfolioSnapshot
+        """
+        snapshot = cls()
+        snapshot.portfolio_exposure = portfolio_exposure
+        errors = snapshot.errors
+
+        group_symbols = group_set = None
+        if correlation_groups is not _NO_CORRELATION:
+            try:
+                group = correlation_group(correlation_groups, symbol)
+                if group is not None:
+                    snapshot.in_correlation_group = True
+                    group_symbols, group_set = group
+            except Exception as e:
+                errors['correlation'] = e
+
+        try:
+            active_positions = portfolio_exposure.get('active_positions', [])
+            snapshot.num_active = len(active_positions)
+        except Exception as e:
+            errors['active'] = errors['conflict'] = e
+            active_positions = []
+            if group_symbols is not None:
+                errors.setdefault('correlation', e)
+
+        for position in active_positions:
+            # Xung đột cùng symbol: dừng ở vị thế đầu tiên lỗ / ngược hướng (hoặc lỗi dữ liệu)
+            if snapshot.conflict is None and 'conflict' not in errors:
+                try:
+                    if position.get('symbol') == symbol:
+                        position_profit = position.get('profit', 0)
+                        if position_profit < 0:
+                            snapshot.conflict = 'losing'
+                        elif position_profit >= 0 and position.get('type', '') != signal_type:
+                            snapshot.conflict = 'opposite'
+                except Exception as e:
+                    errors['conflict'] = e
+            if group_symbols is not None and 'correlation' not in errors:
+                try:
+                    position_symbol = position.get('symbol')
+                    if is_group_member(position_symbol, group_symbols, group_set):
+                        snapshot.correlated_symbols.append(position_symbol)
+                except Exception as e:
+                    errors['correlation'] = e
+
+        try:
+            pending_orders = portfolio_exposure.get('pending_orders', [])
+            snapshot.num_pending = len(pending_orders)
+        except Exception as e:
+            errors['pending'] = errors['tickets'] = e
+            pending_orders = []
+        for order in pending_orders:
+            try:
+                if order.get('symbol') == symbol:
+                    snapshot.pending_tickets.append(order.get('ticket'))
+            except Exception as e:
+                errors['tickets'] = e
+                break
+        return snapshot
+
+    def require(self, *parts: str):
+        """Ném lại lỗi dữ liệu của các phần luật cần dùng"""
+        for part in parts:
+            if part in self.errors:
+                raise self.errors[part]
+
+
+def correlation_group(correlation_groups: Any, symbol: Any) -> Optional[Tuple[Any, Optional[frozenset]]]:
+    """
+    Nhóm tương quan đầu tiên chứa symbol (tên nhóm rỗng => không thuộc nhóm)
+
+    Returns:
+        tuple: (symbol của nhóm, frozenset hoặc None nếu không có index) hoặc None
+    """
+    group = lookup_correlation_group(correlation_groups, symbol)
+    if group is not NOT_INDEXED:
+        return group
+    for group_name, symbols in correlation_groups.items():
+        if symbol in symbols:
+            return (correlation_groups.get(group_name, []), None) if group_name else None
+    return None
+
+
+def is_group_member(value: Any, symbols: Any, symbol_set: Optional[frozenset]) -> bool:
+    """value in symbols, tra bằng set nếu có index"""
+    if symbol_set is not None:
+        try:
+            return value in symbol_set
+        except TypeError:
+            pass
+    return value in symbols
+
+
+class RuleProfile:
+    """Profile đã biên dịch: luật pre-flight, hệ số điều chỉnh lot và ngưỡng margin"""
+
+    def __init__(self, name: str, rules: List[Dict[str, Any]]):
+        """
+        Args:
+            name: Tên profile
+            rules: [{'rule': tên, 'enabled': bool, ...tham số}] đã kiểm tra, theo thứ tự áp dụng
+        """
+        self.name = name
+        self.rules = rules
+        enabled = [rule for rule in rules if rule['enabled']]
+        self._checks: List[Tuple[str, Callable]] = [
+            (rule['rule'], _PRE_FLIGHT_COMPILERS[rule['rule']](rule)) for rule in enabled if rule['rule'] in PRE_FLIGHT_RULES
+        ]
+        self._adjustments: List[Tuple[str, Callable]] = [
+            (rule['rule'], _SIZING_COMPILERS[rule['rule']](rule)) for rule in enabled if rule['rule'] in SIZING_RULES
+        ]
+        margin = next((rule for rule in enabled if rule['rule'] == MARGIN_RULE), None)
+        # Không có luật margin => mọi lot đều an toàn ký quỹ
+        self.min_free_margin_percent = margin['min_free_margin_percent'] if margin else -math.inf
+        self.max_margin_usage_percent = margin['max_margin_usage_percent'] if margin else math.inf
+        self.vector_rules = self._vector_rules(enabled)
+
+    def pre_flight(self, snapshot: PortfolioSnapshot, context: Dict[str, Any]) -> Tuple[str, str, dict]:
+        """
+        STEP 1: chạy các luật pre-flight theo thứ tự, dừng ở luật đầu tiên quyết định
+
+        Args:
+            snapshot: Portfolio đã tổng hợp
+            context: {'equity', 'vRisk', 'vTotalRiskCap', 'max_positions', 'is_pending_order'}
+
+        Returns:
+            tuple: (status, reason, data)
+        """
+        try:
+            for _, check in self._checks:
+                decision = check(snapshot, context)
+                if decision is not None:
+                    return decision
+            return ("CONTINUE", "All pre-flight checks passed", {})
+        except Exception as e:
+            return ("SKIP", f"Error in pre-flight checks: {str(e)}", {})
+
+    def adjust_lot(self, lot: float, snapshot: PortfolioSnapshot, account_info: dict) -> Tuple[float, List[str]]:
+        """
+        STEP 3c: nhân lot với hệ số của các luật điều chỉnh được kích hoạt
+
+        Returns:
+            tuple: (lot sau điều chỉnh, tên các luật đã áp dụng)
+        """
+        applied = []
+        for name, adjust in self._adjustments:
+            factor = adjust(snapshot, account_info)
+            if factor is not None:
+                lot *= factor
+                applied.append(name)
+        return lot, applied
+
+    def _vector_rules(self, enabled: List[Dict[str, Any]]) -> Optional[Dict[str, float]]:
+        """
+        Tham số cho pipeline vectorized (risk_math.DEFAULT_RISK_RULES) nếu profile cùng cấu trúc với mặc định
+
+        Pipeline vectorized có thứ tự luật cố định: mọi luật pre-flight bật đúng thứ tự mặc định, luật điều chỉnh
+        theo thứ tự drawdown > correlation > weighted_positions (luật tắt = hệ số 1.0) với cùng mốc đếm vị thế.
+
+        Returns:
+            dict hoặc None nếu profile chỉ chạy được bằng RiskManagerService
+        """
+        names = [rule['rule'] for rule in enabled]
+        if tuple(name for name in names if name in PRE_FLIGHT_RULES) != PRE_FLIGHT_RULES:
+            return None
+        sizing = [name for name in names if name in SIZING_RULES]
+        if sizing != [name for name in SIZING_RULES if name in sizing]:
+            return None
+
+        by_name = {rule['rule']: rule for rule in enabled}
+        defaults = RULE_PARAMETERS
+        drawdown = by_name.get('drawdown', dict(defaults['drawdown'], factor=1.0))
+        correlation = by_name.get('correlation', dict(defaults['correlation'], factor=1.0))
+        weighted = by_name.get('weighted_positions', {'pending_weight': PENDING_ORDER_WEIGHT,
+                                                      'tiers': [[EFFECTIVE_POSITIONS_HIGH, 1.0], [EFFECTIVE_POSITIONS_LOW, 1.0]]})
+        tiers = sorted((tuple(tier) for tier in weighted['tiers']), reverse=True)
+        if (correlation['min_positions'] != CORRELATION_MIN_POSITIONS or weighted['pending_weight'] != PENDING_ORDER_WEIGHT
+                or [tier[0] for tier in tiers] != [EFFECTIVE_POSITIONS_HIGH, EFFECTIVE_POSITIONS_LOW]):
+            return None
+        return {
+            'drawdown_threshold': drawdown['threshold'],
+            'drawdown_factor': drawdown['factor'],
+            'correlation_factor': correlation['factor'],
+            'high_positions_factor': tiers[0][1],
+            'low_positions_factor': tiers[1][1],
+            'min_free_margin_percent': self.min_free_margin_percent,
+            'max_margin_usage_percent': self.max_margin_usage_percent
+        }
+
+
+# ------------------------------------------------------------------
+# Rule compilers
+# ------------------------------------------------------------------
+def _compile_position_limit(rule: dict) -> Callable:
+    def check(snapshot: PortfolioSnapshot, context: dict):
+        snapshot.require('active')
+        if snapshot.num_active >= context['max_positions']:
+            return ("STOP_TRADE", "Max position limit reached", {})
+        return None
+    return check
+
+
+def _compile_same_symbol_conflict(rule: dict) -> Callable:
+    def check(snapshot: PortfolioSnapshot, context: dict):
+        snapshot.require('conflict')
+        if snapshot.conflict == 'losing':
+            return ("SKIP", "An active trade on the same symbol is losing", {})
+        if snapshot.conflict == 'opposite':
+            return ("SKIP", "Opposite direction trade on a profitable symbol is forbidden", {})
+        return None
+    return check
+
+
+def _compile_pending_replacement(rule: dict) -> Callable:
+    def check(snapshot: PortfolioSnapshot, context: dict):
+        # Lệnh chờ cùng symbol bị thay thế (bất kể hướng) => bỏ qua các luật pre-flight sau
+        if not context['is_pending_order']:
+            return None
+        snapshot.require('tickets')
+        if snapshot.pending_tickets:
+            return ("CONTINUE", "Pending orders identified for replacement", {'tickets_to_delete': list(snapshot.pending_tickets)})
+        return None
+    return check
+
+
+def _compile_portfolio_risk_cap(rule: dict) -> Callable:
+    def check(snapshot: PortfolioSnapshot, context: dict):
+        existing_loss = snapshot.portfolio_exposure.get('summary', {}).get('total_potential_loss_from_portfolio_usd', 0.0)
+        equity = context['equity']
+        total_risk_percent = ((existing_loss + equity * (context['vRisk'] / 100)) / equity) * 100
+        if total_risk_percent > context['vTotalRiskCap']:
+            return ("STOP_TRADE", "Total portfolio risk exceeds cap", {})
+        return None
+    return check
+
+
+def _compile_drawdown(rule: dict) -> Callable:
+    threshold, factor = rule['threshold'], rule['factor']
+
+    def adjust(snapshot: PortfolioSnapshot, account_info: dict):
+        profit = float(account_info.get('profit', 0))
+        balance = float(account_info.get('balance', 0))
+        return factor if profit < -(threshold * balance) else None
+    return adjust
+
+
+def _compile_correlation(rule: dict) -> Callable:
+    min_positions, factor = rule['min_positions'], rule['factor']
+
+    def adjust(snapshot: PortfolioSnapshot, account_info: dict):
+        snapshot.require('correlation')
+        if snapshot.in_correlation_group and len(snapshot.correlated_symbols) >= min_positions:
+            return factor
+        return None
+    return adjust
+
+
+def _compile_weighted_positions(rule: dict) -> Callable:
+    pending_weight = rule['pending_weight']
+    tiers = sorted(((tier[0], tier[1]) for tier in rule['tiers']), reverse=True)
+
+    def adjust(snapshot: PortfolioSnapshot, account_info: dict):
+        snapshot.require('active', 'pending')
+        effective_positions = snapshot.num_active + (snapshot.num_pending * pending_weight)
+        for min_positions, factor in tiers:
+            if effective_positions >= min_positions:
+                return factor
+        return None
+    return adjust
+
+
+_PRE_FLIGHT_COMPILERS = {
+    'position_limit': _compile_position_limit,
+    'same_symbol_conflict': _compile_same_symbol_conflict,
+    'pending_replacement': _compile_pending_replacement,
+    'portfolio_risk_cap': _compile_portfolio_risk_cap
+}
+_SIZING_COMPILERS = {
+    'drawdown': _compile_drawdown,
+    'correlation': _compile_correlation,
+    'weighted_positions': _compile_weighted_positions
+}
+
+
+# ------------------------------------------------------------------
+# Spec validation
+# ------------------------------------------------------------------
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _validate_rule(entry: Dict[str, Any], profile: str) -> Dict[str, Any]:
+    """Kiểm tra 1 luật và điền tham số mặc định"""
+    if not isinstance(entry, dict) or entry.get('rule') not in RULE_PARAMETERS:
+        raise ValueError(f"Profile '{profile}': unknown rule {entry!r}")
+    name = entry['rule']
+    defaults = RULE_PARAMETERS[name]
+    unknown = set(entry) - set(defaults) - {'rule', 'enabled'}
+    if unknown:
+        raise ValueError(f"Profile '{profile}', rule '{name}': unknown parameters {sorted(unknown)}")
+
+    rule = {'rule': name, 'enabled': entry.get('enabled', True)}
+    if not isinstance(rule['enabled'], bool):
+        raise ValueError(f"Profile '{profile}', rule '{name}': 'enabled' must be true/false")
+    for key, default in defaults.items():
+        value = copy.deepcopy(entry.get(key, default))
+        if key == 'tiers':
+            if (not isinstance(value, list) or not value
+                    or not all(isinstance(t, list) and len(t) == 2 and all(_is_number(v) for v in t) for t in value)):
+                raise ValueError(f"Profile '{profile}', rule '{name}': 'tiers' must be [[min_positions, factor], ...]")
+        elif not _is_number(value):
+            raise ValueError(f"Profile '{profile}', rule '{name}': '{key}' must be a number")
+        rule[key] = value
+    return rule
+
+
+def _resolve_profile(name: str, profiles: Dict[str, Any], seen: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+    """Danh sách luật của profile (đã áp dụng extends / overrides)"""
+    if name in seen:
+        raise ValueError(f"Profile '{name}': circular extends ({' -> '.join(seen + (name,))})")
+    spec = profiles.get(name)
+    if not isinstance(spec, dict):
+        raise ValueError(f"Profile '{name}' not found")
+
+    if 'extends' in spec:
+        rules = _resolve_profile(spec['extends'], profiles, seen + (name,))
+        overrides = spec.get('overrides') or {}
+        if not isinstance(overrides, dict):
+            raise ValueError(f"Profile '{name}': 'overrides' must be an object")
+        by_name = {rule['rule']: i for i, rule in enumerate(rules)}
+        for rule_name, params in overrides.items():
+            if rule_name not in by_name or not isinstance(params, dict):
+                raise ValueError(f"Profile '{name}': cannot override rule '{rule_name}'")
+            i = by_name[rule_name]
+            rules[i] = _validate_rule(dict(rules[i], **params), name)
+        return rules
+
+    entries = spec.get('rules')
+    if not isinstance(entries, list):
+        raise ValueError(f"Profile '{name}': 'rules' must be a list")
+    rules = [_validate_rule(entry, name) for entry in entries]
+    names = [rule['rule'] for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Profile '{name}': duplicated rules")
+    return rules
+
+
+def compile_rules(spec: Dict[str, Any]) -> Tuple[Dict[str, RuleProfile], str, Dict[str, str]]:
+    """
+    Biên dịch toàn bộ file luật
+
+    Returns:
+        tuple: ({tên profile: RuleProfile}, default_profile, {login: tên profile})
+
+    Raises:
+        ValueError: Spec không hợp lệ
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get('profiles'), dict) or not spec['profiles']:
+        raise ValueError("Risk rules must define a non-empty 'profiles' object")
+    profiles = {name: RuleProfile(name, _resolve_profile(name, spec['profiles'])) for name in spec['profiles']}
+    default_profile = spec.get('default_profile', DEFAULT_PROFILE)
+    if default_profile not in profiles:
+        raise ValueError(f"default_profile '{default_profile}' not found")
+    accounts = spec.get('accounts') or {}
+    if not isinstance(accounts, dict) or any(profile not in profiles for profile in accounts.values()):
+        raise ValueError("'accounts' must map login -> existing profile")
+    return profiles, default_profile, {str(login): profile for login, profile in accounts.items()}
+
+
+# ------------------------------------------------------------------
+# Registry (hot reload + per-account cache)
+# ------------------------------------------------------------------
+class RiskRuleRegistry:
+    """Profile đã biên dịch, đọc lại file khi thay đổi"""
+
+    def __init__(self, path: Optional[str] = None, reload_seconds: Optional[float] = None):
+        """
+        Args:
+            path: Đường dẫn file luật (mặc định settings.RISK_RULES_PATH)
+            reload_seconds: Khoảng cách tối thiểu giữa 2 lần kiểm tra mtime
+        """
+        self.path = path or settings.RISK_RULES_PATH
+        self.reload_seconds = settings.RISK_RULES_RELOAD_SECONDS if reload_seconds is None else reload_seconds
+        self.logger = Logger("risk_rules")
+        self._lock = threading.Lock()
+        self._profiles: Optional[Dict[str, RuleProfile]] = None
+        self._default_profile = DEFAULT_PROFILE
+        self._accounts: Dict[str, str] = {}
+        self._account_cache: Dict[Tuple[str, Optional[str]], RuleProfile] = {}
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._version = 0
+        self._last_error: Optional[str] = None
+
+    def load(self, spec: Dict[str, Any]):
+        """
+        Nạp spec đã đọc (file hoặc dict) và thay toàn bộ profile
+
+        Raises:
+            ValueError: Spec không hợp lệ (profile cũ được giữ nguyên)
+        """
+        profiles, default_profile, accounts = compile_rules(spec)
+        with self._lock:
+            self._profiles, self._default_profile, self._accounts = profiles, default_profile, accounts
+            self._account_cache = {}
+            self._version += 1
+
+    def profile(self, name: Optional[str] = None) -> RuleProfile:
+        """Profile theo tên (không có / không tồn tại => default_profile)"""
+        self._maybe_reload()
+        profiles = self._profiles
+        return profiles.get(name) or profiles[self._default_profile]
+
+    def resolve(self, account_info: Any, balance_config: Any) -> RuleProfile:
+        """
+        Profile của tài khoản: balance_config.risk_profile > accounts[login] > default_profile
+
+        Returns:
+            RuleProfile
+        """
+        self._maybe_reload()
+        login = account_info.get('login') if isinstance(account_info, dict) else None
+        requested = balance_config.get('risk_profile') if isinstance(balance_config, dict) else None
+        key = (str(login), requested)
+        cached = self._account_cache.get(key)
+        if cached is not None:
+            return cached
+
+        name = requested or self._accounts.get(str(login)) or self._default_profile
+        if name not in self._profiles:
+            self.logger.warning(f"Risk profile '{name}' không tồn tại, dùng '{self._default_profile}'")
+        profile = self.profile(name)
+        with self._lock:
+            if len(self._account_cache) >= ACCOUNT_PROFILE_CACHE_SIZE:
+                self._account_cache = {}
+            self._account_cache[key] = profile
+        return profile
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Trạng thái file luật (cho /health)"""
+        self._maybe_reload()
+        return {
+            'path': self.path,
+            'version': self._version,
+            'profiles': sorted(self._profiles),
+            'default_profile': self._default_profile,
+            'cached_accounts': len(self._account_cache),
+            'last_error': self._last_error
+        }
+
+    def _maybe_reload(self):
+        """Đọc lại file nếu mtime thay đổi (tối đa 1 lần mỗi reload_seconds)"""
+        now = time.monotonic()
+        if self._profiles is not None and now - self._checked_at < self.reload_seconds:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._profiles is not None and mtime == self._mtime:
+            return
+
+        try:
+            if mtime is None:
+                spec = DEFAULT_RULES_SPEC
+            else:
+                with open(self.path, encoding='utf-8') as f:
+                    spec = json.load(f)
+            self.load(spec)
+            self._mtime, self._last_error = mtime, None
+            self.logger.info(f"Loaded risk rules v{self._version} ({self.path if mtime else 'built-in defaults'}): "
+                             f"{', '.join(sorted(self._profiles))}")
+        except (ValueError, OSError) as e:
+            self._mtime, self._last_error = mtime, str(e)
+            self.logger.error(f"Invalid risk rules file {self.path}: {e}")
+            if self._profiles is None:
+                self.load(DEFAULT_RULES_SPEC)
+
+
+# Global registry instance (mỗi worker process có 1 bản)
+risk_rule_registry = RiskRuleRegistry()
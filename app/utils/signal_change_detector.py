@@ -0,0 +1,209 @@
+"""
+Signal Change Detector
+So sánh feature vector của request /signal (nến cuối, indicators, key level gần nhất theo từng timeframe)
+với feature vector đã lưu cùng kết quả AI lần trước.
+
+Mọi thay đổi nằm trong tolerance => thị trường chưa đổi đáng kể, phát lại signal cũ (timestamp mới) thay vì gọi AI.
+Luôn so với fingerprint của lần gọi AI gần nhất (không cập nhật khi phát lại) nên thay đổi nhỏ cộng dồn
+vẫn vượt tolerance; SIGNAL_REUSE_MAX_AGE giới hạn thời gian 1 kết quả AI được phát lại.
+"""
+
+import math
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+# ===== CẤU HÌNH CHANGE DETECTOR (khai báo ở đầu file để dễ bảo trì) =====
+# Tolerance theo feature: đơn vị ATR của timeframe (giá / level / MACD), điểm (RSI / ADX), tỉ lệ (ATR)
+DEFAULT_TOLERANCES = {
+    "close": 0.15,       # Giá đóng cửa nến cuối
+    "sma": 0.10,         # sma_100 / sma_200
+    "bollinger": 0.15,   # Dải trên / dưới Bollinger
+    "level": 0.10,       # Nearest support / resistance
+    "macd": 0.05,        # MACD histogram
+    "rsi": 2.0,
+    "adx": 2.0,
+    "atr": 0.05          # |ATR mới / ATR cũ - 1|
+}
+ATR_UNIT_FEATURES = ("close", "sma", "bollinger", "level", "macd")
+
+
+def parse_tolerances(text: Optional[str]) -> Dict[str, float]:
+    """
+    Tolerance mặc định + override dạng "rsi=1.5,level=0.05"
+
+    Raises:
+        ValueError: Tên feature không hợp lệ hoặc giá trị không phải số >= 0
+    """
+    tolerances = dict(DEFAULT_TOLERANCES)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip().lower()
+        if name not in DEFAULT_TOLERANCES:
+            raise ValueError(f"Invalid signal reuse tolerance '{item.strip()}', expected one of {', '.join(DEFAULT_TOLERANCES)}")
+        try:
+            tolerances[name] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid signal reuse tolerance '{item.strip()}'") from None
+        if tolerances[name] < 0:
+            raise ValueError(f"Invalid signal reuse tolerance '{item.strip()}'")
+    return tolerances
+
+
+def extract_fingerprint(multi_timeframes: Any) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Feature vector của request: {timeframe: {feature: value}} (None = không có dữ liệu)
+
+    Args:
+        multi_timeframes: multi_timeframes đã có indicators + analyze_price_action
+    """
+    fingerprint = {}
+    if not isinstance(multi_timeframes, dict):
+        return fingerprint
+    for tf, data in sorted(multi_timeframes.items()):
+        if not isinstance(data, dict):
+            continue
+        indicators = data.get('indicators') if isinstance(data.get('indicators'), dict) else {}
+        analysis = data.get('analyze_price_action') if isinstance(data.get('analyze_price_action'), dict) else {}
+        context = analysis.get('current_price_context') or {}
+        macd, adx, bands = indicators.get('macd'), indicators.get('adx'), indicators.get('bollinger_bands')
+        fingerprint[tf] = {
+            "close": _number(context.get('price')),
+            "sma_100": _number(indicators.get('sma_100')),
+            "sma_200": _number(indicators.get('sma_200')),
+            "bollinger_upper": _number(bands[1]) if _is_sequence(bands, 3) else None,
+            "bollinger_lower": _number(bands[2]) if _is_sequence(bands, 3) else None,
+            "support": _number((context.get('nearest_support') or {}).get('price')),
+            "resistance": _number((context.get('nearest_resistance') or {}).get('price')),
+            "macd": _number(macd[2]) if _is_sequence(macd, 3) else None,
+            "rsi": _number(indicators.get('rsi')),
+            "adx": _number(adx[0]) if _is_sequence(adx, 1) else _number(adx),
+            "atr": _number(indicators.get('atr'))
+        }
+    return fingerprint
+
+
+def _tolerance_key(feature: str) -> str:
+    if feature.startswith("sma_"):
+        return "sma"
+    if feature.startswith("bollinger_"):
+        return "bollinger"
+    if feature in ("support", "resistance"):
+        return "level"
+    return feature
+
+
+def compare_fingerprints(previous: Dict[str, Dict[str, Optional[float]]], current: Dict[str, Dict[str, Optional[float]]],
+                         tolerances: Dict[str, float]) -> Tuple[Dict[str, str], float]:
+    """
+    So sánh 2 feature vector
+
+    Returns:
+        (changes, max_ratio): changes = {feature: lý do} vượt tolerance (rỗng => chưa đổi đáng kể),
+        max_ratio = thay đổi lớn nhất / tolerance
+    """
+    if not current or set(previous) != set(current):
+        return {"timeframes": f"Timeframes changed ({', '.join(sorted(previous))} -> {', '.join(sorted(current))})"}, math.inf
+
+    changes, max_ratio = {}, 0.0
+    for tf in sorted(current):
+        old, new = previous[tf], current[tf]
+        atr = old.get("atr")
+        if new.get("close") is None or atr is None or atr <= 0:
+            return {"atr": f"{tf}: price / ATR unavailable"}, math.inf
+        for feature, value in new.items():
+            before = old.get(feature)
+            if (before is None) != (value is None):
+                changes.setdefault(feature, f"{tf} {feature} {'appeared' if before is None else 'disappeared'}")
+                max_ratio = math.inf
+                continue
+            if value is None:
+                continue
+            key = _tolerance_key(feature)
+            if key == "atr":
+                delta = abs(value / atr - 1.0)
+            elif key in ATR_UNIT_FEATURES:
+                delta = abs(value - before) / atr
+            else:
+                delta = abs(value - before)
+            tolerance = tolerances[key]
+            ratio = delta / tolerance if tolerance > 0 else (0.0 if delta == 0 else math.inf)
+            max_ratio = max(max_ratio, ratio)
+            if ratio > 1.0:
+                unit = " ATR" if key in ATR_UNIT_FEATURES else ""
+                changes.setdefault(feature, f"{tf} {feature} moved {delta:.3g}{unit} > {tolerance:g}{unit}")
+    return changes, max_ratio
+
+
+class SignalChangeDetector:
+    """Quyết định phát lại signal cũ + thống kê feature nào làm signal phải phân tích lại"""
+
+    def __init__(self, enabled: Optional[bool] = None, tolerances: Optional[Dict[str, float]] = None,
+                 max_age: Optional[int] = None):
+        """
+        Args:
+            enabled: Bật/tắt (mặc định SIGNAL_REUSE_ENABLED)
+            tolerances: Tolerance theo feature (mặc định DEFAULT_TOLERANCES + SIGNAL_REUSE_TOLERANCES)
+            max_age: Số giây 1 kết quả AI được phát lại (mặc định SIGNAL_REUSE_MAX_AGE)
+        """
+        self.enabled = settings.SIGNAL_REUSE_ENABLED if enabled is None else enabled
+        self.tolerances = dict(DEFAULT_TOLERANCES, **tolerances) if tolerances else parse_tolerances(settings.SIGNAL_REUSE_TOLERANCES)
+        self.max_age = settings.SIGNAL_REUSE_MAX_AGE if max_age is None else max_age
+        self._stats = {"checked": 0, "reused": 0, "changed": 0}
+        self._changed_by: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check(self, basis: Optional[Dict[str, Any]], fingerprint: Dict[str, Dict[str, Optional[float]]]) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            basis: {'signal', 'fingerprint', 'analyzed_at'} đã lưu cùng kết quả AI lần trước
+            fingerprint: extract_fingerprint của request hiện tại
+
+        Returns:
+            {'signal', 'analyzed_at', 'max_change'} nếu phát lại được, ngược lại None (gọi AI)
+        """
+        if not self.enabled or not isinstance(basis, dict) or not isinstance(basis.get("signal"), dict):
+            return None
+        changes, max_ratio = compare_fingerprints(basis.get("fingerprint") or {}, fingerprint, self.tolerances)
+        with self._lock:
+            self._stats["checked"] += 1
+            self._stats["changed" if changes else "reused"] += 1
+            for feature in changes:
+                self._changed_by[feature] = self._changed_by.get(feature, 0) + 1
+        if changes:
+            return None
+        return {"signal": basis["signal"], "analyzed_at": basis.get("analyzed_at"), "max_change": round(max_ratio, 3)}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số lần phát lại / phải phân tích lại và feature gây thay đổi (để chỉnh tolerance)"""
+        with self._lock:
+            stats = dict(self._stats)
+            changed_by = dict(sorted(self._changed_by.items(), key=lambda item: -item[1]))
+        return {
+            "enabled": self.enabled,
+            "max_age": self.max_age,
+            "tolerances": dict(self.tolerances),
+            **stats,
+            "reuse_rate": round(stats["reused"] / stats["checked"], 4) if stats["checked"] else 0.0,
+            "changed_by": changed_by
+        }
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _is_sequence(value: Any, length: int) -> bool:
+    return isinstance(value, (list, tuple)) and len(value) >= length
+
+
+# Global detector instance
+signal_change_detector = SignalChangeDetector()
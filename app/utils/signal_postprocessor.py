@@ -0,0 +1,138 @@
+"""
+Signal Post-processor
+Tính chính xác các field dẫn xuất của signal AI từ indicators + symbol_info.digits (thay vì để model tự tính):
+- stop_loss_proposed = stop_loss_structure ∓ 0.5 × ATR (khi model trả mức cấu trúc - prompt compact)
+- risk_reward_ratio = |TP - entry| / |entry - SL|
+- pips_to_take_profit = |TP - entry| / pip divisor
+- trailing_stop_loss = 2 × ATR / pip divisor
+Pip divisor theo luật của prompt_signal_analyst: digits 2/3 (JPY) => 0.01, còn lại 0.0001.
+"""
+
+import math
+import threading
+from typing import Any, Dict, Optional
+
+from app.utils.indicator_engine import indicator_engine
+
+
+# ===== CẤU HÌNH POST-PROCESSOR (khai báo ở đầu file để dễ bảo trì) =====
+TSL_ATR_MULTIPLIER = 2.0        # trailing_stop_loss = N × ATR
+SL_BUFFER_ATR = 0.5             # Volatility buffer cộng vào mức cấu trúc của SL
+JPY_DIGITS = (2, 3)
+JPY_PIP_DIVISOR = 0.01
+DEFAULT_PIP_DIVISOR = 0.0001
+RATIO_DECIMALS = 2              # risk_reward_ratio
+PIPS_DECIMALS = 1               # pips_to_take_profit / trailing_stop_loss
+DERIVED_FIELDS = ("stop_loss_proposed", "risk_reward_ratio", "pips_to_take_profit", "trailing_stop_loss")
+TRADE_SIGNALS = ("BUY", "SELL")
+
+
+def pip_divisor(digits: Any) -> float:
+    """Giá trị 1 pip theo số chữ số thập phân của giá"""
+    return JPY_PIP_DIVISOR if digits in JPY_DIGITS else DEFAULT_PIP_DIVISOR
+
+
+def derive_fields(signal: Dict[str, Any], atr: Optional[float], digits: Optional[int],
+                  current_price: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Tính các field dẫn xuất của 1 signal BUY/SELL
+
+    Args:
+        signal: Signal đã parse (entry / take_profit / stop_loss_proposed hoặc stop_loss_structure)
+        atr: ATR của main timeframe
+        digits: symbol_info.digits (None => pip non-JPY, không làm tròn giá)
+        current_price: Giá hiện tại, dùng làm entry cho lệnh MARKET không có entry_price_proposed
+
+    Returns:
+        {field: value} cho các field tính được (rỗng nếu không phải BUY/SELL)
+    """
+    if signal.get("signal_type") not in TRADE_SIGNALS:
+        return {}
+    direction = 1.0 if signal["signal_type"] == "BUY" else -1.0
+    divisor = pip_divisor(digits)
+    atr = _number(atr)
+    derived = {}
+
+    entry = _number(signal.get("entry_price_proposed"))
+    if entry is None and signal.get("order_type_proposed") in (None, "MARKET"):
+        entry = _number(current_price)
+        if entry is not None:
+            derived["entry_price_proposed"] = entry
+
+    stop_loss = _number(signal.get("stop_loss_proposed"))
+    structure = _number(signal.get("stop_loss_structure"))
+    if structure is not None and atr is not None:
+        stop_loss = _round_price(structure - direction * SL_BUFFER_ATR * atr, digits)
+        derived["stop_loss_proposed"] = stop_loss
+
+    take_profit = _number(signal.get("take_profit_proposed"))
+    if entry is not None and stop_loss is not None and take_profit is not None:
+        risk, reward = abs(entry - stop_loss), abs(take_profit - entry)
+        derived["risk_reward_ratio"] = round(reward / risk, RATIO_DECIMALS) if risk > 0 else None
+        derived["pips_to_take_profit"] = round(reward / divisor, PIPS_DECIMALS)
+    if atr is not None:
+        derived["trailing_stop_loss"] = round(TSL_ATR_MULTIPLIER * atr / divisor, PIPS_DECIMALS)
+    return derived
+
+
+class SignalPostProcessor:
+    """Ghi đè field dẫn xuất của signal AI bằng giá trị tính chính xác + thống kê số lần model tính sai"""
+
+    def __init__(self):
+        self._stats = {"processed": 0, "structure_stop_loss": 0}
+        self._corrections: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def process(self, signal: Dict[str, Any], request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Args:
+            signal: Signal đã parse từ AI (sửa tại chỗ)
+            request_data: Request /signal (multi_timeframes, symbol_info, timeframe, symbol)
+
+        Returns:
+            signal đã điền field dẫn xuất (bỏ stop_loss_structure)
+        """
+        main_timeframe = request_data.get("timeframe")
+        tf_data = (request_data.get("multi_timeframes") or {}).get(main_timeframe)
+        tf_data = tf_data if isinstance(tf_data, dict) else {}
+        namespace = (request_data.get("cache_key") or {}).get("timezone")
+        indicators = tf_data.get("indicators") or indicator_engine.get_snapshot(request_data.get("symbol"), main_timeframe, namespace) or {}
+        analysis = tf_data.get("analyze_price_action") if isinstance(tf_data.get("analyze_price_action"), dict) else {}
+        current_price = (analysis.get("current_price_context") or {}).get("price")
+        digits = (request_data.get("symbol_info") or {}).get("digits")
+
+        derived = derive_fields(signal, indicators.get("atr") if isinstance(indicators, dict) else None,
+                                digits if isinstance(digits, int) else None, current_price)
+        with self._lock:
+            self._stats["processed"] += 1
+            if "stop_loss_structure" in signal and "stop_loss_proposed" in derived:
+                self._stats["structure_stop_loss"] += 1
+            for field, value in derived.items():
+                previous = _number(signal.get(field))
+                # Model (prompt full) đã tự tính và lệch giá trị chính xác
+                if field in DERIVED_FIELDS and previous is not None and value is not None and not math.isclose(previous, value, rel_tol=0.01):
+                    self._corrections[field] = self._corrections.get(field, 0) + 1
+        signal.update(derived)
+        signal.pop("stop_loss_structure", None)
+        return signal
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số signal đã xử lý và số lần giá trị của model lệch > 1% theo field"""
+        with self._lock:
+            return {**self._stats, "corrections": dict(self._corrections)}
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _round_price(price: float, digits: Optional[int]) -> float:
+    return round(price, digits) if digits is not None else price
+
+
+# Global post-processor instance
+signal_postprocessor = SignalPostProcessor()
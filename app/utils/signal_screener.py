@@ -0,0 +1,372 @@
+"""
+Signal Screener
+Chấm điểm chất lượng setup (0-100) từ indicators + analyze_price_action đã có của request, trước khi gọi AI
+
+Theo các luật của prompt_signal_analyst:
+- Timeframe alignment (strong +3 / moderate +2 / weak +1 / none 0) trên higher / main / lower
+- Indicator confluence: đa số indicator của main timeframe cùng hướng (giá vs sma_100 / sma_200, sma_100 vs sma_200,
+  +DI vs -DI, MACD histogram, RSI vs 50)
+- Trend strength: ADX của main timeframe (> 25 = trending, thấp => ranging)
+- Location: khoảng cách từ giá tới key level gần nhất theo ATR (giữa 2 level xa => không có setup)
+
+Điểm < SIGNAL_SCREENER_THRESHOLD => HOLD không cần gọi AI (mode "enforce").
+Mode "shadow" chỉ chấm điểm và ghi thống kê điểm vs quyết định thật của AI để chỉnh ngưỡng.
+"""
+
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.indicator_engine import indicator_engine
+from app.utils.timeframe_config import get_timeframe_config
+
+
+# ===== CẤU HÌNH SCREENER (khai báo ở đầu file để dễ bảo trì) =====
+MODE_OFF = "off"
+MODE_SHADOW = "shadow"
+MODE_ENFORCE = "enforce"
+
+WEIGHTS = {"alignment": 35.0, "confluence": 25.0, "trend": 20.0, "location": 20.0}  # Tổng 100
+NEUTRAL_BAND = 1.0 / 3.0       # |trung bình phiếu| dưới mức này => timeframe neutral
+ADX_RANGING = 15.0             # ADX <= 15 => 0 điểm trend
+ADX_TRENDING = 25.0            # ADX >= 25 => đủ điểm trend (ngưỡng của prompt)
+LEVEL_NEAR_ATR = 0.5           # Giá cách key level <= 0.5 ATR => đủ điểm location
+LEVEL_FAR_ATR = 2.0            # Giá cách mọi key level >= 2 ATR => giữa vùng, 0 điểm location
+OPEN_SPACE_LOCATION = 0.5      # Không có level 1 phía (vùng giá mới) => nửa điểm location
+SCORE_BUCKET = 10              # Độ rộng bucket điểm trong thống kê shadow
+TRADE_SIGNALS = ("BUY", "SELL")
+ROLE_COUNT = 3                 # higher / main / lower
+MAIN_ROLE = 1
+VOTE_COUNT = 6                 # Số phiếu hướng mỗi timeframe (xem _timeframe_votes)
+
+
+def _timeframe_votes(indicators: Any, price: float) -> List[float]:
+    """Phiếu hướng thô của 1 timeframe (NaN = indicator thiếu): giá vs SMA, SMA nhanh vs chậm, DI, MACD histogram, RSI"""
+    if not isinstance(indicators, dict):
+        return [math.nan] * VOTE_COUNT
+    macd, adx = indicators.get('macd'), indicators.get('adx')
+    sma_fast, sma_slow = _number(indicators.get('sma_100')), _number(indicators.get('sma_200'))
+    return [
+        price - sma_fast,
+        price - sma_slow,
+        sma_fast - sma_slow,
+        _number(adx[1]) - _number(adx[2]) if _is_sequence(adx, 3) else math.nan,
+        _number(macd[2]) if _is_sequence(macd, 3) else math.nan,
+        _number(indicators.get('rsi')) - 50.0
+    ]
+
+
+def extract_features(multi_timeframes: Any, timeframe: Optional[str],
+                     indicators_fallback: Optional[Callable[[str], Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Dữ liệu số của 1 setup cho score_features
+
+    Args:
+        multi_timeframes: multi_timeframes đã có indicators + analyze_price_action
+        timeframe: Main timeframe
+        indicators_fallback: timeframe -> indicators khi timeframe không gửi indicators (vd. IndicatorEngine)
+
+    Returns:
+        dict hoặc None nếu thiếu dữ liệu của main timeframe (giá, ATR)
+    """
+    if not isinstance(multi_timeframes, dict) or not isinstance(multi_timeframes.get(timeframe), dict):
+        return None
+    tf_config = get_timeframe_config(timeframe)
+
+    def indicators_of(tf: str) -> Any:
+        indicators = multi_timeframes[tf].get('indicators')
+        if not indicators and indicators_fallback:
+            indicators = indicators_fallback(tf)
+        return indicators
+
+    def context_of(tf: str) -> dict:
+        analysis = multi_timeframes[tf].get('analyze_price_action') or {}
+        return analysis.get('current_price_context') or {} if isinstance(analysis, dict) else {}
+
+    main_indicators = indicators_of(timeframe) or {}
+    context = context_of(timeframe)
+    price = _number(context.get('price'))
+    atr = _number(main_indicators.get('atr')) if isinstance(main_indicators, dict) else math.nan
+    if math.isnan(price) or price <= 0 or math.isnan(atr) or atr <= 0:
+        return None
+
+    roles = [tf_config['higher_timeframe'], timeframe, tf_config['lower_timeframe']]
+    votes, names = [], []
+    for role, tf in enumerate(roles):
+        if role != MAIN_ROLE and (tf == timeframe or not isinstance(multi_timeframes.get(tf), dict)):
+            votes.append([math.nan] * VOTE_COUNT)
+            continue
+        tf_price = _number(context_of(tf).get('price'))
+        votes.append(_timeframe_votes(indicators_of(tf), price if math.isnan(tf_price) else tf_price))
+        names.append(tf)
+
+    adx = main_indicators.get('adx')
+    levels = [_number((context.get(key) or {}).get('price')) if isinstance(context.get(key), dict) else math.nan
+              for key in ('nearest_support', 'nearest_resistance')]
+    return {
+        "timeframes": names,
+        "votes": votes,
+        "adx": _number(adx[0]) if _is_sequence(adx, 1) else _number(adx),
+        "level_distances": [abs(price - level) / atr for level in levels]
+    }
+
+
+def score_features(features: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Chấm điểm nhiều setup trong 1 lượt vectorized
+
+    Returns:
+        dict các mảng (N,): score, bias (-1/0/1), alignment (0-3), confluence, trend, location, nearest (ATR),
+        main_vote; directions (N, 3) (0 cho timeframe không có dữ liệu), valid (N,) False nếu main timeframe không có phiếu
+    """
+    votes = np.sign(np.array([f["votes"] for f in features], dtype=np.float64).reshape(len(features), ROLE_COUNT, VOTE_COUNT))
+    counts = np.sum(~np.isnan(votes), axis=2)
+    present = counts > 0
+    tf_vote = np.where(present, np.nansum(votes, axis=2) / np.maximum(counts, 1), 0.0)
+    directions = np.where(present & (np.abs(tf_vote) >= NEUTRAL_BAND), np.sign(tf_vote), 0.0)
+
+    # Alignment theo prompt: 3 = cùng hướng, 2 = 1 neutral, 1 = 1 ngược hướng, 0 = lẫn lộn
+    dominant = np.sign(directions.sum(axis=1))
+    agree = np.sum(present & (directions == dominant[:, None]), axis=1)
+    oppose = np.sum(present & (directions == -dominant[:, None]), axis=1)
+    alignment = np.select(
+        [dominant == 0, agree == present.sum(axis=1), oppose == 0, agree > oppose], [0, 3, 2, 1], default=0
+    ).astype(np.float64)
+
+    main_vote = tf_vote[:, MAIN_ROLE]
+    bias = np.where(dominant != 0, dominant, np.sign(main_vote))
+    confluence = np.maximum(main_vote * bias, 0.0)
+
+    adx = np.array([f["adx"] for f in features], dtype=np.float64)
+    trend = np.nan_to_num(np.clip((adx - ADX_RANGING) / (ADX_TRENDING - ADX_RANGING), 0.0, 1.0), nan=0.0)
+
+    distances = np.array([f["level_distances"] for f in features], dtype=np.float64).reshape(len(features), 2)
+    levels = np.sum(~np.isnan(distances), axis=1)
+    nearest = np.min(np.where(np.isnan(distances), np.inf, distances), axis=1)
+    location = np.clip((LEVEL_FAR_ATR - nearest) / (LEVEL_FAR_ATR - LEVEL_NEAR_ATR), 0.0, 1.0)
+    # Không có level 1 phía / cả 2 phía (vùng giá mới) => tối thiểu nửa điểm
+    location = np.where(levels < 2, np.maximum(location, OPEN_SPACE_LOCATION), location)
+
+    score = np.round(WEIGHTS["alignment"] * alignment / 3.0 + WEIGHTS["confluence"] * confluence
+                     + WEIGHTS["trend"] * trend + WEIGHTS["location"] * location, 1)
+    return {
+        "score": score, "bias": bias, "alignment": alignment, "confluence": confluence, "trend": trend,
+        "location": location, "nearest": np.where(levels > 0, nearest, np.nan), "adx": adx, "main_vote": main_vote,
+        "directions": directions, "valid": present[:, MAIN_ROLE]
+    }
+
+
+def alignment_points(directions: List[int]) -> int:
+    """Điểm alignment theo prompt cho danh sách hướng (-1/0/1) của các timeframe"""
+    features = {"votes": [[float(d)] * VOTE_COUNT for d in directions] + [[math.nan] * VOTE_COUNT] * (ROLE_COUNT - len(directions)),
+                "adx": math.nan, "level_distances": [math.nan, math.nan]}
+    return int(score_features([features])["alignment"][0])
+
+
+def describe(features: Dict[str, Any], scores: Dict[str, np.ndarray], i: int, timeframe: Optional[str]) -> Dict[str, Any]:
+    """Kết quả của setup thứ i: điểm, hướng, thành phần và lý do điểm thấp"""
+    components = {name: round(float(scores[name][i]) / (3.0 if name == "alignment" else 1.0), 3)
+                  for name in ("alignment", "confluence", "trend", "location")}
+    directions = [int(d) for role, d in enumerate(scores["directions"][i])
+                  if not all(math.isnan(v) for v in features["votes"][role])]
+    adx, nearest = float(scores["adx"][i]), float(scores["nearest"][i])
+
+    reasons = []
+    if scores["alignment"][i] <= 1:
+        reasons.append(f"Timeframes not aligned ({', '.join(f'{tf}={d:+d}' for tf, d in zip(features['timeframes'], directions))})")
+    if components["confluence"] < NEUTRAL_BAND:
+        reasons.append(f"Indicators conflicting on {timeframe}")
+    if components["trend"] < 1.0:
+        reasons.append(f"ADX {adx:.1f} < {ADX_TRENDING:.0f} (ranging)" if not math.isnan(adx) else "ADX unavailable")
+    if not math.isnan(nearest) and components["location"] == 0.0:
+        reasons.append(f"Price mid-range: nearest key level {nearest:.1f} ATR away")
+    return {
+        "score": float(scores["score"][i]),
+        "bias": {1: "BULLISH", -1: "BEARISH"}.get(int(scores["bias"][i]), "NEUTRAL"),
+        "components": components,
+        "reasons": reasons
+    }
+
+
+def screen_setup(multi_timeframes: Dict[str, Any], timeframe: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Chấm điểm setup của request /signal
+
+    Args:
+        multi_timeframes: multi_timeframes đã có indicators + analyze_price_action
+        timeframe: Main timeframe của request
+
+    Returns:
+        dict {'score', 'bias', 'components', 'reasons'} hoặc None nếu thiếu dữ liệu (không chấm được => gọi AI)
+    """
+    features = extract_features(multi_timeframes, timeframe)
+    if features is None:
+        return None
+    scores = score_features([features])
+    return describe(features, scores, 0, timeframe) if scores["valid"][0] else None
+
+
+def rank_setups(items: List[Dict[str, Any]], top_n: int, min_score: float,
+                indicators_fallback: Optional[Callable[[str, str, Optional[str]], Any]] = None) -> Dict[str, Any]:
+    """
+    Chấm điểm nhiều symbol / timeframe trong 1 lượt và chọn các setup đáng phân tích đầy đủ bằng /signal
+
+    Args:
+        items: [{'symbol', 'timeframe', 'multi_timeframes', 'timezone'}] (timezone = cache_key.timezone, có thể thiếu)
+        top_n: Số candidate tối đa
+        min_score: Điểm tối thiểu của candidate
+        indicators_fallback: (symbol, timeframe, timezone) -> indicators khi item không gửi indicators
+
+    Returns:
+        dict: candidates (điểm giảm dần), below_threshold, unscored (thiếu dữ liệu), summary
+    """
+    features, scored_items, unscored = [], [], []
+    for item in items:
+        symbol, timeframe, namespace = item.get('symbol'), item.get('timeframe'), item.get('timezone')
+        fallback = (lambda tf, symbol=symbol, namespace=namespace: indicators_fallback(symbol, tf, namespace)) if indicators_fallback else None
+        f = extract_features(item.get('multi_timeframes'), timeframe, fallback)
+        if f is None:
+            unscored.append({"symbol": symbol, "timeframe": timeframe})
+        else:
+            features.append(f)
+            scored_items.append(item)
+
+    ranked = []
+    if features:
+        scores = score_features(features)
+        for i in np.argsort(-scores["score"], kind="stable"):
+            item = scored_items[i]
+            if not scores["valid"][i]:
+                unscored.append({"symbol": item.get('symbol'), "timeframe": item.get('timeframe')})
+                continue
+            ranked.append(dict(symbol=item.get('symbol'), timeframe=item.get('timeframe'),
+                               **describe(features[i], scores, i, item.get('timeframe'))))
+
+    passing = [entry for entry in ranked if entry["score"] >= min_score]
+    candidates = passing[:max(top_n, 0)]
+    return {
+        "candidates": candidates,
+        "below_threshold": [entry for entry in ranked if entry["score"] < min_score] + passing[len(candidates):],
+        "unscored": unscored,
+        "summary": {"items": len(items), "scored": len(ranked), "candidates": len(candidates),
+                    "min_score": min_score, "top_n": top_n}
+    }
+
+
+class SignalScreener:
+    """Gate chấm điểm setup + thống kê điểm vs quyết định AI (shadow) để chỉnh ngưỡng"""
+
+    def __init__(self, mode: Optional[str] = None, threshold: Optional[float] = None):
+        """
+        Args:
+            mode: off / shadow / enforce (mặc định SIGNAL_SCREENER_MODE)
+            threshold: Điểm tối thiểu để gọi AI (mặc định SIGNAL_SCREENER_THRESHOLD)
+        """
+        self.mode = (mode or settings.SIGNAL_SCREENER_MODE).lower()
+        self.threshold = settings.SIGNAL_SCREENER_THRESHOLD if threshold is None else threshold
+        self._buckets: Dict[int, Dict[str, int]] = {}
+        self._screened = 0
+        self._skipped = 0
+        self._batches = {"requests": 0, "items": 0, "candidates": 0}
+        self._lock = threading.Lock()
+
+    def screen(self, multi_timeframes: Dict[str, Any], timeframe: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            Kết quả screen_setup + 'skip' (True => trả HOLD, không gọi AI) hoặc None nếu tắt / thiếu dữ liệu
+        """
+        if self.mode not in (MODE_SHADOW, MODE_ENFORCE):
+            return None
+        result = screen_setup(multi_timeframes, timeframe)
+        if result is None:
+            return None
+        result["skip"] = self.mode == MODE_ENFORCE and result["score"] < self.threshold
+        with self._lock:
+            self._screened += 1
+            if result["skip"]:
+                self._skipped += 1
+        return result
+
+    def rank(self, items: List[Dict[str, Any]], top_n: Optional[int] = None,
+             min_score: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Chấm điểm cả universe (bất kể mode) và trả các candidate nên gọi /signal
+
+        Args:
+            items: [{'symbol', 'timeframe', 'multi_timeframes', 'timezone'}] - timeframe thiếu indicators lấy từ
+                IndicatorEngine theo timezone (cache_key.timezone của broker)
+            top_n: Số candidate tối đa (mặc định SIGNAL_SCREEN_TOP_N)
+            min_score: Điểm tối thiểu (mặc định threshold của screener)
+
+        Returns:
+            Kết quả rank_setups
+        """
+        result = rank_setups(
+            items,
+            settings.SIGNAL_SCREEN_TOP_N if top_n is None else top_n,
+            self.threshold if min_score is None else min_score,
+            indicator_engine.get_snapshot
+        )
+        with self._lock:
+            self._batches["requests"] += 1
+            self._batches["items"] += len(items)
+            self._batches["candidates"] += len(result["candidates"])
+        return result
+
+    def record(self, result: Optional[Dict[str, Any]], signal_type: Optional[str]):
+        """Ghi quyết định thật của AI cho 1 request đã chấm điểm (không ghi request bị bỏ qua)"""
+        if not result or result.get("skip"):
+            return
+        bucket = min(int(result["score"] // SCORE_BUCKET) * SCORE_BUCKET, 100 - SCORE_BUCKET)
+        outcome = "ai_trade" if signal_type in TRADE_SIGNALS else "ai_hold"
+        with self._lock:
+            stats = self._buckets.setdefault(bucket, {"ai_trade": 0, "ai_hold": 0})
+            stats[outcome] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Thống kê theo bucket điểm và theo từng ngưỡng ứng viên:
+        saved_calls = số lần gọi AI tránh được, missed_trades = số tín hiệu BUY/SELL của AI sẽ bị bỏ
+        """
+        with self._lock:
+            buckets = {bucket: dict(stats) for bucket, stats in sorted(self._buckets.items())}
+            screened, skipped = self._screened, self._skipped
+            batches = dict(self._batches)
+        labelled = sum(s["ai_trade"] + s["ai_hold"] for s in buckets.values())
+        thresholds = {}
+        for candidate in range(SCORE_BUCKET, 100, SCORE_BUCKET):
+            below = [s for bucket, s in buckets.items() if bucket < candidate]
+            saved = sum(s["ai_trade"] + s["ai_hold"] for s in below)
+            missed = sum(s["ai_trade"] for s in below)
+            thresholds[candidate] = {
+                "saved_calls": saved,
+                "missed_trades": missed,
+                "saved_rate": round(saved / labelled, 4) if labelled else 0.0
+            }
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "screened": screened,
+            "skipped": skipped,
+            "buckets": {f"{bucket}-{bucket + SCORE_BUCKET}": stats for bucket, stats in buckets.items()},
+            "thresholds": thresholds,
+            "batch": batches
+        }
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value) if value is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _is_sequence(value: Any, length: int) -> bool:
+    return isinstance(value, (list, tuple)) and len(value) >= length
+
+
+# Global screener instance
+signal_screener = SignalScreener()
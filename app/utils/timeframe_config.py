@@ -96,4 +96,4 @@ def get_timeframe_config(main_tf_desc):
         """
         print(f"Warning: Unknown timeframe description '{main_tf_desc}'. Falling back to robust H4 configuration.")
         # Gọi lại chính nó với giá trị mặc định để tránh lặp code, sử dụng config đã sửa
-        return get_timeframe_config(4)
\ No newline at end of file
+        return get_timeframe_config("H4")
\ No newline at end of file
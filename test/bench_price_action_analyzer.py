@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark PriceActionAnalyzer trên chuỗi 1k / 10k nến
+
+Chạy: python test/bench_price_action_analyzer.py [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.price_action_analyzer import PriceActionAnalyzer
+from app.utils.candle_codec import CandleColumns, decode_columns, encode_columns, rows_to_columns
+
+SERIES_SIZES = [1_000, 10_000]
+DEFAULT_REPEAT = 20
+
+
+def make_series(n, seed=42):
+    """Random-walk OHLCV arrays (H1, epoch seconds)"""
+    rng = np.random.default_rng(seed)
+    closes = 1.10 + np.cumsum(rng.normal(0, 0.0006, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0005, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0005, n)
+    volumes = rng.integers(500, 2000, n).astype(np.float64)
+    times = np.arange(n, dtype=np.int64) * 3600 + 1_700_000_000
+    return times, opens, highs, lows, closes, volumes
+
+
+def bench(label, fn, repeat):
+    """Chạy fn `repeat` lần, trả về (p50, min) tính bằng ms"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    print(f"  {label:<28} p50={p50:8.3f} ms   min={timings[0]:8.3f} ms")
+    return p50, timings[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PriceActionAnalyzer")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    analyzer = PriceActionAnalyzer()
+    print("📊 PriceActionAnalyzer benchmark")
+    print("=" * 60)
+    for n in SERIES_SIZES:
+        times, opens, highs, lows, closes, volumes = make_series(n)
+        candles = [
+            {"time": int(times[i]), "open": float(opens[i]), "high": float(highs[i]),
+             "low": float(lows[i]), "close": float(closes[i]), "volume": float(volumes[i]),
+             "tick_volume": float(volumes[i])}
+            for i in range(n)
+        ]
+        payload = encode_columns(CandleColumns(times, opens, highs, lows, closes, volumes))
+        print(f"\n{n:,} candles")
+        bench("analyze_arrays (NumPy)", lambda: analyzer.analyze_arrays(times, opens, highs, lows, closes, volumes), args.repeat)
+        bench("analyze_price_action (dicts)", lambda: analyzer.analyze_price_action(candles), args.repeat)
+        bench("decode raw_data (rows)", lambda: rows_to_columns(candles), args.repeat)
+        bench("decode raw_columns (base64)", lambda: decode_columns(payload), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark + regression check RiskManagerService trên app/tests/final_risk_manager/test_cases.json
+
+- Single-thread: replay các case qua analyze_risk (xen kẽ theo vòng), p50/p99 theo case, ops/s, bộ nhớ cấp phát đỉnh mỗi lần gọi
+- Process pool: replay toàn bộ case qua ProcessPoolExecutor (pickle request/response như /risk_manager), ops/s
+- So sánh với baseline đã lưu: chậm hơn / cấp phát nhiều hơn quá ngưỡng hoặc quyết định thay đổi => exit code 1
+
+Chạy: python test/bench_risk_manager_service.py [--repeat 30] [--workers 2] [--tolerance 0.25] [--update-baseline]
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.risk_manager_service import RiskManagerService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASES_PATH = os.path.join(ROOT, "app", "tests", "final_risk_manager", "test_cases.json")
+BASELINE_PATH = os.path.join(ROOT, "test", "bench_risk_manager_service_baseline.json")
+DEFAULT_REPEAT = 30
+DEFAULT_TOLERANCE = 0.25  # Chậm hơn / cấp phát nhiều hơn 25% so với baseline => fail
+CASE_TOLERANCE = 2.0      # p50 của 1 case được phép chậm hơn gấp CASE_TOLERANCE lần ngưỡng chung (case ngắn nhiễu hơn)
+
+
+def load_cases():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        return [(case["test_name"], case["params"]) for case in json.load(f)]
+
+
+def make_logger():
+    """Logger stdlib ghi ra devnull: vẫn tính chi phí format + emit của log nhưng không ghi đĩa"""
+    logger = logging.getLogger("bench_risk_manager")
+    logger.handlers[:] = [logging.StreamHandler(open(os.devnull, "w", encoding="utf-8"))]
+    logger.handlers[0].setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def decisions_digest(results):
+    """Hash các quyết định (status, lot, TP, lãi/lỗ dự kiến...) để phát hiện thay đổi hành vi"""
+    payload = json.dumps(results, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def bench_single(service, cases, repeat):
+    """Replay toàn bộ case `repeat` vòng trong process hiện tại (xen kẽ case để nhiễu chia đều)"""
+    timings = {name: [] for name, _ in cases}
+    results = []
+    for round_index in range(repeat):
+        for name, params in cases:
+            request = copy.deepcopy(params)
+            start = time.perf_counter()
+            result = service.analyze_risk(request)
+            timings[name].append(time.perf_counter() - start)
+            if round_index == 0:
+                results.append(result)
+    per_case = {}
+    for name, values in timings.items():
+        values.sort()
+        per_case[name] = {"p50_us": round(percentile(values, 0.5) * 1e6, 1), "p99_us": round(percentile(values, 0.99) * 1e6, 1)}
+    total = sum(sum(values) for values in timings.values())
+    return {"ops_per_sec": round(len(cases) * repeat / total, 1), "cases": per_case, "digest": decisions_digest(results)}
+
+
+def bench_allocations(service, cases):
+    """Bộ nhớ cấp phát đỉnh (KiB) trung bình mỗi lần gọi analyze_risk"""
+    requests = [copy.deepcopy(params) for _, params in cases]
+    service.analyze_risk(copy.deepcopy(cases[0][1]))  # warm-up: import / cache lần đầu
+    tracemalloc.start()
+    peaks = []
+    for request in requests:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        service.analyze_risk(request)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return round(sum(peaks) / len(peaks) / 1024, 2)
+
+
+_pool_service = None
+
+
+def _pool_task(params):
+    """analyze_risk trong worker với cùng điều kiện như single-thread (không ghi response log / log file)"""
+    global _pool_service
+    if _pool_service is None:
+        patch("app.services.risk_manager_service.response_logger").start()
+        _pool_service = RiskManagerService(logger=make_logger())
+    return _pool_service.analyze_risk(params)
+
+
+def bench_pool(cases, repeat, workers):
+    """Replay qua process pool (pickle request/response như /risk_manager), ops/s"""
+    requests = [params for _, params in cases] * repeat
+    context = multiprocessing.get_context(settings.EXECUTOR_PROCESS_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        list(pool.map(_pool_task, requests[:workers * 4]))  # warm-up: khởi tạo service trong worker
+        start = time.perf_counter()
+        list(pool.map(_pool_task, requests, chunksize=1))
+        elapsed = time.perf_counter() - start
+    return {"workers": workers, "ops_per_sec": round(len(requests) / elapsed, 1)}
+
+
+def compare(report, baseline, tolerance):
+    """Danh sách regression so với baseline"""
+    failures = []
+    if report["single"]["digest"] != baseline["single"]["digest"]:
+        failures.append("decisions changed (digest mismatch) - verify with validate_refactor.py, then --update-baseline")
+    floor = baseline["single"]["ops_per_sec"] * (1 - tolerance)
+    if report["single"]["ops_per_sec"] < floor:
+        failures.append(f"single-thread ops/s {report['single']['ops_per_sec']} < {floor:.1f}")
+    for name, stats in report["single"]["cases"].items():
+        expected = baseline["single"]["cases"].get(name)
+        if expected and stats["p50_us"] > expected["p50_us"] * (1 + tolerance * CASE_TOLERANCE):
+            failures.append(f"{name}: p50 {stats['p50_us']} us > baseline {expected['p50_us']} us")
+    ceiling = baseline["alloc_kib_per_call"] * (1 + tolerance)
+    if report["alloc_kib_per_call"] > ceiling:
+        failures.append(f"allocations {report['alloc_kib_per_call']} KiB/call > {ceiling:.2f}")
+    if "pool" in report and "pool" in baseline and report["pool"]["workers"] == baseline["pool"]["workers"]:
+        floor = baseline["pool"]["ops_per_sec"] * (1 - tolerance)
+        if report["pool"]["ops_per_sec"] < floor:
+            failures.append(f"process pool ops/s {report['pool']['ops_per_sec']} < {floor:.1f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RiskManagerService")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--workers", type=int, default=settings.EXECUTOR_PROCESS_WORKERS, help="0 = bỏ qua process pool")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    cases = load_cases()
+    print(f"📊 RiskManagerService benchmark ({len(cases)} cases x {args.repeat})")
+    print("=" * 60)
+    # Không ghi response log ra đĩa (đo đường xử lý, không đo I/O)
+    with patch("app.services.risk_manager_service.response_logger"):
+        service = RiskManagerService(logger=make_logger())
+        report = {"single": bench_single(service, cases, args.repeat), "alloc_kib_per_call": bench_allocations(service, cases)}
+    if args.workers > 0:
+        report["pool"] = bench_pool(cases, args.repeat, args.workers)
+
+    single = report["single"]
+    slowest = sorted(single["cases"].items(), key=lambda item: -item[1]["p50_us"])[:5]
+    print(f"  single-thread               {single['ops_per_sec']:10.1f} ops/s")
+    if "pool" in report:
+        print(f"  process pool ({report['pool']['workers']} workers)    {report['pool']['ops_per_sec']:10.1f} ops/s")
+    print(f"  allocations                 {report['alloc_kib_per_call']:10.2f} KiB/call (peak)")
+    print("  slowest cases (p50 / p99):")
+    for name, stats in slowest:
+        print(f"    {name[:44]:<44} {stats['p50_us']:8.1f} / {stats['p99_us']:8.1f} us")
+
+    if args.update_baseline or not os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\n💾 Baseline saved: {os.path.relpath(BASELINE_PATH, ROOT)}")
+        return 0
+
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    failures = compare(report, baseline, args.tolerance)
+    print(f"\nBaseline: {baseline['single']['ops_per_sec']} ops/s single-thread, {baseline['alloc_kib_per_call']} KiB/call")
+    if failures:
+        print("❌ REGRESSION:")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print("✅ No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
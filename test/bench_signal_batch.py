@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark /signal batch vs single: token của prompt và throughput với provider giả lập
+
+- Token: prompt thật của prompt_signal_analyst (dữ liệu W1 / H4 / H1 phân tích từ nến ngẫu nhiên) cho N symbol,
+  mode single (N prompt) vs batch (N / K prompt); token ước lượng = ký tự / CHARS_PER_TOKEN
+- Throughput: SignalService.analyze_signal_batch với AI giả lập, thời gian mỗi lần gọi =
+  round trip + input token / prefill + output token / decode, tối đa --concurrency lần gọi song song
+  (giới hạn của provider); thời gian được thu nhỏ theo --time-scale khi chạy rồi quy đổi lại
+
+Chạy: python test/bench_signal_batch.py [--symbols 12] [--batch-size 4] [--concurrency 4] [--rtt 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.utils.candle_codec import CandleColumns
+from app.utils.indicator_engine import IndicatorState
+from app.utils.price_action_analyzer import PriceActionAnalyzer
+from app.services.signal_service import SignalService
+
+CHARS_PER_TOKEN = 4            # Ước lượng token cho prompt tiếng Anh + JSON
+TIMEFRAME_SECONDS = {"W1": 604800, "H4": 14400, "H1": 3600}
+SYMBOLS = ["EURUSD", "GBPUSD", "AUDUSD", "NZDUSD", "USDCAD", "USDCHF", "EURGBP", "EURJPY",
+           "GBPJPY", "USDJPY", "AUDJPY", "EURCHF", "XAUUSD", "CADJPY", "EURAUD", "GBPCHF"]
+DEFAULT_SYMBOLS = 12
+DEFAULT_BARS = 300
+OUTPUT_TOKENS_PER_SIGNAL = 180  # JSON signal + technical_reasoning
+
+
+def make_request(symbol: str, seed: int, bars: int):
+    rng = np.random.default_rng(seed)
+    multi_timeframes = {}
+    for tf, seconds in TIMEFRAME_SECONDS.items():
+        closes = 1.10 + np.cumsum(rng.normal(0.0, 0.0008, bars))
+        opens = np.concatenate([[closes[0]], closes[:-1]])
+        highs, lows = np.maximum(opens, closes) + 0.0004, np.minimum(opens, closes) - 0.0004
+        columns = CandleColumns(1_726_000_000 + np.arange(bars) * seconds, opens, highs, lows, closes, np.full(bars, 1000.0))
+        multi_timeframes[tf] = {"indicators": IndicatorState.from_arrays(*columns).snapshot(),
+                                "analyze_price_action": PriceActionAnalyzer().analyze_arrays(*columns)}
+    return {"symbol": symbol, "timeframe": "H4", "symbol_info": {"digits": 5, "point": 0.00001},
+            "cache_key": {"timezone": "GMT+3.0", "timeframe": "H4", "symbol": symbol},
+            "multi_timeframes": multi_timeframes}
+
+
+def prompt_symbols(prompt: str):
+    if "JSON array only" in prompt:
+        listed = prompt.split("trading symbols: ")[1].split(". Apply")[0]
+        return [symbol.strip() for symbol in listed.split(",")]
+    return [prompt.split("for the trading symbol ")[1].split(".")[0]]
+
+
+class FakeProvider:
+    """AI giả lập: latency theo token, giới hạn số lần gọi song song"""
+
+    def __init__(self, rtt: float, prefill_tps: float, decode_tps: float, concurrency: int, time_scale: float):
+        self.rtt, self.prefill_tps, self.decode_tps, self.time_scale = rtt, prefill_tps, decode_tps, time_scale
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def generate_response(self, prompt: str) -> str:
+        symbols = prompt_symbols(prompt)
+        input_tokens = len(prompt) / CHARS_PER_TOKEN
+        output_tokens = OUTPUT_TOKENS_PER_SIGNAL * len(symbols)
+        async with self.semaphore:
+            await asyncio.sleep((self.rtt + input_tokens / self.prefill_tps + output_tokens / self.decode_tps) * self.time_scale)
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        signals = [{"symbol": symbol, "signal_type": "HOLD", "order_type_proposed": None,
+                    "technical_reasoning": "bench"} for symbol in symbols]
+        return json.dumps(signals if len(signals) > 1 or "JSON array only" in prompt else signals[0])
+
+
+def bench_mode(requests, batch_size: int, args):
+    service = SignalService(redis_client=MagicMock())
+    service.redis_client.is_connected.return_value = False
+    provider = FakeProvider(args.rtt, args.prefill_tps, args.decode_tps, args.concurrency, args.time_scale)
+    service.ai_service = provider
+    with patch.object(settings, "MARKET_CALENDAR_ENABLED", False), \
+            patch("app.services.signal_service.signal_screener.mode", "off"), \
+            patch("app.services.signal_service.response_logger"):
+        started = time.perf_counter()
+        results = asyncio.run(service.analyze_signal_batch([dict(r) for r in requests], batch_size))
+        elapsed = (time.perf_counter() - started) / args.time_scale
+    assert all(result.get("success") for result in results), results
+    return {
+        "ai_calls": provider.calls,
+        "input_tokens": int(provider.input_tokens),
+        "output_tokens": int(provider.output_tokens),
+        "seconds": round(elapsed, 2),
+        "signals_per_min": round(len(requests) / elapsed * 60, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /signal batch vs single")
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS)
+    parser.add_argument("--batch-size", type=int, default=settings.SIGNAL_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=4, help="Số lần gọi AI song song tối đa của provider")
+    parser.add_argument("--rtt", type=float, default=0.5, help="Round trip mỗi lần gọi (giây)")
+    parser.add_argument("--prefill-tps", type=float, default=4000.0, help="Input token / giây")
+    parser.add_argument("--decode-tps", type=float, default=50.0, help="Output token / giây")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Hệ số thu nhỏ thời gian chờ giả lập")
+    parser.add_argument("--bars", type=int, default=DEFAULT_BARS)
+    args = parser.parse_args()
+
+    symbols = [SYMBOLS[i % len(SYMBOLS)] + ("" if i < len(SYMBOLS) else str(i)) for i in range(args.symbols)]
+    requests = [make_request(symbol, seed, args.bars) for seed, symbol in enumerate(symbols)]
+
+    print(f"📊 Signal batch benchmark ({len(requests)} symbols, batch size {args.batch_size}, concurrency {args.concurrency})")
+    print("=" * 72)
+    single = bench_mode(requests, 1, args)
+    batched = bench_mode(requests, args.batch_size, args)
+    print(f"  {'mode':<10}{'AI calls':>10}{'input tok':>12}{'output tok':>12}{'seconds':>10}{'signals/min':>14}")
+    for name, report in (("single", single), ("batch", batched)):
+        print(f"  {name:<10}{report['ai_calls']:>10}{report['input_tokens']:>12}{report['output_tokens']:>12}"
+              f"{report['seconds']:>10}{report['signals_per_min']:>14}")
+    print(f"\n  input tokens saved:  {1 - batched['input_tokens'] / single['input_tokens']:.1%}")
+    print(f"  AI calls saved:      {1 - batched['ai_calls'] / single['ai_calls']:.1%}")
+    print(f"  throughput:          x{batched['signals_per_min'] / single['signals_per_min']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test AccountStateService: snapshot + delta theo version, tham chiếu account_state trong request (backend in-memory)
+"""
+
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.constants import ErrorCodes
+from app.services.account_state_service import (
+    AccountStateConflict, AccountStateError, AccountStateService, apply_state_delta
+)
+from app.routers.v1.trading import AccountStateDeltaRequest, apply_account_state_delta
+
+ACCOUNT = {"login": 1001, "server": "Broker-Demo", "equity": 5000.0, "balance": 5000.0, "profit": 0.0, "leverage": 100}
+PORTFOLIO = {
+    "active_positions": [{"ticket": 1, "symbol": "GBPUSD", "type": "BUY", "profit": 5.0}],
+    "pending_orders": [],
+    "summary": {"total_potential_loss_from_portfolio_usd": 40.0}
+}
+SYMBOL_INFO = {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01, "trade_contract_size": 100000}
+FIELDS = {"account_info_json": "account_info", "portfolio_exposure_json": "portfolio_exposure"}
+
+
+def make_service():
+    service = AccountStateService(ttl=60, symbol_info_ttl=60, local_cache_size=2)
+    assert service.redis is None  # Không kết nối Redis => in-memory
+    return service
+
+
+def test_apply_state_delta_ops():
+    state = {"account_info": dict(ACCOUNT), "portfolio_exposure": PORTFOLIO}
+    updated = apply_state_delta(state, [
+        {"op": "account", "fields": {"equity": 5012.5, "profit": 12.5}},
+        {"op": "position_updated", "ticket": 1, "fields": {"profit": 12.5}},
+        {"op": "position_opened", "position": {"ticket": 2, "symbol": "EURUSD", "type": "SELL", "profit": 0.0}},
+        {"op": "order_placed", "order": {"ticket": 7, "symbol": "XAUUSD", "type": "BUY_LIMIT"}},
+        {"op": "position_closed", "ticket": 1},
+        {"op": "summary", "fields": {"total_potential_loss_from_portfolio_usd": 25.0}},
+        {"op": "account_type", "fields": {"type": "DEMO"}},
+    ])
+    assert updated["account_info"]["equity"] == 5012.5 and updated["account_info"]["server"] == "Broker-Demo"
+    assert [p["ticket"] for p in updated["portfolio_exposure"]["active_positions"]] == [2]
+    assert [o["ticket"] for o in updated["portfolio_exposure"]["pending_orders"]] == [7]
+    assert updated["portfolio_exposure"]["summary"]["total_potential_loss_from_portfolio_usd"] == 25.0
+    assert updated["account_type_details"] == {"type": "DEMO"}
+    # State gốc không bị sửa
+    assert state["portfolio_exposure"]["active_positions"][0]["profit"] == 5.0
+
+    for ops in ([{"op": "position_closed", "ticket": 99}], [{"op": "order_placed", "order": {"symbol": "X"}}],
+                [{"op": "account"}], [{"op": "rebalance"}]):
+        with pytest.raises(AccountStateError):
+            apply_state_delta(state, ops)
+
+
+def test_versions_advance_and_conflicts_are_reported():
+    async def scenario():
+        service = make_service()
+        v1 = await service.put("1001", {"account_info": ACCOUNT, "portfolio_exposure": PORTFOLIO})
+        v2 = await service.apply("1001", v1, [{"op": "account", "fields": {"equity": 4990.0}}])
+        assert v2 > v1
+        assert (await service.resolve("1001", v2))["account_info"]["equity"] == 4990.0
+
+        # Delta trên version cũ / login chưa có state
+        with pytest.raises(AccountStateConflict) as stale:
+            await service.apply("1001", v1, [{"op": "account", "fields": {"equity": 1.0}}])
+        assert stale.value.current_version == v2
+        with pytest.raises(AccountStateConflict) as missing:
+            await service.resolve("2002", 1)
+        assert missing.value.current_version is None
+
+        # Delta lỗi không tạo version mới
+        with pytest.raises(AccountStateError):
+            await service.apply("1001", v2, [{"op": "position_closed", "ticket": 42}])
+        assert (await service.resolve("1001", v2))["account_info"]["equity"] == 4990.0
+
+        # Version cũ còn trong cache local vẫn bị từ chối
+        with pytest.raises(AccountStateConflict) as cached_stale:
+            await service.resolve("1001", v1)
+        assert cached_stale.value.current_version == v2
+        return service
+
+    service = asyncio.run(scenario())
+    metrics = service.get_metrics()
+    assert metrics["backend"] == "memory" and metrics["cached_versions"] == 2
+    assert metrics["hits"] >= 2 and metrics["misses"] >= 1
+
+
+def test_resolve_rejects_version_superseded_after_cache_hit():
+    async def scenario():
+        service = make_service()
+        v1 = await service.put("1001", {"account_info": ACCOUNT, "portfolio_exposure": PORTFOLIO})
+        assert (await service.resolve("1001", v1))["account_info"]["equity"] == 5000.0
+        # Writer khác (process khác) ghi v2: cache local của process này vẫn giữ v1
+        other = make_service()
+        other._memory = service._memory
+        v2 = await other.apply("1001", v1, [{"op": "position_closed", "ticket": 1}])
+        assert ("1001", v1) in service._local
+        with pytest.raises(AccountStateConflict) as stale:
+            await service.resolve("1001", v1)
+        assert stale.value.current_version == v2
+        assert (await service.resolve("1001", v2))["portfolio_exposure"]["active_positions"] == []
+
+    asyncio.run(scenario())
+
+
+def test_hydrate_fills_request_from_reference():
+    async def scenario():
+        service = make_service()
+        version = await service.put(1001, {"account_info": ACCOUNT, "portfolio_exposure": PORTFOLIO})
+        signal = {"symbol": "EURUSD", "signal_type": "BUY"}
+
+        # Lần đầu gửi symbol_info => lưu theo broker (account_info.server)
+        first = {"proposed_signal_json": signal, "account_info_json": None, "portfolio_exposure_json": None,
+                 "symbol_info": SYMBOL_INFO, "account_state": {"login": "1001", "version": version}}
+        assert await service.hydrate(first, FIELDS, "EURUSD") is None
+        assert first["account_info_json"] == ACCOUNT and first["portfolio_exposure_json"] == PORTFOLIO
+        assert "account_state" not in first
+        assert await service.get_symbol_info("Broker-Demo", "EURUSD") == SYMBOL_INFO
+
+        # Lần sau bỏ symbol_info, field gửi kèm được giữ nguyên
+        override = dict(ACCOUNT, equity=1.0)
+        second = {"account_info_json": override, "portfolio_exposure_json": None, "symbol_info": None,
+                  "account_state": {"login": "1001", "version": version}}
+        assert await service.hydrate(second, FIELDS, "EURUSD") is None
+        assert second["symbol_info"] == SYMBOL_INFO and second["account_info_json"] is override
+
+        # Version cũ => lỗi stale kèm version hiện tại
+        new_version = await service.apply(1001, version, [{"op": "account", "fields": {"equity": 10.0}}])
+        stale = {"account_info_json": None, "portfolio_exposure_json": None, "symbol_info": None,
+                 "account_state": {"login": "1001", "version": version - 1}}
+        error = await service.hydrate(stale, FIELDS, "EURUSD")
+        assert error["errorCode"] == ErrorCodes.ACCOUNT_STATE_STALE
+        assert error["data"] == {"current_version": new_version}
+
+        # Không có account_state và thiếu field / symbol_info chưa từng lưu
+        error = await service.hydrate({"account_info_json": None, "portfolio_exposure_json": {}, "symbol_info": {}}, FIELDS, "EURUSD")
+        assert error["errorCode"] == ErrorCodes.MISSING_REQUIRED_FIELD
+        unknown = {"account_info_json": None, "portfolio_exposure_json": None, "symbol_info": None,
+                   "account_state": {"login": "1001", "version": new_version}}
+        error = await service.hydrate(unknown, FIELDS, "XAUUSD")
+        assert error["errorCode"] == ErrorCodes.MISSING_REQUIRED_FIELD and "symbol_info" in error["errorMsg"]
+
+    asyncio.run(scenario())
+
+
+def test_delta_endpoint_reports_invalid_ops_as_client_error():
+    async def scenario():
+        service = make_service()
+        version = await service.put("1001", {"account_info": ACCOUNT, "portfolio_exposure": PORTFOLIO})
+        with patch("app.routers.v1.trading.account_state_service", service):
+            bad = await apply_account_state_delta(AccountStateDeltaRequest(
+                login="1001", version=version, ops=[{"op": "position_closed", "ticket": 42}]))
+            stale = await apply_account_state_delta(AccountStateDeltaRequest(
+                login="1001", version=version - 1, ops=[]))
+        assert bad["errorCode"] == ErrorCodes.ACCOUNT_STATE_INVALID and "Unknown position ticket: 42" in bad["errorMsg"]
+        assert stale["errorCode"] == ErrorCodes.ACCOUNT_STATE_STALE
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_apply_state_delta_ops()
+    test_versions_advance_and_conflicts_are_reported()
+    test_resolve_rejects_version_superseded_after_cache_hit()
+    test_hydrate_fills_request_from_reference()
+    test_delta_endpoint_reports_invalid_ops_as_client_error()
+    print("✅ All account state tests passed")
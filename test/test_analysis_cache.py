@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test AnalysisCache + tái sử dụng block phân tích trong MultiTimeframesProcessor
+"""
+
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import Logger
+from app.utils.analysis_cache import AnalysisCache
+from app.utils.candle_codec import rows_to_columns
+from app.utils import multi_timeframes_processor as processor_module
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor
+
+
+SYMBOL_INFO = {"point": 1e-05, "digits": 5}
+
+
+def make_candles(n=250, start=1_726_000_000, step=7200, seed=5):
+    """Chuỗi nến random-walk theo format raw_data của MT5"""
+    rng = np.random.default_rng(seed)
+    closes = 1.17 + np.cumsum(rng.normal(0, 0.0008, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0006, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0006, n)
+    volumes = rng.integers(800, 1600, n)
+    return [
+        {"time": int(start + i * step), "open": float(opens[i]), "high": float(highs[i]),
+         "low": float(lows[i]), "close": float(closes[i]), "tick_volume": int(volumes[i])}
+        for i in range(n)
+    ]
+
+
+def test_key_changes_with_forming_bar_and_history():
+    """Nến cuối đổi giá hoặc lịch sử đổi => key khác; cùng dữ liệu => cùng key"""
+    candles = make_candles(100)
+    key = AnalysisCache.make_key("EURUSD", "H4", rows_to_columns(candles), 0.0001)
+    assert key == AnalysisCache.make_key("EURUSD", "H4", rows_to_columns([dict(c) for c in candles]), 0.0001)
+
+    forming = [dict(c) for c in candles]
+    forming[-1]["close"] += 0.0002
+    assert key != AnalysisCache.make_key("EURUSD", "H4", rows_to_columns(forming), 0.0001)
+
+    revised = [dict(c) for c in candles]
+    revised[10]["high"] += 0.0005
+    assert key != AnalysisCache.make_key("EURUSD", "H4", rows_to_columns(revised), 0.0001)
+    assert key != AnalysisCache.make_key("EURUSD", "D1", rows_to_columns(candles), 0.0001)
+
+
+def test_lru_eviction_and_role_metrics():
+    cache = AnalysisCache(max_entries=2)
+    cache.put(("a",), {"x": 1})
+    cache.put(("b",), {"x": 2})
+    assert cache.get(("a",), "higher") == {"x": 1}
+    cache.put(("c",), {"x": 3})  # b ít dùng nhất => bị loại
+    assert cache.get(("b",), "main") is None
+
+    metrics = cache.get_metrics()
+    assert metrics["entries"] == 2
+    assert metrics["roles"]["higher"] == {"hits": 1, "misses": 0, "hit_rate": 1.0}
+    assert metrics["roles"]["main"]["misses"] == 1
+
+
+def test_processor_reuses_unchanged_timeframes():
+    """Request thứ 2 chỉ phân tích timeframe có nến mới, block còn lại lấy từ cache"""
+    cache = AnalysisCache(max_entries=16)
+    processor = MultiTimeframesProcessor(Logger("test_analysis_cache"))
+    higher, main = make_candles(250, step=86400, seed=1), make_candles(250, step=14400, seed=2)
+    roles = {"D1": "higher", "H4": "main"}
+
+    def request(main_candles):
+        return {"D1": {"raw_data": higher}, "H4": {"raw_data": main_candles}}
+
+    with patch.object(processor_module, "analysis_cache", cache):
+        first = request(main)
+        assert processor.process_multi_timeframes("XAUUSD", SYMBOL_INFO, first, "signal_generation", roles=roles)["success"]
+
+        next_main = main[1:] + [dict(main[-1], time=main[-1]["time"] + 14400)]
+        second = request(next_main)
+        with patch.object(processor_module, "analyze_timeframe", wraps=processor_module.analyze_timeframe) as analyze:
+            result = processor.process_multi_timeframes("XAUUSD", SYMBOL_INFO, second, "signal_generation", roles=roles)
+
+    assert result["success"], result.get("error")
+    assert analyze.call_count == 1  # Chỉ H4
+    # Block lấy từ cache là bản copy của request trước
+    assert second["D1"]["analyze_price_action"] == first["D1"]["analyze_price_action"]
+    assert second["D1"]["analyze_price_action"] is not first["D1"]["analyze_price_action"]
+    assert second["D1"]["indicators"] == first["D1"]["indicators"]
+    assert result["raw_data_counts"] == {"D1": 250, "H4": 250}
+
+    roles_metrics = cache.get_metrics()["roles"]
+    assert roles_metrics["higher"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert roles_metrics["main"]["hits"] == 0
+
+
+def test_cached_block_isolated_and_engine_advanced_on_hit():
+    """Sửa block của 1 request không làm hỏng cache; hit mà client không gửi indicators => engine vẫn được cập nhật"""
+    cache = AnalysisCache(max_entries=16)
+    cache.put(("k",), {"analyze_price_action": {"levels": [1.1]}})
+    block = cache.get(("k",))
+    block["analyze_price_action"]["levels"].append(9.9)
+    assert cache.get(("k",)) == {"analyze_price_action": {"levels": [1.1]}}
+
+    processor = MultiTimeframesProcessor(Logger("test_analysis_cache"))
+    candles = make_candles(250, step=14400, seed=3)
+    with patch.object(processor_module, "analysis_cache", cache):
+        # Request đầu gửi indicators của client => engine không được dùng
+        first = {"H4": {"raw_data": candles, "indicators": {"atr": 1.0}}}
+        assert processor.process_multi_timeframes("GBPUSD", SYMBOL_INFO, first, "signal_generation")["success"]
+        first["H4"]["analyze_price_action"]["current_price_context"]["price"] = 0.0
+
+        second = {"H4": {"raw_data": [dict(c) for c in candles]}}
+        with patch.object(processor_module, "indicator_engine", wraps=processor_module.indicator_engine) as engine:
+            assert processor.process_multi_timeframes("GBPUSD", SYMBOL_INFO, second, "signal_generation")["success"]
+
+    assert engine.update.call_count == 1
+    assert second["H4"]["indicators"]["atr"] != 1.0 and second["H4"]["indicators"]["atr"] > 0
+    assert second["H4"]["analyze_price_action"]["current_price_context"]["price"] > 0
+    assert cache.get_metrics()["roles"]["unknown"]["hits"] >= 1
+
+
+if __name__ == "__main__":
+    test_key_changes_with_forming_bar_and_history()
+    test_lru_eviction_and_role_metrics()
+    test_processor_reuses_unchanged_timeframes()
+    test_cached_block_isolated_and_engine_advanced_on_hit()
+    print("✅ All analysis cache tests passed")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test candle_codec (raw_columns columnar / base64) + MultiTimeframesProcessor
+"""
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import Logger
+from app.utils.candle_codec import (
+    CandleDecodeError, decode_columns, decode_timeframe, encode_columns, rows_to_columns
+)
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor
+
+
+def make_candles(n=250, start=1_726_000_000, step=7200, seed=11):
+    """Chuỗi nến random-walk theo format raw_data của MT5"""
+    rng = np.random.default_rng(seed)
+    closes = 1.17 + np.cumsum(rng.normal(0, 0.0008, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0006, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0006, n)
+    volumes = rng.integers(800, 1600, n)
+    return [
+        {"time": int(start + i * step), "open": float(opens[i]), "high": float(highs[i]),
+         "low": float(lows[i]), "close": float(closes[i]), "tick_volume": int(volumes[i])}
+        for i in range(n)
+    ]
+
+
+def to_list_columns(candles):
+    return {field: [c[field] for c in candles] for field in ("time", "open", "high", "low", "close", "tick_volume")}
+
+
+def test_all_formats_decode_to_same_columns():
+    """raw_data, raw_columns list và base64 phải cho cùng các mảng"""
+    candles = make_candles(120)
+    from_rows = rows_to_columns(candles)
+    from_lists = decode_timeframe({"raw_columns": to_list_columns(candles)})
+    from_base64 = decode_columns(encode_columns(from_rows))
+
+    assert from_rows.size == from_lists.size == from_base64.size == 120
+    for a, b, c in zip(from_rows, from_lists, from_base64):
+        np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+        np.testing.assert_array_equal(np.asarray(a), np.asarray(c))
+
+
+def test_base64_decode_is_zero_copy_view():
+    """Cột base64 là view trên buffer đã decode (không copy từng phần tử)"""
+    payload = encode_columns(rows_to_columns(make_candles(50)))
+    columns = decode_columns(payload)
+    assert columns.closes.base is not None
+    assert not columns.closes.flags.writeable
+
+
+def test_invalid_payloads_raise_decode_error():
+    """Cột lệch độ dài / base64 hỏng / encoding lạ => CandleDecodeError"""
+    columns = to_list_columns(make_candles(30))
+    columns["close"] = columns["close"][:-1]
+    with pytest.raises(CandleDecodeError):
+        decode_columns(columns)
+
+    payload = encode_columns(rows_to_columns(make_candles(30)))
+    payload["open"] = payload["open"][:-4] + "!!!!"
+    with pytest.raises(CandleDecodeError):
+        decode_columns(payload)
+
+    with pytest.raises(CandleDecodeError):
+        decode_columns({"encoding": "msgpack"})
+
+
+def test_processor_accepts_raw_columns_without_deepcopy():
+    """Processor phân tích raw_columns giống raw_data; tmp giữ payload gốc, prompt không còn nến thô"""
+    processor = MultiTimeframesProcessor(Logger("test_candle_codec"))
+    candles = make_candles(250)
+    payload = encode_columns(rows_to_columns(candles))
+    by_columns = {"H2": {"indicators": {"rsi": 50.0}, "raw_columns": payload}}
+    by_rows = {"H2": {"indicators": {"rsi": 50.0}, "raw_data": candles}}
+
+    result = processor.process_multi_timeframes("EURUSD", {"point": 1e-05, "digits": 5}, by_columns, "signal_generation")
+    processor.process_multi_timeframes("EURUSD", {"point": 1e-05, "digits": 5}, by_rows, "signal_generation")
+
+    assert result["success"], result.get("error")
+    assert result["raw_data_counts"] == {"H2": 250}
+    assert "raw_columns" not in by_columns["H2"]
+    assert result["tmp_multi_timeframes"]["H2"]["raw_columns"] is payload
+    assert by_columns["H2"]["analyze_price_action"] == by_rows["H2"]["analyze_price_action"]
+
+
+if __name__ == "__main__":
+    test_all_formats_decode_to_same_columns()
+    test_base64_decode_is_zero_copy_view()
+    test_invalid_payloads_raise_decode_error()
+    test_processor_accepts_raw_columns_without_deepcopy()
+    print("✅ All candle codec tests passed")
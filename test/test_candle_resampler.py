@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test candle_resampler (dựng H2/H4/H8/D1/W1 từ 1 chuỗi M30/H1)
+"""
+
+import sys
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.candle_codec import CandleColumns
+from app.utils.candle_resampler import build_timeframes, parse_timezone_offset, resample, ResampleError
+
+HOUR = 3600
+MONDAY = int(datetime(2025, 9, 1, tzinfo=timezone.utc).timestamp())
+
+
+def make_h1_week_series(weeks=3, seed=1):
+    """Nến H1 từ Thứ 2 00:00 tới Thứ 6 23:00 (giờ server), nghỉ cuối tuần"""
+    times = np.array([MONDAY + w * 7 * 24 * HOUR + h * HOUR for w in range(weeks) for h in range(5 * 24)], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    n = times.size
+    closes = 1.10 + np.cumsum(rng.normal(0, 0.001, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.001, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.001, n)
+    volumes = rng.integers(100, 1000, n).astype(np.float64)
+    return CandleColumns(times, opens, highs, lows, closes, volumes)
+
+
+def reference_resample(columns, seconds, offset=0, anchor=0):
+    """Resample bằng vòng lặp Python để đối chiếu"""
+    groups = {}
+    for t, o, h, l, c, v in zip(*columns):
+        key = (int(t) + offset - anchor) // seconds
+        if key not in groups:
+            groups[key] = [key * seconds + anchor - offset, o, h, l, c, v]
+        else:
+            bar = groups[key]
+            bar[2], bar[3], bar[4], bar[5] = max(bar[2], h), min(bar[3], l), c, bar[5] + v
+    return [groups[k] for k in sorted(groups)]
+
+
+@pytest.mark.parametrize("tf,seconds", [("H4", 4 * HOUR), ("H8", 8 * HOUR), ("D1", 24 * HOUR)])
+def test_resample_matches_reference(tf, seconds):
+    series = make_h1_week_series()
+    built = resample(series, "H1", tf)
+    expected = reference_resample(series, seconds)
+    np.testing.assert_allclose(np.column_stack(built), np.array(expected))
+
+
+def test_weekly_bars_start_sunday_and_skip_weekend_gap():
+    """W1 mở từ Chủ nhật 00:00; D1 không sinh nến Thứ 7/Chủ nhật"""
+    series = make_h1_week_series()
+    weekly = resample(series, "H1", "W1")
+    daily = resample(series, "H1", "D1")
+
+    assert weekly.size == 3
+    assert all(datetime.fromtimestamp(int(t), tz=timezone.utc).weekday() == 6 for t in weekly.times)
+    assert daily.size == 15
+    assert all(datetime.fromtimestamp(int(t), tz=timezone.utc).weekday() < 5 for t in daily.times)
+
+
+def test_utc_series_is_bucketed_by_broker_timezone():
+    """Chuỗi time UTC thật + broker GMT+3 => biên D1 ở 21:00 UTC"""
+    series = make_h1_week_series(weeks=1)
+    utc_series = series._replace(times=series.times - 3 * HOUR)
+    daily = resample(utc_series, "H1", "D1", utc_offset_seconds=parse_timezone_offset("GMT+3.0"))
+    np.testing.assert_array_equal(daily.times, resample(series, "H1", "D1").times - 3 * HOUR)
+
+
+def test_parse_timezone_offset_and_invalid_targets():
+    assert parse_timezone_offset("GMT+3.0") == 3 * HOUR
+    assert parse_timezone_offset("GMT-5") == -5 * HOUR
+    assert parse_timezone_offset("UTC+05:30") == parse_timezone_offset("GMT+5.5") == 5 * HOUR + 1800
+    assert parse_timezone_offset("unknown") == 0
+
+    with pytest.raises(ResampleError):
+        build_timeframes(make_h1_week_series(), "H1", ["M30"])
+    with pytest.raises(ResampleError):
+        build_timeframes(make_h1_week_series(), "H4", ["D1"])
+
+    built = build_timeframes(make_h1_week_series(), "H1", ["W1", "H4", "H1"], max_bars=50)
+    assert built["H4"].size == 50 and built["H1"].size == 50 and built["W1"].size == 3
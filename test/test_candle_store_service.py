@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test CandleStoreService (delta sync nến cho /signal, chạy với hot window in-memory)
+"""
+
+import asyncio
+import json
+import sys
+import os
+from datetime import timezone
+from unittest.mock import PropertyMock, patch
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.candle_store_service import CandleStoreService
+from app.utils.candle_codec import CandleColumns, encode_columns
+
+STEP = 3600
+
+
+def make_columns(n=300, seed=9):
+    """Chuỗi nến H1 dạng cột (time epoch int64)"""
+    rng = np.random.default_rng(seed)
+    closes = 1.30 + np.cumsum(rng.normal(0, 0.001, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0008, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0008, n)
+    volumes = rng.integers(500, 1500, n).astype(np.float64)
+    times = 1_726_000_000 + np.arange(n, dtype=np.int64) * STEP
+    return CandleColumns(times, opens, highs, lows, closes, volumes)
+
+
+def slice_columns(columns, start, end=None):
+    return CandleColumns(*(col[start:end] for col in columns))
+
+
+def delta_payload(columns, start, end=None):
+    part = slice_columns(columns, start, end)
+    return dict(encode_columns(part), since=int(part.times[0]))
+
+
+def test_delta_rebuilds_full_window():
+    """Full upload rồi delta (nến đã ack + nến mới) => cửa sổ giống upload đầy đủ"""
+    full = make_columns()
+    store = CandleStoreService(window_size=250)
+
+    first = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_columns": encode_columns(slice_columns(full, 0, 298))}}))
+    assert first["success"] and first["acks"] == {"H1": int(full.times[297])}
+
+    # Nến 297 lúc ack còn đang hình thành => gửi lại cùng 2 nến mới
+    payload = delta_payload(full, 297)
+    second = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": payload}}))
+
+    assert second["success"], second["error"]
+    assert len(json.dumps({"raw_delta": payload})) < 600
+    window = second["columns"]["H1"]
+    assert window.size == 250
+    expected = slice_columns(full, 50)
+    for actual_col, expected_col in zip(window, expected):
+        np.testing.assert_array_equal(actual_col, expected_col)
+    assert second["acks"] == {"H1": int(full.times[-1])}
+
+
+def test_delta_without_history_requires_resync():
+    """Store chưa có dữ liệu / since không khớp nến đã lưu => resync"""
+    full = make_columns()
+    store = CandleStoreService()
+    cold = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 290)}}))
+    assert not cold["success"] and cold["resync"] == ["H1"]
+
+    asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_columns": encode_columns(slice_columns(full, 0, 200))}}))
+    gap = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 250)}}))
+    assert gap["resync"] == ["H1"]
+
+
+def test_store_is_namespaced_by_timezone():
+    """Cùng symbol nhưng khác timezone broker => cửa sổ riêng"""
+    full = make_columns()
+    store = CandleStoreService()
+    asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_columns": encode_columns(slice_columns(full, 0, 280))}}))
+    other = asyncio.run(store.sync_timeframes("GMT+2.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 279)}}))
+    assert other["resync"] == ["H1"]
+
+
+class FakeCollection:
+    """Mongo collection tối giản (find / delete_many / insert_many) dùng chung giữa nhiều worker"""
+
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.docs if d["key"] == query["key"]])
+
+    async def delete_many(self, query):
+        since = query["ts"]["$gte"]
+        self.docs = [d for d in self.docs if d["key"] != query["key"] or d["ts"] < since]
+
+    async def insert_many(self, docs, ordered=False):
+        self.docs.extend(dict(d) for d in docs)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        # Mongo trả datetime naive (UTC)
+        return [dict(d, ts=d["ts"].astimezone(timezone.utc).replace(tzinfo=None)) for d in self.docs[:length]]
+
+
+def test_stale_hot_window_reloads_from_mongo():
+    """Delta tới worker có hot window cũ (worker khác đã ghi nến mới) => đọc lại Mongo, không bắt resync"""
+    full = make_columns()
+    mongo = FakeCollection()
+    worker_a, worker_b = CandleStoreService(), CandleStoreService()
+    worker_a._collection_ready = worker_b._collection_ready = True
+
+    with patch.object(CandleStoreService, "collection", new_callable=PropertyMock, return_value=mongo):
+        upload = {"H1": {"raw_columns": encode_columns(slice_columns(full, 0, 290))}}
+        assert asyncio.run(worker_a.sync_timeframes("GMT+3.0", "EURUSD", upload))["success"]
+        on_b = asyncio.run(worker_b.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 289, 295)}}))
+        assert on_b["acks"] == {"H1": int(full.times[294])}
+
+        # Hot window của A dừng ở nến 289, since (294) chỉ có trong Mongo
+        back_on_a = asyncio.run(worker_a.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 294)}}))
+
+    assert back_on_a["success"], back_on_a.get("resync")
+    np.testing.assert_array_equal(back_on_a["columns"]["H1"].times, full.times)
+    np.testing.assert_array_equal(back_on_a["columns"]["H1"].closes, full.closes)
+
+
+def test_delta_with_unordered_times_is_rejected():
+    """Delta / upload đầy đủ có time trùng / lùi => lỗi payload, cửa sổ đã lưu không đổi"""
+    full = make_columns()
+    store = CandleStoreService()
+    asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_columns": encode_columns(slice_columns(full, 0, 298))}}))
+
+    for order in ([297, 299, 298], [297, 298, 298]):
+        part = CandleColumns(*(col[order] for col in full))
+        payload = dict(encode_columns(part), since=int(full.times[297]))
+        result = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": payload}}))
+        assert not result["success"] and "strictly increasing" in result["error"]
+
+    resumed = asyncio.run(store.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_delta": delta_payload(full, 297)}}))
+    assert resumed["success"] and resumed["acks"] == {"H1": int(full.times[-1])}
+
+    # Upload đầy đủ cũng phải tăng dần: không vào hot window
+    unsorted = CandleColumns(*(col[[0, 2, 1] + list(range(3, 250))] for col in full))
+    fresh = CandleStoreService()
+    result = asyncio.run(fresh.sync_timeframes("GMT+3.0", "EURUSD", {"H1": {"raw_columns": encode_columns(unsorted)}}))
+    assert not result["success"] and "strictly increasing" in result["error"]
+    assert fresh.get_window(fresh.make_key("GMT+3.0", "EURUSD", "H1")) is None
+
+
+if __name__ == "__main__":
+    test_delta_rebuilds_full_window()
+    test_delta_without_history_requires_resync()
+    test_store_is_namespaced_by_timezone()
+    test_stale_hot_window_reloads_from_mongo()
+    test_delta_with_unordered_times_is_rejected()
+    print("✅ All candle store tests passed")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test RollingCorrelationEngine: cập nhật cuốn chiếu theo nến phải giống tính lại toàn bộ cửa sổ
+"""
+
+import sys
+import os
+import copy
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.candle_codec import CandleColumns
+from app.utils.correlation_engine import CorrelationEngineRegistry, RollingCorrelationEngine
+from app.utils.logger import NullLogger
+from app.services.risk_manager_service import RiskManagerService
+
+STEP = 3600
+START = 1_726_000_000
+SYMBOLS = ["EURUSD", "GBPUSD", "USDCHF", "XAUUSD"]
+
+
+def make_closes(n=600, seed=5):
+    """EURUSD/GBPUSD cùng chiều, USDCHF ngược chiều, XAUUSD độc lập"""
+    rng = np.random.default_rng(seed)
+    usd = rng.normal(0, 0.002, n)
+    returns = {
+        "EURUSD": usd + rng.normal(0, 0.0006, n),
+        "GBPUSD": usd + rng.normal(0, 0.0008, n),
+        "USDCHF": -usd + rng.normal(0, 0.0007, n),
+        "XAUUSD": rng.normal(0, 0.003, n),
+    }
+    return {symbol: 1.2 * np.exp(np.cumsum(r)) for symbol, r in returns.items()}
+
+
+def window(closes, end, size=300, missing=()):
+    """Cửa sổ nến [end - size, end] (nến end đang hình thành), bỏ các nến trong missing"""
+    index = np.array([i for i in range(max(0, end - size), end + 1) if i not in missing], dtype=np.int64)
+    c = closes[index]
+    return CandleColumns(START + index * STEP, c, c, c, c, np.ones(index.size))
+
+
+def reference_matrix(closes, last_closed, size, missing):
+    """Tính lại toàn bộ: căn theo mốc chung, thiếu nến => giá trước đó, size lợi suất cuối"""
+    timeline = np.arange(last_closed - size, last_closed + 1)
+    aligned = []
+    for symbol in SYMBOLS:
+        present = np.array([i for i in range(last_closed + 1) if i not in missing.get(symbol, ())])
+        aligned.append(np.log(closes[symbol][present[np.searchsorted(present, timeline, side='right') - 1]]))
+    return np.corrcoef(np.diff(np.array(aligned), axis=1))
+
+
+def test_incremental_updates_match_full_recompute():
+    closes = make_closes()
+    missing = {"XAUUSD": {350, 351, 420}}
+    engine = RollingCorrelationEngine(window=120, min_bars=30, max_symbols=10, stale_bars=24)
+    for symbol in SYMBOLS:
+        assert engine.update(symbol, window(closes[symbol], 300, missing=missing.get(symbol, ())))
+    rebuilds = engine.rebuilds
+
+    for end in range(301, 560):
+        # Symbol gửi nến lệch nhau: EURUSD luôn đi trước, các symbol còn lại theo sau
+        for symbol in SYMBOLS:
+            engine.update(symbol, window(closes[symbol], end, missing=missing.get(symbol, ())))
+        # Thiếu nến ngay trước nến đang hình thành => nến cuối nhận được coi là chưa đóng, chốt chậm vài nhịp
+        last_closed = (engine._last_time - START) // STEP
+        assert engine.bars == 120 and end - 4 < last_closed <= end - 1
+        np.testing.assert_allclose(engine.matrix(), reference_matrix(closes, last_closed, 120, missing), atol=1e-9)
+    # Cập nhật tăng dần, không dựng lại cửa sổ
+    assert engine.rebuilds == rebuilds
+
+    corr = dict(zip(SYMBOLS, engine.matrix()[0]))
+    assert corr["GBPUSD"] > 0.8 and corr["USDCHF"] < -0.8 and abs(corr["XAUUSD"]) < 0.3
+    assert engine.correlated("EURUSD", 0.7) == sorted(["GBPUSD", "USDCHF"], key=lambda s: -abs(corr[s]))
+    assert engine.clusters(0.7) == [["EURUSD", "GBPUSD", "USDCHF"]]
+
+
+def test_stale_symbol_does_not_block_and_rebuilds_on_return():
+    closes = make_closes(seed=8)
+    engine = RollingCorrelationEngine(window=100, min_bars=30, max_symbols=10, stale_bars=5)
+    for symbol in SYMBOLS:
+        engine.update(symbol, window(closes[symbol], 300))
+    # XAUUSD ngừng gửi nến: các symbol khác vẫn chốt được mốc mới (XAUUSD giữ giá cũ)
+    for end in range(301, 320):
+        for symbol in SYMBOLS[:3]:
+            engine.update(symbol, window(closes[symbol], end))
+    assert engine._last_time == START + 318 * STEP
+    # XAUUSD quay lại với đủ lịch sử => tính lại đúng như chưa từng bị chậm
+    engine.update("XAUUSD", window(closes["XAUUSD"], 319))
+    np.testing.assert_allclose(engine.matrix(), reference_matrix(closes, 318, 100, {}), atol=1e-9)
+
+    # Chưa đủ min_bars / symbol lạ / time không phải epoch
+    short = RollingCorrelationEngine(window=100, min_bars=30, max_symbols=1, stale_bars=5)
+    assert short.update("EURUSD", window(closes["EURUSD"], 20))
+    assert short.matrix() is None and short.correlations("EURUSD") is None
+    assert not short.update("GBPUSD", window(closes["GBPUSD"], 20))
+    assert not short.update("EURUSD", CandleColumns(["2024.01.01 00:00"] * 3, *(np.ones(3),) * 5))
+
+
+def test_rolling_groups_drive_risk_manager_correlation():
+    closes = make_closes()
+    registry = CorrelationEngineRegistry(timeframe="H1", window=120, min_bars=30, max_symbols=10, stale_bars=24)
+    for symbol in SYMBOLS:
+        assert registry.observe("+03:00", symbol, {"H1": window(closes[symbol], 400), "H4": None})
+    assert not registry.observe("+03:00", "EURUSD", {"M15": window(closes["EURUSD"], 400)})
+    assert registry.correlation_groups("+00:00", "EURUSD") is None
+    assert registry.correlation_groups("+03:00", "AUDUSD") is None
+
+    groups = registry.correlation_groups("+03:00", "EURUSD", threshold=0.7)
+    assert set(groups["ROLLING:EURUSD"]) == {"EURUSD", "GBPUSD", "USDCHF"}
+    snapshot = registry.snapshot("+03:00", threshold=0.7)
+    assert snapshot["symbols"] == SYMBOLS and snapshot["clusters"] == [["EURUSD", "GBPUSD", "USDCHF"]]
+    assert snapshot["matrix"][0][0] == 1.0
+
+    params = {
+        "proposed_signal_json": {"symbol": "EURUSD", "signal_type": "BUY", "order_type_proposed": "MARKET",
+                                 "entry_price_proposed": 1.1000, "stop_loss_proposed": 1.0950,
+                                 "take_profit_proposed": 1.1100, "estimate_win_probability": 72},
+        "account_info_json": {"login": 1, "equity": 5000, "balance": 5000, "profit": 0.0, "leverage": 100},
+        "symbol_info": {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01,
+                        "trade_tick_value": 1.0, "trade_tick_size": 0.00001, "trade_contract_size": 100000},
+        "portfolio_exposure_json": {
+            "active_positions": [{"symbol": "GBPUSD", "type": "BUY", "profit": 5.0},
+                                 {"symbol": "USDCHF", "type": "SELL", "profit": 1.0},
+                                 {"symbol": "XAUUSD", "type": "BUY", "profit": 2.0}],
+            "pending_orders": [],
+            "summary": {"total_potential_loss_from_portfolio_usd": 40.0, "total_margin_used_from_portfolio_usd": 300.0}
+        },
+        "balance_config": {"max_risk": 2.0, "total_max_risk": 6.0, "max_position": 5},
+        "correlation_groups_json": {},
+        "symbol": {"origin_name": "EURUSD"}
+    }
+    risk = RiskManagerService(logger=NullLogger())
+    without_groups = risk._analyze_risk_enhanced(copy.deepcopy(params), NullLogger())
+    rolling = risk._analyze_risk_enhanced(dict(copy.deepcopy(params), correlation_groups_json=groups), NullLogger())
+    static = risk._analyze_risk_enhanced(
+        dict(copy.deepcopy(params), correlation_groups_json={"USD": ["EURUSD", "GBPUSD", "USDCHF"]}), NullLogger()
+    )
+    # Nhóm theo ngưỡng = nhóm cố định tương ứng; có vị thế tương quan => lot nhỏ hơn
+    assert rolling == static
+    assert rolling["lot_size"] < without_groups["lot_size"]
+
+
+if __name__ == "__main__":
+    test_incremental_updates_match_full_recompute()
+    test_stale_symbol_does_not_block_and_rebuilds_on_return()
+    test_rolling_groups_drive_risk_manager_correlation()
+    print("✅ All correlation engine tests passed")
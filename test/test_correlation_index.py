@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test CorrelationIndex: cùng nhóm / cùng vị thế tương quan như cách duyệt correlation_groups_json cũ
+"""
+
+import sys
+import os
+import copy
+import random
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.correlation_index import NOT_INDEXED, CorrelationIndexCache
+from app.utils.risk_rules import PortfolioSnapshot
+
+
+SYMBOLS = ["EURUSD", "GBPUSD", "AUDUSD", "NZDUSD", "USDJPY", "EURJPY", "XAUUSD", "US30", "BTCUSD"]
+
+
+def legacy_correlated(correlation_groups, symbol, active_positions):
+    """Cách duyệt cũ của _apply_portfolio_adjustments"""
+    current_symbol_group = None
+    for group_name, group_symbols in correlation_groups.items():
+        if symbol in group_symbols:
+            current_symbol_group = group_name
+            break
+    if not current_symbol_group:
+        return False, []
+    return True, [p.get('symbol') for p in active_positions if p.get('symbol') in correlation_groups.get(current_symbol_group, [])]
+
+
+def random_groups(rng):
+    names = rng.sample(["USD_MAJORS", "JPY", "METALS", "", "INDICES", "CRYPTO"], rng.randint(1, 5))
+    return {name: rng.sample(SYMBOLS, rng.randint(1, 4)) for name in names}
+
+
+def test_index_matches_group_scan():
+    rng = random.Random(3)
+    for _ in range(500):
+        groups = random_groups(rng)
+        symbol = rng.choice(SYMBOLS)
+        active = [{"symbol": rng.choice(SYMBOLS + [None]), "type": "BUY", "profit": 1.0} for _ in range(rng.randint(0, 6))]
+        snapshot = PortfolioSnapshot.build({"active_positions": active}, symbol, "BUY", groups)
+        assert (snapshot.in_correlation_group, snapshot.correlated_symbols) == legacy_correlated(groups, symbol, active)
+
+    # Dạng không dựng được index (giá trị là chuỗi, symbol không hashable) => duyệt như cũ
+    for groups, symbol, active in (({"FX": "EURUSD,GBPUSD"}, "EURUSD", [{"symbol": "GBPUSD"}]),
+                                   ({"FX": ["EURUSD", ["GBPUSD"]]}, "EURUSD", [{"symbol": ["GBPUSD"]}]),
+                                   ({"FX": ["EURUSD", "GBPUSD"]}, "EURUSD", [{"symbol": ["GBPUSD"]}, {"symbol": "GBPUSD"}])):
+        snapshot = PortfolioSnapshot.build({"active_positions": active}, symbol, "BUY", groups)
+        assert (snapshot.in_correlation_group, snapshot.correlated_symbols) == legacy_correlated(groups, symbol, active)
+
+
+def test_index_is_shared_by_content():
+    cache = CorrelationIndexCache(max_entries=2)
+    groups = {"USD_MAJORS": ["EURUSD", "GBPUSD"], "JPY": ["USDJPY", "EURUSD"], "METALS": ["XAUUSD"]}
+    assert cache.lookup(groups, "EURUSD")[1] == frozenset({"EURUSD", "GBPUSD"})
+    index = cache._last[1]
+    assert index.groups_of["EURUSD"] == ("USD_MAJORS", "JPY")
+
+    # Request khác cùng nội dung => dùng lại index; nhóm sau nhóm của symbol không ảnh hưởng kết quả
+    assert cache.lookup(copy.deepcopy(groups), "GBPUSD")[1] == frozenset({"EURUSD", "GBPUSD"})
+    changed_tail = dict(copy.deepcopy(groups), METALS=["XAUUSD", "XAGUSD"])
+    assert cache.lookup(changed_tail, "EURUSD")[1] == frozenset({"EURUSD", "GBPUSD"})
+    assert cache._last[1] is index and cache.get_metrics()["hits"] == 2
+    # Cùng object nhưng symbol cần nhóm chưa được xác nhận => so sánh lại (nhóm METALS khác => index mới)
+    assert cache.lookup(changed_tail, "XAGUSD")[1] == frozenset({"XAUUSD", "XAGUSD"})
+    assert cache._last[1] is not index
+
+    # Thứ tự nhóm quyết định nhóm của symbol
+    assert cache.lookup({"JPY": ["USDJPY", "EURUSD"], "USD_MAJORS": ["EURUSD", "GBPUSD"]}, "EURUSD")[1] == frozenset({"USDJPY", "EURUSD"})
+    assert cache.lookup({"FX": "EURUSD"}, "EURUSD") is NOT_INDEXED
+    assert cache.lookup(groups, ["EURUSD"]) is NOT_INDEXED
+    assert cache.get_metrics()["entries"] <= cache.max_entries
+
+
+if __name__ == "__main__":
+    test_index_matches_group_scan()
+    test_index_is_shared_by_content()
+    print("✅ All correlation index tests passed")
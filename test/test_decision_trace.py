@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test DecisionTrace: /risk_manager mặc định chỉ ghi trường quyết định + 1 dòng tổng kết, trace=True ghi log chi tiết
+"""
+
+import sys
+import os
+import copy
+import json
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.risk_manager_service import RiskManagerService
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "app", "tests", "final_risk_manager", "test_cases.json")
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.lines = []
+
+    def debug(self, message):
+        self.lines.append(('debug', message))
+
+    def info(self, message):
+        self.lines.append(('info', message))
+
+    def warning(self, message, exc_info=False):
+        self.lines.append(('warning', message))
+
+    def error(self, message, exc_info=False):
+        self.lines.append(('error', message))
+
+    def critical(self, message, exc_info=False):
+        self.lines.append(('critical', message))
+
+
+def run(params):
+    logger = RecordingLogger()
+    with patch("app.services.risk_manager_service.response_logger") as response_logger:
+        result = RiskManagerService(logger=logger).analyze_risk(copy.deepcopy(params))
+    return result, logger.lines, response_logger.log_risk_manager_response.call_args.kwargs
+
+
+def test_trace_is_compact_by_default_and_verbose_on_request():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        cases = json.load(f)
+    statuses = set()
+    for case in cases:
+        result, lines, logged = run(case["params"])
+        verbose_result, verbose_lines, verbose_logged = run(dict(case["params"], trace=True))
+        statuses.add(result["status"])
+
+        # Cùng quyết định, cùng trace cho response log
+        assert result == verbose_result
+        assert logged["decision_trace"] == verbose_logged["decision_trace"]
+        assert logged["decision_trace"]["status"] == result["status"]
+
+        # Mặc định: không dump params, chỉ 1 dòng info (lỗi vẫn ghi ngay)
+        assert [level for level, _ in lines if level != "error"] == ["info"]
+        assert "RISK MANAGER" in lines[-1][1] and f"status={result['status']}" in lines[-1][1]
+        assert any("=== PARAMS:" in message for _, message in verbose_lines)
+        assert len(verbose_lines) > 10
+
+        if result["status"] == "CONTINUE":
+            trace = logged["decision_trace"]
+            assert trace["pre_flight"] == "CONTINUE" and trace["margin_lot"] == result["lot_size"]
+            assert {"profile", "base_lot", "adjusted_lot", "adjustments", "estimate_loss"} <= set(trace)
+    assert "CONTINUE" in statuses and len(statuses) > 1
+
+
+def test_trace_setting_enables_verbose_logging():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        params = json.load(f)[0]["params"]
+    with patch("app.services.risk_manager_service.settings.RISK_MANAGER_TRACE", True):
+        _, lines, _ = run(params)
+    assert any("=== PARAMS:" in message for _, message in lines)
+
+
+if __name__ == "__main__":
+    test_trace_is_compact_by_default_and_verbose_on_request()
+    test_trace_setting_enables_verbose_logging()
+    print("✅ All decision trace tests passed")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test ExecutorManager (process pool CPU-bound + thread pool I/O, hàng đợi giới hạn)
+"""
+
+import asyncio
+import sys
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.executor import ExecutorManager, ExecutorQueueFullError
+from app.utils.candle_codec import rows_to_columns
+from app.utils.logger import Logger
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor, analyze_timeframe
+from app.services.signal_service import SignalService
+
+
+def make_candles(n=250, step=7200, seed=5):
+    """Chuỗi nến random-walk theo format raw_data"""
+    rng = np.random.default_rng(seed)
+    closes = 1.25 + np.cumsum(rng.normal(0, 0.001, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0008, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0008, n)
+    return [
+        {"time": 1_726_000_000 + i * step, "open": float(opens[i]), "high": float(highs[i]),
+         "low": float(lows[i]), "close": float(closes[i]), "tick_volume": int(rng.integers(500, 1500))}
+        for i in range(n)
+    ]
+
+
+def test_runs_inline_when_not_started():
+    """Chưa start (script/test) => chạy inline, metrics mode inline"""
+    manager = ExecutorManager(process_workers=1, thread_workers=1)
+    assert asyncio.run(manager.run_cpu(sum, [1, 2, 3])) == 6
+    assert manager.get_metrics()["cpu"]["mode"] == "inline"
+
+
+def test_cpu_task_runs_in_process_pool():
+    """analyze_timeframe chạy trong process pool cho kết quả giống chạy trực tiếp"""
+    columns = rows_to_columns(make_candles(250))
+    manager = ExecutorManager(process_workers=1, thread_workers=1)
+    manager.start()
+    try:
+        result = asyncio.run(manager.run_cpu(analyze_timeframe, columns, 0.0001))
+    finally:
+        manager.shutdown()
+
+    assert result == analyze_timeframe(columns, 0.0001)
+    metrics = manager.get_metrics()["cpu"]
+    assert metrics["completed"] == 1 and metrics["in_flight"] == 0
+
+
+def test_bounded_queue_rejects_when_full():
+    """1 worker + queue 0 => request thứ 2 đồng thời bị từ chối, metrics ghi nhận rejected"""
+    manager = ExecutorManager(process_workers=0, thread_workers=1, thread_max_queue=0)
+    manager.start()
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(manager.run_io(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorQueueFullError):
+            await manager.run_io(len, "x")
+        release.set()
+        return await first
+
+    try:
+        assert asyncio.run(scenario()) is True
+    finally:
+        manager.shutdown()
+    assert manager.get_metrics()["io"]["rejected"] == 1
+
+
+def test_cache_waiters_do_not_hold_io_threads():
+    """Request trùng chờ cache trên event loop: IO pool 1 thread vẫn phục vụ Redis I/O khác trong lúc chờ"""
+    manager = ExecutorManager(process_workers=0, thread_workers=1, thread_max_queue=8)
+    manager.start()
+    service = SignalService(redis_client=MagicMock())
+    service.cache_wait_timeout = 3
+    cache = {}
+    service.redis_client.get.side_effect = cache.get
+
+    async def scenario():
+        waiters = [asyncio.ensure_future(service._wait_for_cache("signal:GMT+3.0:H4:EURUSD")) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        assert await asyncio.wait_for(manager.run_io(len, "x"), timeout=1) == 1
+        cache["signal:GMT+3.0:H4:EURUSD"] = {"signal_type": "BUY"}
+        return await asyncio.gather(*waiters)
+
+    try:
+        with patch("app.services.signal_service.executor_manager", manager):
+            assert asyncio.run(scenario()) == [{"signal_type": "BUY"}] * 4
+            service.cache_wait_timeout = 0
+            assert asyncio.run(service._wait_for_cache("signal:GMT+3.0:H4:GBPUSD")) is None
+    finally:
+        manager.shutdown()
+
+
+def test_async_processor_matches_sync():
+    """process_multi_timeframes_async cho cùng kết quả với bản đồng bộ"""
+    processor = MultiTimeframesProcessor(Logger("test_executor"))
+    by_sync = {"H4": {"indicators": {"rsi": 50.0}, "raw_data": make_candles(250, step=14400)}}
+    by_async = {"H4": {"indicators": {"rsi": 50.0}, "raw_data": make_candles(250, step=14400)}}
+
+    processor.process_multi_timeframes("EURUSD", {"point": 1e-05, "digits": 5}, by_sync, "signal_generation")
+    result = asyncio.run(processor.process_multi_timeframes_async("EURUSD", {"point": 1e-05, "digits": 5}, by_async, "signal_generation"))
+
+    assert result["success"], result.get("error")
+    assert by_async["H4"]["analyze_price_action"] == by_sync["H4"]["analyze_price_action"]
+
+
+if __name__ == "__main__":
+    test_runs_inline_when_not_started()
+    test_cpu_task_runs_in_process_pool()
+    test_bounded_queue_rejects_when_full()
+    test_cache_waiters_do_not_hold_io_threads()
+    test_async_processor_matches_sync()
+    print("✅ All executor tests passed")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test IndicatorEngine (rolling indicators incremental theo symbol/timeframe)
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import Logger
+from app.utils.indicator_engine import IndicatorEngine, IndicatorState, indicator_engine
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor
+from app.services.prompt_service import PromptService
+
+INDICATOR_KEYS = ["rsi", "macd", "bollinger_bands", "atr", "adx", "sma_100", "sma_200", "volume_sma_250"]
+
+
+def make_series(n=400, seed=3):
+    """OHLCV arrays random-walk + time epoch (H1)"""
+    rng = np.random.default_rng(seed)
+    closes = 1.10 + np.cumsum(rng.normal(0, 0.001, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.001, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.001, n)
+    volumes = rng.integers(100, 900, n).astype(np.float64)
+    times = [1_700_000_000 + i * 3600 for i in range(n)]
+    return times, opens, highs, lows, closes, volumes
+
+
+def assert_snapshots_close(actual, expected):
+    assert list(actual) == INDICATOR_KEYS
+    for key in INDICATOR_KEYS:
+        np.testing.assert_allclose(np.asarray(actual[key], dtype=float), np.asarray(expected[key], dtype=float),
+                                   rtol=1e-9, atol=1e-12, err_msg=key)
+
+
+def test_batch_matches_bar_by_bar():
+    """Cold batch (vectorized) phải cho kết quả giống push từng nến"""
+    series = make_series()
+    state = IndicatorState()
+    for bar in zip(*series):
+        state.push(*bar)
+
+    assert_snapshots_close(IndicatorState.from_arrays(*series).snapshot(), state.snapshot())
+
+
+def test_incremental_update_and_forming_bar_replacement():
+    """Nến mới được đẩy incremental; nến cuối đổi giá được rollback rồi cập nhật lại"""
+    times, opens, highs, lows, closes, volumes = make_series()
+    engine = IndicatorEngine()
+
+    engine.update("EURUSD", "H1", times[:300], opens[:300], highs[:300], lows[:300], closes[:300], volumes[:300])
+    forming = closes.copy()
+    forming[299] += 0.0007
+    engine.update("EURUSD", "H1", times[:300], opens[:300], highs[:300], lows[:300], forming[:300], volumes[:300])
+    # Client gửi cửa sổ trượt 350 nến mới nhất
+    snapshot = engine.update("EURUSD", "H1", times[50:], opens[50:], highs[50:], lows[50:], closes[50:], volumes[50:])
+
+    assert engine.stats["cold_builds"] == 1
+    assert engine.stats["incremental_updates"] == 2
+    assert_snapshots_close(snapshot, IndicatorState.from_arrays(times, opens, highs, lows, closes, volumes).snapshot())
+
+
+def test_discontinuous_data_triggers_cold_rebuild():
+    """Dữ liệu không nối tiếp state hiện tại => build lại từ đầu"""
+    times, opens, highs, lows, closes, volumes = make_series()
+    engine = IndicatorEngine()
+    engine.update("EURUSD", "H1", times[:100], opens[:100], highs[:100], lows[:100], closes[:100], volumes[:100])
+    engine.update("EURUSD", "H1", times[200:], opens[200:], highs[200:], lows[200:], closes[200:], volumes[200:])
+    assert engine.stats["cold_builds"] == 2
+
+
+def test_state_is_namespaced_by_broker_timezone_and_bounded():
+    """2 broker khác timezone (time lệch 1 giờ) không build lại state của nhau; số state giới hạn theo LRU"""
+    times, opens, highs, lows, closes, volumes = make_series()
+    shifted, other_closes = [t + 3600 for t in times], closes + 0.0001  # Broker thứ 2: feed lệch nhẹ
+    engine = IndicatorEngine(max_states=2)
+    for end in (300, 301, 302):
+        engine.update("EURUSD", "H1", times[:end], opens[:end], highs[:end], lows[:end], closes[:end], volumes[:end], namespace="GMT+2.0")
+        engine.update("EURUSD", "H1", shifted[:end], opens[:end], highs[:end], lows[:end], other_closes[:end], volumes[:end], namespace="GMT+3.0")
+    assert engine.stats["cold_builds"] == 2 and engine.stats["incremental_updates"] == 4
+    assert engine.get_snapshot("EURUSD", "H1", "GMT+2.0")["sma_100"] != engine.get_snapshot("EURUSD", "H1", "GMT+3.0")["sma_100"]
+    assert engine.get_snapshot("EURUSD", "H1") is None
+
+    # State ít dùng nhất (GMT+2.0) bị loại khi vượt max_states
+    engine.update("GBPUSD", "H1", times[:300], opens[:300], highs[:300], lows[:300], closes[:300], volumes[:300], namespace="GMT+3.0")
+    assert engine.get_snapshot("EURUSD", "H1", "GMT+2.0") is None and engine.stats["evictions"] == 1
+    assert engine.get_snapshot("EURUSD", "H1", "GMT+3.0") is not None
+
+
+def test_not_enough_bars_returns_none_values():
+    """Chưa đủ nến cho chu kỳ dài => None thay vì giá trị sai"""
+    snapshot = IndicatorState.from_arrays(*[series[:150] for series in make_series()]).snapshot()
+    assert snapshot["sma_200"] is None and snapshot["volume_sma_250"] is None
+    assert snapshot["sma_100"] is not None and snapshot["rsi"] is not None
+
+
+def test_processor_and_prompt_use_engine_indicators():
+    """Timeframe không có indicators => processor tính từ raw_data, PromptService dùng snapshot"""
+    times, opens, highs, lows, closes, volumes = make_series(260)
+    raw_data = [
+        {"time": times[i], "open": opens[i], "high": highs[i], "low": lows[i], "close": closes[i], "tick_volume": volumes[i]}
+        for i in range(len(times))
+    ]
+    indicator_engine.reset(symbol="TESTENGINE")
+    processor = MultiTimeframesProcessor(Logger("test_indicator_engine"))
+    multi_timeframes = {"H1": {"raw_data": raw_data}}
+
+    result = processor.process_multi_timeframes("TESTENGINE", {"point": 1e-05, "digits": 5}, multi_timeframes, "signal_generation")
+
+    assert result["success"], result.get("error")
+    assert list(multi_timeframes["H1"]["indicators"]) == INDICATOR_KEYS
+
+    attached = PromptService()._attach_engine_indicators("TESTENGINE", {"H1": {"analyze_price_action": {}}})
+    assert attached["H1"]["indicators"] == multi_timeframes["H1"]["indicators"]
+    indicator_engine.reset(symbol="TESTENGINE")
+
+
+if __name__ == "__main__":
+    test_batch_matches_bar_by_bar()
+    test_incremental_update_and_forming_bar_replacement()
+    test_discontinuous_data_triggers_cold_rebuild()
+    test_state_is_namespaced_by_broker_timezone_and_bounded()
+    test_not_enough_bars_returns_none_values()
+    test_processor_and_prompt_use_engine_indicators()
+    print("✅ All indicator engine tests passed")
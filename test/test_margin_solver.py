@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test margin_solver: binary search / closed form phải cho cùng lot với vòng lặp tuyến tính cũ
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.risk_manager_service import RiskManagerService
+from app.utils.margin_solver import MarginIndex, MarginModel, candidate_units, closed_form_margin, get_margin_model
+
+
+class NullLogger:
+    """Logger không ghi gì (vòng lặp tuyến tính log rất nhiều dòng)"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def make_margin_map(max_lot, margin_per_lot, step=0.01, gaps=(), jitter=None):
+    """Map lot -> margin như EA gửi lên (có thể thiếu vài lot / không đơn điệu)"""
+    margin_map, lot = {}, step
+    while lot <= max_lot:
+        key = f"{lot:.2f}"
+        if key not in gaps:
+            margin_map[key] = round(lot * margin_per_lot, 2)
+        lot = round(lot + step, 2)
+    if jitter:
+        for key, delta in jitter.items():
+            if key in margin_map:
+                margin_map[key] += delta
+    return margin_map
+
+
+def solve_both(service, initial_lot, account_info, portfolio, margin_map=None, margin_fn=None, step=0.01):
+    linear = service._search_margin_lot_linear(
+        initial_lot, 0.01, step, account_info, portfolio,
+        margin_fn or (lambda lot: margin_map.get(f"{lot:.2f}")), NullLogger()
+    )
+    solution = service._solve_margin_lot(initial_lot, 0.01, step, account_info, portfolio, margin_map, margin_fn)
+    return linear, solution
+
+
+def test_binary_search_matches_linear_walk():
+    """Random tài khoản / map (kể cả map thiếu lot và không đơn điệu) => cùng lot với vòng lặp cũ"""
+    service = RiskManagerService(logger=NullLogger())
+    rng = np.random.default_rng(3)
+    for _ in range(100):
+        equity = float(rng.uniform(100, 50_000))
+        portfolio = {"summary": {"total_margin_used_from_portfolio_usd": float(rng.uniform(0, equity * 0.5))}}
+        margin_map = make_margin_map(
+            max_lot=float(rng.choice([1.0, 5.0, 20.0])), margin_per_lot=float(rng.uniform(20, 5000)),
+            gaps={f"{v:.2f}" for v in rng.uniform(0.01, 5, 5)},
+            jitter={"0.50": float(rng.uniform(-5, 5))} if rng.random() < 0.3 else None
+        )
+        initial_lot = round(float(rng.uniform(0.01, 25)), 2)
+        linear, solution = solve_both(service, initial_lot, {"equity": equity}, portfolio, margin_map)
+        assert solution is not None
+        assert solution.lot == linear
+
+
+def test_closed_form_matches_linear_walk_and_script_formula():
+    service = RiskManagerService(logger=NullLogger())
+    margin_fn = service._margin_model_fn(
+        None, {"entry_price_proposed": 1.17}, {"leverage": 500}, {"trade_contract_size": 100000}
+    )
+    assert margin_fn(0.37) == closed_form_margin(0.37, 100000, 1.17, 500) == round(0.37 * 100000 * 1.17 / 500, 2)
+
+    for equity in (150.0, 1000.0, 25_000.0):
+        portfolio = {"summary": {"total_margin_used_from_portfolio_usd": equity * 0.1}}
+        linear, solution = solve_both(service, 50.0, {"equity": equity}, portfolio, margin_fn=margin_fn)
+        assert solution.lot == linear
+        assert solution.probes < 20
+
+
+def test_unsupported_inputs_fall_back_to_linear():
+    service = RiskManagerService(logger=NullLogger())
+    portfolio = {"summary": {"total_margin_used_from_portfolio_usd": 0.0}}
+    margin_map = make_margin_map(1.0, 100.0)
+    assert candidate_units(0.5, 0.01, 0.005) is None
+    assert service._solve_margin_lot(0.5, 0.01, 0.01, {"equity": 0}, portfolio, margin_map) is None
+    assert service._solve_margin_lot(0.5, 0.01, 0.01, {"equity": 1000}, portfolio, {"0.10": "abc"}) is None
+    assert service._margin_model_fn(None, {"entry_price_proposed": 1.1}, {}, {"trade_contract_size": 100000}) is None
+
+
+def test_margin_model_tiers_rate_and_cache():
+    """Bậc leverage tính lũy tiến, margin_rate quy đổi tiền tệ, model cache theo account/symbol"""
+    model = MarginModel.from_dict({
+        "contract_size": 100000, "leverage": 100, "margin_rate": 1.1,
+        "tiers": [{"up_to_lot": 1, "leverage": 500}, {"up_to_lot": 5, "leverage": 200}]
+    }, entry_price=1.0)
+    assert model.margin(0.5) == round(0.5 * 110000 / 500, 2)
+    assert model.margin(3) == round(110000 / 500 + 2 * 110000 / 200, 2)
+    assert model.margin(7) == round(110000 / 500 + 4 * 110000 / 200 + 2 * 110000 / 100, 2)
+
+    assert MarginModel.from_dict({"contract_size": 100000, "leverage": 0}, 1.0) is None
+    assert MarginModel.from_dict({"contract_size": 100000, "leverage": 100,
+                                  "tiers": [{"up_to_lot": 5, "leverage": 500}, {"up_to_lot": 1, "leverage": 200}]}, 1.0) is None
+
+    params = {"contract_size": 100, "leverage": 100}
+    first = get_margin_model(123, "XAUUSD", params, 2400.0)
+    assert get_margin_model(123, "XAUUSD", params, 2400.0) is first
+    assert get_margin_model(456, "XAUUSD", params, 2400.0) is not first
+    assert get_margin_model(123, "XAUUSD", params, 2401.0) is not first
+
+
+def test_index_ignores_keys_linear_walk_never_reads():
+    """Vòng lặp cũ chỉ tra key f"{lot:.2f}" => "0.1" hoặc value None không được dùng"""
+    index = MarginIndex.from_map({"0.1": 5.0, "0.10": 10.0, "0.20": None, "x": 1.0})
+    assert index.units.tolist() == [10]
+    found, margins = index.lookup(np.array([20, 10], dtype=np.int64))
+    assert found.tolist() == [False, True] and margins.tolist() == [10.0]
+
+
+def test_analyze_risk_without_margin_map_uses_closed_form():
+    service = RiskManagerService(logger=NullLogger())
+    params = {
+        "proposed_signal_json": {
+            "symbol": "EURUSD", "signal_type": "BUY", "order_type_proposed": "MARKET",
+            "entry_price_proposed": 1.1000, "stop_loss_proposed": 1.0950, "take_profit_proposed": 1.1075,
+            "estimate_win_probability": 70
+        },
+        "account_info_json": {"equity": 10000, "balance": 10000, "profit": 0, "leverage": 500},
+        "symbol_info": {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01,
+                        "trade_tick_value": 1.0, "trade_tick_size": 0.00001, "trade_contract_size": 100000},
+        "portfolio_exposure_json": {"active_positions": [], "pending_orders": [], "summary": {}},
+        "balance_config": {"max_risk": 2.0, "total_max_risk": 6.0, "max_position": 5},
+        "correlation_groups_json": {},
+        "symbol": {"origin_name": "EURUSD"}
+    }
+    with_formula = service._analyze_risk_enhanced(params, NullLogger())
+    params["margin_model"] = {"contract_size": 100000, "leverage": 500, "margin_rate": 1.0, "price": None, "tiers": None}
+    with_model = service._analyze_risk_enhanced(params, NullLogger())
+    params["lot_size_to_margin_map"] = make_margin_map(5.0, 220.0)
+    with_map = service._analyze_risk_enhanced(params, NullLogger())
+
+    assert with_formula["status"] == "CONTINUE"
+    assert with_formula["lot_size"] == with_model["lot_size"] == with_map["lot_size"] == 0.24
+
+
+if __name__ == "__main__":
+    test_binary_search_matches_linear_walk()
+    test_closed_form_matches_linear_walk_and_script_formula()
+    test_unsupported_inputs_fall_back_to_linear()
+    test_margin_model_tiers_rate_and_cache()
+    test_index_ignores_keys_linear_walk_never_reads()
+    test_analyze_risk_without_margin_map_uses_closed_form()
+    print("✅ All margin solver tests passed")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test MarketHours: phiên tuần theo giờ New York (DST), ngày nghỉ theo giờ broker và /signal ngoài giờ giao dịch không gọi AI
+"""
+
+import sys
+import os
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.market_hours import MarketHours, parse_week_time
+from app.services.signal_service import SignalService
+
+BROKER_OFFSET = 3 * 3600  # GMT+3
+
+
+def utc(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_weekly_session_and_holidays():
+    calendar = MarketHours("FRI 22:00", "SUN 22:00", "UTC", ["2026-12-25", " "])
+    # 2026-10-16 là thứ Sáu
+    assert calendar.status(utc(2026, 10, 16, 21, 59)) == (True, "Market is open")
+    assert calendar.status(utc(2026, 10, 16, 22, 0)) == (False, "Market closed - Weekend")
+    assert not calendar.status(utc(2026, 10, 17, 12, 0))[0]
+    assert not calendar.status(utc(2026, 10, 18, 21, 59))[0]
+    assert calendar.status(utc(2026, 10, 18, 22, 0))[0]
+    assert calendar.next_open(utc(2026, 10, 17, 12, 0)) == utc(2026, 10, 18, 22, 0)
+    assert calendar.next_open(utc(2026, 10, 20, 9, 0)) == utc(2026, 10, 20, 9, 0)
+
+    # Ngày nghỉ tính theo ngày của broker: 24/12 21:00 UTC đã là 25/12 ở GMT+3
+    assert calendar.status(utc(2026, 12, 24, 21, 0)) == (True, "Market is open")
+    assert calendar.status(utc(2026, 12, 24, 21, 0), BROKER_OFFSET) == (False, "Market closed - Holiday 2026-12-25")
+    assert calendar.next_open(utc(2026, 12, 24, 21, 0), BROKER_OFFSET) == utc(2026, 12, 25, 21, 0)
+
+    # Ngày nghỉ ngay trước cuối tuần => mở lại sau cuối tuần
+    friday_holiday = MarketHours("FRI 22:00", "SUN 22:00", "UTC", holidays=["2026-10-16"])
+    assert friday_holiday.next_open(utc(2026, 10, 16, 8, 0)) == utc(2026, 10, 18, 22, 0)
+
+    # Phiên không vắt qua đầu tuần (close < open theo thứ tự tuần)
+    short_week = MarketHours("SAT 00:00", "MON 01:00", "UTC")
+    assert not short_week.status(utc(2026, 10, 19, 0, 30))[0] and short_week.status(utc(2026, 10, 19, 1, 0))[0]
+    assert parse_week_time("mon 01:30") == 5400
+    for text in ("FRIDAY 22:00", "FRI", "FRI xx:00"):
+        with pytest.raises(ValueError):
+            parse_week_time(text)
+
+
+def test_weekly_session_follows_new_york_dst():
+    calendar = MarketHours()
+    # Giờ mùa hè (EDT): đóng / mở lúc 21:00 UTC
+    assert calendar.status(utc(2026, 10, 16, 20, 59))[0] and not calendar.status(utc(2026, 10, 16, 21, 0))[0]
+    assert not calendar.status(utc(2026, 10, 18, 20, 59))[0] and calendar.status(utc(2026, 10, 18, 21, 0))[0]
+    # Giờ mùa đông (EST): 22:00 UTC
+    assert calendar.status(utc(2026, 12, 4, 21, 30))[0] and not calendar.status(utc(2026, 12, 4, 22, 0))[0]
+    assert calendar.next_open(utc(2026, 12, 5, 12, 0)) == utc(2026, 12, 6, 22, 0)
+    # DST kết thúc Chủ nhật 2026-11-01: đóng thứ Sáu 21:00 UTC, mở lại 22:00 UTC
+    assert not calendar.status(utc(2026, 10, 30, 21, 0))[0]
+    assert calendar.next_open(utc(2026, 10, 31, 12, 0)) == utc(2026, 11, 1, 22, 0)
+    # DST bắt đầu Chủ nhật 2027-03-14: đóng thứ Sáu 22:00 UTC, mở lại 21:00 UTC
+    assert calendar.status(utc(2027, 3, 12, 21, 30))[0]
+    assert calendar.next_open(utc(2027, 3, 13, 12, 0)) == utc(2027, 3, 14, 21, 0)
+
+
+def test_signal_outside_trading_hours_skips_ai():
+    service = SignalService(redis_client=MagicMock())
+    service.ai_service = MagicMock(generate_response=AsyncMock(return_value=None))
+    request = {"cache_key": {"timezone": "GMT+3.0", "timeframe": "H1", "symbol": "EURUSD"}, "symbol": "EURUSD",
+               "timeframe": "H1", "multi_timeframes": {}}
+    closed = MarketHours(holidays=["2026-12-25"])
+    saturday = utc(2026, 10, 17, 12, 0)
+
+    with patch("app.services.signal_service.market_calendar", closed), \
+            patch("app.utils.market_hours.time.time", return_value=saturday):
+        # Không có signal cache => HOLD
+        service.redis_client.is_connected.return_value = False
+        result = asyncio.run(service.analyze_signal(dict(request)))
+        assert result["data"]["signal_type"] == "HOLD" and result["data"]["symbol"] == "EURUSD"
+        assert result["market_closed"] == {"reason": "Market closed - Weekend", "next_open": utc(2026, 10, 18, 21, 0)}
+
+        # Signal cache còn => trả lại signal đó
+        cached = {"symbol": "EURUSD", "signal_type": "BUY", "technical_reasoning": "cached"}
+        service.redis_client.is_connected.return_value = True
+        service.redis_client.get.return_value = cached
+        result = asyncio.run(service.analyze_signal(dict(request)))
+        assert result["data"] == cached and result["market_closed"]["reason"] == "Market closed - Weekend"
+        service.redis_client.get.assert_called_once_with("signal:GMT+3.0:H1:EURUSD")
+
+    assert service.market_closed_stops == 2
+    service.ai_service.generate_response.assert_not_called()
+
+
+if __name__ == "__main__":
+    test_weekly_session_and_holidays()
+    test_weekly_session_follows_new_york_dst()
+    test_signal_outside_trading_hours_skips_ai()
+    print("✅ All market calendar tests passed")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test MultiAccountRiskService: quyết định của từng tài khoản phải giống /risk_manager gọi riêng lẻ
+"""
+
+import sys
+import os
+import copy
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import NullLogger
+from app.utils.risk_math import round_like_python
+from app.services.risk_manager_service import RiskManagerService
+from app.services.multi_account_risk_service import MultiAccountRiskService
+
+
+FX_INFO = {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01,
+           "trade_tick_value": 1.0, "trade_tick_size": 0.00001, "trade_contract_size": 100000}
+GROUPS = {"USD_MAJORS": ["EURUSD", "GBPUSD", "AUDUSD"], "JPY": ["USDJPY"]}
+
+
+def make_margin_map(margin_per_lot, max_lot=20.0):
+    margin_map, lot = {}, 0.01
+    while lot <= max_lot:
+        margin_map[f"{lot:.2f}"] = round(lot * margin_per_lot, 2)
+        lot = round(lot + 0.01, 2)
+    return margin_map
+
+
+def make_signal(order_type="MARKET", win=70, tp=1.1120):
+    return {"symbol": "EURUSD", "signal_type": "BUY", "order_type_proposed": order_type,
+            "entry_price_proposed": 1.1000, "stop_loss_proposed": 1.0950, "take_profit_proposed": tp,
+            "estimate_win_probability": win, "technical_reasoning": "EURUSD setup"}
+
+
+def make_accounts(n, seed=7):
+    """Tài khoản ngẫu nhiên: equity, drawdown, vị thế tương quan / cùng symbol, lệnh chờ, leverage"""
+    rng = np.random.default_rng(seed)
+    accounts = []
+    for login in range(n):
+        equity = float(rng.uniform(50, 200_000))
+        active = [{"symbol": str(rng.choice(["GBPUSD", "AUDUSD", "USDJPY", "EURUSD"])),
+                   "type": str(rng.choice(["BUY", "SELL"])), "profit": float(rng.uniform(-50, 50))}
+                  for _ in range(int(rng.integers(0, 5)))]
+        pending = [{"symbol": str(rng.choice(["EURUSD", "USDJPY"])), "ticket": int(rng.integers(1, 1000))}
+                   for _ in range(int(rng.integers(0, 3)))]
+        accounts.append({
+            "account_info_json": {"login": login, "equity": equity, "balance": equity * float(rng.uniform(1.0, 1.1)),
+                                  "profit": float(rng.uniform(-0.08, 0.02)) * equity,
+                                  "leverage": int(rng.choice([30, 100, 500]))},
+            "portfolio_exposure_json": {
+                "active_positions": active, "pending_orders": pending,
+                "summary": {"total_potential_loss_from_portfolio_usd": float(rng.uniform(0, 0.05)) * equity,
+                            "total_margin_used_from_portfolio_usd": float(rng.uniform(0, 0.45)) * equity}
+            },
+            "balance_config": {"max_risk": float(rng.choice([0.5, 1.0, 2.0])), "total_max_risk": 6.0,
+                               "max_position": int(rng.integers(2, 6))}
+        })
+    return accounts
+
+
+def assert_matches_single(params, result):
+    risk = RiskManagerService(logger=NullLogger())
+    for account, decision in zip(params["accounts"], result["decisions"]):
+        single = risk._analyze_risk_enhanced({
+            "proposed_signal_json": params["proposed_signal_json"],
+            "account_info_json": account["account_info_json"],
+            "symbol_info": params["symbol_info"],
+            "portfolio_exposure_json": copy.deepcopy(account["portfolio_exposure_json"]),
+            "balance_config": account["balance_config"],
+            "correlation_groups_json": params["correlation_groups_json"],
+            "symbol": params["symbol"],
+            "lot_size_to_margin_map": account.get("lot_size_to_margin_map") or params.get("lot_size_to_margin_map"),
+            "margin_model": account.get("margin_model") or params.get("margin_model")
+        }, NullLogger())
+        assert {k: v for k, v in decision.items() if k != "login"} == single, account["account_info_json"]["login"]
+        assert decision["login"] == account["account_info_json"]["login"]
+
+
+def make_params(accounts, signal=None, **extra):
+    params = {"proposed_signal_json": signal or make_signal(), "symbol_info": dict(FX_INFO),
+              "symbol": {"origin_name": "EURUSD"}, "correlation_groups_json": GROUPS, "accounts": accounts}
+    params.update(extra)
+    return params
+
+
+def test_fan_out_matches_single_account_logic():
+    """Leverage từng tài khoản (công thức), map dùng chung, lệnh chờ thay thế, R:R bị kéo về 1.5"""
+    service = MultiAccountRiskService(logger=NullLogger())
+    for params in (make_params(make_accounts(300)),
+                   make_params(make_accounts(300, seed=8), lot_size_to_margin_map=make_margin_map(220.0)),
+                   make_params(make_accounts(200, seed=9), signal=make_signal("LIMIT", win=80, tp=1.1300))):
+        result = service.size_accounts(params)
+        assert_matches_single(params, result)
+        assert result["summary"]["fallback"] == 0
+        statuses = {d["status"] for d in result["decisions"]}
+        assert {"CONTINUE", "SKIP", "STOP_TRADE"} <= statuses
+
+
+def test_accounts_outside_vectorized_range_use_single_logic():
+    """Equity 0, dữ liệu không phải số, margin theo bậc, nguồn margin riêng của tài khoản"""
+    accounts = make_accounts(40, seed=11)
+    accounts[0]["account_info_json"]["equity"] = 0
+    accounts[1]["balance_config"]["max_risk"] = "2.0"
+    accounts[2]["margin_model"] = {"contract_size": 100000, "leverage": 100, "margin_rate": 1.0,
+                                   "tiers": [{"up_to_lot": 1, "leverage": 500}]}
+    accounts[3]["lot_size_to_margin_map"] = make_margin_map(2200.0)
+    accounts[4]["account_info_json"].pop("leverage")
+    params = make_params(accounts)
+    result = MultiAccountRiskService(logger=NullLogger()).size_accounts(params)
+    assert_matches_single(params, result)
+    assert result["summary"]["fallback"] == 2
+
+
+def test_round_like_python_matches_builtin_round():
+    values = np.concatenate([np.arange(0, 50, 0.005), np.random.default_rng(1).uniform(0, 100, 5000)])
+    assert round_like_python(values, 2).tolist() == [round(float(v), 2) for v in values]
+
+
+if __name__ == "__main__":
+    test_fan_out_matches_single_account_logic()
+    test_accounts_outside_vectorized_range_use_single_logic()
+    test_round_like_python_matches_builtin_round()
+    print("✅ All multi-account risk tests passed")
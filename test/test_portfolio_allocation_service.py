@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test PortfolioAllocationService: quyết định từng tín hiệu phải giống /risk_manager
+trên snapshot đã cộng các lệnh được chấp nhận trước nó
+"""
+
+import sys
+import os
+import copy
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import NullLogger
+from app.services.risk_manager_service import RiskManagerService
+from app.services.portfolio_allocation_service import PortfolioAllocationService
+
+
+FX_INFO = {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01,
+           "trade_tick_value": 1.0, "trade_tick_size": 0.00001, "trade_contract_size": 100000}
+
+
+def make_margin_map(margin_per_lot, max_lot=5.0):
+    margin_map, lot = {}, 0.01
+    while lot <= max_lot:
+        margin_map[f"{lot:.2f}"] = round(lot * margin_per_lot, 2)
+        lot = round(lot + 0.01, 2)
+    return margin_map
+
+
+def make_signal(symbol, signal_type, entry, sl, tp, win, order_type="MARKET"):
+    return {"symbol": symbol, "signal_type": signal_type, "order_type_proposed": order_type,
+            "entry_price_proposed": entry, "stop_loss_proposed": sl, "take_profit_proposed": tp,
+            "estimate_win_probability": win, "technical_reasoning": f"{symbol} setup"}
+
+
+def make_params():
+    signals = [
+        make_signal("AUDUSD", "SELL", 0.6600, 0.6640, 0.6520, 60),
+        make_signal("EURUSD", "BUY", 1.1000, 1.0950, 1.1100, 80),
+        make_signal("USDCAD", "BUY", 1.3800, 1.3760, 1.3850, 70, order_type="LIMIT"),
+        make_signal("EURUSD", "SELL", 1.1000, 1.1050, 1.0900, 50),
+        make_signal("NZDUSD", "BUY", 0.6000, 0.5970, 0.6050, 58),
+    ]
+    return {
+        "proposed_signals_json": signals,
+        "account_info_json": {"equity": 10000, "balance": 10000, "profit": 0, "leverage": 500, "login": 1},
+        "symbol_info_by_symbol": {s: dict(FX_INFO) for s in ("AUDUSD", "EURUSD", "USDCAD", "NZDUSD")},
+        "portfolio_exposure_json": {
+            "active_positions": [{"symbol": "GBPUSD", "type": "BUY", "profit": 12.0}],
+            "pending_orders": [{"symbol": "USDCAD", "ticket": 77, "potential_loss_usd": 30.0, "margin_used_usd": 20.0}],
+            "summary": {"total_potential_loss_from_portfolio_usd": 130.0, "total_margin_used_from_portfolio_usd": 120.0}
+        },
+        "balance_config": {"max_risk": 2.0, "total_max_risk": 5.0, "max_position": 5},
+        "correlation_groups_json": {"USD_MAJORS": ["EURUSD", "AUDUSD", "NZDUSD", "GBPUSD"]},
+        "lot_size_to_margin_maps": {s: make_margin_map(220.0) for s in ("AUDUSD", "EURUSD", "USDCAD", "NZDUSD")}
+    }
+
+
+def replay_single(params, decisions):
+    """Gọi logic /risk_manager lần lượt theo rank trên snapshot tự cộng dồn"""
+    risk = RiskManagerService(logger=NullLogger())
+    portfolio = PortfolioAllocationService._copy_portfolio(params["portfolio_exposure_json"])
+    expected = {}
+    for i in sorted(range(len(decisions)), key=lambda k: decisions[k]["rank"]):
+        signal = params["proposed_signals_json"][i]
+        if decisions[i].get("reason") == "Symbol already allocated in this batch":
+            continue
+        single = risk._analyze_risk_enhanced({
+            "proposed_signal_json": signal,
+            "account_info_json": params["account_info_json"],
+            "symbol_info": params["symbol_info_by_symbol"][signal["symbol"]],
+            "portfolio_exposure_json": copy.deepcopy(portfolio),
+            "balance_config": params["balance_config"],
+            "correlation_groups_json": params["correlation_groups_json"],
+            "symbol": {"origin_name": signal["symbol"]},
+            "lot_size_to_margin_map": params["lot_size_to_margin_maps"][signal["symbol"]]
+        }, NullLogger())
+        expected[i] = single
+        if single["status"] == "CONTINUE":
+            margin = params["lot_size_to_margin_maps"][signal["symbol"]][f"{single['lot_size']:.2f}"]
+            PortfolioAllocationService._apply_allocation(
+                portfolio, signal, signal["symbol"], single,
+                {"margin_usd": margin, "risk_usd": abs(single["estimate_loss"])}
+            )
+    return expected
+
+
+def test_batch_decisions_match_sequential_single_signal_logic():
+    params = make_params()
+    service = PortfolioAllocationService(logger=NullLogger())
+    result = service.allocate(copy.deepcopy(params))
+    decisions = result["decisions"]
+
+    # Rank theo win probability giảm dần
+    assert [d["rank"] for d in decisions] == [3, 1, 2, 5, 4]
+    for i, single in replay_single(params, decisions).items():
+        batch = {k: v for k, v in decisions[i].items() if k not in ("rank", "reason")}
+        assert batch == single, params["proposed_signals_json"][i]["symbol"]
+
+    # EURUSD thứ 2 trong batch bị bỏ, tổng rủi ro không vượt total_max_risk
+    assert decisions[3]["status"] == "SKIP"
+    assert decisions[2]["delete_pending_orders"] == [77]
+    assert result["summary"]["total_risk_percent_after"] <= params["balance_config"]["total_max_risk"]
+    assert result["summary"]["accepted"] == sum(d["status"] == "CONTINUE" for d in decisions)
+
+
+def test_total_risk_cap_stops_lower_ranked_signals():
+    params = make_params()
+    params["balance_config"]["total_max_risk"] = 3.5
+    decisions = PortfolioAllocationService(logger=NullLogger()).allocate(params)["decisions"]
+    assert decisions[1]["status"] == "CONTINUE"
+    assert {decisions[i]["status"] for i in (0, 4)} == {"STOP_TRADE"}
+
+
+def test_invalid_signal_is_skipped_without_breaking_batch():
+    params = make_params()
+    params["proposed_signals_json"][0]["entry_price_proposed"] = None
+    decisions = PortfolioAllocationService(logger=NullLogger()).allocate(params)["decisions"]
+    assert decisions[0]["status"] == "SKIP" and decisions[0]["rank"] == 5
+    assert decisions[1]["status"] == "CONTINUE"
+
+
+if __name__ == "__main__":
+    test_batch_decisions_match_sequential_single_signal_logic()
+    test_total_risk_cap_stops_lower_ranked_signals()
+    test_invalid_signal_is_skipped_without_breaking_batch()
+    print("✅ All portfolio allocation tests passed")
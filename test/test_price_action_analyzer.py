@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test PriceActionAnalyzer + MultiTimeframesProcessor (phân tích price action phía server)
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import Logger
+from app.utils.price_action_analyzer import PriceActionAnalyzer
+from app.utils.multi_timeframes_processor import MultiTimeframesProcessor
+
+
+def make_candles(n=250, start=1_726_000_000, step=7200, seed=7):
+    """Tạo chuỗi nến random-walk giống dữ liệu MT5 (tick_volume, time epoch)"""
+    rng = np.random.default_rng(seed)
+    closes = 1.17 + np.cumsum(rng.normal(0, 0.0008, n))
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) + rng.uniform(0, 0.0006, n)
+    lows = np.minimum(opens, closes) - rng.uniform(0, 0.0006, n)
+    volumes = rng.integers(800, 1600, n)
+    return [
+        {
+            "time": int(start + i * step),
+            "open": float(opens[i]),
+            "high": float(highs[i]),
+            "low": float(lows[i]),
+            "close": float(closes[i]),
+            "tick_volume": int(volumes[i])
+        }
+        for i in range(n)
+    ]
+
+
+def test_analyze_price_action_schema():
+    """Output phải khớp schema analyze_price_action mà prompt sử dụng"""
+    candles = [dict(c, volume=c["tick_volume"]) for c in make_candles()]
+    analysis = PriceActionAnalyzer().analyze_price_action(candles, instrument_pip_size=0.0001)
+
+    assert set(analysis) == {"time_context", "key_levels", "price_patterns", "volume_context", "current_price_context"}
+    assert analysis["time_context"]["total_candles"] == 250
+    assert analysis["time_context"]["end_time"].endswith(" UTC")
+
+    key_levels = analysis["key_levels"]
+    assert key_levels["period_high"]["price"] >= key_levels["period_low"]["price"]
+    resistance_prices = [lv["price"] for lv in key_levels["resistance"]]
+    support_prices = [lv["price"] for lv in key_levels["support"]]
+    assert resistance_prices == sorted(resistance_prices)
+    assert support_prices == sorted(support_prices, reverse=True)
+    for level in key_levels["resistance"] + key_levels["support"]:
+        assert level["type"] in ("swing_high", "swing_low", "round_number")
+        assert level["recency"] in ("recent", "intermediate", "historic")
+
+    price_context = analysis["current_price_context"]
+    assert price_context["price"] == round(candles[-1]["close"], 5)
+    assert price_context["nearest_resistance"]["price"] > price_context["price"]
+    assert price_context["nearest_support"]["price"] < price_context["price"]
+    assert analysis["volume_context"]["status"] in ("Above Average", "Below Average", "Normal")
+
+
+def test_detects_bullish_engulfing_on_last_candle():
+    """Nến cuối nuốt trọn nến giảm trước đó => Bullish ENGULFING"""
+    candles = [dict(c, volume=c["tick_volume"]) for c in make_candles(60)]
+    base = candles[-3]["close"]
+    candles[-2].update({"open": base + 0.0010, "high": base + 0.0012, "low": base - 0.0002, "close": base})
+    candles[-1].update({"open": base - 0.0002, "high": base + 0.0030, "low": base - 0.0003, "close": base + 0.0028})
+
+    patterns = PriceActionAnalyzer().analyze_price_action(candles)["price_patterns"]
+
+    assert "Bullish ENGULFING" in patterns["all_detected_on_last"]
+    assert patterns["all_detected_on_last"] == sorted(patterns["all_detected_on_last"], key=lambda p: p.split(" ")[1])
+
+
+def test_not_enough_candles_returns_default_analysis():
+    """< 20 nến => default analysis (volume N/A, price 0)"""
+    analysis = PriceActionAnalyzer().analyze_price_action(make_candles(10))
+    assert analysis["volume_context"]["status"] == "N/A"
+    assert analysis["current_price_context"]["price"] == 0
+
+
+def test_processor_attaches_analysis_and_strips_raw_data():
+    """Client chỉ gửi raw_data => server gắn analyze_price_action và bỏ raw_data khỏi prompt"""
+    processor = MultiTimeframesProcessor(Logger("test_price_action_analyzer"))
+    multi_timeframes = {
+        "D1": {"indicators": {"rsi": 55.0}, "raw_data": make_candles(250, step=86400)},
+        "H2": {"indicators": {"rsi": 45.0}, "raw_data": make_candles(250)},
+    }
+    assert processor.has_raw_data(multi_timeframes)
+
+    result = processor.process_multi_timeframes("EURUSD", {"point": 1e-05, "digits": 5}, multi_timeframes, "signal_generation")
+
+    assert result["success"], result.get("error")
+    assert result["raw_data_counts"] == {"D1": 250, "H2": 250}
+    for tf in ("D1", "H2"):
+        assert "raw_data" not in multi_timeframes[tf]
+        assert "analyze_price_action" in multi_timeframes[tf]
+        assert len(result["tmp_multi_timeframes"][tf]["raw_data"]) == 250
+    assert not processor.has_raw_data(multi_timeframes)
+
+
+if __name__ == "__main__":
+    test_analyze_price_action_schema()
+    test_detects_bullish_engulfing_on_last_candle()
+    test_not_enough_candles_returns_default_analysis()
+    test_processor_attaches_analysis_and_strips_raw_data()
+    print("✅ All price action analyzer tests passed")
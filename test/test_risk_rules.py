@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test risk_rules: profile đã biên dịch, chọn profile theo tài khoản, hot reload
+"""
+
+import sys
+import os
+import json
+import copy
+import importlib.util
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import NullLogger
+from app.utils.risk_rules import DEFAULT_RULES_SPEC, RiskRuleRegistry
+from app.services.risk_manager_service import RiskManagerService
+from app.services.multi_account_risk_service import MultiAccountRiskService
+
+# Helpers của test multi-account (package `test` trùng tên module chuẩn => nạp theo đường dẫn)
+_spec = importlib.util.spec_from_file_location(
+    "multi_account_helpers", os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_multi_account_risk_service.py")
+)
+helpers = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(helpers)
+
+
+def make_registry(**profiles):
+    spec = {"profiles": dict(DEFAULT_RULES_SPEC["profiles"], **profiles), "accounts": {"7": "strict"} if "strict" in profiles else {}}
+    registry = RiskRuleRegistry(path="missing_risk_rules.json")
+    registry.load(spec)
+    return registry
+
+
+STRICT = {"extends": "default", "overrides": {"drawdown": {"threshold": 0.01, "factor": 0.5},
+                                              "margin": {"min_free_margin_percent": 70, "max_margin_usage_percent": 25}}}
+NO_CORRELATION = {"extends": "default", "overrides": {"correlation": {"enabled": False}}}
+NO_POSITION_LIMIT = {"extends": "default", "overrides": {"position_limit": {"enabled": False}}}
+
+
+def test_custom_profiles_match_between_single_and_multi_account():
+    """Profile theo tài khoản: bản vectorized dùng tham số của profile, profile khác cấu trúc đi qua RiskManagerService"""
+    registry = make_registry(strict=STRICT, no_correlation=NO_CORRELATION, no_position_limit=NO_POSITION_LIMIT)
+    accounts = helpers.make_accounts(240, seed=21)
+    for i, account in enumerate(accounts):
+        account["balance_config"]["risk_profile"] = ["default", "strict", "no_correlation", "no_position_limit"][i % 4]
+    params = helpers.make_params(accounts)
+
+    risk = RiskManagerService(logger=NullLogger(), rule_registry=registry)
+    result = MultiAccountRiskService(risk_service=risk, logger=NullLogger()).size_accounts(params)
+    assert result["summary"]["fallback"] == 60
+    for account, decision in zip(accounts, result["decisions"]):
+        single = risk._analyze_risk_enhanced(dict(copy.deepcopy(params), **copy.deepcopy(account)), NullLogger())
+        assert {k: v for k, v in decision.items() if k != "login"} == single
+
+    # Profile chặt hơn thực sự thay đổi quyết định, không bao giờ cho lot lớn hơn
+    default_risk = RiskManagerService(logger=NullLogger(), rule_registry=make_registry())
+    changed = 0
+    for account, decision in list(zip(accounts, result["decisions"]))[1::4]:
+        request = dict(copy.deepcopy(params), **copy.deepcopy(account))
+        request["balance_config"]["risk_profile"] = "default"
+        baseline = default_risk._analyze_risk_enhanced(request, NullLogger())
+        changed += decision["lot_size"] != baseline["lot_size"]
+        assert (decision["lot_size"] or 0) <= (baseline["lot_size"] or 0)
+    assert changed > 0
+
+
+def test_profile_resolution_and_account_cache():
+    registry = make_registry(strict=STRICT)
+    assert registry.resolve({"login": 1}, {}).name == "default"
+    assert registry.resolve({"login": 7}, {}).name == "strict"
+    assert registry.resolve({"login": 7}, {"risk_profile": "default"}).name == "default"
+    assert registry.resolve({"login": 1}, {"risk_profile": "unknown"}).name == "default"
+    assert registry.resolve({"login": 7}, {}) is registry.resolve({"login": 7}, None)
+    assert registry.get_metrics()["cached_accounts"] == 4
+
+    strict = registry.profile("strict")
+    assert (strict.min_free_margin_percent, strict.max_margin_usage_percent) == (70, 25)
+    assert strict.vector_rules["drawdown_factor"] == 0.5
+    assert registry.profile("default").vector_rules is not None
+
+
+def test_hot_reload_on_file_change(tmp_path):
+    path = tmp_path / "risk_rules.json"
+    spec = {"default_profile": "default", "accounts": {"7": "strict"}, "profiles": {**DEFAULT_RULES_SPEC["profiles"], "strict": STRICT}}
+    path.write_text(json.dumps(spec))
+    registry = RiskRuleRegistry(path=str(path), reload_seconds=0)
+    assert registry.resolve({"login": 7}, {}).min_free_margin_percent == 70
+
+    def rewrite(content, mtime_ns):
+        path.write_text(content)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    spec["profiles"]["strict"]["overrides"]["margin"]["min_free_margin_percent"] = 80
+    rewrite(json.dumps(spec), 2_000_000_000 * 10**9)
+    assert registry.resolve({"login": 7}, {}).min_free_margin_percent == 80
+    assert registry.get_metrics()["version"] == 2
+
+    # File lỗi => giữ profile đang dùng
+    rewrite('{"profiles": {"default": {"rules": [{"rule": "no_such_rule"}]}}}', 2_000_000_001 * 10**9)
+    assert registry.resolve({"login": 7}, {}).min_free_margin_percent == 80
+    assert "no_such_rule" in registry.get_metrics()["last_error"]
+
+
+def test_invalid_specs_are_rejected():
+    registry = RiskRuleRegistry(path="missing_risk_rules.json")
+    for profiles in ({"default": {"rules": [{"rule": "drawdown", "factor": "0.7"}]}},
+                     {"default": {"rules": [{"rule": "margin"}, {"rule": "margin"}]}},
+                     {"default": {"extends": "other"}, "other": {"extends": "default"}},
+                     {"default": {"extends": "missing"}}):
+        with pytest.raises(ValueError):
+            registry.load({"profiles": profiles})
+    # Không có file => luật mặc định
+    assert registry.profile().vector_rules["min_free_margin_percent"] == 50
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_custom_profiles_match_between_single_and_multi_account()
+    test_profile_resolution_and_account_cache()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_hot_reload_on_file_change(pathlib.Path(tmp))
+    test_invalid_specs_are_rejected()
+    print("✅ All risk rules tests passed")
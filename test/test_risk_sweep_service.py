@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test RiskSweepService: mỗi điểm lưới phải giống /risk_manager với cùng cấu hình
+"""
+
+import sys
+import os
+import copy
+import itertools
+from unittest.mock import patch
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import NullLogger
+from app.utils.risk_rules import DEFAULT_RULES_SPEC, RiskRuleRegistry
+from app.services.risk_manager_service import RiskManagerService
+from app.services.risk_sweep_service import RiskSweepService
+
+
+def make_params(grid, profit=0.0):
+    return {
+        "proposed_signal_json": {
+            "symbol": "EURUSD", "signal_type": "BUY", "order_type_proposed": "MARKET",
+            "entry_price_proposed": 1.1000, "stop_loss_proposed": 1.0950, "take_profit_proposed": 1.1100,
+            "estimate_win_probability": 72, "technical_reasoning": "EURUSD setup"
+        },
+        "account_info_json": {"login": 1, "equity": 3000, "balance": 3000, "profit": profit, "leverage": 100},
+        "symbol_info": {"volume_min": 0.01, "volume_max": 100, "volume_step": 0.01,
+                        "trade_tick_value": 1.0, "trade_tick_size": 0.00001, "trade_contract_size": 100000},
+        "portfolio_exposure_json": {
+            "active_positions": [{"symbol": "GBPUSD", "type": "BUY", "profit": 5.0},
+                                 {"symbol": "AUDUSD", "type": "SELL", "profit": 1.0}],
+            "pending_orders": [],
+            "summary": {"total_potential_loss_from_portfolio_usd": 60.0, "total_margin_used_from_portfolio_usd": 900.0}
+        },
+        "balance_config": {"max_risk": 2.0, "total_max_risk": 6.0, "max_position": 5},
+        "correlation_groups_json": {"USD_MAJORS": ["EURUSD", "GBPUSD", "AUDUSD"]},
+        "symbol": {"origin_name": "EURUSD"},
+        "grid": grid
+    }
+
+
+def single(params, rule_registry=None, **balance):
+    request = copy.deepcopy(params)
+    request["balance_config"].update(balance)
+    return RiskManagerService(logger=NullLogger(), rule_registry=rule_registry)._analyze_risk_enhanced(request, NullLogger())
+
+
+def test_balance_config_grid_matches_single_calls():
+    grid = {"max_risk": [0.5, 1.0, 2.0], "total_max_risk": [2.0, 3.0, 6.0], "max_position": [2, 3, 5]}
+    params = make_params(grid)
+    result = RiskSweepService(logger=NullLogger()).sweep(params)
+    assert result["points"] == 27
+
+    for k, values in enumerate(itertools.product(*grid.values())):
+        expected = single(params, **dict(zip(grid, values)))
+        assert [result["grid"][name][k] for name in grid] == list(values)
+        assert result["status"][k] == expected["status"]
+        assert result["lot_size"][k] == expected["lot_size"]
+        assert result["estimate_loss"][k] == expected["estimate_loss"]
+        assert result["estimate_profit"][k] == expected["estimate_profit"]
+    assert {"CONTINUE", "STOP_TRADE"} <= set(result["status"])
+
+
+def test_threshold_grid_matches_equivalent_configurations():
+    """Ngưỡng margin = risk profile tương ứng; drawdown_threshold cực lớn = tài khoản không drawdown
+
+    Thứ tự điểm theo SWEEP_PARAMETERS (drawdown_threshold trước các ngưỡng margin)
+    """
+    params = make_params({"min_free_margin_percent": [50, 60], "max_margin_usage_percent": [40, 35],
+                          "drawdown_threshold": [0.04, 10.0]}, profit=-200.0)
+    params["portfolio_exposure_json"]["summary"]["total_margin_used_from_portfolio_usd"] = 1030.0
+    result = RiskSweepService(logger=NullLogger()).sweep(params)
+    profiles = dict(DEFAULT_RULES_SPEC["profiles"])
+    for min_free, max_usage in itertools.product([50, 60], [40, 35]):
+        profiles[f"margin_{min_free}_{max_usage}"] = {"extends": "default", "overrides": {
+            "margin": {"min_free_margin_percent": min_free, "max_margin_usage_percent": max_usage}}}
+    registry = RiskRuleRegistry(path="missing_risk_rules.json")
+    registry.load({"profiles": profiles})
+    for k, (drawdown, min_free, max_usage) in enumerate(itertools.product([0.04, 10.0], [50, 60], [40, 35])):
+        request = params if drawdown == 0.04 else dict(params, account_info_json=dict(params["account_info_json"], profit=0.0))
+        expected = single(request, registry, risk_profile=f"margin_{min_free}_{max_usage}")
+        assert (result["status"][k], result["lot_size"][k]) == (expected["status"], expected["lot_size"])
+    # Ngưỡng margin chặt hơn => lot không lớn hơn
+    assert result["grid"]["min_free_margin_percent"][3] == 60 and result["grid"]["max_margin_usage_percent"][3] == 35
+    assert result["lot_size"][3] < result["lot_size"][0]
+
+
+def test_invalid_grid_is_rejected():
+    service = RiskSweepService(logger=NullLogger())
+    with pytest.raises(ValueError):
+        service.sweep(make_params({"max_riskk": [1.0]}))
+    with pytest.raises(ValueError):
+        service.sweep(make_params({"max_risk": []}))
+    with patch("app.services.risk_sweep_service.settings.RISK_SWEEP_MAX_POINTS", 10):
+        with pytest.raises(ValueError):
+            service.sweep(make_params({"max_risk": list(range(1, 12))}))
+
+
+if __name__ == "__main__":
+    test_balance_config_grid_matches_single_calls()
+    test_threshold_grid_matches_equivalent_configurations()
+    test_invalid_grid_is_rejected()
+    print("✅ All risk sweep tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test batch /signal: nhiều symbol cùng main timeframe chung 1 lần gọi AI, entry lỗi fallback gọi AI riêng
+"""
+
+import sys
+import os
+import json
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.prompt_batch import prompt_batch_metrics
+from app.services.signal_service import SignalService
+
+
+def request(symbol, timeframe="H4"):
+    return {
+        "symbol": symbol, "timeframe": timeframe, "symbol_info": {"digits": 5},
+        "cache_key": {"timezone": "GMT+3.0", "timeframe": timeframe, "symbol": symbol},
+        "multi_timeframes": {timeframe: {"indicators": {"atr": 0.0020, "rsi": 55.0},
+                                         "analyze_price_action": {"current_price_context": {"price": 1.1}}}}
+    }
+
+
+def signal(symbol, signal_type="HOLD"):
+    return {"symbol": symbol, "signal_type": signal_type, "order_type_proposed": None, "technical_reasoning": "x"}
+
+
+def fake_ai(prompt):
+    """Prompt batch => JSON array (USDJPY sai định dạng); prompt single => 1 object của symbol trong prompt"""
+    if "JSON array only" in prompt:
+        return "```json\n" + json.dumps([signal("EURUSD", "BUY"), signal("GBPUSD"), signal("USDJPY", "LONG")]) + "\n```"
+    symbol = prompt.split("for the trading symbol ")[1].split(".")[0]
+    return json.dumps(signal(symbol, "SELL"))
+
+
+def test_batch_groups_by_timeframe_and_falls_back_per_symbol():
+    service = SignalService(redis_client=MagicMock())
+    service.redis_client.is_connected.return_value = False
+    service.ai_service = MagicMock(generate_response=AsyncMock(side_effect=fake_ai))
+    requests = [request("EURUSD"), request("AUDUSD", "H1"), request("GBPUSD"), request("USDJPY"),
+                dict(request("NZDUSD"), cache_key={})]
+    before = prompt_batch_metrics.get_metrics()
+
+    with patch("app.services.signal_service.settings.MARKET_CALENDAR_ENABLED", False), \
+            patch("app.services.signal_service.signal_screener.mode", "off"), \
+            patch("app.services.signal_service.response_logger"):
+        results = asyncio.run(service.analyze_signal_batch(requests, batch_size=4))
+
+    assert [r["data"]["symbol"] for r in results[:4]] == ["EURUSD", "AUDUSD", "GBPUSD", "USDJPY"]
+    assert [r["data"]["signal_type"] for r in results[:4]] == ["BUY", "SELL", "HOLD", "SELL"]
+    # H4: EURUSD / GBPUSD từ prompt batch, USDJPY lỗi => gọi riêng; H1 chỉ 1 symbol => mode single
+    assert results[0]["prompt_batch"] == {"size": 3} and results[2]["prompt_batch"] == {"size": 3}
+    assert "prompt_batch" not in results[1] and "prompt_batch" not in results[3]
+    # Request lỗi cache_key không giữ batch lại
+    assert results[4]["success"] is False
+    assert service.ai_service.generate_response.call_count == 3
+    batch_prompt = service.ai_service.generate_response.call_args_list[0][0][0]
+    assert batch_prompt.count("1. **PRE-ANALYZED DATA REVIEW") == 1 and '"USDJPY"' in batch_prompt
+
+    after = prompt_batch_metrics.get_metrics()
+    assert after["batches"] - before["batches"] == 1
+    assert after["batched_items"] - before["batched_items"] == 2
+    assert after["fallbacks"] - before["fallbacks"] == 1 and after["single"] - before["single"] == 1
+
+
+def test_parse_batch_response_validates_each_entry():
+    service = SignalService(redis_client=MagicMock())
+    entries = [signal("EURUSD", "BUY"), signal("GBPUSD"), signal("GBPUSD", "SELL"), {"symbol": "USDJPY"}, "oops"]
+    parsed = service._parse_ai_batch_response("Here you go:\n" + json.dumps(entries), ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD"])
+    assert parsed[0]["signal_type"] == "BUY"
+    # Trùng symbol / thiếu field / không có trong kết quả => None (gọi AI riêng)
+    assert parsed[1:] == [None, None, None]
+    assert service._parse_ai_batch_response('{"symbol": "EURUSD"}', ["EURUSD"]) == [None]
+    assert service._parse_ai_batch_response("[not json]", ["EURUSD", "GBPUSD"]) == [None, None]
+
+
+if __name__ == "__main__":
+    test_batch_groups_by_timeframe_and_falls_back_per_symbol()
+    test_parse_batch_response_validates_each_entry()
+    print("✅ All signal batch tests passed")
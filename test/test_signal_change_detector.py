@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test SignalChangeDetector: input chưa đổi đáng kể (trong tolerance) => phát lại signal cũ, không gọi AI
+"""
+
+import sys
+import os
+import copy
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.signal_change_detector import (
+    SignalChangeDetector, compare_fingerprints, extract_fingerprint, parse_tolerances, DEFAULT_TOLERANCES
+)
+from app.services.signal_service import SignalService
+
+
+def timeframe(price, rsi=55.0, histogram=0.0004, adx=27.0, support=1.0990, resistance=1.1080, atr=0.0020):
+    return {
+        "indicators": {"rsi": rsi, "macd": [0.001, 0.001 - histogram, histogram], "atr": atr, "adx": [adx, 24.0, 15.0],
+                       "sma_100": 1.0950, "sma_200": 1.0900, "bollinger_bands": [price, price + 0.004, price - 0.004]},
+        "analyze_price_action": {"current_price_context": {
+            "price": price,
+            "nearest_support": {"price": support} if support else None,
+            "nearest_resistance": {"price": resistance} if resistance else None}}
+    }
+
+
+def setup(**h4):
+    return {"D1": timeframe(1.1000, rsi=60.0, atr=0.0080), "H4": timeframe(**dict({"price": 1.1000}, **h4))}
+
+
+def test_compare_fingerprints_per_feature_tolerances():
+    base = extract_fingerprint(setup())
+    assert base["H4"]["adx"] == 27.0 and base["H4"]["resistance"] == 1.1080
+
+    # Giá nhích 0.1 ATR, RSI +1.5 điểm => chưa đổi đáng kể
+    changes, max_ratio = compare_fingerprints(base, extract_fingerprint(setup(price=1.1002, rsi=56.5)), DEFAULT_TOLERANCES)
+    assert changes == {} and 0.7 < max_ratio <= 1.0
+
+    assert set(compare_fingerprints(base, extract_fingerprint(setup(rsi=58.0)), DEFAULT_TOLERANCES)[0]) == {"rsi"}
+    # Giá đi 0.5 ATR => close + Bollinger (tính theo giá) cùng đổi
+    assert set(compare_fingerprints(base, extract_fingerprint(setup(price=1.1010)), DEFAULT_TOLERANCES)[0]) == \
+        {"close", "bollinger_upper", "bollinger_lower"}
+    # Level mới / mất level / đổi tập timeframe => phân tích lại
+    assert "resistance" in compare_fingerprints(base, extract_fingerprint(setup(resistance=None)), DEFAULT_TOLERANCES)[0]
+    assert "timeframes" in compare_fingerprints(base, extract_fingerprint({"H4": timeframe(1.1000)}), DEFAULT_TOLERANCES)[0]
+
+    assert parse_tolerances(" rsi=1.5, LEVEL=0.05 ,")["level"] == 0.05
+    assert parse_tolerances("")["rsi"] == DEFAULT_TOLERANCES["rsi"]
+    for text in ("volume=1", "rsi", "rsi=-1"):
+        with pytest.raises(ValueError):
+            parse_tolerances(text)
+
+
+def test_signal_service_reuses_previous_signal_until_inputs_move():
+    store = {}
+    redis = MagicMock()
+    redis.get.side_effect = lambda key: copy.deepcopy(store.get(key))
+    redis.set.side_effect = lambda key, value, ttl: store.__setitem__(key, copy.deepcopy(value))
+    service = SignalService(redis_client=redis)
+    service.ai_service = MagicMock(generate_response=AsyncMock(
+        return_value='{"symbol": "EURUSD", "signal_type": "BUY", "entry_price_proposed": 1.1, "technical_reasoning": "x"}'))
+    detector = SignalChangeDetector(enabled=True, tolerances={}, max_age=1800)
+    request = {"symbol": "EURUSD", "timeframe": "H4", "cache_key": {"timezone": "GMT+3.0", "timeframe": "H4", "symbol": "EURUSD"}}
+
+    with patch("app.services.signal_service.signal_change_detector", detector), \
+            patch("app.services.signal_service.signal_screener.mode", "off"), \
+            patch.object(service.prompt_service, "create_prompt_for_signal_analyst", return_value="prompt"), \
+            patch("app.services.signal_service.response_logger"):
+        first = asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=setup())))
+        assert first["data"]["signal_type"] == "BUY" and "reused_signal" not in first
+        basis = store["signal_basis:signal:GMT+3.0:H4:EURUSD"]
+        assert basis["signal"]["entry_price_proposed"] == 1.1 and "H4" in basis["fingerprint"]
+        assert redis.set.call_args[0][2] == 1800
+
+        quiet = asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=setup(price=1.1001, rsi=56.0))))
+        assert quiet["data"]["signal_type"] == "BUY" and quiet["data"]["timestamp"]
+        assert quiet["reused_signal"]["analyzed_at"] == basis["analyzed_at"] and quiet["reused_signal"]["max_change"] <= 1
+        assert service.ai_service.generate_response.call_count == 1
+
+        moved = asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=setup(price=1.1030))))
+        assert "reused_signal" not in moved and service.ai_service.generate_response.call_count == 2
+
+        # Redis mất kết nối => gọi AI như cũ
+        redis.is_connected.return_value = False
+        asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=setup(price=1.1030))))
+        assert service.ai_service.generate_response.call_count == 3
+
+    metrics = detector.get_metrics()
+    assert (metrics["checked"], metrics["reused"], metrics["changed"]) == (2, 1, 1)
+    assert metrics["changed_by"]["close"] == 1
+
+
+if __name__ == "__main__":
+    test_compare_fingerprints_per_feature_tolerances()
+    test_signal_service_reuses_previous_signal_until_inputs_move()
+    print("✅ All signal change detector tests passed")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test SignalPostProcessor: SL buffer / R:R / pips / trailing stop tính chính xác từ ATR + digits, prompt compact
+"""
+
+import sys
+import os
+import json
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.prompts.prompt_signal_analyst import prompt_signal_analyst
+from app.utils.signal_postprocessor import SignalPostProcessor, derive_fields, pip_divisor
+from app.services.signal_service import SignalService
+
+
+def test_derive_fields_follow_prompt_arithmetic():
+    # Ví dụ trong prompt_signal_analyst (mục 11)
+    buy = {"signal_type": "BUY", "order_type_proposed": "LIMIT", "entry_price_proposed": 1.1000,
+           "stop_loss_structure": 1.0960, "take_profit_proposed": 1.1150}
+    derived = derive_fields(buy, atr=0.00224, digits=5)
+    assert derived["trailing_stop_loss"] == 44.8
+    assert derived["stop_loss_proposed"] == 1.09488
+    assert derived["risk_reward_ratio"] == pytest.approx(0.015 / 0.00512, abs=0.005)
+    assert derived["pips_to_take_profit"] == 150.0
+
+    sell = {"signal_type": "SELL", "order_type_proposed": "MARKET", "stop_loss_structure": 150.40, "take_profit_proposed": 148.90}
+    derived = derive_fields(sell, atr=0.158, digits=3, current_price=149.80)
+    assert derived["trailing_stop_loss"] == 31.6
+    assert derived["entry_price_proposed"] == 149.80 and derived["stop_loss_proposed"] == 150.479
+    assert derived["pips_to_take_profit"] == 90.0 and derived["risk_reward_ratio"] == 1.33
+
+    # SL có sẵn (prompt full) => giữ SL của model, chỉ tính lại R:R / pips
+    full = {"signal_type": "BUY", "entry_price_proposed": 1.1, "stop_loss_proposed": 1.09, "take_profit_proposed": 1.12}
+    assert "stop_loss_proposed" not in derive_fields(full, atr=0.002, digits=5)
+    assert derive_fields(full, atr=0.002, digits=5)["risk_reward_ratio"] == 2.0
+    assert derive_fields({"signal_type": "HOLD"}, atr=0.002, digits=5) == {}
+    assert derive_fields(full, atr=None, digits=None) == {"risk_reward_ratio": 2.0, "pips_to_take_profit": 200.0}
+    assert pip_divisor(2) == pip_divisor(3) == 0.01 and pip_divisor(5) == pip_divisor(None) == 0.0001
+
+
+def test_compact_prompt_and_service_postprocessing():
+    params = {"symbol": "EURUSD", "provided_data": "{}", "main_timeframe": "H4"}
+    full, compact = prompt_signal_analyst(params), prompt_signal_analyst(dict(params, compact=True))
+    assert "TRAILING STOP LOSS CALCULATION" in full and '"trailing_stop_loss"' in full
+    assert "TRAILING STOP LOSS CALCULATION" not in compact and '"trailing_stop_loss"' not in compact
+    assert '"stop_loss_structure"' in compact and len(compact) < len(full) * 0.9
+
+    request = {
+        "symbol": "EURUSD", "timeframe": "H4", "symbol_info": {"digits": 5},
+        "cache_key": {"timezone": "GMT+3.0", "timeframe": "H4", "symbol": "EURUSD"},
+        "multi_timeframes": {"H4": {"indicators": {"atr": 0.0020},
+                                    "analyze_price_action": {"current_price_context": {"price": 1.1000}}}}
+    }
+    ai_signal = {"symbol": "EURUSD", "signal_type": "BUY", "order_type_proposed": "MARKET", "entry_price_proposed": None,
+                 "stop_loss_structure": 1.0975, "take_profit_proposed": 1.1060, "estimate_win_probability": 60,
+                 "technical_reasoning": "x"}
+    service = SignalService(redis_client=MagicMock())
+    service.redis_client.is_connected.return_value = False
+    service.ai_service = MagicMock(generate_response=AsyncMock(return_value=json.dumps(ai_signal)))
+    postprocessor = SignalPostProcessor()
+
+    with patch("app.services.signal_service.signal_postprocessor", postprocessor), \
+            patch("app.services.signal_service.signal_screener.mode", "off"), \
+            patch("app.services.signal_service.settings.SIGNAL_PROMPT_MODE", "compact"), \
+            patch("app.services.signal_service.response_logger"):
+        assert '"stop_loss_structure"' in service.prompt_service.create_prompt_for_signal_analyst(dict(request))
+        result = asyncio.run(service._process_signal_direct(dict(request)))
+        data = result["data"]
+        assert "stop_loss_structure" not in data
+        assert (data["entry_price_proposed"], data["stop_loss_proposed"]) == (1.1, 1.0965)
+        assert (data["risk_reward_ratio"], data["pips_to_take_profit"], data["trailing_stop_loss"]) == (1.71, 60.0, 40.0)
+
+        # Prompt full: model tự tính sai trailing stop => ghi đè + đếm correction
+        full_signal = dict(ai_signal, entry_price_proposed=1.1, stop_loss_proposed=1.0965, trailing_stop_loss=4.0,
+                           risk_reward_ratio=1.71)
+        full_signal.pop("stop_loss_structure")
+        service.ai_service.generate_response.return_value = json.dumps(full_signal)
+        data = asyncio.run(service._process_signal_direct(dict(request)))["data"]
+        assert data["trailing_stop_loss"] == 40.0 and data["stop_loss_proposed"] == 1.0965
+
+    metrics = postprocessor.get_metrics()
+    assert metrics["processed"] == 2 and metrics["structure_stop_loss"] == 1
+    assert metrics["corrections"] == {"trailing_stop_loss": 1}
+
+
+if __name__ == "__main__":
+    test_derive_fields_follow_prompt_arithmetic()
+    test_compact_prompt_and_service_postprocessing()
+    print("✅ All signal post-processor tests passed")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test pre-flight gate của /signal: chỉ trả "no trade" khi /risk_manager chắc chắn từ chối mọi tín hiệu AI có thể đề xuất
+"""
+
+import sys
+import os
+import copy
+import json
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.logger import NullLogger
+from app.services.risk_manager_service import RiskManagerService
+from app.services.signal_service import SignalService
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "app", "tests", "final_risk_manager", "test_cases.json")
+PROPOSALS = [(signal_type, order_type) for signal_type in ("BUY", "SELL") for order_type in ("MARKET", "LIMIT", "STOP")]
+
+
+def test_pre_check_only_stops_when_every_proposal_is_rejected():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        cases = [case["params"] for case in json.load(f)]
+    risk = RiskManagerService(logger=NullLogger())
+    stopped = 0
+    for params in cases:
+        symbol = params["proposed_signal_json"]["symbol"]
+        status, reason = risk.pre_check(symbol, params["account_info_json"], params["portfolio_exposure_json"],
+                                        params["balance_config"])
+        decisions = []
+        for signal_type, order_type in PROPOSALS:
+            request = copy.deepcopy(params)
+            request["proposed_signal_json"].update(signal_type=signal_type, order_type_proposed=order_type)
+            decisions.append(risk._analyze_risk_enhanced(request, NullLogger())["status"])
+        if status == "CONTINUE":
+            continue
+        # Gate dừng => risk manager dừng với mọi tín hiệu, và cùng trạng thái với tín hiệu MARKET
+        stopped += 1
+        assert "CONTINUE" not in decisions, (reason, decisions)
+        assert decisions[0] == status
+    assert 0 < stopped < len(cases)
+
+
+def test_pre_check_edge_cases():
+    risk = RiskManagerService(logger=NullLogger())
+    account = {"equity": 1000.0, "balance": 1000.0}
+    summary = {"total_potential_loss_from_portfolio_usd": 0.0}
+    config = {"max_risk": 2.0, "total_max_risk": 6.0, "max_position": 3}
+
+    full = {"active_positions": [{"symbol": "GBPUSD", "type": "BUY", "profit": 1.0}] * 3, "pending_orders": [], "summary": summary}
+    assert risk.pre_check("EURUSD", account, full, config) == ("STOP_TRADE", "Max position limit reached")
+    # balance_config thiếu max_position => mặc định của /risk_manager (5)
+    assert risk.pre_check("EURUSD", account, full, {"max_risk": 2.0})[0] == "CONTINUE"
+
+    losing = {"active_positions": [{"symbol": "EURUSD", "type": "BUY", "profit": -3.0}], "pending_orders": [], "summary": summary}
+    assert risk.pre_check("EURUSD", account, losing, config)[0] == "SKIP"
+    # Vị thế cùng symbol đang lãi: AI vẫn có thể đề xuất cùng hướng
+    winning = {"active_positions": [{"symbol": "EURUSD", "type": "BUY", "profit": 3.0}], "pending_orders": [], "summary": summary}
+    assert risk.pre_check("EURUSD", account, winning, config)[0] == "CONTINUE"
+
+    # Vượt trần rủi ro nhưng có lệnh chờ cùng symbol => lệnh chờ mới thay thế được (không chặn)
+    capped = {"active_positions": [], "pending_orders": [], "summary": {"total_potential_loss_from_portfolio_usd": 50.0}}
+    assert risk.pre_check("EURUSD", account, capped, config)[0] == "STOP_TRADE"
+    capped["pending_orders"] = [{"symbol": "EURUSD", "ticket": 9}]
+    assert risk.pre_check("EURUSD", account, capped, config)[0] == "CONTINUE"
+
+    # Dữ liệu account lỗi => gate không chặn
+    assert risk.pre_check("EURUSD", {"equity": "n/a"}, capped, config)[0] == "CONTINUE"
+
+
+def test_signal_service_skips_ai_call_when_pre_check_stops():
+    service = SignalService(redis_client=MagicMock())
+    service.redis_client.is_connected.return_value = False
+    service.ai_service = MagicMock(generate_response=AsyncMock(return_value=None))
+    request = {
+        "cache_key": {"timezone": "+03:00", "timeframe": "H1", "symbol": "EURUSD"},
+        "symbol": "EURUSD",
+        "timeframe": "H1",
+        "account_info": {"equity": 1000.0, "balance": 1000.0},
+        "balance_config": {"max_risk": 2.0, "total_max_risk": 6.0, "max_position": 1},
+        "max_positions": 1,
+        "portfolio_exposure": {"active_positions": [{"symbol": "GBPUSD", "type": "BUY", "profit": 1.0}],
+                               "pending_orders": [], "summary": {}},
+        "multi_timeframes": {},
+    }
+
+    # Không phụ thuộc ngày chạy test (market calendar có test riêng); gate bật bằng setting (mặc định tắt)
+    with patch("app.services.signal_service.settings.MARKET_CALENDAR_ENABLED", False), \
+            patch("app.services.signal_service.settings.SIGNAL_PRE_CHECK_ENABLED", True):
+        result = asyncio.run(service.analyze_signal(copy.deepcopy(request)))
+        assert result["success"] and result["data"]["signal_type"] == "HOLD"
+        assert result["pre_check"] == {"status": "STOP_TRADE", "reason": "Max position limit reached"}
+        assert service.pre_check_stops == 1
+        service.ai_service.generate_response.assert_not_called()
+
+        # Tắt theo request / theo setting => đi tiếp tới prompt + AI
+        with patch.object(service.prompt_service, "create_prompt_for_signal_analyst", return_value="prompt"):
+            asyncio.run(service.analyze_signal(dict(copy.deepcopy(request), pre_check=False)))
+            assert service.ai_service.generate_response.call_count == 1
+            with patch("app.services.signal_service.settings.SIGNAL_PRE_CHECK_ENABLED", False):
+                asyncio.run(service.analyze_signal(copy.deepcopy(request)))
+            assert service.ai_service.generate_response.call_count == 2
+
+def test_pre_check_and_risk_manager_share_position_limit():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        cases = {case["test_name"]: case["params"] for case in json.load(f)}
+    risk = RiskManagerService(logger=NullLogger())
+    service = SignalService(redis_client=MagicMock())
+    # balance_config không có max_position, request /signal khai báo max_positions nhỏ hơn số vị thế đang mở
+    for name, expected in (("preflight_stop_trade_max_positions", "STOP_TRADE"), ("random_case_5", "CONTINUE")):
+        params = copy.deepcopy(cases[name])
+        params["balance_config"].pop("max_position")
+        symbol = params["proposed_signal_json"]["symbol"]
+        gate = risk.pre_check(symbol, params["account_info_json"], params["portfolio_exposure_json"], params["balance_config"])
+        decision = risk._analyze_risk_enhanced(copy.deepcopy(params), NullLogger())
+        assert gate[0] == decision["status"] == expected, (name, gate, decision["status"])
+
+        request = {"symbol": symbol, "account_info": params["account_info_json"], "pre_check": True,
+                   "portfolio_exposure": params["portfolio_exposure_json"], "balance_config": params["balance_config"],
+                   "max_positions": 1}
+        assert (service._pre_check(request) is None) == (expected == "CONTINUE")
+
+
+if __name__ == "__main__":
+    test_pre_check_only_stops_when_every_proposal_is_rejected()
+    test_pre_check_edge_cases()
+    test_signal_service_skips_ai_call_when_pre_check_stops()
+    test_pre_check_and_risk_manager_share_position_limit()
+    print("✅ All signal pre-check tests passed")
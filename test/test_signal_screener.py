@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test SignalScreener: điểm setup theo alignment / confluence / ADX / key level, gate enforce và thống kê shadow
+"""
+
+import sys
+import os
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.candle_codec import CandleColumns
+from app.utils.indicator_engine import IndicatorState
+from app.utils.price_action_analyzer import PriceActionAnalyzer
+from app.utils.signal_screener import SignalScreener, alignment_points, rank_setups, screen_setup
+from app.services.signal_service import SignalService
+
+
+def timeframe(price, sma_100, sma_200, adx, rsi, histogram, support=None, resistance=None, atr=0.0020):
+    context = {"price": price,
+               "nearest_support": {"price": support} if support else None,
+               "nearest_resistance": {"price": resistance} if resistance else None}
+    return {
+        "indicators": {"rsi": rsi, "macd": [0.001, 0.001 - histogram, histogram], "atr": atr, "adx": adx,
+                       "sma_100": sma_100, "sma_200": sma_200, "bollinger_bands": [price, price + 0.004, price - 0.004]},
+        "analyze_price_action": {"current_price_context": context}
+    }
+
+
+def bullish_setup():
+    # H4: W1 (higher) / H4 (main) / H1 (lower) cùng tăng, ADX mạnh, giá vừa test support
+    return {
+        "W1": timeframe(1.1000, 1.0800, 1.0700, [31.0, 28.0, 12.0], 61.0, 0.0010),
+        "H4": timeframe(1.1000, 1.0950, 1.0900, [29.0, 26.0, 14.0], 58.0, 0.0004, support=1.0992, resistance=1.1080),
+        "H1": timeframe(1.1000, 1.0990, 1.0970, [24.0, 22.0, 17.0], 55.0, 0.0001),
+    }
+
+
+def ranging_setup():
+    # Timeframe lệch hướng, ADX thấp, giá giữa 2 level xa
+    return {
+        "W1": timeframe(1.1000, 1.1100, 1.1200, [18.0, 12.0, 25.0], 42.0, -0.0010),
+        "H4": timeframe(1.1000, 1.0990, 1.1010, [12.0, 18.0, 19.0], 51.0, -0.0001, support=1.0900, resistance=1.1100),
+        "H1": timeframe(1.1000, 1.0995, 1.0980, [14.0, 21.0, 16.0], 56.0, 0.0002),
+    }
+
+
+def test_alignment_points_follow_prompt_rules():
+    assert alignment_points([1, 1, 1]) == 3
+    assert alignment_points([-1, -1, 0]) == 2
+    assert alignment_points([1, 1, -1]) == 1
+    assert alignment_points([1, -1, 0]) == 0 and alignment_points([0, 0, 0]) == 0
+
+
+def test_screen_scores_clean_trend_above_ranging_market():
+    strong = screen_setup(bullish_setup(), "H4")
+    weak = screen_setup(ranging_setup(), "H4")
+    assert strong["bias"] == "BULLISH" and strong["score"] >= 80 and strong["reasons"] == []
+    assert strong["components"]["alignment"] == 1.0 and strong["components"]["location"] == 1.0
+    assert weak["score"] < 40
+    assert any("ADX" in reason for reason in weak["reasons"])
+    assert any("mid-range" in reason for reason in weak["reasons"])
+    assert any("not aligned" in reason for reason in weak["reasons"])
+
+    # Thiếu main timeframe / ATR / giá => không chấm được
+    assert screen_setup(bullish_setup(), "D1") is None
+    missing_atr = bullish_setup()
+    missing_atr["H4"]["indicators"]["atr"] = None
+    assert screen_setup(missing_atr, "H4") is None
+    # Chỉ có main timeframe vẫn chấm được
+    assert screen_setup({"H4": bullish_setup()["H4"]}, "H4")["components"]["alignment"] == 1.0
+
+
+def test_screen_accepts_server_side_analysis():
+    rng = np.random.default_rng(3)
+    closes = 1.10 + np.cumsum(rng.normal(0.0002, 0.0008, 400))
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    highs, lows = np.maximum(opens, closes) + 0.0004, np.minimum(opens, closes) - 0.0004
+    times = 1_726_000_000 + np.arange(400) * 3600
+    columns = CandleColumns(times, opens, highs, lows, closes, np.full(400, 1000.0))
+    data = {"H1": {"indicators": IndicatorState.from_arrays(*columns).snapshot(),
+                   "analyze_price_action": PriceActionAnalyzer().analyze_arrays(*columns)}}
+    result = screen_setup(data, "H1")
+    assert result is not None and 0 <= result["score"] <= 100 and result["bias"] == "BULLISH"
+
+
+def test_shadow_statistics_and_enforce_gate():
+    shadow = SignalScreener(mode="shadow", threshold=40)
+    for setup, decision in ((bullish_setup(), "BUY"), (ranging_setup(), "HOLD"), (ranging_setup(), "SELL")):
+        result = shadow.screen(setup, "H4")
+        assert result["skip"] is False
+        shadow.record(result, decision)
+    metrics = shadow.get_metrics()
+    assert metrics["screened"] == 3 and metrics["skipped"] == 0
+    assert sum(s["ai_trade"] + s["ai_hold"] for s in metrics["buckets"].values()) == 3
+    # Ngưỡng 40: bỏ 2 lần gọi AI (setup ranging), trong đó AI có 1 tín hiệu SELL
+    assert metrics["thresholds"][40] == {"saved_calls": 2, "missed_trades": 1, "saved_rate": 0.6667}
+    assert SignalScreener(mode="off").screen(bullish_setup(), "H4") is None
+
+    enforce = SignalScreener(mode="enforce", threshold=40)
+    service = SignalService(redis_client=MagicMock())
+    service.ai_service = MagicMock(generate_response=AsyncMock(return_value='{"symbol": "EURUSD", "signal_type": "BUY", "technical_reasoning": "x"}'))
+    request = {"symbol": "EURUSD", "timeframe": "H4", "cache_key": {"timezone": "GMT+3.0", "timeframe": "H4", "symbol": "EURUSD"}}
+    with patch("app.services.signal_service.signal_screener", enforce), \
+            patch.object(service.prompt_service, "create_prompt_for_signal_analyst", return_value="prompt"), \
+            patch("app.services.signal_service.response_logger"):
+        held = asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=ranging_setup())))
+        assert held["data"]["signal_type"] == "HOLD" and held["screener"]["score"] < 40
+        service.ai_service.generate_response.assert_not_called()
+
+        passed = asyncio.run(service._process_signal_direct(dict(request, multi_timeframes=bullish_setup())))
+        assert passed["data"]["signal_type"] == "BUY" and "screener" not in passed
+        assert service.ai_service.generate_response.call_count == 1
+    metrics = enforce.get_metrics()
+    assert metrics["screened"] == 2 and metrics["skipped"] == 1
+    assert sum(s["ai_trade"] for s in metrics["buckets"].values()) == 1
+
+
+def test_rank_matches_single_screen_and_selects_top_candidates():
+    rng = np.random.default_rng(7)
+    items = []
+    for i in range(30):
+        setup = bullish_setup() if i % 3 else ranging_setup()
+        for tf in setup.values():
+            indicators = tf["indicators"]
+            indicators["rsi"] += rng.normal(0, 8)
+            indicators["adx"] = [indicators["adx"][0] + rng.normal(0, 6)] + indicators["adx"][1:]
+            indicators["macd"][2] += rng.normal(0, 0.0005)
+        items.append({"symbol": f"SYM{i}", "timeframe": "H4", "multi_timeframes": setup})
+    items.append({"symbol": "NOATR", "timeframe": "H4", "multi_timeframes": {"H4": {"indicators": {}}}})
+
+    result = rank_setups(items, top_n=5, min_score=40)
+    ranked = result["candidates"] + result["below_threshold"]
+    assert result["unscored"] == [{"symbol": "NOATR", "timeframe": "H4"}]
+    assert result["summary"] == {"items": 31, "scored": 30, "candidates": 5, "min_score": 40, "top_n": 5}
+    # Cùng điểm / lý do như chấm từng request
+    for entry in ranked:
+        single = screen_setup(items[int(entry["symbol"][3:])]["multi_timeframes"], "H4")
+        assert {k: entry[k] for k in single} == single
+    scores = [entry["score"] for entry in result["candidates"]]
+    assert scores == sorted(scores, reverse=True) and min(scores) >= 40
+    passing = [entry for entry in ranked if entry["score"] >= 40]
+    assert all(entry["score"] <= scores[-1] for entry in passing[5:])
+    assert rank_setups(items, top_n=5, min_score=101)["candidates"] == []
+    assert rank_setups([], top_n=5, min_score=40)["summary"]["scored"] == 0
+
+
+def test_rank_uses_indicator_engine_when_indicators_missing():
+    snapshots = {("EURUSD", tf, "GMT+3.0"): data["indicators"] for tf, data in bullish_setup().items()}
+    setup = bullish_setup()
+    for data in setup.values():
+        data.pop("indicators")
+    engine = MagicMock(get_snapshot=lambda symbol, tf, namespace: snapshots.get((symbol, tf, namespace)))
+    screener = SignalScreener(mode="off", threshold=40)
+    # State của engine theo timezone broker: GBPUSD không có state, EURUSD của broker khác cũng không
+    items = [{"symbol": "EURUSD", "timeframe": "H4", "multi_timeframes": setup, "timezone": "GMT+3.0"},
+             {"symbol": "GBPUSD", "timeframe": "H4", "multi_timeframes": setup, "timezone": "GMT+3.0"},
+             {"symbol": "EURUSD", "timeframe": "H4", "multi_timeframes": setup, "timezone": "GMT+2.0"}]
+    with patch("app.utils.signal_screener.indicator_engine", engine):
+        result = screener.rank(items)
+    assert [entry["symbol"] for entry in result["candidates"]] == ["EURUSD"]
+    assert result["candidates"][0]["score"] == screen_setup(bullish_setup(), "H4")["score"]
+    assert result["unscored"] == [{"symbol": "GBPUSD", "timeframe": "H4"}, {"symbol": "EURUSD", "timeframe": "H4"}]
+    assert screener.get_metrics()["batch"] == {"requests": 1, "items": 3, "candidates": 1}
+
+
+if __name__ == "__main__":
+    test_alignment_points_follow_prompt_rules()
+    test_screen_scores_clean_trend_above_ranging_market()
+    test_screen_accepts_server_side_analysis()
+    test_shadow_statistics_and_enforce_gate()
+    test_rank_matches_single_screen_and_selects_top_candidates()
+    test_rank_uses_indicator_engine_when_indicators_missing()
+    print("✅ All signal screener tests passed")